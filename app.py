@@ -1,17 +1,27 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import sqlite3
 import os
 import re
-from datetime import datetime, timedelta
+from datetime import datetime, date, timedelta
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import pandas as pd
 import io
 import zipfile
 import logging
 import math
+import bisect
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_HALF_UP
 from env_config import configure_environment
+from cache_helper import response_cache
+from json_provider import FastJSONProvider
+from compression import gzip_response
 # Import migrations with fallback if not available
 try:
     from migrations.migrate import run_migrations
@@ -23,7 +33,7 @@ except ImportError:
 
 # Import db_helper with fallback if not available
 try:
-    from db_helper import init_db_helper, get_db_helper
+    from db_helper import init_db_helper, get_db_helper, rows_to_dicts, UPSERT_TICKER_SQL
     _db_helper_available = True
 except ImportError as e:
     # Fallback if db_helper module is not available
@@ -39,6 +49,9 @@ except ImportError as e:
         def get_raw_connection(self):
             raise RuntimeError("db_helper module not available. Please pull latest changes from git.")
         
+        def connection(self):
+            raise RuntimeError("db_helper module not available. Please pull latest changes from git.")
+        
         def get_commission_rate(self, *args, **kwargs):
             return 0.0  # Return default commission rate
         
@@ -67,6 +80,38 @@ except ImportError as e:
         if not _db_helper_available:
             logging.warning("db_helper not available - returning dummy helper. Please pull latest changes from git.")
         return _dummy_db_helper
+    
+    def rows_to_dicts(cursor):
+        return [dict(row) for row in cursor.fetchall()]
+
+def days_between(start_date, end_date):
+    """
+    Whole days from start_date to end_date ('YYYY-MM-DD' strings)
+    
+    date.fromisoformat is a C fast path (~35x cheaper than strptime); strptime is
+    only used for non-padded input such as '2025-3-7'.
+    """
+    def parse(value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return datetime.strptime(value, '%Y-%m-%d').date()
+    return (parse(end_date) - parse(start_date)).days
+
+_MONTH_ABBREVIATIONS = ('', 'JAN', 'FEB', 'MAR', 'APR', 'MAY', 'JUN', 'JUL', 'AUG', 'SEP', 'OCT', 'NOV', 'DEC')
+
+def format_expiration(expiration_date):
+    """
+    'YYYY-MM-DD' as the DD-MON-YY form used in cost basis descriptions ('2025-03-21' -> '21-MAR-25')
+    
+    Same result as strptime(...).strftime('%d-%b-%y').upper() without the locale-aware
+    parse and format; raises ValueError/TypeError for unparseable input like strptime.
+    """
+    try:
+        value = date.fromisoformat(expiration_date)
+    except ValueError:
+        value = datetime.strptime(expiration_date, '%Y-%m-%d').date()
+    return f'{value.day:02d}-{_MONTH_ABBREVIATIONS[value.month]}-{value.year % 100:02d}'
 
 def round_standard(value, decimals=2):
     """Round to nearest value, always rounding 0.5 up (standard rounding)"""
@@ -81,6 +126,10 @@ load_dotenv()
 PA_USERNAME = configure_environment()
 
 app = Flask(__name__)
+# jsonify() and app.json.dumps() encode with orjson when it is installed
+app.json = FastJSONProvider(app)
+# gzip JSON responses (the trade list, cost basis, ...) for clients that accept it
+app.after_request(gzip_response)
 
 APP_ENV = os.getenv('APP_ENV', 'development')
 IS_PRODUCTION = APP_ENV == 'production'
@@ -101,6 +150,13 @@ logging.basicConfig(
 # Suppress noisy third-party debug logs
 for _noisy in ('httpcore', 'httpx', 'urllib3', 'yfinance', 'peewee', 'schwab.client.base'):
     logging.getLogger(_noisy).setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+# Shared HTTP session for yfinance lookups, so company name and dividend fetches reuse
+# kept-alive connections to Yahoo instead of a new TCP+TLS handshake per ticker
+YFINANCE_SESSION = requests.Session()
+YFINANCE_SESSION.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                                               max_retries=Retry(total=2, backoff_factor=0.1)))
 
 # Database configuration
 # DB_PATH env var lets test and prod sites point to different databases.
@@ -151,12 +207,62 @@ def run_migrations_on_startup():
 
 def get_db_connection():
     """
-    Get database connection (backward compatibility)
+    Get a new, unpooled database connection that the caller must close
+    (backward compatibility for standalone scripts)
     
-    Note: Prefer using get_db_helper() for new code
+    Note: Prefer get_db() in the app, which reuses pooled connections
     """
     return get_db_helper().get_raw_connection()
 
+def get_db():
+    """
+    Borrow a pooled database connection; it is returned to the pool on exit
+    
+    Usage:
+        with get_db() as conn:
+            cursor = conn.cursor()
+    """
+    return get_db_helper().connection()
+
+def get_account_id_arg(default=None):
+    """
+    Parse the account_id query parameter to an int once per request
+    
+    Missing, empty or non-numeric values (e.g. 'all') return default, so handlers
+    always bind an INTEGER (or nothing) against the account_id indexes.
+    """
+    account_id_arg = request.args.get('account_id')
+    if account_id_arg:
+        try:
+            return int(account_id_arg)
+        except (ValueError, TypeError):
+            pass
+    return default
+
+def revalidated(response):
+    """
+    Tag a JSON response with an ETag of its body and answer 304 Not Modified when the
+    request's If-None-Match already has it
+    
+    max-age=0 makes the browser revalidate on every load, so a client re-requesting
+    unchanged data gets an empty 304 instead of the full body.
+    """
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, max-age=0, must-revalidate'
+    return response.make_conditional(request)
+
+# Schema version stamped into PRAGMA user_version by init_db().
+# Bump this whenever init_db's DDL changes so existing databases re-run it once.
+SCHEMA_VERSION = 9
+
+# Migration scripts shared with init_db for the bankroll roll-up (mv_bankroll_daily,
+# its triggers, the generated trades.is_options flag and the mv_bankroll_summary cache)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+BANKROLL_ROLLUP_MIGRATION = os.path.join(MIGRATIONS_DIR, '025_add_bankroll_rollup.sql')
+IS_OPTIONS_MIGRATION = os.path.join(MIGRATIONS_DIR, '026_add_is_options_to_trades.sql')
+BANKROLL_SUMMARY_CACHE_MIGRATION = os.path.join(MIGRATIONS_DIR, '028_add_bankroll_summary_cache.sql')
+SHARES_MIGRATION = os.path.join(MIGRATIONS_DIR, '029_add_shares_to_trades.sql')
+
 def create_views(cursor):
     """Create SQL views to simplify reporting queries"""
     views = [
@@ -220,9 +326,30 @@ def create_views(cursor):
 
 def init_db():
     """Initialize database with new structure"""
-    conn = get_db_connection()
+    # Seeded accounts/trade types may change underneath any cached GET responses
+    # and the trade_type_id lookups
+    response_cache.clear()
+    _trade_types_by_name.clear()
+    with get_db() as conn:
+        create_schema(conn)
+
+def create_schema(conn):
+    """Create or upgrade the schema on conn, seed reference data and commit"""
     cursor = conn.cursor()
     
+    # Skip the whole DDL pass when this database was already initialized at the current schema version
+    cursor.execute('PRAGMA user_version')
+    if cursor.fetchone()[0] >= SCHEMA_VERSION:
+        return
+    
+    # WAL is persistent, so switch it once here; per-connection PRAGMAs are
+    # applied by db_helper on every connect
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
+    # Run everything below in one explicit transaction. sqlite3 does not open an implicit
+    # transaction for DDL, so otherwise every CREATE/ALTER would commit (and sync) on its own.
+    cursor.execute('BEGIN')
+    
     # Create accounts table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS accounts (
@@ -306,6 +433,7 @@ def init_db():
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             price_per_share REAL DEFAULT 0,
             total_amount REAL DEFAULT 0,
+            margin_capital REAL DEFAULT 0,
             net_credit_per_share NUMERIC(12,5) DEFAULT 0,
             risk_capital_per_share REAL DEFAULT 0,
             margin_percent REAL DEFAULT 100.0,
@@ -389,7 +517,7 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             account_id INTEGER NOT NULL,
             transaction_date TEXT NOT NULL,
-            transaction_type TEXT NOT NULL CHECK(transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'PREMIUM_CREDIT', 'PREMIUM_DEBIT', 'ASSIGNMENT', 'SELL PUT', 'SELL CALL', 'Dividend')),
+            transaction_type TEXT NOT NULL CHECK(transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'PREMIUM_CREDIT', 'PREMIUM_DEBIT', 'ASSIGNMENT', 'SELL PUT', 'SELL CALL', 'BUY PUT', 'BUY CALL', 'CLOSING_DEBIT', 'Dividend')),
             amount NUMERIC(12,2) NOT NULL,
             description TEXT,
             trade_id INTEGER,
@@ -401,52 +529,44 @@ def init_db():
         )
     ''')
     
-    # Check if the table exists and recreate it if it has the old CHECK constraint
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='cash_flows'")
-    if cursor.fetchone():
-        try:
-            # Try to insert a test OPTIONS record to check if the constraint allows it
-            cursor.execute('''
-                INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount)
-                VALUES (?, '2000-01-02', 'OPTIONS', 0.01)
-            ''', (1,))
-            cursor.execute('DELETE FROM cash_flows WHERE transaction_type = "OPTIONS" AND transaction_date = "2000-01-02"')
-        except:
-            # If OPTIONS is not allowed, the table has the old constraint, so recreate it
-            print("Recreating cash_flows table with updated CHECK constraint...")
-            # Save existing data
-            cursor.execute('SELECT * FROM cash_flows')
-            existing_data = [dict(row) for row in cursor.fetchall()]
-            
-            # Drop and recreate the table
-            cursor.execute('DROP TABLE cash_flows')
-            cursor.execute('''
-                CREATE TABLE cash_flows (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    account_id INTEGER NOT NULL,
-                    transaction_date TEXT NOT NULL,
-                    transaction_type TEXT NOT NULL CHECK(transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'PREMIUM_CREDIT', 'PREMIUM_DEBIT', 'ASSIGNMENT', 'SELL PUT', 'SELL CALL', 'Dividend')),
-                    amount NUMERIC(12,2) NOT NULL,
-                    description TEXT,
-                    trade_id INTEGER,
-                    ticker_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (account_id) REFERENCES accounts(id),
-                    FOREIGN KEY (trade_id) REFERENCES trades(id),
-                    FOREIGN KEY (ticker_id) REFERENCES tickers(id)
-                )
-            ''')
-            
-            # Restore existing data
-            for row_dict in existing_data:
-                cursor.execute('''
-                    INSERT INTO cash_flows (id, account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (row_dict['id'], row_dict['account_id'], row_dict['transaction_date'], row_dict['transaction_type'], 
-                      row_dict['amount'], row_dict.get('description'), row_dict.get('trade_id'), row_dict.get('ticker_id'), row_dict.get('created_at')))
-            
-            # Commit the changes
-            conn.commit()
+    # Recreate cash_flows if it still has an old CHECK constraint. Read the stored DDL
+    # instead of probing with a throwaway INSERT/DELETE so this check never writes.
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='cash_flows'")
+    cash_flows_table = cursor.fetchone()
+    if cash_flows_table and 'CLOSING_DEBIT' not in cash_flows_table['sql']:
+        # The table has the old constraint, so recreate it
+        print("Recreating cash_flows table with updated CHECK constraint...")
+        # Save existing data
+        cursor.execute('SELECT * FROM cash_flows')
+        existing_data = [dict(row) for row in cursor.fetchall()]
+        
+        # Drop and recreate the table
+        cursor.execute('DROP TABLE cash_flows')
+        cursor.execute('''
+            CREATE TABLE cash_flows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id INTEGER NOT NULL,
+                transaction_date TEXT NOT NULL,
+                transaction_type TEXT NOT NULL CHECK(transaction_type IN ('DEPOSIT', 'WITHDRAWAL', 'PREMIUM_CREDIT', 'PREMIUM_DEBIT', 'ASSIGNMENT', 'SELL PUT', 'SELL CALL', 'BUY PUT', 'BUY CALL', 'CLOSING_DEBIT', 'Dividend')),
+                amount NUMERIC(12,2) NOT NULL,
+                description TEXT,
+                trade_id INTEGER,
+                ticker_id INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (account_id) REFERENCES accounts(id),
+                FOREIGN KEY (trade_id) REFERENCES trades(id),
+                FOREIGN KEY (ticker_id) REFERENCES tickers(id)
+            )
+        ''')
+        
+        # Restore existing data in one batch; init_db's transaction is still open, so
+        # the rows are written with a single prepared statement and a single commit
+        cursor.executemany('''
+            INSERT INTO cash_flows (id, account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(row_dict['id'], row_dict['account_id'], row_dict['transaction_date'], row_dict['transaction_type'],
+               row_dict['amount'], row_dict.get('description'), row_dict.get('trade_id'), row_dict.get('ticker_id'), row_dict.get('created_at'))
+              for row_dict in existing_data])
     
     # Cleanup: Remove any leftover trades_new table from incomplete migrations
     # This should not happen if migrations run properly, but we clean up just in case
@@ -471,18 +591,15 @@ def init_db():
                 cursor.execute('DROP TABLE trades')
                 cursor.execute('ALTER TABLE trades_new RENAME TO trades')
                 create_views(cursor)
-                conn.commit()
                 print("✓ Completed migration: renamed trades_new to trades")
             elif trades_count > 0 and trades_new_count > 0:
                 # Both tables have data - this is a problem, keep trades and drop trades_new
                 print("⚠ Both trades and trades_new have data. Keeping trades, dropping trades_new")
                 cursor.execute('DROP TABLE trades_new')
-                conn.commit()
                 print("✓ Cleaned up trades_new table")
             else:
                 # trades_new is empty or both are empty - just drop trades_new
                 cursor.execute('DROP TABLE trades_new')
-                conn.commit()
                 print("✓ Cleaned up empty trades_new table")
         except Exception as e:
             print(f"⚠ Error cleaning up trades_new: {e}")
@@ -560,6 +677,12 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # Column already exists
     
+    # Add margin_capital column to trades table if it doesn't exist
+    try:
+        cursor.execute('ALTER TABLE trades ADD COLUMN margin_capital REAL DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    
     # Add cash_flow_id column to cost_basis table if it doesn't exist
     try:
         cursor.execute('ALTER TABLE cost_basis ADD COLUMN cash_flow_id INTEGER')
@@ -583,43 +706,69 @@ def init_db():
     # Create indexes for query optimization
     create_indexes(cursor)
     
+    # Create the bankroll roll-up table and the triggers that maintain it
+    create_bankroll_rollup(cursor)
+    
+    # Generated trades.shares column (table_xinfo, unlike table_info, lists generated columns)
+    cursor.execute('PRAGMA table_xinfo(trades)')
+    if 'shares' not in [col[1] for col in cursor.fetchall()]:
+        with open(SHARES_MIGRATION) as f:
+            for statement in iter_sql_statements(f.read()):
+                cursor.execute(statement)
+    
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    # Single commit for the whole schema pass
     conn.commit()
-    conn.close()
+    
+    # Planner statistics for the tables and indexes just created or changed
+    cursor.execute('ANALYZE')
 
 def create_indexes(cursor):
     """Create indexes for query optimization"""
     indexes = [
+        # Single-column indexes on the leading column of a composite below are redundant
+        # (see migrations/027_drop_redundant_indexes.sql) and only slow down writes
+        'DROP INDEX IF EXISTS idx_trades_account',
+        'DROP INDEX IF EXISTS idx_trades_account_status',
+        'DROP INDEX IF EXISTS idx_cost_basis_ticker',
+        'DROP INDEX IF EXISTS idx_cost_basis_ticker_account',
+        'DROP INDEX IF EXISTS idx_cash_flows_account',
+        'DROP INDEX IF EXISTS idx_commissions_account',
+        'DROP INDEX IF EXISTS idx_bankroll_account',
+        # ... and likewise for migrations/031_add_composite_read_indexes.sql
+        'DROP INDEX IF EXISTS idx_trades_ticker',
+        'DROP INDEX IF EXISTS idx_cash_flows_type',
+        # ... and migrations/032_extend_cash_flows_account_date_index.sql
+        'DROP INDEX IF EXISTS idx_cash_flows_account_date',
+        
         # TRADES TABLE
-        'CREATE INDEX IF NOT EXISTS idx_trades_account ON trades(account_id)',
         'CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(trade_status)',
-        'CREATE INDEX IF NOT EXISTS idx_trades_ticker ON trades(ticker_id)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_ticker_date ON trades(ticker_id, date_trade_open)',
         'CREATE INDEX IF NOT EXISTS idx_trades_date_trade_open ON trades(date_trade_open)',
-        'CREATE INDEX IF NOT EXISTS idx_trades_account_status ON trades(account_id, trade_status)',
+        'CREATE INDEX IF NOT EXISTS idx_trades_account_status_date ON trades(account_id, trade_status, date_trade_open)',
         'CREATE INDEX IF NOT EXISTS idx_trades_account_date ON trades(account_id, date_trade_open)',
         'CREATE INDEX IF NOT EXISTS idx_trades_type ON trades(trade_type)',
         'CREATE INDEX IF NOT EXISTS idx_trades_created ON trades(created_at DESC)',
         
         # COST_BASIS TABLE
-        'CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_account ON cost_basis(ticker_id, account_id)',
         'CREATE INDEX IF NOT EXISTS idx_cost_basis_transaction_date ON cost_basis(transaction_date)',
         'CREATE INDEX IF NOT EXISTS idx_cost_basis_account ON cost_basis(account_id)',
-        'CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker ON cost_basis(ticker_id)',
         'CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_account_date ON cost_basis(ticker_id, account_id, transaction_date)',
+        'CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_date ON cost_basis(ticker_id, transaction_date)',
+        'CREATE INDEX IF NOT EXISTS idx_cost_basis_trade ON cost_basis(trade_id)',
         
         # CASH_FLOWS TABLE
-        'CREATE INDEX IF NOT EXISTS idx_cash_flows_account ON cash_flows(account_id)',
-        'CREATE INDEX IF NOT EXISTS idx_cash_flows_type ON cash_flows(transaction_type)',
+        'CREATE INDEX IF NOT EXISTS idx_cash_flows_type_date ON cash_flows(transaction_type, transaction_date, amount)',
         'CREATE INDEX IF NOT EXISTS idx_cash_flows_date ON cash_flows(transaction_date)',
-        'CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date ON cash_flows(account_id, transaction_date)',
+        'CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date_created ON cash_flows(account_id, transaction_date, created_at)',
         'CREATE INDEX IF NOT EXISTS idx_cash_flows_account_type ON cash_flows(account_id, transaction_type)',
         'CREATE INDEX IF NOT EXISTS idx_cash_flows_ticker ON cash_flows(ticker_id)',
+        'CREATE INDEX IF NOT EXISTS idx_cash_flows_trade ON cash_flows(trade_id)',
         
         # COMMISSIONS TABLE
         'CREATE INDEX IF NOT EXISTS idx_commissions_account_date ON commissions(account_id, effective_date)',
-        'CREATE INDEX IF NOT EXISTS idx_commissions_account ON commissions(account_id)',
         
         # BANKROLL TABLE
-        'CREATE INDEX IF NOT EXISTS idx_bankroll_account ON bankroll(account_id)',
         'CREATE INDEX IF NOT EXISTS idx_bankroll_date ON bankroll(transaction_date)',
         'CREATE INDEX IF NOT EXISTS idx_bankroll_account_date ON bankroll(account_id, transaction_date)',
         
@@ -635,11 +784,116 @@ def create_indexes(cursor):
             # Index might already exist or column might not exist yet
             pass
 
+def iter_sql_statements(script):
+    """Split a .sql script into complete statements (trigger bodies keep their inner semicolons)"""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ''
+    if statement.strip():
+        yield statement
+
+def create_bankroll_rollup(cursor):
+    """Create and populate mv_bankroll_daily / mv_bankroll_summary plus the triggers that keep them current"""
+    # Each script is only applied when its objects are missing (the database may
+    # already have been brought up to date by migrations/migrate.py).
+    # Statements are executed one by one rather than with executescript(), which would
+    # COMMIT the caller's open transaction first.
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='mv_bankroll_daily'")
+    if not cursor.fetchone():
+        with open(BANKROLL_ROLLUP_MIGRATION) as f:
+            for statement in iter_sql_statements(f.read()):
+                cursor.execute(statement)
+    
+    # table_xinfo (unlike table_info) lists generated columns
+    cursor.execute('PRAGMA table_xinfo(trades)')
+    if 'is_options' not in [col[1] for col in cursor.fetchall()]:
+        with open(IS_OPTIONS_MIGRATION) as f:
+            for statement in iter_sql_statements(f.read()):
+                cursor.execute(statement)
+    
+    # Precomputed summaries; the script is idempotent (IF NOT EXISTS throughout)
+    with open(BANKROLL_SUMMARY_CACHE_MIGRATION) as f:
+        for statement in iter_sql_statements(f.read()):
+            cursor.execute(statement)
+
+# Static SQL, built once at import so every request reuses the same statement text
+# (sqlite3 caches prepared statements per connection, keyed by SQL string).
+# TOTAL() is SQLite's NULL-free SUM: it returns 0.0 over an empty set, so the
+# bankroll totals need no COALESCE(SUM(...), 0) wrapper.
+_SQL_GET_TRADE_TYPES = 'SELECT * FROM trade_types ORDER BY category, type_name'
+
+_SQL_BANKROLL_SUMMARY_TEMPLATE = '''
+    WITH deposits AS (
+        SELECT TOTAL(starting_balance) as total
+        FROM accounts
+        WHERE :account_id IS NULL OR id = :account_id
+    ),
+    by_type AS (
+        SELECT 
+            trade_type,
+            MAX(is_options) as is_options,
+            SUM(premium_sum) FILTER (WHERE status NOT IN ('roll', '')) as premiums,
+            SUM(cnt) FILTER (WHERE {status_condition}) as count,
+            SUM(margin_capital_sum) FILTER (WHERE {status_condition}) as margin_capital
+        FROM mv_bankroll_daily
+        WHERE (:account_id IS NULL OR account_id = :account_id)
+          AND (:start_date IS NULL OR trade_date >= :start_date)
+          AND (:end_date IS NULL OR trade_date <= :end_date)
+        GROUP BY trade_type
+    )
+    SELECT 
+        (SELECT total FROM deposits) as starting_bankroll,
+        TOTAL(premiums) as total_premiums,
+        TOTAL(margin_capital) FILTER (WHERE is_options AND count > 0) as used_in_trades,
+        json_group_object(trade_type, json_object('count', count, 'margin_capital', margin_capital))
+            FILTER (WHERE is_options AND count > 0) as breakdown
+    FROM by_type
+'''
+
+# One bankroll summary statement per status_filter; None (default) covers open + assigned
+_SQL_BANKROLL_SUMMARY = {
+    status_filter: _SQL_BANKROLL_SUMMARY_TEMPLATE.format(status_condition=status_condition)
+    for status_filter, status_condition in (
+        ('open', "status = 'open'"),
+        ('completed', "status = 'closed'"),
+        ('assigned', "status = 'assigned'"),
+        (None, "(status = 'open' OR status = 'assigned')"),
+    )
+}
+
+# Precomputed summaries in mv_bankroll_summary (status_filter '' = default view)
+_SQL_GET_CACHED_BANKROLL_SUMMARY = '''
+    SELECT summary_json FROM mv_bankroll_summary WHERE account_id = ? AND status_filter = ?
+'''
+_SQL_UPSERT_CACHED_BANKROLL_SUMMARY = '''
+    INSERT INTO mv_bankroll_summary (account_id, status_filter, summary_json, updated_at)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (account_id, status_filter) DO UPDATE SET
+        summary_json = excluded.summary_json,
+        updated_at = excluded.updated_at
+'''
+
+def bankroll_status_filter(status_filter):
+    """Map a status_filter query value onto a _SQL_BANKROLL_SUMMARY key (unknown values use the default)"""
+    return status_filter if status_filter in _SQL_BANKROLL_SUMMARY else None
+
+# index.html only uses url_for() for static assets, so the rendered page is the same on
+# every request. It is rendered once and served as-is; in debug mode it is re-rendered
+# each time so template edits still show up without a restart.
+_index_html = None
+
 @app.route('/')
 def index():
-    return render_template('index.html')
+    global _index_html
+    if _index_html is None or app.debug:
+        _index_html = render_template('index.html')
+    return Response(_index_html, mimetype='text/html')
 
 @app.route('/api/accounts', methods=['GET'])
+@response_cache.cached('accounts', timeout=300)
 def get_accounts():
     try:
         # Using new database helper
@@ -658,16 +912,17 @@ def create_account():
         start_date = data.get('start_date')
         starting_balance = data.get('starting_balance', 0.0)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (account_name, account_type, start_date, starting_balance) 
-            VALUES (?, ?, ?, ?)
-        ''', (account_name, account_type, start_date, starting_balance))
-        account_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO accounts (account_name, account_type, start_date, starting_balance) 
+                VALUES (?, ?, ?, ?)
+            ''', (account_name, account_type, start_date, starting_balance))
+            account_id = cursor.lastrowid
+            conn.commit()
         
+        response_cache.delete('accounts')
+        response_cache.delete('commissions')
         return jsonify({'success': True, 'account_id': account_id})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -681,37 +936,37 @@ def update_account(account_id):
         starting_balance = data.get('starting_balance')
         is_default = data.get('is_default')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if account exists
-        cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
-        account = cursor.fetchone()
-        if not account:
-            conn.close()
-            return jsonify({'error': 'Account not found'}), 404
-        
-        # If setting this account as default, unset all other defaults
-        if is_default:
-            cursor.execute('UPDATE accounts SET is_default = 0 WHERE id != ?', (account_id,))
-        
-        # Update the account
-        if is_default is not None:
-            cursor.execute('''
-                UPDATE accounts 
-                SET account_name = ?, account_type = ?, starting_balance = ?, is_default = ?
-                WHERE id = ?
-            ''', (account_name, account_type, starting_balance, 1 if is_default else 0, account_id))
-        else:
-            cursor.execute('''
-                UPDATE accounts 
-                SET account_name = ?, account_type = ?, starting_balance = ?
-                WHERE id = ?
-            ''', (account_name, account_type, starting_balance, account_id))
-        
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Check if account exists
+            cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
+            account = cursor.fetchone()
+            if not account:
+                return jsonify({'error': 'Account not found'}), 404
+            
+            # If setting this account as default, unset all other defaults
+            if is_default:
+                cursor.execute('UPDATE accounts SET is_default = 0 WHERE id != ?', (account_id,))
+            
+            # Update the account
+            if is_default is not None:
+                cursor.execute('''
+                    UPDATE accounts 
+                    SET account_name = ?, account_type = ?, starting_balance = ?, is_default = ?
+                    WHERE id = ?
+                ''', (account_name, account_type, starting_balance, 1 if is_default else 0, account_id))
+            else:
+                cursor.execute('''
+                    UPDATE accounts 
+                    SET account_name = ?, account_type = ?, starting_balance = ?
+                    WHERE id = ?
+                ''', (account_name, account_type, starting_balance, account_id))
+            
+            conn.commit()
         
+        response_cache.delete('accounts')
+        response_cache.delete('commissions')
         return jsonify({'success': True})
     except Exception as e:
         import traceback
@@ -721,25 +976,25 @@ def update_account(account_id):
 @app.route('/api/accounts/<int:account_id>/set-default', methods=['PUT'])
 def set_default_account(account_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if account exists
-        cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
-        account = cursor.fetchone()
-        if not account:
-            conn.close()
-            return jsonify({'error': 'Account not found'}), 404
-        
-        # Unset all other defaults
-        cursor.execute('UPDATE accounts SET is_default = 0')
-        
-        # Set this account as default
-        cursor.execute('UPDATE accounts SET is_default = 1 WHERE id = ?', (account_id,))
-        
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Check if account exists
+            cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
+            account = cursor.fetchone()
+            if not account:
+                return jsonify({'error': 'Account not found'}), 404
+            
+            # Unset all other defaults
+            cursor.execute('UPDATE accounts SET is_default = 0')
+            
+            # Set this account as default
+            cursor.execute('UPDATE accounts SET is_default = 1 WHERE id = ?', (account_id,))
+            
+            conn.commit()
         
+        response_cache.delete('accounts')
+        response_cache.delete('commissions')
         return jsonify({'success': True})
     except Exception as e:
         import traceback
@@ -749,45 +1004,44 @@ def set_default_account(account_id):
 @app.route('/api/accounts/<int:account_id>', methods=['DELETE'])
 def delete_account(account_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Check if account exists
-        cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
-        account = cursor.fetchone()
-        if not account:
-            conn.close()
-            return jsonify({'error': 'Account not found'}), 404
-        
-        # Check if account is referenced in trades
-        cursor.execute('SELECT COUNT(*) as count FROM trades WHERE account_id = ?', (account_id,))
-        trades_count = cursor.fetchone()['count']
-        
-        # Check if account is referenced in cost_basis
-        cursor.execute('SELECT COUNT(*) as count FROM cost_basis WHERE account_id = ?', (account_id,))
-        cost_basis_count = cursor.fetchone()['count']
-        
-        # Check if account is referenced in cash_flows
-        cursor.execute('SELECT COUNT(*) as count FROM cash_flows WHERE account_id = ?', (account_id,))
-        cash_flows_count = cursor.fetchone()['count']
-        
-        # Check if account is referenced in commissions
-        cursor.execute('SELECT COUNT(*) as count FROM commissions WHERE account_id = ?', (account_id,))
-        commissions_count = cursor.fetchone()['count']
-        
-        total_references = trades_count + cost_basis_count + cash_flows_count + commissions_count
-        
-        if total_references > 0:
-            conn.close()
-            return jsonify({
-                'error': f'Cannot delete account. It is referenced in {trades_count} trade(s), {cost_basis_count} cost basis entry(ies), {cash_flows_count} cash flow(s), and {commissions_count} commission(s).'
-            }), 400
-        
-        # Delete the account
-        cursor.execute('DELETE FROM accounts WHERE id = ?', (account_id,))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Check if account exists
+            cursor.execute('SELECT id FROM accounts WHERE id = ?', (account_id,))
+            account = cursor.fetchone()
+            if not account:
+                return jsonify({'error': 'Account not found'}), 404
+            
+            # Check if account is referenced in trades
+            cursor.execute('SELECT COUNT(*) as count FROM trades WHERE account_id = ?', (account_id,))
+            trades_count = cursor.fetchone()['count']
+            
+            # Check if account is referenced in cost_basis
+            cursor.execute('SELECT COUNT(*) as count FROM cost_basis WHERE account_id = ?', (account_id,))
+            cost_basis_count = cursor.fetchone()['count']
+            
+            # Check if account is referenced in cash_flows
+            cursor.execute('SELECT COUNT(*) as count FROM cash_flows WHERE account_id = ?', (account_id,))
+            cash_flows_count = cursor.fetchone()['count']
+            
+            # Check if account is referenced in commissions
+            cursor.execute('SELECT COUNT(*) as count FROM commissions WHERE account_id = ?', (account_id,))
+            commissions_count = cursor.fetchone()['count']
+            
+            total_references = trades_count + cost_basis_count + cash_flows_count + commissions_count
+            
+            if total_references > 0:
+                return jsonify({
+                    'error': f'Cannot delete account. It is referenced in {trades_count} trade(s), {cost_basis_count} cost basis entry(ies), {cash_flows_count} cash flow(s), and {commissions_count} commission(s).'
+                }), 400
+            
+            # Delete the account
+            cursor.execute('DELETE FROM accounts WHERE id = ?', (account_id,))
+            conn.commit()
         
+        response_cache.delete('accounts')
+        response_cache.delete('commissions')
         return jsonify({'success': True})
     except Exception as e:
         import traceback
@@ -795,11 +1049,12 @@ def delete_account(account_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/trade-types', methods=['GET'])
+@response_cache.cached('trade_types', timeout=300)
 def get_trade_types():
     try:
         # Using new database helper
         db = get_db_helper()
-        types = db.execute_query('SELECT * FROM trade_types ORDER BY category, type_name')
+        types = db.execute_query(_SQL_GET_TRADE_TYPES)
         return jsonify(types)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -816,146 +1071,122 @@ def refresh_metrics_cache():
         print(f'Error refreshing metrics cache: {e}')
         return jsonify({'error': str(e)}), 500
 
+def compute_bankroll_summary(cursor, account_id=None, status_filter=None, start_date=None, end_date=None):
+    """Compute the /api/bankroll-summary payload from the mv_bankroll_daily roll-up"""
+    # Starting balance, premiums, used margin capital and the donut-chart breakdown all
+    # come from a single statement: one aggregate over the mv_bankroll_daily roll-up
+    # (kept current by triggers on trades) with the accounts total folded in as a CTE.
+    # Margin Capital = (Strike Price - Net Credit Per Share) * Shares
+    # Net Credit Per Share = Premium - Commission
+    # So: Margin Capital = (strike_price - (credit_debit - commission)) * (num_of_contracts * 100)
+    # Only options trades (is_options, generated from trade_type) count toward used capital.
+    # Rows with a NULL trade_status are stored with status '' and never match.
+    # Unset filters are bound as NULL so the statement text only varies by status filter.
+    cursor.execute(
+        _SQL_BANKROLL_SUMMARY[bankroll_status_filter(status_filter)],
+        {'account_id': account_id or None, 'start_date': start_date or None, 'end_date': end_date or None}
+    )
+    summary = cursor.fetchone()
+    
+    starting_bankroll = summary['starting_bankroll']
+    total_premiums = summary['total_premiums']
+    used_in_trades = summary['used_in_trades']
+    # Breakdown by trade type for the donut chart (same status filter as used capital)
+    breakdown_dict = {
+        trade_type: {'count': item['count'], 'margin_capital': float(item['margin_capital'])}
+        for trade_type, item in json.loads(summary['breakdown']).items()
+    }
+    
+    # Total available bankroll = starting + premiums
+    total_bankroll = starting_bankroll + total_premiums
+    available_bankroll = total_bankroll - used_in_trades
+    
+    return {
+        'total_deposits': float(starting_bankroll),
+        'total_premiums': float(total_premiums),
+        'total_bankroll': float(total_bankroll),
+        'used_in_trades': float(used_in_trades),
+        'available': float(available_bankroll),
+        'breakdown': breakdown_dict
+    }
+
+# Background precomputation of unfiltered bankroll summaries into mv_bankroll_summary.
+# Triggers on trades/accounts delete stale rows (migrations/028_add_bankroll_summary_cache.sql);
+# this worker re-fills them off the request thread after writes and cache misses.
+_bankroll_refresh_event = threading.Event()
+_bankroll_refresh_lock = threading.Lock()
+_bankroll_refresh_pending = set()
+_bankroll_refresh_thread = None
+
+def refresh_bankroll_summaries(account_ids):
+    """Recompute and store the cached summaries (every status filter) for the given accounts (0 = all)"""
+    with get_db() as conn:
+        # Take the write lock before reading so no trade write can land between the
+        # read and the upsert (its trigger would otherwise be overwritten by stale data)
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.cursor()
+        for account_id in account_ids:
+            for status_filter in _SQL_BANKROLL_SUMMARY:
+                summary = compute_bankroll_summary(cursor, account_id, status_filter)
+                cursor.execute(
+                    _SQL_UPSERT_CACHED_BANKROLL_SUMMARY,
+                    (account_id, status_filter or '', app.json.dumps(summary))
+                )
+        conn.commit()
+
+def _bankroll_refresh_worker():
+    """Background thread: refresh summaries for accounts queued by schedule_bankroll_summary_refresh"""
+    while True:
+        _bankroll_refresh_event.wait()
+        _bankroll_refresh_event.clear()
+        with _bankroll_refresh_lock:
+            account_ids = sorted(_bankroll_refresh_pending)
+            _bankroll_refresh_pending.clear()
+        try:
+            refresh_bankroll_summaries(account_ids)
+        except Exception:
+            logger.exception('Error refreshing bankroll summaries for %s', account_ids)
+
+def schedule_bankroll_summary_refresh(account_id=None):
+    """Queue a background refresh of an account's summaries (and the all-accounts summary)"""
+    global _bankroll_refresh_thread
+    with _bankroll_refresh_lock:
+        _bankroll_refresh_pending.update({0, account_id or 0})
+        if _bankroll_refresh_thread is None or not _bankroll_refresh_thread.is_alive():
+            _bankroll_refresh_thread = threading.Thread(
+                target=_bankroll_refresh_worker, daemon=True, name='bankroll-refresh'
+            )
+            _bankroll_refresh_thread.start()
+    _bankroll_refresh_event.set()
+
 @app.route('/api/bankroll-summary', methods=['GET'])
 def get_bankroll_summary():
     try:
         # Get date filters, account filter, and status filter
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-        account_id = request.args.get('account_id', type=int)  # None if not provided (show all accounts)
-        status_filter = request.args.get('status_filter')  # 'open', 'completed', etc.
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get starting bankroll from accounts table
-        if account_id:
-            # Filter by specific account
-            cursor.execute('''
-                SELECT COALESCE(SUM(starting_balance), 0) as total
-                FROM accounts
-                WHERE id = ?
-            ''', (account_id,))
-        else:
-            # Sum all accounts
-            cursor.execute('''
-                SELECT COALESCE(SUM(starting_balance), 0) as total
-                FROM accounts
-            ''')
-        starting_bankroll = cursor.fetchone()['total']
-        
-        # Build query for premiums based on date filters and account
-        query = '''
-            SELECT COALESCE(SUM(CASE 
-                WHEN trade_type = 'SELL' THEN credit_debit 
-                ELSE -credit_debit 
-            END), 0) as total_premiums
-            FROM trades
-            WHERE trade_status != 'roll'
-        '''
-        query_params = []
-        if account_id:
-            query += ' AND account_id = ?'
-            query_params.append(account_id)
-        
-        if start_date:
-            query += ' AND date_trade_open >= ?'
-            query_params.append(start_date)
-        if end_date:
-            query += ' AND date_trade_open <= ?'
-            query_params.append(end_date)
-        
-        cursor.execute(query, query_params)
-        total_premiums = cursor.fetchone()['total_premiums']
-        
-        # Total available bankroll = starting + premiums
-        total_bankroll = starting_bankroll + total_premiums
-        
-        # Get total used in open and assigned trades (margin capital) based on date filters
-        # Margin Capital = (Strike Price - Net Credit Per Share) * Shares
-        # Net Credit Per Share = Premium - Commission
-        # So: Margin Capital = (strike_price - (credit_debit - commission)) * (num_of_contracts * 100)
-        # Calculate for options trades (not BTO/STC stock trades) that are open or assigned
-        # Apply status filter if provided
-        base_where = 'trade_status != \'roll\' AND trade_type NOT IN (\'BTO\', \'STC\') AND (trade_type LIKE \'%ROCT PUT\' OR trade_type LIKE \'%ROCT CALL\' OR trade_type LIKE \'ROCT%\' OR trade_type LIKE \'BTO CALL\' OR trade_type LIKE \'STC CALL\')'
-        if account_id:
-            base_where += ' AND account_id = ?'
-        
-        # Determine status condition
-        if status_filter == 'open':
-            status_condition = 'trade_status = \'open\''
-        elif status_filter == 'completed':
-            status_condition = 'trade_status = \'closed\''
-        elif status_filter == 'assigned':
-            status_condition = 'trade_status = \'assigned\''
-        else:
-            # Default: include both open and assigned
-            status_condition = '(trade_status = \'open\' OR trade_status = \'assigned\')'
-        
-        query = f'''
-            SELECT COALESCE(SUM(margin_capital), 0) as used
-            FROM trades
-            WHERE {status_condition} AND {base_where}
-        '''
-        query_params = []
-        if account_id:
-            query_params.append(account_id)
-        
-        if start_date:
-            query += ' AND date_trade_open >= ?'
-            query_params.append(start_date)
-        if end_date:
-            query += ' AND date_trade_open <= ?'
-            query_params.append(end_date)
-        
-        cursor.execute(query, query_params)
-        used_in_trades = cursor.fetchone()['used']
-        
-        available_bankroll = total_bankroll - used_in_trades
-        
-        # Also get breakdown by trade type for the donut chart (apply same status filter)
-        breakdown_query = f'''
-            SELECT 
-                trade_type,
-                COUNT(*) as count,
-                SUM(margin_capital) as margin_capital
-            FROM trades
-            WHERE {status_condition} AND {base_where}
-        '''
-        breakdown_params = []
-        if account_id:
-            breakdown_params.append(account_id)
-        
-        if start_date:
-            breakdown_query += ' AND date_trade_open >= ?'
-            breakdown_params.append(start_date)
-        if end_date:
-            breakdown_query += ' AND date_trade_open <= ?'
-            breakdown_params.append(end_date)
+        account_id = get_account_id_arg()  # None if not provided (show all accounts)
+        status_filter = bankroll_status_filter(request.args.get('status_filter'))  # 'open', 'completed', etc.
         
-        breakdown_query += ' GROUP BY trade_type'
+        # Only the unfiltered (no date range) summaries are precomputed
+        precomputed = not start_date and not end_date
         
-        cursor.execute(breakdown_query, breakdown_params)
-        breakdown = cursor.fetchall()
-        
-        # Convert breakdown to dictionary
-        breakdown_dict = {}
-        for row in breakdown:
-            breakdown_dict[row['trade_type']] = {
-                'count': row['count'],
-                'margin_capital': float(row['margin_capital'] or 0)
-            }
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            if precomputed:
+                cursor.execute(_SQL_GET_CACHED_BANKROLL_SUMMARY, (account_id or 0, status_filter or ''))
+                cached = cursor.fetchone()
+                if cached:
+                    return revalidated(Response(cached['summary_json'], mimetype='application/json'))
+            
+            summary = compute_bankroll_summary(cursor, account_id, status_filter, start_date, end_date)
         
-        conn.close()
+        if precomputed:
+            schedule_bankroll_summary_refresh(account_id)
         
-        return jsonify({
-            'total_deposits': float(starting_bankroll),
-            'total_premiums': float(total_premiums),
-            'total_bankroll': float(total_bankroll),
-            'used_in_trades': float(used_in_trades),
-            'available': float(available_bankroll),
-            'breakdown': breakdown_dict
-        })
+        # The dashboard polls this; an unchanged summary is answered with 304 Not Modified
+        return revalidated(jsonify(summary))
     except Exception as e:
         print(f'Error in bankroll summary: {e}')
         import traceback
@@ -965,71 +1196,73 @@ def get_bankroll_summary():
 @app.route('/api/cash-flows', methods=['GET'])
 def get_cash_flows():
     try:
-        account_id = request.args.get('account_id', 9)
+        account_id = get_account_id_arg(default=9)
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            SELECT cf.*, a.account_name, 
-                   COALESCE(tk.ticker, '') as ticker,
-                   COALESCE(cf.description, '') as display_description
-            FROM cash_flows cf
-            LEFT JOIN accounts a ON cf.account_id = a.id
-            LEFT JOIN tickers tk ON cf.ticker_id = tk.id
-            WHERE cf.account_id = ?
-        '''
-        params = [account_id]
-        
-        if start_date:
-            query += ' AND cf.transaction_date >= ?'
-            params.append(start_date)
-        if end_date:
-            query += ' AND cf.transaction_date <= ?'
-            params.append(end_date)
-        
-        query += ' ORDER BY cf.transaction_date DESC, cf.created_at DESC'
-        
-        cursor.execute(query, params)
-        cash_flows = cursor.fetchall()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Every row belongs to the one account, so its name is looked up once by a
+            # non-correlated subquery instead of joining accounts per row
+            query = '''
+                SELECT cf.*, (SELECT account_name FROM accounts WHERE id = ?) as account_name, 
+                       COALESCE(tk.ticker, '') as ticker,
+                       COALESCE(cf.description, '') as display_description
+                FROM cash_flows cf
+                LEFT JOIN tickers tk ON cf.ticker_id = tk.id
+                WHERE cf.account_id = ?
+            '''
+            params = [account_id, account_id]
+            
+            if start_date:
+                query += ' AND cf.transaction_date >= ?'
+                params.append(start_date)
+            if end_date:
+                query += ' AND cf.transaction_date <= ?'
+                params.append(end_date)
+            
+            # Newest first; rows imported in the same second fall back to id (all three come from
+            # idx_cash_flows_account_date_created, so no sort is needed)
+            query += ' ORDER BY cf.transaction_date DESC, cf.created_at DESC, cf.id DESC'
+            
+            cursor.execute(query, params)
+            cash_flows = rows_to_dicts(cursor)
         
-        return jsonify([dict(cf) for cf in cash_flows])
+        return jsonify(cash_flows)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/commissions', methods=['GET'])
+@response_cache.cached('commissions', timeout=60, query_string=True)
 def get_commissions():
     try:
-        account_id = request.args.get('account_id')
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # If account_id is provided and not empty, filter by account
-        # Otherwise, return all commissions for all accounts
-        if account_id and account_id != '' and account_id != 'all':
-            cursor.execute('''
-                SELECT c.*, a.account_name
-                FROM commissions c
-                LEFT JOIN accounts a ON c.account_id = a.id
-                WHERE c.account_id = ?
-                ORDER BY a.account_name, c.effective_date DESC
-            ''', (account_id,))
-        else:
-            cursor.execute('''
-                SELECT c.*, a.account_name
-                FROM commissions c
-                LEFT JOIN accounts a ON c.account_id = a.id
-                ORDER BY a.account_name, c.effective_date DESC
-            ''')
+        account_id = get_account_id_arg()
         
-        commissions = cursor.fetchall()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # If account_id is provided (and not 'all'), filter by account
+            # Otherwise, return all commissions for all accounts
+            if account_id is not None:
+                cursor.execute('''
+                    SELECT c.*, a.account_name
+                    FROM commissions c
+                    LEFT JOIN accounts a ON c.account_id = a.id
+                    WHERE c.account_id = ?
+                    ORDER BY a.account_name, c.effective_date DESC
+                ''', (account_id,))
+            else:
+                cursor.execute('''
+                    SELECT c.*, a.account_name
+                    FROM commissions c
+                    LEFT JOIN accounts a ON c.account_id = a.id
+                    ORDER BY a.account_name, c.effective_date DESC
+                ''')
+            
+            commissions = rows_to_dicts(cursor)
         
-        return jsonify([dict(c) for c in commissions])
+        return jsonify(commissions)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1058,10 +1291,9 @@ def update_trades_for_commission(account_id, effective_date, commission_rate):
     effective_date <= date_trade_open), then recalculates commission_per_share, net_credit_per_share,
     risk_capital_per_share, margin_capital, and ARORC for affected trades.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with get_db() as conn:
+        cursor = conn.cursor()
+        
         # Find all trades that need to be updated (date_trade_open >= effective_date)
         cursor.execute('''
             SELECT id, credit_debit, strike_price, trade_type, num_of_contracts,
@@ -1149,8 +1381,6 @@ def update_trades_for_commission(account_id, effective_date, commission_rate):
         
         conn.commit()
         return updated_count
-    finally:
-        conn.close()
 
 @app.route('/api/commissions', methods=['POST'])
 def create_commission():
@@ -1161,15 +1391,15 @@ def create_commission():
         effective_date = data.get('effective_date')
         notes = data.get('notes', '')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO commissions 
-            (account_id, commission_rate, effective_date, notes)
-            VALUES (?, ?, ?, ?)
-        ''', (account_id, commission_rate, effective_date, notes))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            conn.execute('''
+                INSERT INTO commissions 
+                (account_id, commission_rate, effective_date, notes)
+                VALUES (?, ?, ?, ?)
+            ''', (account_id, commission_rate, effective_date, notes))
+            conn.commit()
+        
+        response_cache.delete('commissions')
         
         # Update all trades where date_trade_open >= effective_date
         updated_count = update_trades_for_commission(account_id, effective_date, commission_rate)
@@ -1190,26 +1420,26 @@ def update_commission(commission_id):
         effective_date = data.get('effective_date')
         notes = data.get('notes', '')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get the commission record to get account_id
-        cursor.execute('SELECT account_id FROM commissions WHERE id = ?', (commission_id,))
-        commission = cursor.fetchone()
-        if not commission:
-            conn.close()
-            return jsonify({'error': 'Commission not found'}), 404
-        
-        account_id = commission['account_id']
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Get the commission record to get account_id
+            cursor.execute('SELECT account_id FROM commissions WHERE id = ?', (commission_id,))
+            commission = cursor.fetchone()
+            if not commission:
+                return jsonify({'error': 'Commission not found'}), 404
+            
+            account_id = commission['account_id']
+            
+            # Update the commission record
+            cursor.execute('''
+                UPDATE commissions 
+                SET commission_rate = ?, effective_date = ?, notes = ?
+                WHERE id = ?
+            ''', (commission_rate, effective_date, notes, commission_id))
+            conn.commit()
         
-        # Update the commission record
-        cursor.execute('''
-            UPDATE commissions 
-            SET commission_rate = ?, effective_date = ?, notes = ?
-            WHERE id = ?
-        ''', (commission_rate, effective_date, notes, commission_id))
-        conn.commit()
-        conn.close()
+        response_cache.delete('commissions')
         
         # Update all trades where date_trade_open >= effective_date
         updated_count = update_trades_for_commission(account_id, effective_date, commission_rate)
@@ -1225,24 +1455,24 @@ def update_commission(commission_id):
 @app.route('/api/commissions/<int:commission_id>', methods=['DELETE'])
 def delete_commission(commission_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get the commission record before deleting it (need account_id and effective_date)
-        cursor.execute('SELECT account_id, effective_date FROM commissions WHERE id = ?', (commission_id,))
-        commission = cursor.fetchone()
-        
-        if not commission:
-            conn.close()
-            return jsonify({'error': 'Commission not found'}), 404
-        
-        account_id = commission['account_id']
-        effective_date = commission['effective_date']
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Get the commission record before deleting it (need account_id and effective_date)
+            cursor.execute('SELECT account_id, effective_date FROM commissions WHERE id = ?', (commission_id,))
+            commission = cursor.fetchone()
+            
+            if not commission:
+                return jsonify({'error': 'Commission not found'}), 404
+            
+            account_id = commission['account_id']
+            effective_date = commission['effective_date']
+            
+            # Delete the commission record
+            cursor.execute('DELETE FROM commissions WHERE id = ?', (commission_id,))
+            conn.commit()
         
-        # Delete the commission record
-        cursor.execute('DELETE FROM commissions WHERE id = ?', (commission_id,))
-        conn.commit()
-        conn.close()
+        response_cache.delete('commissions')
         
         # Update all trades where date_trade_open >= effective_date for this account
         # This will recalculate commission_per_share, net_credit_per_share, risk_capital_per_share,
@@ -1264,96 +1494,95 @@ def backfill_commissions():
     This updates all trades that have commission_per_share = 0 or need to be updated.
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all trades
-        cursor.execute('''
-            SELECT id, account_id, date_trade_open, credit_debit, strike_price, trade_type, 
-                   num_of_contracts, days_to_expiration, margin_percent
-            FROM trades
-            ORDER BY account_id, date_trade_open
-        ''')
-        
-        all_trades = cursor.fetchall()
-        updated_count = 0
-        
-        for trade in all_trades:
-            trade_id = trade['id']
-            account_id = trade['account_id']
-            date_trade_open = trade['date_trade_open']
-            credit_debit = trade['credit_debit']
-            strike_price = trade['strike_price']
-            trade_type = trade['trade_type']
-            num_of_contracts = trade['num_of_contracts']
-            days_to_expiration = trade['days_to_expiration']
-            margin_percent = trade['margin_percent'] if trade['margin_percent'] is not None else 100.0
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # Get the correct commission rate for this trade (the one with the latest effective_date <= date_trade_open)
+            # Get all trades
             cursor.execute('''
-                SELECT commission_rate
-                FROM commissions
-                WHERE account_id = ? AND effective_date <= ?
-                ORDER BY effective_date DESC
-                LIMIT 1
-            ''', (account_id, date_trade_open))
-            
-            commission_row = cursor.fetchone()
-            if commission_row:
-                # Use the commission rate that applies to this trade
-                trade_commission_rate = commission_row['commission_rate']
-            else:
-                # No commission found, use 0.0 as default
-                trade_commission_rate = 0.0
-            
-            # Recalculate net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
-            net_credit_per_share = round_standard((credit_debit - trade_commission_rate), 5)
-            
-            # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
-            risk_capital_per_share = None
-            if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
+                SELECT id, account_id, date_trade_open, credit_debit, strike_price, trade_type, 
+                       num_of_contracts, days_to_expiration, margin_percent
+                FROM trades
+                ORDER BY account_id, date_trade_open
+            ''')
             
-            # Recalculate margin_capital
-            # Use unrounded risk_capital_per_share for margin_capital calculation
-            margin_capital = None
-            if trade_type not in ['BTO', 'STC'] and strike_price > 0:
+            all_trades = cursor.fetchall()
+            updated_count = 0
+            
+            for trade in all_trades:
+                trade_id = trade['id']
+                account_id = trade['account_id']
+                date_trade_open = trade['date_trade_open']
+                credit_debit = trade['credit_debit']
+                strike_price = trade['strike_price']
+                trade_type = trade['trade_type']
+                num_of_contracts = trade['num_of_contracts']
+                days_to_expiration = trade['days_to_expiration']
+                margin_percent = trade['margin_percent'] if trade['margin_percent'] is not None else 100.0
+                
+                # Get the correct commission rate for this trade (the one with the latest effective_date <= date_trade_open)
+                cursor.execute('''
+                    SELECT commission_rate
+                    FROM commissions
+                    WHERE account_id = ? AND effective_date <= ?
+                    ORDER BY effective_date DESC
+                    LIMIT 1
+                ''', (account_id, date_trade_open))
+                
+                commission_row = cursor.fetchone()
+                if commission_row:
+                    # Use the commission rate that applies to this trade
+                    trade_commission_rate = commission_row['commission_rate']
+                else:
+                    # No commission found, use 0.0 as default
+                    trade_commission_rate = 0.0
+                
+                # Recalculate net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
+                net_credit_per_share = round_standard((credit_debit - trade_commission_rate), 5)
+                
+                # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
+                risk_capital_per_share = None
                 if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                    # Use unrounded risk_capital_per_share for margin_capital calculation
+                    risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
+                
+                # Recalculate margin_capital
+                # Use unrounded risk_capital_per_share for margin_capital calculation
+                margin_capital = None
+                if trade_type not in ['BTO', 'STC'] and strike_price > 0:
+                    if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                        # Use unrounded risk_capital_per_share for margin_capital calculation
+                        risk_capital_unrounded = strike_price - net_credit_per_share
+                        margin_capital = num_of_contracts * 100 * risk_capital_unrounded
+                    else:
+                        margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
+                
+                # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
+                # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+                # Use unrounded risk_capital_per_share for ARORC calculation
+                arorc = None
+                if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                    # Calculate unrounded risk_capital_per_share for ARORC calculation
                     risk_capital_unrounded = strike_price - net_credit_per_share
-                    margin_capital = num_of_contracts * 100 * risk_capital_unrounded
-                else:
-                    margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
-            
-            # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
-            # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-            # Use unrounded risk_capital_per_share for ARORC calculation
-            arorc = None
-            if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                # Calculate unrounded risk_capital_per_share for ARORC calculation
-                risk_capital_unrounded = strike_price - net_credit_per_share
-                if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
-                    # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                    denominator = risk_capital_unrounded * (margin_percent / 100.0)
-                    if denominator > 0:
-                        # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                        arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
-                        arorc = round_standard(arorc_decimal * 100.0, 1)
+                    if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                        # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
+                        denominator = risk_capital_unrounded * (margin_percent / 100.0)
+                        if denominator > 0:
+                            # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
+                            arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
+                            arorc = round_standard(arorc_decimal * 100.0, 1)
+                
+                # Update the trade
+                cursor.execute('''
+                    UPDATE trades 
+                    SET commission_per_share = ?,
+                        net_credit_per_share = ?,
+                        risk_capital_per_share = ?,
+                        margin_capital = ?,
+                        ARORC = ?
+                    WHERE id = ?
+                ''', (trade_commission_rate, net_credit_per_share, risk_capital_per_share, margin_capital, arorc, trade_id))
+                updated_count += 1
             
-            # Update the trade
-            cursor.execute('''
-                UPDATE trades 
-                SET commission_per_share = ?,
-                    net_credit_per_share = ?,
-                    risk_capital_per_share = ?,
-                    margin_capital = ?,
-                    ARORC = ?
-                WHERE id = ?
-            ''', (trade_commission_rate, net_credit_per_share, risk_capital_per_share, margin_capital, arorc, trade_id))
-            updated_count += 1
-        
-        conn.commit()
-        conn.close()
+            conn.commit()
         
         return jsonify({'success': True, 'trades_updated': updated_count})
     except Exception as e:
@@ -1377,15 +1606,14 @@ def create_cash_flow():
         # Round amount to 2 decimal places for NUMERIC(12,2)
         amount = round(float(amount), 2)
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO cash_flows 
-            (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id))
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO cash_flows 
+                (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id))
+            conn.commit()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -1396,12 +1624,7 @@ def get_trades():
     try:
         # Get account_id - handle both string and int conversion
         account_id_arg = request.args.get('account_id')
-        account_id = None
-        if account_id_arg:
-            try:
-                account_id = int(account_id_arg)
-            except (ValueError, TypeError):
-                account_id = None
+        account_id = get_account_id_arg()
         
         print(f'[DEBUG] Trades query - account_id_arg: {account_id_arg}, account_id: {account_id}')
         
@@ -1424,7 +1647,6 @@ def get_trades():
             print(f'[DEBUG] First trade - account_id: {sample_trade.get("account_id")}, account_name: {sample_trade.get("account_name")}, ticker: {sample_trade.get("ticker")}')
         
         # Add computed fields for backward compatibility and cumulative net credit
-        trades_list = []
         # Create a map of trade_id to trade for quick lookup
         trade_map = {trade['id']: trade for trade in trades}
 
@@ -1444,10 +1666,14 @@ def get_trades():
             else:
                 trade['net_credit_per_share'] = sto_price
         
+        cumulative_net_credit = {}
+        
         def calculate_cumulative_net_credit(trade_id):
-            """Calculate cumulative net credit for a trade by summing all ancestors"""
+            """Calculate cumulative net credit for a trade by summing all ancestors (memoized per request)"""
             if trade_id not in trade_map:
                 return 0
+            if trade_id in cumulative_net_credit:
+                return cumulative_net_credit[trade_id]
             
             trade = trade_map[trade_id]
             trade_parent_id = trade.get('trade_parent_id')
@@ -1462,21 +1688,24 @@ def get_trades():
             
             # If this trade has a parent, add parent's cumulative net credit
             if trade_parent_id:
-                parent_cumulative = calculate_cumulative_net_credit(trade_parent_id)
-                return parent_cumulative + net_credit_total
+                net_credit_total += calculate_cumulative_net_credit(trade_parent_id)
             
-            # Root trade: return its own net credit total
+            cumulative_net_credit[trade_id] = net_credit_total
             return net_credit_total
         
-        for trade_dict in trades:
-            trade_dict['shares'] = trade_dict['num_of_contracts'] * 100 if trade_dict['trade_type'] not in ['BTO', 'STC'] else trade_dict['num_of_contracts']
-            # Calculate cumulative net credit total
-            trade_dict['cumulative_net_credit_total'] = calculate_cumulative_net_credit(trade_dict['id'])
-            # Flag trades that were assigned (so UI can show ASSIGNED badge)
-            trade_dict['is_assigned'] = (trade_dict.get('trade_status') == 'assigned')
-            trades_list.append(trade_dict)
-        
-        return jsonify(trades_list)
+        def generate():
+            # Serialize one trade at a time instead of building the whole JSON document in memory.
+            # shares is a generated column on trades.
+            yield '['
+            for i, trade_dict in enumerate(trades):
+                # Calculate cumulative net credit total
+                trade_dict['cumulative_net_credit_total'] = calculate_cumulative_net_credit(trade_dict['id'])
+                # Flag trades that were assigned (so UI can show ASSIGNED badge)
+                trade_dict['is_assigned'] = (trade_dict.get('trade_status') == 'assigned')
+                yield (',' if i else '') + app.json.dumps(trade_dict)
+            yield ']\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
     except Exception as e:
         print(f'Error fetching trades: {e}')
         return jsonify({'error': 'Failed to fetch trades'}), 500
@@ -1491,488 +1720,708 @@ def get_trade(trade_id):
         if not trade_dict:
             return jsonify({'error': 'Trade not found'}), 404
         
-        # Add computed fields for backward compatibility
-        trade_dict['shares'] = trade_dict['num_of_contracts'] * 100 if trade_dict['trade_type'] not in ['BTO', 'STC'] else trade_dict['num_of_contracts']
-        
+        # shares is a generated column on trades (migrations/029_add_shares_to_trades.sql)
         return jsonify(trade_dict)
     except Exception as e:
         print(f'Error fetching trade {trade_id}: {e}')
         return jsonify({'error': 'Failed to fetch trade'}), 500
 
+# Base trade types stored with the ticker in front (e.g. "AAPL ROCT PUT")
+TICKER_PREFIXED_TRADE_TYPES = frozenset({'ROCT PUT', 'ROCT CALL', 'ROP', 'ROC'})
+# Base trade types that get risk_capital_per_share and ARORC (cash-secured puts)
+PUT_PREMIUM_TRADE_TYPES = frozenset({'ROCT PUT', 'RULE ONE PUT'})
+
+# Statements used when adding trades, defined once so every call submits the same SQL
+# text and reuses the connection's prepared statement (see db_helper.STATEMENT_CACHE_SIZE)
+TRADE_INSERT_COLUMNS = (
+    'account_id', 'ticker_id', 'ticker', 'date_trade_open', 'expiration_date', 'num_of_contracts', 'num_of_shares',
+    'credit_debit', 'total_premium', 'days_to_expiration', 'current_price', 'strike_price', 'long_strike',
+    'trade_status', 'trade_type', 'price_per_share', 'total_amount', 'commission_per_share', 'margin_capital',
+    'net_credit_per_share', 'risk_capital_per_share', 'margin_percent', 'ARORC', 'trade_type_id',
+)
+_SQL_INSERT_TRADE = f'''
+    INSERT INTO trades ({', '.join(TRADE_INSERT_COLUMNS)})
+    VALUES ({', '.join('?' * len(TRADE_INSERT_COLUMNS))})
+'''
+_SQL_INSERT_TRADE_CASH_FLOW = '''
+    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_COST_BASIS = '''
+    INSERT INTO cost_basis
+    (account_id, ticker_id, trade_id, cash_flow_id, transaction_date, description, shares, cost_per_share,
+     total_amount, running_basis, running_shares, basis_per_share)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_LINK_COST_BASIS_CASH_FLOW = 'UPDATE cost_basis SET cash_flow_id = ? WHERE id = ?'
+_SQL_GET_TRADE_TYPE_BY_NAME = 'SELECT id, requires_contracts FROM trade_types WHERE type_name = ?'
+
+# trade_types rows by type_name. The table is only written by init_db (which clears this),
+# so a name resolves to the same trade_type_id for the life of the process.
+_trade_types_by_name = {}
+
+def get_trade_type(cursor, type_name):
+    """{'id', 'requires_contracts'} for a trade_types name, or None if there is no such type"""
+    trade_type = _trade_types_by_name.get(type_name)
+    if trade_type is None:
+        cursor.execute(_SQL_GET_TRADE_TYPE_BY_NAME, (type_name,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        trade_type = _trade_types_by_name[type_name] = {'id': row['id'], 'requires_contracts': row['requires_contracts']}
+    return trade_type
+
+# Bulk inserts: new trades are the rows above the pre-insert maximum id
+_SQL_MAX_TRADE_ID = 'SELECT IFNULL(MAX(id), 0) as max_id FROM trades'
+_SQL_TRADE_IDS_AFTER = 'SELECT id FROM trades WHERE id > ? ORDER BY id'
+# Earliest new cost_basis entry per (account, ticker), where running totals are recomputed from
+_SQL_FIRST_NEW_COST_BASIS_ENTRIES = '''
+    SELECT account_id, ticker_id, id FROM (
+        SELECT account_id, ticker_id, id,
+               ROW_NUMBER() OVER (PARTITION BY account_id, ticker_id ORDER BY transaction_date, rowid) as position
+        FROM cost_basis
+        WHERE trade_id > ?
+    )
+    WHERE position = 1
+'''
+_SQL_LINK_NEW_COST_BASIS_CASH_FLOWS = '''
+    UPDATE cost_basis SET cash_flow_id = (
+        SELECT cf.id FROM cash_flows cf WHERE cf.trade_id = cost_basis.trade_id
+    )
+    WHERE trade_id > ? AND cash_flow_id IS NULL
+'''
+# Latest cost basis entry (by transaction_date, then insertion order) per (account, ticker)
+# for the given tickers; {placeholders} is filled in with one ? per ticker id
+_SQL_LATEST_COST_BASIS_TOTALS = '''
+    SELECT account_id, ticker_id, transaction_date, running_basis, running_shares FROM (
+        SELECT account_id, ticker_id, transaction_date, running_basis, running_shares,
+               ROW_NUMBER() OVER (PARTITION BY account_id, ticker_id ORDER BY transaction_date DESC, rowid DESC) as position
+        FROM cost_basis
+        WHERE ticker_id IN ({placeholders})
+    )
+    WHERE position = 1
+'''
+
+def latest_cost_basis_totals(cursor, ticker_ids):
+    """{(account_id, ticker_id): (transaction_date, running_basis, running_shares)} of the latest entry for each pair"""
+    if not ticker_ids:
+        return {}
+    ticker_ids = list(ticker_ids)
+    cursor.execute(_SQL_LATEST_COST_BASIS_TOTALS.format(placeholders=','.join(['?'] * len(ticker_ids))), ticker_ids)
+    return {(row['account_id'], row['ticker_id']): (row['transaction_date'], row['running_basis'] or 0, row['running_shares'] or 0)
+            for row in cursor.fetchall()}
+
+_SQL_COMMISSION_SCHEDULE = '''
+    SELECT effective_date, commission_rate
+    FROM commissions
+    WHERE account_id = ?
+    ORDER BY effective_date
+'''
+
+def load_commission_schedule(cursor, account_id):
+    """(effective_dates, commission_rates) for an account, oldest first, for commission_rate_on()"""
+    cursor.execute(_SQL_COMMISSION_SCHEDULE, (account_id,))
+    rows = cursor.fetchall()
+    return [row['effective_date'] for row in rows], [float(row['commission_rate']) for row in rows]
+
+def commission_rate_on(schedule, date_trade_open):
+    """
+    Commission rate in effect on date_trade_open: the one with the latest effective_date
+    that is <= the trade date, or 0.0 if none (same rule as DatabaseHelper.get_commission_rate).
+    """
+    if not isinstance(date_trade_open, str) or len(date_trade_open) != 10:
+        return 0.0
+    effective_dates, commission_rates = schedule
+    position = bisect.bisect_right(effective_dates, date_trade_open)
+    return commission_rates[position - 1] if position else 0.0
+
+def prepare_trade(cursor, data, commission_schedules=None):
+    """
+    Build the trades row for a POST /api/trades payload.
+    Returns a dict with every TRADE_INSERT_COLUMNS value plus base_trade_type and
+    requires_contracts (used for the cost basis and cash flow entries).
+    Gets or creates the ticker; raises ValueError for an unknown trade type.
+    commission_schedules caches load_commission_schedule() per account_id, so a batch of
+    trades reads each account's commissions once.
+    """
+    ticker = data['ticker'].upper()
+    date_trade_open = data['tradeDate']
+    expiration_date = data['expirationDate']
+    num_of_contracts = int(data['num_of_contracts'])
+    premium = float(data['premium'])
+    current_price = float(data['currentPrice'])
+    strike_price = round_standard(float(data.get('strikePrice', 0)), 2)
+    long_strike_raw = data.get('longStrike')
+    long_strike = round_standard(float(long_strike_raw), 2) if long_strike_raw else None
+    trade_type = data.get('tradeType', 'ROCT PUT')
+    account_id = data.get('accountId', 9)  # Default to Rule One
+
+    # Ensure account_id is an integer
+    account_id = int(account_id)
+
+    logger.debug('add_trade - Parsed values: ticker=%s, date_trade_open=%s, expiration_date=%s, num_of_contracts=%s, premium=%s, current_price=%s, strike_price=%s, trade_type=%s, account_id=%s (type: %s)', ticker, date_trade_open, expiration_date, num_of_contracts, premium, current_price, strike_price, trade_type, account_id, type(account_id))
+
+    # Store the base trade type for lookup (before modifying)
+    base_trade_type = trade_type
+
+    # Modify trade type to include ticker for options trades
+    if trade_type in TICKER_PREFIXED_TRADE_TYPES:
+        trade_type = f"{ticker} {trade_type}"
+    is_put_premium = base_trade_type in PUT_PREMIUM_TRADE_TYPES
+
+    # Get trade_type_id (and requires_contracts for the cash flow entry) from trade_types table
+    trade_type_row = get_trade_type(cursor, base_trade_type)
+
+    # Validate that trade_type_id exists
+    if trade_type_row is None:
+        raise ValueError(f'Invalid trade type: "{base_trade_type}" does not exist in trade_types table')
+
+    # Get or create symbol in one statement, inside the same transaction as the trade
+    cursor.execute(UPSERT_TICKER_SQL, {'ticker': ticker, 'company_name': ticker})
+    ticker_id = cursor.fetchone()['id']
+
+    # Calculate days to expiration
+    days_to_expiration = days_between(date_trade_open, expiration_date)
+
+    # Calculate total premium based on trade type
+    # Also calculate num_of_shares
+    if trade_type in ['BTO', 'STC']:
+        total_premium = premium * num_of_contracts
+        price_per_share = premium
+        total_amount = total_premium
+        # For stock trades, num_of_shares should be provided in data, default to num_of_contracts if not provided
+        num_of_shares = data.get('num_of_shares', num_of_contracts)
+    else:
+        total_premium = premium * num_of_contracts * 100
+        price_per_share = 0
+        total_amount = 0
+        # For options trades, calculate num_of_shares = num_of_contracts * 100
+        num_of_shares = num_of_contracts * 100
+
+    # Get commission rate in effect at trade date
+    if commission_schedules is None:
+        commission_schedules = {}
+    if account_id not in commission_schedules:
+        commission_schedules[account_id] = load_commission_schedule(cursor, account_id)
+    commission = commission_rate_on(commission_schedules[account_id], date_trade_open)
+    logger.debug('Commission calculated for account_id=%s, date_trade_open=%s: %s', account_id, date_trade_open, commission)
+
+    # Calculate net_credit_per_share = credit_debit - commission_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
+    net_credit_per_share = round_standard((premium - commission), 5)
+
+    # Calculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
+    # risk_capital_per_share = strike_price - net_credit_per_share (only for ROCT PUT and RULE ONE PUT)
+    risk_capital_per_share = None
+    if is_put_premium:
+        risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
+
+    # Calculate margin_capital for options trades
+    # Use unrounded risk_capital_per_share for margin_capital calculation
+    margin_capital = None
+    if trade_type not in ['BTO', 'STC'] and strike_price > 0:
+        # For ROCT PUT and RULE ONE PUT trades, use unrounded risk_capital_per_share
+        if is_put_premium:
+            # Use unrounded risk_capital_per_share for margin_capital calculation
+            risk_capital_unrounded = strike_price - net_credit_per_share
+            margin_capital = num_of_contracts * 100 * risk_capital_unrounded
+        else:
+            # For other options trades, use the standard calculation
+            margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
+
+    # Set default margin_percent to 100%
+    margin_percent = 100.0
+
+    # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
+    # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * (margin_percent / 100)))
+    # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+    # Use unrounded risk_capital_per_share for ARORC calculation
+    arorc = None
+    if is_put_premium:
+        # Calculate unrounded risk_capital_per_share for ARORC calculation
+        risk_capital_unrounded = strike_price - net_credit_per_share
+        if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+            # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
+            denominator = risk_capital_unrounded * (margin_percent / 100.0)
+            if denominator > 0:
+                # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
+                arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
+                arorc = round_standard(arorc_decimal * 100.0, 1)
+
+    return {
+        'account_id': account_id,
+        'ticker_id': ticker_id,
+        'ticker': ticker,
+        'date_trade_open': date_trade_open,
+        'expiration_date': expiration_date,
+        'num_of_contracts': num_of_contracts,
+        'num_of_shares': num_of_shares,
+        'credit_debit': premium,
+        'total_premium': total_premium,
+        'days_to_expiration': days_to_expiration,
+        'current_price': current_price,
+        'strike_price': strike_price,
+        'long_strike': long_strike,
+        'trade_status': 'open',
+        'trade_type': trade_type,
+        'price_per_share': price_per_share,
+        'total_amount': total_amount,
+        'commission_per_share': commission,
+        'margin_capital': margin_capital,
+        'net_credit_per_share': net_credit_per_share,
+        'risk_capital_per_share': risk_capital_per_share,
+        'margin_percent': margin_percent,
+        'ARORC': arorc,
+        'trade_type_id': trade_type_row['id'],
+        'base_trade_type': base_trade_type,
+        'requires_contracts': trade_type_row['requires_contracts'],
+    }
+
+def trade_insert_params(trade):
+    """Positional parameters for _SQL_INSERT_TRADE from a prepare_trade() dict"""
+    return tuple(trade[column] for column in TRADE_INSERT_COLUMNS)
+
+def trade_cash_flow_values(trade):
+    """(transaction_type, amount, description) of the cash flow entry for a new trade, based on requires_contracts"""
+    base_trade_type = trade['base_trade_type']
+    if trade['requires_contracts'] == 1:
+        # Options trade: determine if PUT or CALL (use base_trade_type for checking)
+        if 'PUT' in base_trade_type or 'ROP' in base_trade_type:
+            transaction_type = 'SELL PUT'
+        elif 'CALL' in base_trade_type or 'ROC' in base_trade_type:
+            transaction_type = 'SELL CALL'
+        else:
+            # Default to PREMIUM_CREDIT if can't determine
+            transaction_type = 'PREMIUM_CREDIT'
+        return (transaction_type, round(trade['credit_debit'] * trade['num_of_contracts'] * 100, 2),
+                f"{trade['trade_type']} premium received")
+
+    # For BTO/STC or other trade types that don't require contracts
+    # These are stock trades, use PREMIUM_CREDIT or PREMIUM_DEBIT
+    if trade['trade_type'] == 'BTO':
+        transaction_type = 'PREMIUM_DEBIT'  # Buying stock
+    else:
+        transaction_type = 'PREMIUM_CREDIT'  # Selling stock
+    return (transaction_type, round(trade['total_premium'], 2),
+            f"{trade['trade_type']} {trade['num_of_contracts']} shares")
+
 @app.route('/api/trades', methods=['POST'])
 def add_trade():
-    conn = None  # Initialize conn outside try block so it's accessible in except
     try:
         data = request.get_json()
-        print(f'[DEBUG] add_trade - Received data: {data}', flush=True)
-        
-        ticker = data['ticker'].upper()
-        date_trade_open = data['tradeDate']
-        expiration_date = data['expirationDate']
-        num_of_contracts = int(data['num_of_contracts'])
-        premium = float(data['premium'])
-        current_price = float(data['currentPrice'])
-        strike_price = round_standard(float(data.get('strikePrice', 0)), 2)
-        long_strike_raw = data.get('longStrike')
-        long_strike = round_standard(float(long_strike_raw), 2) if long_strike_raw else None
-        trade_type = data.get('tradeType', 'ROCT PUT')
-        account_id = data.get('accountId', 9)  # Default to Rule One
-        
-        # Ensure account_id is an integer
-        account_id = int(account_id)
-        
-        print(f'[DEBUG] add_trade - Parsed values: ticker={ticker}, date_trade_open={date_trade_open}, expiration_date={expiration_date}, num_of_contracts={num_of_contracts}, premium={premium}, current_price={current_price}, strike_price={strike_price}, trade_type={trade_type}, account_id={account_id} (type: {type(account_id)})', flush=True)
-        
-        # Store the base trade type for lookup (before modifying)
-        base_trade_type = trade_type
-        
-        # Modify trade type to include ticker for options trades
-        if trade_type in ['ROCT PUT', 'ROCT CALL', 'ROP', 'ROC']:
-            trade_type = f"{ticker} {trade_type}"
-        
-        # Get or create symbol (using new helper)
+        logger.debug('add_trade - Received data: %s', data)
+
         db = get_db_helper()
-        ticker_id = db.create_or_get_ticker(ticker, ticker)
-        
-        # Get trade_type_id from trade_types table
-        # Insert trade (using raw connection for complex transaction)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (base_trade_type,))
-        trade_type_row = cursor.fetchone()
-        trade_type_id = trade_type_row['id'] if trade_type_row else None
-        
-        # Validate that trade_type_id exists
-        if trade_type_id is None:
-            conn.close()
-            return jsonify({'error': f'Invalid trade type: "{base_trade_type}" does not exist in trade_types table'}), 400
-        
-        # Calculate days to expiration
-        date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d').date()
-        expiration = datetime.strptime(expiration_date, '%Y-%m-%d').date()
-        days_to_expiration = (expiration - date_trade_open_obj).days
-        
-        # Calculate total premium based on trade type
-        # Also calculate num_of_shares
-        if trade_type in ['BTO', 'STC']:
-            total_premium = premium * num_of_contracts
-            price_per_share = premium
-            total_amount = total_premium
-            # For stock trades, num_of_shares should be provided in data, default to num_of_contracts if not provided
-            num_of_shares = data.get('num_of_shares', num_of_contracts)
-        else:
-            total_premium = premium * num_of_contracts * 100
-            price_per_share = 0
-            total_amount = 0
-            # For options trades, calculate num_of_shares = num_of_contracts * 100
-            num_of_shares = num_of_contracts * 100
-        
-        # Get commission rate in effect at trade date (using new helper)
-        print(f'[DEBUG] Before get_commission_rate: account_id={account_id} (type: {type(account_id)}), date_trade_open={date_trade_open} (type: {type(date_trade_open)})', flush=True)
-        commission = db.get_commission_rate(account_id, date_trade_open)
-        print(f'[DEBUG] Commission calculated for account_id={account_id}, date_trade_open={date_trade_open}: {commission}', flush=True)
-        
-        # Calculate net_credit_per_share = credit_debit - commission_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
-        net_credit_per_share = round_standard((premium - commission), 5)
-        
-        # Calculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
-        # risk_capital_per_share = strike_price - net_credit_per_share (only for ROCT PUT and RULE ONE PUT)
-        risk_capital_per_share = None
-        if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-            risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
-        
-        # Calculate margin_capital for options trades
-        # Use unrounded risk_capital_per_share for margin_capital calculation
-        margin_capital = None
-        if trade_type not in ['BTO', 'STC'] and strike_price > 0:
-            # For ROCT PUT and RULE ONE PUT trades, use unrounded risk_capital_per_share
-            if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                # Use unrounded risk_capital_per_share for margin_capital calculation
-                risk_capital_unrounded = strike_price - net_credit_per_share
-                margin_capital = num_of_contracts * 100 * risk_capital_unrounded
-            else:
-                # For other options trades, use the standard calculation
-                margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
-        
-        # Set default margin_percent to 100%
-        margin_percent = 100.0
-        
-        # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
-        # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * (margin_percent / 100)))
-        # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-        # Use unrounded risk_capital_per_share for ARORC calculation
-        arorc = None
-        if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-            # Calculate unrounded risk_capital_per_share for ARORC calculation
-            risk_capital_unrounded = strike_price - net_credit_per_share
-            if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
-                # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                denominator = risk_capital_unrounded * (margin_percent / 100.0)
-                if denominator > 0:
-                    # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                    arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
-                    arorc = round_standard(arorc_decimal * 100.0, 1)
-        
-        # Insert trade (using raw connection for complex transaction)
-        cursor.execute('''
-            INSERT INTO trades 
-            (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares, credit_debit, total_premium, 
-             days_to_expiration, current_price, strike_price, long_strike, trade_status, trade_type, 
-             price_per_share, total_amount, commission_per_share, margin_capital, net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares, premium, total_premium,
-              days_to_expiration, current_price, strike_price, long_strike, 'open', trade_type,
-              price_per_share, total_amount, commission, margin_capital, net_credit_per_share, risk_capital_per_share, margin_percent, arorc, trade_type_id))
-        
-        trade_id = cursor.lastrowid
-        print(f'[DEBUG] Trade created with trade_id={trade_id}, commission_per_share={commission}', flush=True)
-        
-        # Create cost basis entry for ALL trades
-        print(f'[DEBUG] Creating cost_basis entry: base_trade_type={base_trade_type}, trade_type={trade_type}, account_id={account_id}', flush=True)
-        try:
-            if base_trade_type in ['BTO', 'STC']:
-                print(f'[DEBUG] Creating cost_basis entry for BTO/STC trade', flush=True)
-                create_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, base_trade_type, num_of_contracts, premium, total_premium)
-            else:
-                # Create cost basis entry for options trades (ROCT PUT, ROCT CALL, etc.)
-                print(f'[DEBUG] Creating cost_basis entry for options trade: account_id={account_id}, ticker_id={ticker_id}, trade_id={trade_id}', flush=True)
-                create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, num_of_contracts, premium, strike_price, expiration_date)
-                print(f'[DEBUG] Cost_basis entry created successfully for trade_id={trade_id}', flush=True)
-        except Exception as cost_basis_error:
-            import traceback
-            error_detail = traceback.format_exc()
-            print(f'[ERROR] Failed to create cost_basis entry: {cost_basis_error}', flush=True)
-            print(f'[ERROR] Traceback: {error_detail}', flush=True)
-            # Re-raise so the transaction is rolled back
-            raise
-        
-        # Create cash flow entry for EVERY trade based on requires_contracts
-        cash_flow_id = None
-        
-        # Check if this trade type requires contracts (use base_trade_type, not the full trade_type with ticker)
-        cursor.execute('SELECT requires_contracts FROM trade_types WHERE type_name = ?', (base_trade_type,))
-        trade_type_row = cursor.fetchone()
-        requires_contracts = trade_type_row['requires_contracts'] if trade_type_row else 0
-        print(f'[DEBUG] Trade type lookup: base_trade_type={base_trade_type}, requires_contracts={requires_contracts}', flush=True)
-        
-        if requires_contracts == 1:
-            # Options trade: determine if PUT or CALL (use base_trade_type for checking)
-            if 'PUT' in base_trade_type or 'ROP' in base_trade_type:
-                transaction_type = 'SELL PUT'
-            elif 'CALL' in base_trade_type or 'ROC' in base_trade_type:
-                transaction_type = 'SELL CALL'
-            else:
-                # Default to PREMIUM_CREDIT if can't determine
-                transaction_type = 'PREMIUM_CREDIT'
-            cash_flow_amount = round(premium * num_of_contracts * 100, 2)
-            print(f'[DEBUG] Creating cash_flow entry: account_id={account_id}, date_trade_open={date_trade_open}, transaction_type={transaction_type}, amount={cash_flow_amount}', flush=True)
+
+        # Insert trade (using raw connection for complex transaction). BEGIN IMMEDIATE takes
+        # the write lock up front so the trade, cost basis and cash flow writes below all
+        # run in one transaction with a single commit.
+        with get_db() as conn:
+            cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
+
             try:
-                cursor.execute('''
-                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (account_id, date_trade_open, transaction_type, cash_flow_amount, 
-                      f"{trade_type} premium received", trade_id, ticker_id))
+                trade = prepare_trade(cursor, data)
+            except ValueError as e:
+                conn.rollback()
+                return jsonify({'error': str(e)}), 400
+
+            account_id = trade['account_id']
+            ticker_id = trade['ticker_id']
+            date_trade_open = trade['date_trade_open']
+            base_trade_type = trade['base_trade_type']
+            trade_type = trade['trade_type']
+
+            cursor.execute(_SQL_INSERT_TRADE, trade_insert_params(trade))
+
+            trade_id = cursor.lastrowid
+            logger.debug('Trade created with trade_id=%s, commission_per_share=%s', trade_id, trade['commission_per_share'])
+
+            # Create cost basis entry for ALL trades
+            logger.debug('Creating cost_basis entry: base_trade_type=%s, trade_type=%s, account_id=%s', base_trade_type, trade_type, account_id)
+            try:
+                if base_trade_type in ['BTO', 'STC']:
+                    logger.debug('Creating cost_basis entry for BTO/STC trade')
+                    cost_basis_id = create_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, base_trade_type,
+                                                            trade['num_of_contracts'], trade['credit_debit'], trade['total_premium'],
+                                                            ticker=trade['ticker'])
+                else:
+                    # Create cost basis entry for options trades (ROCT PUT, ROCT CALL, etc.)
+                    logger.debug('Creating cost_basis entry for options trade: account_id=%s, ticker_id=%s, trade_id=%s', account_id, ticker_id, trade_id)
+                    cost_basis_id = create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type,
+                                                                    trade['num_of_contracts'], trade['credit_debit'], trade['strike_price'], trade['expiration_date'],
+                                                                    ticker=trade['ticker'])
+                    logger.debug('Cost_basis entry created successfully for trade_id=%s', trade_id)
+            except Exception as cost_basis_error:
+                logger.exception('Failed to create cost_basis entry: %s', cost_basis_error)
+                # Re-raise so the transaction is rolled back
+                raise
+
+            # Create cash flow entry for EVERY trade based on requires_contracts
+            transaction_type, cash_flow_amount, cash_flow_description = trade_cash_flow_values(trade)
+            logger.debug('Creating cash_flow entry: account_id=%s, date_trade_open=%s, transaction_type=%s, amount=%s', account_id, date_trade_open, transaction_type, cash_flow_amount)
+            try:
+                cursor.execute(_SQL_INSERT_TRADE_CASH_FLOW, (account_id, date_trade_open, transaction_type, cash_flow_amount,
+                                                             cash_flow_description, trade_id, ticker_id))
                 cash_flow_id = cursor.lastrowid
-                print(f'[DEBUG] Cash_flow entry created with id={cash_flow_id}', flush=True)
+                logger.debug('Cash_flow entry created with id=%s', cash_flow_id)
             except Exception as cash_flow_error:
-                import traceback
-                error_detail = traceback.format_exc()
-                print(f'[ERROR] Failed to create cash_flow entry: {cash_flow_error}', flush=True)
-                print(f'[ERROR] Traceback: {error_detail}', flush=True)
+                logger.exception('Failed to create cash_flow entry: %s', cash_flow_error)
                 # Re-raise so the transaction is rolled back
                 raise
-        else:
-            # For BTO/STC or other trade types that don't require contracts
-            # These are stock trades, use PREMIUM_CREDIT or PREMIUM_DEBIT
-            if trade_type == 'BTO':
-                transaction_type = 'PREMIUM_DEBIT'  # Buying stock
-            else:
-                transaction_type = 'PREMIUM_CREDIT'  # Selling stock
-            cursor.execute('''
-                INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (account_id, date_trade_open, transaction_type, round(total_premium, 2), 
-                  f"{trade_type} {num_of_contracts} shares", trade_id, ticker_id))
-            cash_flow_id = cursor.lastrowid
-        
-        # Update cost_basis entry to link to cash_flow if cash flow was created
-        if cash_flow_id:
-            cursor.execute('''
-                UPDATE cost_basis SET cash_flow_id = ? 
-                WHERE trade_id = ? AND ticker_id = ? AND transaction_date = ? AND cash_flow_id IS NULL
-            ''', (cash_flow_id, trade_id, ticker_id, date_trade_open))
-            rows_updated = cursor.rowcount
-            if rows_updated > 0:
-                print(f'[DEBUG] Updated cost_basis entry to link cash_flow_id={cash_flow_id} for trade_id={trade_id} (rows updated: {rows_updated})', flush=True)
-            else:
-                print(f'[WARNING] UPDATE cost_basis to link cash_flow_id={cash_flow_id} for trade_id={trade_id} did not update any rows. Checking if cost_basis entry exists...', flush=True)
-                # Check if cost_basis entry exists but already has a cash_flow_id
-                cursor.execute('SELECT id, cash_flow_id FROM cost_basis WHERE trade_id = ? AND ticker_id = ? AND transaction_date = ?', (trade_id, ticker_id, date_trade_open))
-                existing_entry = cursor.fetchone()
-                if existing_entry:
-                    print(f'[DEBUG] Found cost_basis entry id={existing_entry["id"]}, cash_flow_id={existing_entry["cash_flow_id"]}', flush=True)
-                else:
-                    print(f'[ERROR] No cost_basis entry found for trade_id={trade_id}, ticker_id={ticker_id}, transaction_date={date_trade_open}', flush=True)
-        
-        # Verify cost_basis entry was created
-        cursor.execute('SELECT id FROM cost_basis WHERE trade_id = ?', (trade_id,))
-        cost_basis_check = cursor.fetchone()
-        if cost_basis_check:
-            print(f'[DEBUG] Verified cost_basis entry exists: id={cost_basis_check["id"]}', flush=True)
-        else:
-            print(f'[ERROR] cost_basis entry NOT found for trade_id={trade_id}', flush=True)
-        
-        # Verify cash_flow entry was created
-        if cash_flow_id:
-            cursor.execute('SELECT id FROM cash_flows WHERE id = ?', (cash_flow_id,))
-            cash_flow_check = cursor.fetchone()
-            if cash_flow_check:
-                print(f'[DEBUG] Verified cash_flow entry exists: id={cash_flow_check["id"]}', flush=True)
-            else:
-                print(f'[ERROR] cash_flow entry NOT found for cash_flow_id={cash_flow_id}', flush=True)
-        
-        conn.commit()
-        print(f'[DEBUG] Transaction committed successfully', flush=True)
-        conn.close()
-        
+
+            # Link the cost_basis entry created above to the cash_flow, by primary key
+            cursor.execute(_SQL_LINK_COST_BASIS_CASH_FLOW, (cash_flow_id, cost_basis_id))
+            logger.debug('Linked cost_basis entry id=%s to cash_flow_id=%s for trade_id=%s', cost_basis_id, cash_flow_id, trade_id)
+
+            conn.commit()
+            logger.debug('Transaction committed successfully')
+
         # Invalidate metrics cache for this account (cache will refresh on next read)
         db.invalidate_metrics_cache(account_id=account_id)
-        
-        print(f'[DEBUG] Trade creation completed successfully: trade_id={trade_id}, cost_basis created, cash_flow_id={cash_flow_id}', flush=True)
+        # The insert trigger dropped this account's precomputed bankroll summary; rebuild it off-thread
+        schedule_bankroll_summary_refresh(account_id)
+
+        logger.debug('Trade creation completed successfully: trade_id=%s, cost_basis created, cash_flow_id=%s', trade_id, cash_flow_id)
         return jsonify({'success': True, 'trade_id': trade_id})
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f'[ERROR] Error adding trade: {e}', flush=True)
-        print(f'[ERROR] Traceback: {error_detail}', flush=True)
-        # Rollback transaction on error if connection exists
-        try:
-            if conn is not None:
-                conn.rollback()
-                conn.close()
-                print(f'[DEBUG] Transaction rolled back due to error', flush=True)
-        except Exception as rollback_error:
-            print(f'[ERROR] Error during rollback: {rollback_error}', flush=True)
+        logger.exception('Error adding trade: %s', e)
+        # The pooled connection rolls back any open transaction when the with-block exits
         return jsonify({'success': False, 'error': f'Failed to add trade: {str(e)}'}), 500
 
-def create_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, num_of_contracts, price_per_share, total_amount):
-    """Create cost basis entry for BTO/STC trades"""
-    description = f"{trade_type} {num_of_contracts} {cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,)).fetchone()['ticker']}"
-    
-    # Get current running totals for this account and ticker
-    # Order by transaction_date DESC to get the most recent entry for THIS specific ticker
-    cursor.execute('''
-        SELECT running_basis, running_shares 
-        FROM cost_basis 
-        WHERE ticker_id = ? AND account_id = ?
-        ORDER BY transaction_date DESC, rowid DESC
+@app.route('/api/trades/bulk', methods=['POST'])
+def add_trades_bulk():
+    """
+    Add a JSON array of trades (each in the POST /api/trades format) in one transaction.
+    Rows are prepared in Python and written with one executemany per table (trades,
+    cost_basis, cash_flows). Cost basis running totals are computed in Python, continuing
+    from each (account, ticker)'s latest entry. Only pairs where a new entry is dated
+    before an existing one get a window-function UPDATE afterwards (see
+    recalculate_running_totals), since the later entries' totals change as well.
+    """
+    try:
+        items = request.get_json()
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'Expected a non-empty JSON array of trades'}), 400
+
+        db = get_db_helper()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
+
+            trades = []
+            commission_schedules = {}
+            for index, item in enumerate(items):
+                try:
+                    trades.append(prepare_trade(cursor, item, commission_schedules))
+                except (KeyError, TypeError, ValueError) as e:
+                    conn.rollback()
+                    return jsonify({'error': f'Trade {index}: {e}'}), 400
+
+            # Running totals depend on earlier entries, so write in trade-date order
+            # (stable, so same-day trades keep their request order)
+            order = sorted(range(len(trades)), key=lambda i: trades[i]['date_trade_open'])
+            trades = [trades[i] for i in order]
+
+            # AUTOINCREMENT ids only grow and BEGIN IMMEDIATE holds the write lock, so the new
+            # trades are exactly the rows above the current maximum id, in insertion order
+            cursor.execute(_SQL_MAX_TRADE_ID)
+            last_trade_id = cursor.fetchone()['max_id']
+            cursor.executemany(_SQL_INSERT_TRADE, [trade_insert_params(trade) for trade in trades])
+            cursor.execute(_SQL_TRADE_IDS_AFTER, (last_trade_id,))
+            trade_ids = [row['id'] for row in cursor.fetchall()]
+
+            # Running totals carry on from each pair's latest entry. As in
+            # _SQL_RECALCULATE_RUNNING_TOTALS, the new amounts are summed first and then added
+            # to the prior totals. Back-dated pairs go in with zero totals, fixed up below.
+            latest = latest_cost_basis_totals(cursor, {trade['ticker_id'] for trade in trades})
+            sums = {}
+            backdated = set()
+            cost_basis_rows = []
+            cash_flow_rows = []
+            for trade, trade_id in zip(trades, trade_ids):
+                description, shares, cost_per_share, total_amount = trade_cost_basis_values(trade)
+                key = (trade['account_id'], trade['ticker_id'])
+                latest_date, prior_basis, prior_shares = latest.get(key, (None, 0, 0))
+                if latest_date is not None and trade['date_trade_open'] < latest_date:
+                    backdated.add(key)
+                sum_basis, sum_shares = sums.get(key, (0, 0))
+                sum_basis, sum_shares = sum_basis + total_amount, sum_shares + shares
+                sums[key] = (sum_basis, sum_shares)
+                if key in backdated:
+                    running_basis = running_shares = basis_per_share = 0
+                else:
+                    running_basis, running_shares = prior_basis + sum_basis, prior_shares + sum_shares
+                    basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
+                cost_basis_rows.append((trade['account_id'], trade['ticker_id'], trade_id, None, trade['date_trade_open'],
+                                        description, shares, cost_per_share, total_amount,
+                                        running_basis, running_shares, basis_per_share))
+
+                transaction_type, amount, cash_flow_description = trade_cash_flow_values(trade)
+                cash_flow_rows.append((trade['account_id'], trade['date_trade_open'], transaction_type, amount,
+                                       cash_flow_description, trade_id, trade['ticker_id']))
+
+            cursor.executemany(_SQL_INSERT_COST_BASIS, cost_basis_rows)
+            cursor.executemany(_SQL_INSERT_TRADE_CASH_FLOW, cash_flow_rows)
+
+            # One window-function pass per back-dated (account, ticker), starting at its earliest new entry
+            if backdated:
+                cursor.execute(_SQL_FIRST_NEW_COST_BASIS_ENTRIES, (last_trade_id,))
+                for row in cursor.fetchall():
+                    if (row['account_id'], row['ticker_id']) in backdated:
+                        recalculate_running_totals(cursor, row['account_id'], row['ticker_id'], row['id'])
+
+            # Link each new cost_basis entry to its trade's cash flow
+            cursor.execute(_SQL_LINK_NEW_COST_BASIS_CASH_FLOWS, (last_trade_id,))
+
+            conn.commit()
+        logger.debug('Bulk add committed %s trades', len(trade_ids))
+
+        for account_id in {trade['account_id'] for trade in trades}:
+            db.invalidate_metrics_cache(account_id=account_id)
+            schedule_bankroll_summary_refresh(account_id)
+
+        # Report trade ids in request order
+        ids_by_position = dict(zip(order, trade_ids))
+        return jsonify({'success': True, 'trade_ids': [ids_by_position[i] for i in range(len(trade_ids))]})
+    except Exception as e:
+        logger.exception('Error adding trades in bulk: %s', e)
+        return jsonify({'success': False, 'error': f'Failed to add trades: {str(e)}'}), 500
+
+# Ticker symbol for a cost basis description plus whether the trade already has an
+# ASSIGNED entry (only used by create_assigned_cost_basis_entry), in one round trip.
+# No row is returned when ticker_id does not exist.
+_SQL_COST_BASIS_CONTEXT = '''
+    SELECT t.ticker,
+           EXISTS (
+               SELECT 1 FROM cost_basis
+               WHERE trade_id = :trade_id AND account_id = :account_id AND ticker_id = :ticker_id
+                 AND description LIKE 'ASSIGNED%'
+           ) as already_assigned
+    FROM tickers t
+    WHERE t.id = :ticker_id
+'''
+
+def get_cost_basis_context(cursor, account_id, ticker_id, trade_id=None):
+    """Return the _SQL_COST_BASIS_CONTEXT row (ticker, already_assigned) or None for an unknown ticker"""
+    cursor.execute(_SQL_COST_BASIS_CONTEXT, {'account_id': account_id, 'ticker_id': ticker_id, 'trade_id': trade_id})
+    return cursor.fetchone()
+
+# Running totals for an (account, ticker) pair, recomputed with window functions from the
+# entry :from_id onward (entries are ordered by transaction_date, then insertion order).
+# Totals continue from the entry just before :from_id, so earlier entries are left as
+# they are. New entries are inserted with zero running totals and then fixed up by this
+# statement, which also corrects every later entry when the new one is back-dated.
+_SQL_RECALCULATE_RUNNING_TOTALS = '''
+    WITH start AS (
+        SELECT transaction_date, rowid as start_rowid FROM cost_basis WHERE id = :from_id
+    ),
+    prior AS (
+        SELECT running_basis, running_shares
+        FROM cost_basis, start
+        WHERE account_id = :account_id AND ticker_id = :ticker_id
+          AND (cost_basis.transaction_date, cost_basis.rowid) < (start.transaction_date, start.start_rowid)
+        ORDER BY cost_basis.transaction_date DESC, cost_basis.rowid DESC
         LIMIT 1
-    ''', (ticker_id, account_id))
-    
-    last_entry = cursor.fetchone()
-    if last_entry:
-        running_basis = last_entry['running_basis']
-        running_shares = last_entry['running_shares']
-    else:
-        running_basis = 0
-        running_shares = 0
+    ),
+    totals AS (
+        SELECT cost_basis.id,
+               IFNULL((SELECT running_basis FROM prior), 0) + SUM(total_amount) OVER w as running_basis,
+               IFNULL((SELECT running_shares FROM prior), 0) + SUM(shares) OVER w as running_shares
+        FROM cost_basis, start
+        WHERE account_id = :account_id AND ticker_id = :ticker_id
+          AND (cost_basis.transaction_date, cost_basis.rowid) >= (start.transaction_date, start.start_rowid)
+        WINDOW w AS (ORDER BY cost_basis.transaction_date, cost_basis.rowid ROWS UNBOUNDED PRECEDING)
+    )
+    UPDATE cost_basis SET
+        running_basis = totals.running_basis,
+        running_shares = totals.running_shares,
+        basis_per_share = CASE WHEN totals.running_shares <> 0
+                               THEN totals.running_basis / totals.running_shares
+                               ELSE totals.running_basis END
+    FROM totals
+    WHERE cost_basis.id = totals.id
+'''
+
+# Running totals for every cost_basis entry in one window pass, per (account, ticker) in the
+# same order as _SQL_RECALCULATE_RUNNING_TOTALS (transaction_date, then insertion order).
+# Used after a full rebuild, where every entry is inserted with zero running totals.
+_SQL_RECALCULATE_ALL_RUNNING_TOTALS = '''
+    WITH totals AS (
+        SELECT id,
+               SUM(total_amount) OVER w as running_basis,
+               SUM(shares) OVER w as running_shares
+        FROM cost_basis
+        WINDOW w AS (PARTITION BY account_id, ticker_id ORDER BY transaction_date, rowid ROWS UNBOUNDED PRECEDING)
+    )
+    UPDATE cost_basis SET
+        running_basis = totals.running_basis,
+        running_shares = totals.running_shares,
+        basis_per_share = CASE WHEN totals.running_shares <> 0
+                               THEN totals.running_basis / totals.running_shares
+                               ELSE totals.running_basis END
+    FROM totals
+    WHERE cost_basis.id = totals.id
+'''
+
+def recalculate_running_totals(cursor, account_id, ticker_id, from_id):
+    """Recompute running_basis/running_shares/basis_per_share for an account and ticker from cost_basis entry from_id on"""
+    cursor.execute(_SQL_RECALCULATE_RUNNING_TOTALS, {'account_id': account_id, 'ticker_id': ticker_id, 'from_id': from_id})
+
+def stock_cost_basis_values(ticker, trade_type, num_of_contracts, price_per_share, total_amount):
+    """(description, shares, cost_per_share, total_amount) of the cost basis entry for a BTO/STC trade"""
+    description = f"{trade_type} {num_of_contracts} {ticker}"
     
     # For STC, make total_amount negative (we receive proceeds, so it reduces our basis)
+    # and shares negative to show we sold them. For BTO, add shares (we're buying)
     if trade_type == 'STC':
-        total_amount = -abs(total_amount)
+        return description, -num_of_contracts, price_per_share, -abs(total_amount)
+    return description, num_of_contracts, price_per_share, total_amount
+
+def options_cost_basis_values(ticker, trade_type, num_of_contracts, premium, strike_price, expiration_date):
+    """(description, shares, cost_per_share, total_amount) of the cost basis entry for an options trade"""
+    # Format expiration date as DD-MMM-YY
+    try:
+        expiration_formatted = format_expiration(expiration_date)
+    except Exception as e:
+        logger.warning('Error formatting expiration date %s: %s', expiration_date, e)
+        expiration_formatted = expiration_date  # Fallback
     
-    # Update running totals
-    new_running_basis = running_basis + total_amount
-    # For STC, subtract shares (we're selling). For BTO, add shares (we're buying)
-    if trade_type == 'STC':
-        new_running_shares = running_shares - num_of_contracts
-    else:  # BTO
-        new_running_shares = running_shares + num_of_contracts
+    # Create trade description based on trade type
+    # Format strike_price and premium to 2 decimal places
+    strike_str = f"{strike_price:.2f}" if strike_price else "0.0"
+    premium_str = f"{premium:.2f}" if premium else "0.0"
     
-    # For display: STC shares should be negative to show we sold them
-    if trade_type == 'STC':
-        display_shares = -num_of_contracts
+    if 'ROP' in trade_type or 'PUT' in trade_type:
+        description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} PUT @{premium_str}"
+    elif 'ROC' in trade_type or 'CALL' in trade_type:
+        description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} CALL @{premium_str}"
     else:
-        display_shares = num_of_contracts
+        description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} {trade_type} @{premium_str}"
     
-    # Calculate basis per share
-    basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
+    # For options trades (contracts):
+    # - shares = 0 for all options trades (ROCT, ROP, ROC)
+    # - cost_per_share = 0 (no cost per share for options)
+    # - total_amount = premium * num_of_contracts * 100 (total premium collected, negative for SELL as we receive money)
+    return description, 0, 0, -(premium * num_of_contracts * 100)
+
+def trade_cost_basis_values(trade):
+    """Cost basis entry values for a prepare_trade() dict (BTO/STC or options)"""
+    if trade['base_trade_type'] in ['BTO', 'STC']:
+        return stock_cost_basis_values(trade['ticker'], trade['base_trade_type'], trade['num_of_contracts'],
+                                       trade['credit_debit'], trade['total_premium'])
+    return options_cost_basis_values(trade['ticker'], trade['trade_type'], trade['num_of_contracts'],
+                                     trade['credit_debit'], trade['strike_price'], trade['expiration_date'])
+
+def create_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, num_of_contracts, price_per_share, total_amount, ticker=None):
+    """Create cost basis entry for BTO/STC trades and return its id (ticker is looked up when not given)"""
+    # Ticker for the description
+    if ticker is None:
+        ticker = get_cost_basis_context(cursor, account_id, ticker_id)['ticker']
+    description, shares, cost_per_share, total_amount = stock_cost_basis_values(
+        ticker, trade_type, num_of_contracts, price_per_share, total_amount)
     
-    # Insert cost basis entry
-    cursor.execute('''
-        INSERT INTO cost_basis 
-        (account_id, ticker_id, trade_id, cash_flow_id, transaction_date, description, shares, cost_per_share, 
-         total_amount, running_basis, running_shares, basis_per_share)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (account_id, ticker_id, trade_id, None, date_trade_open, description, display_shares, price_per_share,
-          total_amount, new_running_basis, new_running_shares, basis_per_share))
-
-def create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, num_of_contracts, premium, strike_price, expiration_date):
-    """Create cost basis entry for options trades (ROCT PUT, ROCT CALL, etc.)"""
-    import sys
-    print(f"create_options_cost_basis_entry: ticker_id={ticker_id}, account_id={account_id}, date_trade_open={date_trade_open}", file=sys.stderr)
+    # Insert cost basis entry, then fill in its running totals (and any later entries')
+    cursor.execute(_SQL_INSERT_COST_BASIS, (account_id, ticker_id, trade_id, None, date_trade_open, description, shares, cost_per_share,
+                                            total_amount, 0, 0, 0))
+    cost_basis_id = cursor.lastrowid
+    recalculate_running_totals(cursor, account_id, ticker_id, cost_basis_id)
+    return cost_basis_id
+
+def create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, num_of_contracts, premium, strike_price, expiration_date, ticker=None):
+    """Create cost basis entry for options trades (ROCT PUT, ROCT CALL, etc.) and return its id (ticker is looked up when not given)"""
+    logger.debug('create_options_cost_basis_entry: ticker_id=%s, account_id=%s, date_trade_open=%s', ticker_id, account_id, date_trade_open)
     try:
-        # Get ticker for description
-        cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-        ticker = cursor.fetchone()['ticker']
-        
-        # Format expiration date as DD-MMM-YY
-        try:
-            exp_date = datetime.strptime(expiration_date, '%Y-%m-%d')
-            # Use %d which already zero-pads, but ensure it's uppercase
-            expiration_formatted = exp_date.strftime('%d-%b-%y').upper()
-            print(f"Formatted expiration date: {expiration_date} -> {expiration_formatted}", file=sys.stderr)
-        except Exception as e:
-            print(f"Error formatting expiration date {expiration_date}: {e}", file=sys.stderr)
-            expiration_formatted = expiration_date  # Fallback
-        
-        # Create trade description based on trade type
-        # Format strike_price and premium to 2 decimal places
-        strike_str = f"{strike_price:.2f}" if strike_price else "0.0"
-        premium_str = f"{premium:.2f}" if premium else "0.0"
-        
-        print(f"create_options_cost_basis_entry: strike_price={strike_price}, premium={premium}, num_of_contracts={num_of_contracts}", file=sys.stderr)
-        
-        if 'ROP' in trade_type or 'PUT' in trade_type:
-            description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} PUT @{premium_str}"
-        elif 'ROC' in trade_type or 'CALL' in trade_type:
-            description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} CALL @{premium_str}"
-        else:
-            description = f"SELL -{num_of_contracts} {ticker} 100 {expiration_formatted} {strike_str} {trade_type} @{premium_str}"
-        
-        print(f"create_options_cost_basis_entry: description={description}", file=sys.stderr)
-        
-        # For options trades (contracts):
-        # - shares = 0 for all options trades (ROCT, ROP, ROC)
-        # - cost_per_share = 0 (no cost per share for options)
-        # - total_amount = premium * num_of_contracts * 100 (total premium collected, negative for SELL as we receive money)
-        shares = 0  # No shares for all options trades (ROCT, ROP, ROC)
-        cost_per_share = 0  # No cost per share for options trades
-        total_amount = -(premium * num_of_contracts * 100)  # Total premium in dollars (negative because we receive premium)
-        
-        # Get current running totals for this account and ticker
-        # Order by transaction_date DESC to get the most recent entry for THIS specific ticker
-        cursor.execute('''
-            SELECT running_basis, running_shares 
-            FROM cost_basis 
-            WHERE ticker_id = ? AND account_id = ?
-            ORDER BY transaction_date DESC, rowid DESC
-            LIMIT 1
-        ''', (ticker_id, account_id))
-        
-        last_entry = cursor.fetchone()
-        import sys
-        print(f"Looking for prior entries: ticker_id={ticker_id}, account_id={account_id}, last_entry={last_entry}", file=sys.stderr)
-        if last_entry:
-            running_basis = last_entry['running_basis']
-            running_shares = last_entry['running_shares']
-            print(f"Found prior entry: running_basis={running_basis}, running_shares={running_shares}", file=sys.stderr)
-        else:
-            running_basis = 0
-            running_shares = 0
-            print(f"No prior entry found", file=sys.stderr)
-        
-        # Calculate basis per share
-        # If this is the first entry (no prior entries), set running_basis to total_amount
-        if last_entry is None:
-            # First entry: basis should be the amount, and basis/share should be the amount
-            new_running_basis = total_amount
-            new_running_shares = shares
-            basis_per_share = total_amount
-            print(f"First entry for ticker: running_basis={new_running_basis}, total_amount={total_amount}", file=sys.stderr)
-        else:
-            # Update running totals (for options, shares represents contracts)
-            new_running_basis = running_basis + total_amount
-            new_running_shares = running_shares + shares  # Add contracts
-            basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
-            print(f"Subsequent entry: prior running_basis={running_basis}, total_amount={total_amount}, new_running_basis={new_running_basis}", file=sys.stderr)
-        
-        # Insert cost basis entry
-        cursor.execute('''
-            INSERT INTO cost_basis 
-            (account_id, ticker_id, trade_id, cash_flow_id, transaction_date, description, shares, cost_per_share, 
-             total_amount, running_basis, running_shares, basis_per_share)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (account_id, ticker_id, trade_id, None, date_trade_open, description, shares, cost_per_share,
-              total_amount, new_running_basis, new_running_shares, basis_per_share))
-        
-        cost_basis_id = cursor.lastrowid
-        print(f"[DEBUG] Created cost basis entry for options trade {trade_id}: id={cost_basis_id}, description={description}", flush=True)
-        print(f"[DEBUG] Cost basis entry details: account_id={account_id}, ticker_id={ticker_id}, trade_id={trade_id}, transaction_date={date_trade_open}, total_amount={total_amount}", flush=True)
+        # Ticker for the description
+        if ticker is None:
+            ticker = get_cost_basis_context(cursor, account_id, ticker_id)['ticker']
+        description, shares, cost_per_share, total_amount = options_cost_basis_values(
+            ticker, trade_type, num_of_contracts, premium, strike_price, expiration_date)
+        logger.debug('create_options_cost_basis_entry: description=%s', description)
+        
+        # Insert cost basis entry, then fill in its running totals (and any later entries').
+        # With no prior entries the totals start from 0, so running_basis and basis/share are the amount
+        cursor.execute(_SQL_INSERT_COST_BASIS, (account_id, ticker_id, trade_id, None, date_trade_open, description, shares, cost_per_share,
+                                                total_amount, 0, 0, 0))
+        cost_basis_id = cursor.lastrowid
+        recalculate_running_totals(cursor, account_id, ticker_id, cost_basis_id)
+        logger.debug('Created cost basis entry for options trade %s: id=%s, description=%s', trade_id, cost_basis_id, description)
+        logger.debug('Cost basis entry details: account_id=%s, ticker_id=%s, trade_id=%s, transaction_date=%s, total_amount=%s', account_id, ticker_id, trade_id, date_trade_open, total_amount)
+        return cost_basis_id
         
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"[ERROR] Error creating options cost basis entry: {e}", flush=True)
-        print(f"[ERROR] Traceback: {error_detail}", flush=True)
+        logger.exception('Error creating options cost basis entry: %s', e)
         # Re-raise the exception so the calling function knows it failed
         raise
 
+# A trade row plus its ticker symbol (as ticker_symbol) in one round trip
+_SQL_GET_TRADE_WITH_TICKER = '''
+    SELECT t.*, tk.ticker as ticker_symbol
+    FROM trades t
+    LEFT JOIN tickers tk ON tk.id = t.ticker_id
+    WHERE t.id = ?
+'''
+# Only the trade columns update_trade reads (current values for its recalculations)
+_SQL_GET_TRADE_FOR_UPDATE = '''
+    SELECT trade_type, trade_parent_id, date_trade_open, expiration_date, days_to_expiration,
+           num_of_contracts, strike_price, credit_debit, commission_per_share, net_credit_per_share,
+           risk_capital_per_share, margin_percent
+    FROM trades
+    WHERE id = ?
+'''
+# Only the trade columns update_trade_status (and create_assigned_cost_basis_entry) read,
+# plus its ticker symbol (as ticker_symbol)
+_SQL_GET_TRADE_FOR_STATUS = '''
+    SELECT t.id, t.account_id, t.ticker_id, t.trade_type_id, t.trade_type, t.trade_status, t.trade_parent_id,
+           t.date_trade_open, t.expiration_date, t.num_of_contracts, t.strike_price,
+           t.net_credit_per_share, t.margin_percent, tk.ticker as ticker_symbol
+    FROM trades t
+    LEFT JOIN tickers tk ON tk.id = t.ticker_id
+    WHERE t.id = ?
+'''
+_SQL_FIRST_COST_BASIS_ENTRY = '''
+    SELECT id FROM cost_basis
+    WHERE ticker_id = ? AND account_id = ?
+    ORDER BY transaction_date ASC, rowid ASC
+    LIMIT 1
+'''
+
 @app.route('/api/trades/<int:trade_id>', methods=['DELETE'])
 def delete_trade(trade_id):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get trade info before deletion
-        cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-        trade = cursor.fetchone()
-        
-        if not trade:
-            return jsonify({'error': 'Trade not found'}), 404
-        
-        # Get cost basis entries before deletion to know which ticker/account to recalculate
-        cursor.execute('SELECT ticker_id, account_id FROM cost_basis WHERE trade_id = ? LIMIT 1', (trade_id,))
-        cost_basis_entry = cursor.fetchone()
-        
-        # If no cost_basis entry, get ticker_id and account_id from the trade itself
-        if not cost_basis_entry:
-            trade_dict = dict(trade)
-            ticker_id = trade_dict.get('ticker_id')
-            account_id = trade_dict.get('account_id')
-        else:
-            ticker_id = cost_basis_entry['ticker_id']
-            account_id = cost_basis_entry['account_id']
-        
-        # Delete associated cost basis entries
-        cursor.execute('DELETE FROM cost_basis WHERE trade_id = ?', (trade_id,))
-        
-        # Delete associated cash flows
-        cursor.execute('DELETE FROM cash_flows WHERE trade_id = ?', (trade_id,))
-        
-        # Delete the trade
-        cursor.execute('DELETE FROM trades WHERE id = ?', (trade_id,))
-        
-        # Recalculate running totals for all remaining cost_basis entries for this ticker/account
-        if ticker_id and account_id:
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # Get all remaining entries for this ticker/account ordered by transaction_date
-            cursor.execute('''
-                SELECT id, total_amount, shares, transaction_date, rowid
-                FROM cost_basis 
-                WHERE ticker_id = ? AND account_id = ?
-                ORDER BY transaction_date ASC, rowid ASC
-            ''', (ticker_id, account_id))
-            all_entries = cursor.fetchall()
-            
-            # Recalculate running totals sequentially
-            running_basis = 0
-            running_shares = 0
-            for entry in all_entries:
-                entry_dict = dict(entry)
-                running_basis += entry_dict['total_amount']
-                running_shares += entry_dict['shares']
-                basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
-                
-                cursor.execute('''
-                    UPDATE cost_basis 
-                    SET running_basis = ?, running_shares = ?, basis_per_share = ?
-                    WHERE id = ?
-                ''', (running_basis, running_shares, basis_per_share, entry_dict['id']))
-        
-        conn.commit()
-        conn.close()
-        
+            # Delete the trade, getting its ticker/account back in the same statement
+            cursor.execute('DELETE FROM trades WHERE id = ? RETURNING ticker_id, account_id', (trade_id,))
+            trade = cursor.fetchone()
+            
+            if not trade:
+                return jsonify({'error': 'Trade not found'}), 404
+            
+            # Delete associated cost basis entries; their ticker/account are the ones to recalculate
+            cursor.execute('DELETE FROM cost_basis WHERE trade_id = ? RETURNING ticker_id, account_id', (trade_id,))
+            cost_basis_entry = cursor.fetchone()
+            
+            # If no cost_basis entry, use ticker_id and account_id from the trade itself
+            if not cost_basis_entry:
+                ticker_id = trade['ticker_id']
+                account_id = trade['account_id']
+            else:
+                ticker_id = cost_basis_entry['ticker_id']
+                account_id = cost_basis_entry['account_id']
+            
+            # Delete associated cash flows
+            cursor.execute('DELETE FROM cash_flows WHERE trade_id = ?', (trade_id,))
+            
+            # Recalculate running totals for all remaining cost_basis entries for this ticker/account
+            if ticker_id and account_id:
+                cursor.execute(_SQL_FIRST_COST_BASIS_ENTRY, (ticker_id, account_id))
+                first_entry = cursor.fetchone()
+                if first_entry:
+                    recalculate_running_totals(cursor, account_id, ticker_id, first_entry['id'])
+            
+            conn.commit()
+
         return jsonify({'success': True})
     except Exception as e:
         print(f'Error deleting trade: {e}')
@@ -1982,328 +2431,316 @@ def delete_trade(trade_id):
 def update_trade(trade_id):
     try:
         data = request.get_json()
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get current trade
-        cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-        trade = cursor.fetchone()
-        
-        if not trade:
-            return jsonify({'error': 'Trade not found'}), 404
-        
-        # Update trade fields
-        updates = []
-        params = []
-        
-        # Track if dates are being updated (needed for DTE recalculation)
-        date_trade_open_updated = False
-        expiration_date_updated = False
-        new_date_trade_open = None
-        new_expiration_date = None
-        
-        if 'ticker' in data:
-            ticker = data['ticker'].upper()
-            # Get or create symbol (case-insensitive)
-            cursor.execute('SELECT id FROM tickers WHERE UPPER(ticker) = UPPER(?)', (ticker,))
-            symbol_row = cursor.fetchone()
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            if symbol_row:
-                ticker_id = symbol_row['id']
-            else:
-                # Create new symbol (store as uppercase)
-                cursor.execute('INSERT INTO tickers (ticker, company_name) VALUES (?, ?)', (ticker.upper(), ticker))
-                ticker_id = cursor.lastrowid
-            
-            updates.append('ticker_id = ?')
-            params.append(ticker_id)
-            updates.append('ticker = ?')
-            params.append(ticker)
-        
-        if 'tradeDate' in data:
-            date_trade_open_updated = True
-            new_date_trade_open = data['tradeDate']
-            updates.append('date_trade_open = ?')
-            params.append(new_date_trade_open)
-        elif 'date_trade_open' in data:
-            date_trade_open_updated = True
-            new_date_trade_open = data['date_trade_open']
-            updates.append('date_trade_open = ?')
-            params.append(new_date_trade_open)
-        
-        if 'expirationDate' in data:
-            expiration_date_updated = True
-            new_expiration_date = data['expirationDate']
-            updates.append('expiration_date = ?')
-            params.append(new_expiration_date)
-        elif 'expiration_date' in data:
-            expiration_date_updated = True
-            new_expiration_date = data['expiration_date']
-            updates.append('expiration_date = ?')
-            params.append(new_expiration_date)
-        
-        # Recalculate days_to_expiration if either date changed
-        days_to_expiration_updated = False
-        new_days_to_expiration = None
-        if date_trade_open_updated or expiration_date_updated:
-            # Use new dates if provided, otherwise use current trade dates
-            date_trade_open_for_dte = new_date_trade_open if date_trade_open_updated else trade['date_trade_open']
-            expiration_date_for_dte = new_expiration_date if expiration_date_updated else trade['expiration_date']
-            
-            # Calculate days to expiration
-            date_trade_open_obj = datetime.strptime(date_trade_open_for_dte, '%Y-%m-%d').date()
-            expiration = datetime.strptime(expiration_date_for_dte, '%Y-%m-%d').date()
-            days_to_expiration = (expiration - date_trade_open_obj).days
-            days_to_expiration_updated = True
-            new_days_to_expiration = days_to_expiration
-            
-            updates.append('days_to_expiration = ?')
-            params.append(days_to_expiration)
-        
-        if 'num_of_contracts' in data:
-            num_contracts = int(data['num_of_contracts'])
-            updates.append('num_of_contracts = ?')
-            params.append(num_contracts)
-            # Recalculate total_premium when num_of_contracts changes
-            # Get current credit_debit to calculate new total
-            current_credit_debit = trade['credit_debit']
-            new_total_premium = current_credit_debit * num_contracts
-            updates.append('total_premium = ?')
-            params.append(new_total_premium)
-            # Recalculate margin_capital when num_of_contracts changes
-            current_trade_type = data.get('tradeType') or trade['trade_type']
-            current_strike = float(data.get('strikePrice') or trade['strike_price'])
-            current_risk_capital = trade.get('risk_capital_per_share')
-            if current_risk_capital is not None and ('ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type))):
-                # For ROCT PUT and RULE ONE PUT trades, use risk_capital_per_share
-                new_margin_capital = num_contracts * 100 * current_risk_capital
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            elif current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
-                # For other options trades, use standard calculation
-                current_commission = trade.get('commission_per_share', 0)
-                current_net_credit = current_credit_debit - current_commission
-                new_margin_capital = (current_strike - current_net_credit) * num_contracts * 100
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-        
-        if 'premium' in data or 'creditDebit' in data:
-            credit_debit = float(data.get('premium') or data.get('creditDebit'))
-            updates.append('credit_debit = ?')
-            params.append(credit_debit)
-            # Recalculate total_premium when credit_debit changes
-            current_num_contracts = trade['num_of_contracts']
-            new_total_premium = credit_debit * current_num_contracts
-            updates.append('total_premium = ?')
-            params.append(new_total_premium)
-            # Recalculate net_credit_per_share and risk_capital_per_share (net_credit rounded to 5 decimals, risk_capital to 2 decimals)
-            current_commission = trade.get('commission_per_share', 0)
-            new_net_credit = round_standard((credit_debit - current_commission), 5)
-            updates.append('net_credit_per_share = ?')
-            params.append(new_net_credit)
-            # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades
-            current_trade_type = data.get('tradeType') or trade['trade_type']
-            current_strike = float(data.get('strikePrice') or trade['strike_price'])
-            if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
-                new_risk_capital = round_standard((current_strike - new_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
-                # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
-                # Use unrounded risk_capital_per_share for margin_capital calculation
-                current_num_contracts = trade['num_of_contracts']
-                risk_capital_unrounded = current_strike - new_net_credit
-                new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            else:
-                updates.append('risk_capital_per_share = ?')
-                params.append(None)
-                # For other options trades, recalculate margin_capital using standard formula
-                if current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
-                    current_num_contracts = trade['num_of_contracts']
-                    new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+            # Get current trade
+            cursor.execute(_SQL_GET_TRADE_FOR_UPDATE, (trade_id,))
+            trade = cursor.fetchone()
+            
+            if not trade:
+                return jsonify({'error': 'Trade not found'}), 404
+            
+            # Update trade fields
+            updates = []
+            params = []
+            
+            # Track if dates are being updated (needed for DTE recalculation)
+            date_trade_open_updated = False
+            expiration_date_updated = False
+            new_date_trade_open = None
+            new_expiration_date = None
+            
+            if 'ticker' in data:
+                ticker = data['ticker'].upper()
+                # Get or create symbol in one statement (tickers are stored upper-case)
+                cursor.execute(UPSERT_TICKER_SQL, {'ticker': ticker, 'company_name': ticker})
+                ticker_id = cursor.fetchone()['id']
+                
+                updates.append('ticker_id = ?')
+                params.append(ticker_id)
+                updates.append('ticker = ?')
+                params.append(ticker)
+            
+            if 'tradeDate' in data:
+                date_trade_open_updated = True
+                new_date_trade_open = data['tradeDate']
+                updates.append('date_trade_open = ?')
+                params.append(new_date_trade_open)
+            elif 'date_trade_open' in data:
+                date_trade_open_updated = True
+                new_date_trade_open = data['date_trade_open']
+                updates.append('date_trade_open = ?')
+                params.append(new_date_trade_open)
+            
+            if 'expirationDate' in data:
+                expiration_date_updated = True
+                new_expiration_date = data['expirationDate']
+                updates.append('expiration_date = ?')
+                params.append(new_expiration_date)
+            elif 'expiration_date' in data:
+                expiration_date_updated = True
+                new_expiration_date = data['expiration_date']
+                updates.append('expiration_date = ?')
+                params.append(new_expiration_date)
+            
+            # Recalculate days_to_expiration if either date changed
+            days_to_expiration_updated = False
+            new_days_to_expiration = None
+            if date_trade_open_updated or expiration_date_updated:
+                # Use new dates if provided, otherwise use current trade dates
+                date_trade_open_for_dte = new_date_trade_open if date_trade_open_updated else trade['date_trade_open']
+                expiration_date_for_dte = new_expiration_date if expiration_date_updated else trade['expiration_date']
+                
+                # Calculate days to expiration
+                days_to_expiration = days_between(date_trade_open_for_dte, expiration_date_for_dte)
+                days_to_expiration_updated = True
+                new_days_to_expiration = days_to_expiration
+                
+                updates.append('days_to_expiration = ?')
+                params.append(days_to_expiration)
+            
+            if 'num_of_contracts' in data:
+                num_contracts = int(data['num_of_contracts'])
+                updates.append('num_of_contracts = ?')
+                params.append(num_contracts)
+                # Recalculate total_premium when num_of_contracts changes
+                # Get current credit_debit to calculate new total
+                current_credit_debit = trade['credit_debit']
+                new_total_premium = current_credit_debit * num_contracts
+                updates.append('total_premium = ?')
+                params.append(new_total_premium)
+                # Recalculate margin_capital when num_of_contracts changes
+                current_trade_type = data.get('tradeType') or trade['trade_type']
+                current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                current_risk_capital = trade['risk_capital_per_share']
+                if current_risk_capital is not None and ('ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type))):
+                    # For ROCT PUT and RULE ONE PUT trades, use risk_capital_per_share
+                    new_margin_capital = num_contracts * 100 * current_risk_capital
                     updates.append('margin_capital = ?')
                     params.append(new_margin_capital)
-        
-        if 'currentPrice' in data:
-            updates.append('current_price = ?')
-            params.append(float(data['currentPrice']))
-        
-        if 'strikePrice' in data:
-            strike_price = round_standard(float(data['strikePrice']), 2)
-            updates.append('strike_price = ?')
-            params.append(strike_price)
-            # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades when strike changes (rounded to nearest hundredth)
-            current_trade_type = data.get('tradeType') or trade['trade_type']
-            current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
-            current_commission = trade.get('commission_per_share', 0)
-            current_net_credit = round_standard((current_credit_debit - current_commission), 5)
-            if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
-                new_risk_capital = round_standard((strike_price - current_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
-                # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
+                elif current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                    # For other options trades, use standard calculation
+                    current_commission = trade['commission_per_share']
+                    current_net_credit = current_credit_debit - current_commission
+                    new_margin_capital = (current_strike - current_net_credit) * num_contracts * 100
+                    updates.append('margin_capital = ?')
+                    params.append(new_margin_capital)
+            
+            if 'premium' in data or 'creditDebit' in data:
+                credit_debit = float(data.get('premium') or data.get('creditDebit'))
+                updates.append('credit_debit = ?')
+                params.append(credit_debit)
+                # Recalculate total_premium when credit_debit changes
                 current_num_contracts = trade['num_of_contracts']
-                new_margin_capital = current_num_contracts * 100 * new_risk_capital
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            else:
-                # For other options trades, recalculate margin_capital using standard formula
-                if current_trade_type not in ['BTO', 'STC'] and strike_price > 0:
+                new_total_premium = credit_debit * current_num_contracts
+                updates.append('total_premium = ?')
+                params.append(new_total_premium)
+                # Recalculate net_credit_per_share and risk_capital_per_share (net_credit rounded to 5 decimals, risk_capital to 2 decimals)
+                current_commission = trade['commission_per_share']
+                new_net_credit = round_standard((credit_debit - current_commission), 5)
+                updates.append('net_credit_per_share = ?')
+                params.append(new_net_credit)
+                # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades
+                current_trade_type = data.get('tradeType') or trade['trade_type']
+                current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
+                    new_risk_capital = round_standard((current_strike - new_net_credit), 2)
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(new_risk_capital)
+                    # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
+                    # Use unrounded risk_capital_per_share for margin_capital calculation
                     current_num_contracts = trade['num_of_contracts']
-                    new_margin_capital = (strike_price - current_net_credit) * current_num_contracts * 100
+                    risk_capital_unrounded = current_strike - new_net_credit
+                    new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
                     updates.append('margin_capital = ?')
                     params.append(new_margin_capital)
-        
-        if 'tradeType' in data:
-            new_trade_type = data['tradeType']
-            
-            # Extract base trade type (before ticker prefix for options)
-            base_trade_type = new_trade_type
-            if 'ROCT PUT' in new_trade_type or 'ROCT CALL' in new_trade_type:
-                # Extract base type (e.g., "ROCT PUT" from "AAPL ROCT PUT")
-                if 'ROCT PUT' in new_trade_type:
-                    base_trade_type = 'ROCT PUT'
-                elif 'ROCT CALL' in new_trade_type:
-                    base_trade_type = 'ROCT CALL'
-            
-            # Validate that trade_type_id exists for the new trade type
-            cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (base_trade_type,))
-            trade_type_row = cursor.fetchone()
-            new_trade_type_id = trade_type_row['id'] if trade_type_row else None
-            
-            if new_trade_type_id is None:
-                conn.close()
-                return jsonify({'error': f'Invalid trade type: "{base_trade_type}" does not exist in trade_types table'}), 400
-            
-            # Update both trade_type and trade_type_id
-            updates.append('trade_type = ?')
-            params.append(new_trade_type)
-            updates.append('trade_type_id = ?')
-            params.append(new_trade_type_id)
-            
-            # Recalculate risk_capital_per_share based on new trade type (rounded to nearest hundredth)
-            current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
-            current_commission = trade.get('commission_per_share', 0)
-            current_net_credit = round_standard((current_credit_debit - current_commission), 5)
-            current_strike = float(data.get('strikePrice') or trade['strike_price'])
-            if 'ROCT PUT' in new_trade_type or 'RULE ONE PUT' in new_trade_type or ('PUT' in new_trade_type and ('ROCT' in new_trade_type or 'RULE ONE' in new_trade_type)):
-                new_risk_capital = round_standard((current_strike - current_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
-                # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
-                current_num_contracts = trade['num_of_contracts']
-                new_margin_capital = current_num_contracts * 100 * new_risk_capital
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            else:
-                updates.append('risk_capital_per_share = ?')
-                params.append(None)
-                # For other options trades, recalculate margin_capital using standard formula
-                if new_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                else:
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(None)
+                    # For other options trades, recalculate margin_capital using standard formula
+                    if current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                        current_num_contracts = trade['num_of_contracts']
+                        new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+            
+            if 'currentPrice' in data:
+                updates.append('current_price = ?')
+                params.append(float(data['currentPrice']))
+            
+            if 'strikePrice' in data:
+                strike_price = round_standard(float(data['strikePrice']), 2)
+                updates.append('strike_price = ?')
+                params.append(strike_price)
+                # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades when strike changes (rounded to nearest hundredth)
+                current_trade_type = data.get('tradeType') or trade['trade_type']
+                current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
+                current_commission = trade['commission_per_share']
+                current_net_credit = round_standard((current_credit_debit - current_commission), 5)
+                if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
+                    new_risk_capital = round_standard((strike_price - current_net_credit), 2)
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(new_risk_capital)
+                    # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
                     current_num_contracts = trade['num_of_contracts']
-                    new_margin_capital = (current_strike - current_net_credit) * current_num_contracts * 100
+                    new_margin_capital = current_num_contracts * 100 * new_risk_capital
                     updates.append('margin_capital = ?')
                     params.append(new_margin_capital)
                 else:
+                    # For other options trades, recalculate margin_capital using standard formula
+                    if current_trade_type not in ['BTO', 'STC'] and strike_price > 0:
+                        current_num_contracts = trade['num_of_contracts']
+                        new_margin_capital = (strike_price - current_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+            
+            if 'tradeType' in data:
+                new_trade_type = data['tradeType']
+                
+                # Extract base trade type (before ticker prefix for options)
+                base_trade_type = new_trade_type
+                if 'ROCT PUT' in new_trade_type or 'ROCT CALL' in new_trade_type:
+                    # Extract base type (e.g., "ROCT PUT" from "AAPL ROCT PUT")
+                    if 'ROCT PUT' in new_trade_type:
+                        base_trade_type = 'ROCT PUT'
+                    elif 'ROCT CALL' in new_trade_type:
+                        base_trade_type = 'ROCT CALL'
+                
+                # Validate that trade_type_id exists for the new trade type
+                trade_type_row = get_trade_type(cursor, base_trade_type)
+                new_trade_type_id = trade_type_row['id'] if trade_type_row else None
+                
+                if new_trade_type_id is None:
+                    return jsonify({'error': f'Invalid trade type: "{base_trade_type}" does not exist in trade_types table'}), 400
+                
+                # Update both trade_type and trade_type_id
+                updates.append('trade_type = ?')
+                params.append(new_trade_type)
+                updates.append('trade_type_id = ?')
+                params.append(new_trade_type_id)
+                
+                # Recalculate risk_capital_per_share based on new trade type (rounded to nearest hundredth)
+                current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
+                current_commission = trade['commission_per_share']
+                current_net_credit = round_standard((current_credit_debit - current_commission), 5)
+                current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                if 'ROCT PUT' in new_trade_type or 'RULE ONE PUT' in new_trade_type or ('PUT' in new_trade_type and ('ROCT' in new_trade_type or 'RULE ONE' in new_trade_type)):
+                    new_risk_capital = round_standard((current_strike - current_net_credit), 2)
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(new_risk_capital)
+                    # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
+                    current_num_contracts = trade['num_of_contracts']
+                    new_margin_capital = current_num_contracts * 100 * new_risk_capital
                     updates.append('margin_capital = ?')
+                    params.append(new_margin_capital)
+                else:
+                    updates.append('risk_capital_per_share = ?')
                     params.append(None)
-        
-        # Recalculate net_credit_per_share and risk_capital_per_share if commission_per_share changes
-        if 'commission_per_share' in data or 'commissionPerShare' in data:
-            commission = float(data.get('commission_per_share') or data.get('commissionPerShare'))
-            updates.append('commission_per_share = ?')
-            params.append(commission)
-            # Recalculate net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
-            current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
-            new_net_credit = round_standard((current_credit_debit - commission), 5)
-            updates.append('net_credit_per_share = ?')
-            params.append(new_net_credit)
-            # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth)
-            current_trade_type = data.get('tradeType') or trade['trade_type']
-            current_strike = float(data.get('strikePrice') or trade['strike_price'])
-            if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
-                new_risk_capital = round_standard((current_strike - new_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
-                # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
-                # Use unrounded risk_capital_per_share for margin_capital calculation
-                current_num_contracts = trade['num_of_contracts']
-                risk_capital_unrounded = current_strike - new_net_credit
-                new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            else:
-                # For other options trades, recalculate margin_capital using standard formula
-                if current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                    # For other options trades, recalculate margin_capital using standard formula
+                    if new_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                        current_num_contracts = trade['num_of_contracts']
+                        new_margin_capital = (current_strike - current_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+                    else:
+                        updates.append('margin_capital = ?')
+                        params.append(None)
+            
+            # Recalculate net_credit_per_share and risk_capital_per_share if commission_per_share changes
+            if 'commission_per_share' in data or 'commissionPerShare' in data:
+                commission = float(data.get('commission_per_share') or data.get('commissionPerShare'))
+                updates.append('commission_per_share = ?')
+                params.append(commission)
+                # Recalculate net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
+                current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
+                new_net_credit = round_standard((current_credit_debit - commission), 5)
+                updates.append('net_credit_per_share = ?')
+                params.append(new_net_credit)
+                # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth)
+                current_trade_type = data.get('tradeType') or trade['trade_type']
+                current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
+                    new_risk_capital = round_standard((current_strike - new_net_credit), 2)
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(new_risk_capital)
+                    # Recalculate margin_capital for ROCT PUT and RULE ONE PUT trades
+                    # Use unrounded risk_capital_per_share for margin_capital calculation
                     current_num_contracts = trade['num_of_contracts']
-                    new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+                    risk_capital_unrounded = current_strike - new_net_credit
+                    new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
                     updates.append('margin_capital = ?')
                     params.append(new_margin_capital)
-        
-        # Recalculate ARORC for ROCT PUT and RULE ONE PUT trades
-        # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * margin_percent))
-        # Get current values for ARORC calculation
-        current_trade_type = data.get('tradeType') or trade['trade_type']
-        current_days_to_expiration = new_days_to_expiration if days_to_expiration_updated else trade['days_to_expiration']
-        current_net_credit = None
-        current_risk_capital = None
-        current_margin_percent = trade.get('margin_percent', 100.0)
-        
-        # Determine current net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
-        if 'premium' in data or 'creditDebit' in data:
-            current_credit_debit = float(data.get('premium') or data.get('creditDebit'))
-            current_commission = trade.get('commission_per_share', 0)
-            current_net_credit = round_standard((current_credit_debit - current_commission), 5)
-        elif 'commission_per_share' in data or 'commissionPerShare' in data:
-            current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
-            commission = float(data.get('commission_per_share') or data.get('commissionPerShare'))
-            current_net_credit = round_standard((current_credit_debit - commission), 5)
-        else:
-            current_net_credit = trade.get('net_credit_per_share', 0)
-        
-        # Determine current risk_capital_per_share (rounded to nearest hundredth) for storage
-        # But use unrounded value for ARORC calculation
-        current_risk_capital_for_storage = None
-        current_risk_capital_unrounded = None
-        if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
-            # Check if risk_capital_per_share was updated
-            if 'strikePrice' in data or 'premium' in data or 'creditDebit' in data or 'commission_per_share' in data or 'commissionPerShare' in data or 'tradeType' in data:
-                current_strike = float(data.get('strikePrice') or trade['strike_price'])
-                current_risk_capital_for_storage = round_standard((current_strike - current_net_credit), 2)
-                # Use unrounded value for ARORC calculation
-                current_risk_capital_unrounded = current_strike - current_net_credit
+                else:
+                    # For other options trades, recalculate margin_capital using standard formula
+                    if current_trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                        current_num_contracts = trade['num_of_contracts']
+                        new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+            
+            # Recalculate ARORC for ROCT PUT and RULE ONE PUT trades
+            # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * margin_percent))
+            # Get current values for ARORC calculation
+            current_trade_type = data.get('tradeType') or trade['trade_type']
+            current_days_to_expiration = new_days_to_expiration if days_to_expiration_updated else trade['days_to_expiration']
+            current_net_credit = None
+            current_risk_capital = None
+            current_margin_percent = trade['margin_percent']
+            
+            # Determine current net_credit_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
+            if 'premium' in data or 'creditDebit' in data:
+                current_credit_debit = float(data.get('premium') or data.get('creditDebit'))
+                current_commission = trade['commission_per_share']
+                current_net_credit = round_standard((current_credit_debit - current_commission), 5)
+            elif 'commission_per_share' in data or 'commissionPerShare' in data:
+                current_credit_debit = float(data.get('premium') or data.get('creditDebit') or trade['credit_debit'])
+                commission = float(data.get('commission_per_share') or data.get('commissionPerShare'))
+                current_net_credit = round_standard((current_credit_debit - commission), 5)
             else:
-                current_risk_capital_for_storage = trade.get('risk_capital_per_share')
-                # Calculate unrounded value for ARORC calculation
-                current_strike = float(data.get('strikePrice') or trade['strike_price'])
-                current_risk_capital_unrounded = current_strike - current_net_credit
-        
-        # Calculate ARORC if all required values are available
-        # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-        # Use unrounded risk_capital_per_share for ARORC calculation
-        new_arorc = None
-        if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
-            if current_risk_capital_unrounded is not None and current_risk_capital_unrounded > 0 and current_days_to_expiration > 0 and current_margin_percent > 0 and current_net_credit is not None:
-                # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                denominator = current_risk_capital_unrounded * (current_margin_percent / 100.0)
-                if denominator > 0:
-                    # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                    arorc_decimal = (365.0 / current_days_to_expiration) * (current_net_credit / denominator)
-                    new_arorc = round_standard(arorc_decimal * 100.0, 1)
-        
-        # Add ARORC update if calculated
-        if new_arorc is not None or ('ROCT PUT' not in current_trade_type and 'RULE ONE PUT' not in current_trade_type and not ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type))):
-            updates.append('ARORC = ?')
-            params.append(new_arorc)
-        
-        if updates:
-            params.append(trade_id)
-            query = f"UPDATE trades SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
-        
-        conn.commit()
-        conn.close()
+                current_net_credit = trade['net_credit_per_share']
+            
+            # Determine current risk_capital_per_share (rounded to nearest hundredth) for storage
+            # But use unrounded value for ARORC calculation
+            current_risk_capital_for_storage = None
+            current_risk_capital_unrounded = None
+            if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
+                # Check if risk_capital_per_share was updated
+                if 'strikePrice' in data or 'premium' in data or 'creditDebit' in data or 'commission_per_share' in data or 'commissionPerShare' in data or 'tradeType' in data:
+                    current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                    current_risk_capital_for_storage = round_standard((current_strike - current_net_credit), 2)
+                    # Use unrounded value for ARORC calculation
+                    current_risk_capital_unrounded = current_strike - current_net_credit
+                else:
+                    current_risk_capital_for_storage = trade['risk_capital_per_share']
+                    # Calculate unrounded value for ARORC calculation
+                    current_strike = float(data.get('strikePrice') or trade['strike_price'])
+                    current_risk_capital_unrounded = current_strike - current_net_credit
+            
+            # Calculate ARORC if all required values are available
+            # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+            # Use unrounded risk_capital_per_share for ARORC calculation
+            new_arorc = None
+            if 'ROCT PUT' in current_trade_type or 'RULE ONE PUT' in current_trade_type or ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type)):
+                if current_risk_capital_unrounded is not None and current_risk_capital_unrounded > 0 and current_days_to_expiration > 0 and current_margin_percent > 0 and current_net_credit is not None:
+                    # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
+                    denominator = current_risk_capital_unrounded * (current_margin_percent / 100.0)
+                    if denominator > 0:
+                        # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
+                        arorc_decimal = (365.0 / current_days_to_expiration) * (current_net_credit / denominator)
+                        new_arorc = round_standard(arorc_decimal * 100.0, 1)
+            
+            # Add ARORC update if calculated
+            if new_arorc is not None or ('ROCT PUT' not in current_trade_type and 'RULE ONE PUT' not in current_trade_type and not ('PUT' in current_trade_type and ('ROCT' in current_trade_type or 'RULE ONE' in current_trade_type))):
+                updates.append('ARORC = ?')
+                params.append(new_arorc)
+            
+            if updates:
+                params.append(trade_id)
+                query = f"UPDATE trades SET {', '.join(updates)} WHERE id = ?"
+                cursor.execute(query, params)
+            
+            conn.commit()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -2319,384 +2756,359 @@ def update_trade_status(trade_id):
         if not new_status:
             return jsonify({'error': 'Status is required'}), 400
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get current trade
-        cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-        trade = cursor.fetchone()
-        
-        if not trade:
-            conn.close()
-            return jsonify({'error': 'Trade not found'}), 404
-        
-        # Convert trade to dict for easier access
-        trade_dict = dict(trade) if hasattr(trade, 'keys') and not isinstance(trade, dict) else trade
-        print(f'[DEBUG] update_trade_status - trade_id: {trade_id}, new_status: {new_status}, trade_dict keys: {list(trade_dict.keys()) if isinstance(trade_dict, dict) else "N/A"}')
-        print(f'[DEBUG] update_trade_status - ticker_id: {trade_dict.get("ticker_id")}, expiration_date: {trade_dict.get("expiration_date")}, num_of_contracts: {trade_dict.get("num_of_contracts")}, strike_price: {trade_dict.get("strike_price")}')
-        
-        old_status = trade_dict.get('trade_status') or 'open'  # Default to 'open' if None
-        
-        # Update status and closing_debit based on new status
-        # If status is not 'roll' or 'closed', set closing_debit to 0.00
-        new_status_lower = new_status.lower() if new_status else ''
-        from datetime import datetime
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        if new_status_lower not in ['roll', 'closed']:
-            cursor.execute('UPDATE trades SET trade_status = ?, closing_debit = 0.00, total_debit = 0.00, date_trade_rolled = NULL WHERE id = ?', (new_status, trade_id))
-        else:
-            # Auto-fill today as roll/close date if not already set
-            cursor.execute('''
-                UPDATE trades SET trade_status = ?,
-                    date_trade_rolled = CASE WHEN date_trade_rolled IS NULL OR date_trade_rolled = '' THEN ? ELSE date_trade_rolled END
-                WHERE id = ?
-            ''', (new_status, current_date, trade_id))
-        
-        # Record status change (only if status actually changed)
-        if old_status != new_status:
-            try:
-                cursor.execute('''
-                    INSERT INTO trade_status_history (trade_id, old_status, new_status)
-                    VALUES (?, ?, ?)
-                ''', (trade_id, old_status, new_status))
-            except Exception as e:
-                # If trade_status_history table doesn't exist or has issues, log but don't fail
-                print(f'Warning: Could not insert into trade_status_history: {e}')
-                import traceback
-                print(f'Traceback: {traceback.format_exc()}')
-        
-        # Handle assigned trades - create cost basis entry and cash flow entry
-        if new_status == 'assigned' and old_status != 'assigned':
-            # Create assigned cost basis entry (same pattern as ROCT CALL)
-            create_assigned_cost_basis_entry(cursor, trade)
-            
-            # Create cash flow entry for the assignment
-            # Convert Row to dict if needed
-            account_id = trade_dict.get('account_id', 9)
-            ticker_id = trade_dict['ticker_id']
-            date_trade_open = trade_dict['date_trade_open']
-            num_of_contracts = trade_dict['num_of_contracts']
-            strike_price = trade_dict['strike_price']
-            trade_type = trade_dict['trade_type']
-            
-            # Get ticker symbol for description
-            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-            ticker = cursor.fetchone()['ticker']
-            
-            # Calculate total amount based on trade type:
-            # - PUTs (ROCT PUT, ROP): negative (we're being assigned to buy, money goes out)
-            # - CALLs (ROCT CALL, ROC): positive (we're being assigned to sell, money comes in)
-            shares = num_of_contracts * 100
-            if 'PUT' in trade_type or 'ROP' in trade_type:
-                # PUT assignment: negative amount (buying shares)
-                total_amount = -(strike_price * shares)
-                description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
-            else:
-                # CALL assignment: positive amount (selling shares)
-                total_amount = strike_price * shares
-                description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
+        # BEGIN IMMEDIATE takes the write lock up front, so the status update, history row and
+        # any cost basis, cash flow or roll trade writes below run in one transaction
+        with get_db() as conn:
+            cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
             
-            # Use expiration_date + 2 days as transaction_date for assigned trades
-            expiration_date = trade_dict.get('expiration_date', date_trade_open)
-            from datetime import datetime, timedelta
-            try:
-                exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
-                assignment_transaction_date = (exp_date_obj + timedelta(days=2)).strftime('%Y-%m-%d')
-            except:
-                assignment_transaction_date = expiration_date  # Fallback to expiration_date if parsing fails
+            # Get current trade (and its ticker symbol, used for assignment and roll entries)
+            cursor.execute(_SQL_GET_TRADE_FOR_STATUS, (trade_id,))
+            trade = cursor.fetchone()
             
-            cursor.execute('''
-                INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (account_id, assignment_transaction_date, 'ASSIGNMENT', round(total_amount, 2), 
-                  description, trade_id, ticker_id))
-            cash_flow_id = cursor.lastrowid
+            if not trade:
+                return jsonify({'error': 'Trade not found'}), 404
             
-            # Link the cost_basis entry to this cash flow
-            # Use expiration_date as transaction_date for cost_basis (cost_basis uses expiration_date, cash_flow uses expiration_date + 2)
-            assigned_date_trade_open = trade_dict.get('expiration_date', date_trade_open)
-            cursor.execute('''
-                UPDATE cost_basis SET cash_flow_id = ? 
-                WHERE trade_id = ? AND account_id = ? AND ticker_id = ? AND transaction_date = ?
-                AND description LIKE 'ASSIGNED%' AND cash_flow_id IS NULL
-            ''', (cash_flow_id, trade_id, account_id, ticker_id, assigned_date_trade_open))
-        
-        # Handle unassigning - delete assigned cost basis entry
-        elif old_status == 'assigned' and new_status != 'assigned':
-            # Convert Row to dict if needed
+            # Convert trade to dict for easier access
             trade_dict = dict(trade) if hasattr(trade, 'keys') and not isinstance(trade, dict) else trade
-            account_id = trade_dict.get('account_id', 9)
-            ticker_id = trade_dict['ticker_id']
-            
-            # Delete assigned cost basis entries
-            cursor.execute('''
-                DELETE FROM cost_basis 
-                WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
-                AND description LIKE 'ASSIGNED%'
-            ''', (trade_id, account_id, ticker_id))
-        
-        # Handle rolling - create a new trade entry
-        if new_status == 'roll' and old_status == 'open':
-            print(f'[DEBUG] Creating roll trade for trade_id: {trade_id}')
-            # Convert Row to dict if needed (already done above)
-            # trade_dict is already created at the beginning of the function
-            account_id = trade_dict.get('account_id', 9)
-            ticker_id = trade_dict.get('ticker_id')
-            if not ticker_id:
-                error_msg = f"Trade {trade_id} is missing ticker_id for roll"
-                print(f'Error: {error_msg}')
-                conn.rollback()
-                conn.close()
-                return jsonify({'error': error_msg}), 400
-            trade_type = trade_dict.get('trade_type', '')
-            print(f'[DEBUG] Roll trade - account_id: {account_id}, ticker_id: {ticker_id}, trade_type: {trade_type}')
-            
-            # Get ticker symbol for trade_type formatting
-            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-            ticker_row = cursor.fetchone()
-            if not ticker_row:
-                error_msg = f"Ticker not found for ticker_id {ticker_id} (trade_id: {trade_id})"
-                print(f'Error: {error_msg}')
-                conn.rollback()
-                conn.close()
-                return jsonify({'error': error_msg}), 400
-            ticker = ticker_row['ticker']
-            print(f'[DEBUG] Roll trade - ticker: {ticker}')
-            
-            # Get base trade type (remove ticker prefix if present)
-            base_trade_type = trade_type
-            if ticker and trade_type.startswith(ticker + ' '):
-                base_trade_type = trade_type[len(ticker) + 1:]
-            print(f'[DEBUG] Roll trade - base_trade_type: {base_trade_type}')
+            print(f'[DEBUG] update_trade_status - trade_id: {trade_id}, new_status: {new_status}, trade_dict keys: {list(trade_dict.keys()) if isinstance(trade_dict, dict) else "N/A"}')
+            print(f'[DEBUG] update_trade_status - ticker_id: {trade_dict.get("ticker_id")}, expiration_date: {trade_dict.get("expiration_date")}, num_of_contracts: {trade_dict.get("num_of_contracts")}, strike_price: {trade_dict.get("strike_price")}')
             
-            # Get trade_type_id
-            cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (base_trade_type,))
-            trade_type_row = cursor.fetchone()
-            trade_type_id = trade_type_row['id'] if trade_type_row else None
-            
-            # If trade_type_id is not found, try to get it from the original trade
-            if trade_type_id is None:
-                trade_type_id = trade_dict.get('trade_type_id')
-                print(f'Warning: trade_type_id not found for base_trade_type "{base_trade_type}", using original trade_type_id: {trade_type_id}')
+            old_status = trade_dict.get('trade_status') or 'open'  # Default to 'open' if None
             
-            # Get current date for the new trade and to set date_trade_rolled on parent
+            # Update status and closing_debit based on new status
+            # If status is not 'roll' or 'closed', set closing_debit to 0.00
+            new_status_lower = new_status.lower() if new_status else ''
             from datetime import datetime
             current_date = datetime.now().strftime('%Y-%m-%d')
-            
-            # Set date_trade_rolled on the original trade to current date
-            cursor.execute('UPDATE trades SET date_trade_rolled = ? WHERE id = ?', (current_date, trade_id))
-            
-            # Recalculate existing child trades' DTE and ARORC when parent is rolled
-            # Find all existing child trades
-            cursor.execute('SELECT * FROM trades WHERE trade_parent_id = ?', (trade_id,))
-            existing_child_trades = cursor.fetchall()
-            for child_row in existing_child_trades:
-                child_trade = safe_row_to_dict(child_row)
-                child_trade_id = child_trade.get('id')
-                child_date_trade_open = child_trade.get('date_trade_open')
-                
-                if child_date_trade_open:
-                    from datetime import datetime
-                    try:
-                        date_trade_open_obj = datetime.strptime(child_date_trade_open, '%Y-%m-%d')
-                        exp_date_obj = datetime.strptime(current_date, '%Y-%m-%d')  # Use parent's date_trade_rolled
-                        days_to_exp = (exp_date_obj - date_trade_open_obj).days
-                        
-                        # Update child trade's DTE
-                        cursor.execute('UPDATE trades SET days_to_expiration = ? WHERE id = ?', (days_to_exp, child_trade_id))
-                        
-                        # Recalculate child trade's ARORC if it's a ROCT PUT or RULE ONE PUT
-                        child_trade_type = child_trade.get('trade_type', '')
-                        if 'ROCT PUT' in child_trade_type or 'RULE ONE PUT' in child_trade_type or ('PUT' in child_trade_type and ('ROCT' in child_trade_type or 'RULE ONE' in child_trade_type)):
-                            child_net_credit = child_trade.get('net_credit_per_share', 0)
-                            child_strike = child_trade.get('strike_price', 0)
-                            child_margin_percent = child_trade.get('margin_percent', 100.0)
-                            
-                            risk_capital_unrounded = child_strike - child_net_credit
-                            if risk_capital_unrounded > 0 and days_to_exp > 0 and child_margin_percent > 0:
-                                denominator = risk_capital_unrounded * (child_margin_percent / 100.0)
-                                if denominator > 0:
-                                    arorc_decimal = (365.0 / days_to_exp) * (child_net_credit / denominator)
-                                    new_arorc = round_standard(arorc_decimal * 100.0, 1)
-                                    cursor.execute('UPDATE trades SET ARORC = ? WHERE id = ?', (new_arorc, child_trade_id))
-                    except Exception as e:
-                        print(f'Error recalculating child trade {child_trade_id}: {e}')
-                        pass  # If date parsing fails, skip recalculation
-            
-            # Get parent trade's original expiration date to save in child trade
-            # Child trade's expiration_date should store parent's original expiration_date
-            parent_expiration_date = trade_dict.get('expiration_date', current_date)
-            
-            # Format trade_type with ticker for options trades (same rules as ROCT CALL)
-            # Apply ticker prefix to all trade types that should have it
-            if base_trade_type in ['ROCT PUT', 'ROCT CALL', 'ROC', 'ROP', 'RULE ONE PUT', 'RULE ONE CALL']:
-                formatted_trade_type = f"{ticker} {base_trade_type}"
+            if new_status_lower not in ['roll', 'closed']:
+                cursor.execute('UPDATE trades SET trade_status = ?, closing_debit = 0.00, total_debit = 0.00, date_trade_rolled = NULL WHERE id = ?', (new_status, trade_id))
             else:
-                # For other trade types, preserve the original format (may already have ticker or may not need it)
-                formatted_trade_type = trade_type
-            print(f'[DEBUG] Roll trade - formatted_trade_type: {formatted_trade_type}')
-            print(f'[DEBUG] Roll trade - parent_expiration_date: {parent_expiration_date}')
-            
-            # Get commission rate in effect at trade date (using same logic as add_trade)
-            db = get_db_helper()
-            print(f'[DEBUG] Roll trade - Before get_commission_rate: account_id={account_id} (type: {type(account_id)}), date_trade_open={current_date} (type: {type(current_date)})', flush=True)
-            commission = db.get_commission_rate(account_id, current_date)
-            print(f'[DEBUG] Roll trade - Commission calculated for account_id={account_id}, date_trade_open={current_date}: {commission}', flush=True)
-            
-            # Create a new trade entry with default values (same rules as ROCT CALL roll)
-            # Use the same ticker, trade_type, and account
-            # Set default values for editable fields
-            # Set trade_parent_id to the original trade's ID
-            # Include ticker column (added in migration 015)
-            try:
-                # Calculate num_of_shares for child trade
-                child_num_of_contracts = trade_dict.get('num_of_contracts', 1)
-                # For options trades, num_of_shares = num_of_contracts * 100
-                # Check if it's an options trade (not BTO/STC)
-                child_num_of_shares = None
-                if base_trade_type not in ['BTO', 'STC']:
-                    child_num_of_shares = child_num_of_contracts * 100
-                
+                # Auto-fill today as roll/close date if not already set
                 cursor.execute('''
-                    INSERT INTO trades 
-                    (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
-                     credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status, 
-                     trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
-                     net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id, trade_parent_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    account_id,
-                    ticker_id,
-                    ticker,        # Include ticker column (same as ROCT CALL roll)
-                    current_date,  # Child's date_trade_open = current date (date when roll happened)
-                    parent_expiration_date,  # Child's expiration_date = parent's original expiration_date (save for reference)
-                    child_num_of_contracts,  # Use same num_of_contracts as parent trade
-                    child_num_of_shares,  # num_of_shares = num_of_contracts * 100 for options trades
-                    0.0,           # Default credit/debit (editable)
-                    0.0,           # Default total_premium
-                    0,             # Default DTE (will be recalculated using parent's date_trade_rolled)
-                    0.0,           # Default current_price
-                    0.0,           # Default strike (editable)
-                    None,          # long_strike (NULL for non-spread roll trades)
-                    'open',        # New trade starts as 'open'
-                    formatted_trade_type,    # Same trade_type (formatted with ticker)
-                    commission,   # Commission rate in effect at trade date
-                    0.0,           # Default price_per_share
-                    0.0,           # Default total_amount
-                    None,          # Default margin_capital (NULL)
-                    0.0,           # Default net_credit_per_share (will be recalculated when credit_debit is set)
-                    None,          # Default risk_capital_per_share (NULL)
-                    100.0,         # Default margin percent
-                    None,          # Default ARORC (NULL, will be recalculated using parent's date_trade_rolled)
-                    trade_type_id,  # trade_type_id
-                    trade_id  # trade_parent_id - set to the original trade's ID
-                ))
-                new_trade_id = cursor.lastrowid
-                print(f'[DEBUG] Roll trade - new_trade_id created: {new_trade_id}')
-            except Exception as e:
-                import traceback
-                error_msg = f"Error creating roll trade: {str(e)}"
-                print(f'Error: {error_msg}')
-                print(f'Traceback: {traceback.format_exc()}')
-                conn.rollback()
-                conn.close()
-                return jsonify({'error': error_msg}), 500
-            
-            # Don't create diagonal cost basis entry here - it will be created when the new trade
-            # is filled in with actual values (strike, credit, expiration_date) in update_trade_field
-            # This ensures the diagonal entry has real values, not default 0.0 values
-            
-            # Return the new trade ID so frontend can update it
-            conn.commit()
-            print(f'[DEBUG] Roll trade - committed, new_trade_id: {new_trade_id}')
-            conn.close()
+                    UPDATE trades SET trade_status = ?,
+                        date_trade_rolled = CASE WHEN date_trade_rolled IS NULL OR date_trade_rolled = '' THEN ? ELSE date_trade_rolled END
+                    WHERE id = ?
+                ''', (new_status, current_date, trade_id))
             
-            return jsonify({
-                'success': True,
-                'new_trade_id': new_trade_id,
-                'message': 'New trade created for roll'
-            })
-        
-        # Handle ROCS BPS closed -> auto-create adjacent ROP trade
-        trade_type_for_bps = trade_dict.get('trade_type', '')
-        if new_status == 'closed' and old_status == 'open' and ('BULL PUT SPREAD' in trade_type_for_bps or 'BPS' in trade_type_for_bps):
-            print(f'[DEBUG] ROCS BPS closed - creating adjacent ROP trade for trade_id: {trade_id}')
-            bps_account_id = trade_dict.get('account_id', 9)
-            bps_ticker_id = trade_dict.get('ticker_id')
-            from datetime import datetime
-            bps_current_date = datetime.now().strftime('%Y-%m-%d')
-            bps_expiration = next_friday_str = None
-            try:
-                def _next_friday(d):
-                    days_ahead = 4 - d.weekday()
-                    if days_ahead <= 0:
-                        days_ahead += 7
-                    return d + timedelta(days=days_ahead)
-                bps_expiration = _next_friday(datetime.now()).strftime('%Y-%m-%d')
-            except:
-                bps_expiration = bps_current_date
-
-            if bps_ticker_id:
-                cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (bps_ticker_id,))
-                bps_ticker_row = cursor.fetchone()
-                bps_ticker = bps_ticker_row['ticker'] if bps_ticker_row else 'TBD'
+            # Record status change (only if status actually changed)
+            if old_status != new_status:
+                try:
+                    cursor.execute('''
+                        INSERT INTO trade_status_history (trade_id, old_status, new_status)
+                        VALUES (?, ?, ?)
+                    ''', (trade_id, old_status, new_status))
+                except Exception as e:
+                    # If trade_status_history table doesn't exist or has issues, log but don't fail
+                    print(f'Warning: Could not insert into trade_status_history: {e}')
+                    import traceback
+                    print(f'Traceback: {traceback.format_exc()}')
+            
+            # Handle assigned trades - create cost basis entry and cash flow entry
+            if new_status == 'assigned' and old_status != 'assigned':
+                # Create assigned cost basis entry (same pattern as ROCT CALL)
+                cost_basis_id = create_assigned_cost_basis_entry(cursor, trade)
+                
+                # Create cash flow entry for the assignment
+                # Convert Row to dict if needed
+                account_id = trade_dict.get('account_id', 9)
+                ticker_id = trade_dict['ticker_id']
+                date_trade_open = trade_dict['date_trade_open']
+                num_of_contracts = trade_dict['num_of_contracts']
+                strike_price = trade_dict['strike_price']
+                trade_type = trade_dict['trade_type']
+                
+                # Ticker symbol for description
+                ticker = trade_dict['ticker_symbol']
+                
+                # Calculate total amount based on trade type:
+                # - PUTs (ROCT PUT, ROP): negative (we're being assigned to buy, money goes out)
+                # - CALLs (ROCT CALL, ROC): positive (we're being assigned to sell, money comes in)
+                shares = num_of_contracts * 100
+                if 'PUT' in trade_type or 'ROP' in trade_type:
+                    # PUT assignment: negative amount (buying shares)
+                    total_amount = -(strike_price * shares)
+                    description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
+                else:
+                    # CALL assignment: positive amount (selling shares)
+                    total_amount = strike_price * shares
+                    description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
                 
-                db = get_db_helper()
-                bps_commission = db.get_commission_rate(bps_account_id, bps_current_date)
+                # Use expiration_date + 2 days as transaction_date for assigned trades
+                expiration_date = trade_dict.get('expiration_date', date_trade_open)
+                from datetime import datetime, timedelta
+                try:
+                    exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
+                    assignment_transaction_date = (exp_date_obj + timedelta(days=2)).strftime('%Y-%m-%d')
+                except:
+                    assignment_transaction_date = expiration_date  # Fallback to expiration_date if parsing fails
                 
-                cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', ('ROP',))
-                rop_type_row = cursor.fetchone()
-                rop_type_id = rop_type_row['id'] if rop_type_row else None
-                bps_child_num_contracts = trade_dict.get('num_of_contracts', 1)
-                bps_child_num_shares = bps_child_num_contracts * 100
-
+                cursor.execute(_SQL_INSERT_TRADE_CASH_FLOW, (account_id, assignment_transaction_date, 'ASSIGNMENT', round(total_amount, 2),
+                                                             description, trade_id, ticker_id))
+                cash_flow_id = cursor.lastrowid
+                
+                # Link the cost_basis entry created above to this cash flow, by primary key
+                if cost_basis_id is not None:
+                    cursor.execute(_SQL_LINK_COST_BASIS_CASH_FLOW, (cash_flow_id, cost_basis_id))
+            
+            # Handle unassigning - delete assigned cost basis entry
+            elif old_status == 'assigned' and new_status != 'assigned':
+                # Convert Row to dict if needed
+                trade_dict = dict(trade) if hasattr(trade, 'keys') and not isinstance(trade, dict) else trade
+                account_id = trade_dict.get('account_id', 9)
+                ticker_id = trade_dict['ticker_id']
+                
+                # Delete assigned cost basis entries
                 cursor.execute('''
-                    INSERT INTO trades
-                    (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
-                     credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status,
-                     trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
-                     net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id, trade_parent_id)
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                ''', (
-                    bps_account_id, bps_ticker_id, bps_ticker, bps_current_date, bps_expiration,
-                    bps_child_num_contracts, bps_child_num_shares,
-                    0.0, 0.0, 0, 0.0, 0.0, None, 'open',
-                    f'{bps_ticker} ROP',
-                    bps_commission, 0.0, 0.0, None, 0.0, None, 100.0, None,
-                    rop_type_id, trade_id
-                ))
-                new_rop_trade_id = cursor.lastrowid
-                print(f'[DEBUG] ROCS BPS - created adjacent ROP trade_id: {new_rop_trade_id}')
+                    DELETE FROM cost_basis 
+                    WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
+                    AND description LIKE 'ASSIGNED%'
+                ''', (trade_id, account_id, ticker_id))
+            
+            # Handle rolling - create a new trade entry
+            if new_status == 'roll' and old_status == 'open':
+                print(f'[DEBUG] Creating roll trade for trade_id: {trade_id}')
+                # Convert Row to dict if needed (already done above)
+                # trade_dict is already created at the beginning of the function
+                account_id = trade_dict.get('account_id', 9)
+                ticker_id = trade_dict.get('ticker_id')
+                if not ticker_id:
+                    error_msg = f"Trade {trade_id} is missing ticker_id for roll"
+                    print(f'Error: {error_msg}')
+                    conn.rollback()
+                    return jsonify({'error': error_msg}), 400
+                trade_type = trade_dict.get('trade_type', '')
+                print(f'[DEBUG] Roll trade - account_id: {account_id}, ticker_id: {ticker_id}, trade_type: {trade_type}')
+                
+                # Ticker symbol for trade_type formatting
+                if not trade_dict['ticker_symbol']:
+                    error_msg = f"Ticker not found for ticker_id {ticker_id} (trade_id: {trade_id})"
+                    print(f'Error: {error_msg}')
+                    conn.rollback()
+                    return jsonify({'error': error_msg}), 400
+                ticker = trade_dict['ticker_symbol']
+                print(f'[DEBUG] Roll trade - ticker: {ticker}')
+                
+                # Get base trade type (remove ticker prefix if present)
+                base_trade_type = trade_type
+                if ticker and trade_type.startswith(ticker + ' '):
+                    base_trade_type = trade_type[len(ticker) + 1:]
+                print(f'[DEBUG] Roll trade - base_trade_type: {base_trade_type}')
+                
+                # Get trade_type_id
+                trade_type_row = get_trade_type(cursor, base_trade_type)
+                trade_type_id = trade_type_row['id'] if trade_type_row else None
+                
+                # If trade_type_id is not found, try to get it from the original trade
+                if trade_type_id is None:
+                    trade_type_id = trade_dict.get('trade_type_id')
+                    print(f'Warning: trade_type_id not found for base_trade_type "{base_trade_type}", using original trade_type_id: {trade_type_id}')
+                
+                # Get current date for the new trade and to set date_trade_rolled on parent
+                from datetime import datetime
+                current_date = datetime.now().strftime('%Y-%m-%d')
+                
+                # Set date_trade_rolled on the original trade to current date
+                cursor.execute('UPDATE trades SET date_trade_rolled = ? WHERE id = ?', (current_date, trade_id))
+                
+                # Recalculate existing child trades' DTE and ARORC when parent is rolled
+                # Find all existing child trades
+                cursor.execute('SELECT * FROM trades WHERE trade_parent_id = ?', (trade_id,))
+                existing_child_trades = cursor.fetchall()
+                for child_row in existing_child_trades:
+                    child_trade = safe_row_to_dict(child_row)
+                    child_trade_id = child_trade.get('id')
+                    child_date_trade_open = child_trade.get('date_trade_open')
+                    
+                    if child_date_trade_open:
+                        from datetime import datetime
+                        try:
+                            date_trade_open_obj = datetime.strptime(child_date_trade_open, '%Y-%m-%d')
+                            exp_date_obj = datetime.strptime(current_date, '%Y-%m-%d')  # Use parent's date_trade_rolled
+                            days_to_exp = (exp_date_obj - date_trade_open_obj).days
+                            
+                            # Update child trade's DTE
+                            cursor.execute('UPDATE trades SET days_to_expiration = ? WHERE id = ?', (days_to_exp, child_trade_id))
+                            
+                            # Recalculate child trade's ARORC if it's a ROCT PUT or RULE ONE PUT
+                            child_trade_type = child_trade.get('trade_type', '')
+                            if 'ROCT PUT' in child_trade_type or 'RULE ONE PUT' in child_trade_type or ('PUT' in child_trade_type and ('ROCT' in child_trade_type or 'RULE ONE' in child_trade_type)):
+                                child_net_credit = child_trade.get('net_credit_per_share', 0)
+                                child_strike = child_trade.get('strike_price', 0)
+                                child_margin_percent = child_trade.get('margin_percent', 100.0)
+                                
+                                risk_capital_unrounded = child_strike - child_net_credit
+                                if risk_capital_unrounded > 0 and days_to_exp > 0 and child_margin_percent > 0:
+                                    denominator = risk_capital_unrounded * (child_margin_percent / 100.0)
+                                    if denominator > 0:
+                                        arorc_decimal = (365.0 / days_to_exp) * (child_net_credit / denominator)
+                                        new_arorc = round_standard(arorc_decimal * 100.0, 1)
+                                        cursor.execute('UPDATE trades SET ARORC = ? WHERE id = ?', (new_arorc, child_trade_id))
+                        except Exception as e:
+                            print(f'Error recalculating child trade {child_trade_id}: {e}')
+                            pass  # If date parsing fails, skip recalculation
+                
+                # Get parent trade's original expiration date to save in child trade
+                # Child trade's expiration_date should store parent's original expiration_date
+                parent_expiration_date = trade_dict.get('expiration_date', current_date)
+                
+                # Format trade_type with ticker for options trades (same rules as ROCT CALL)
+                # Apply ticker prefix to all trade types that should have it
+                if base_trade_type in ['ROCT PUT', 'ROCT CALL', 'ROC', 'ROP', 'RULE ONE PUT', 'RULE ONE CALL']:
+                    formatted_trade_type = f"{ticker} {base_trade_type}"
+                else:
+                    # For other trade types, preserve the original format (may already have ticker or may not need it)
+                    formatted_trade_type = trade_type
+                print(f'[DEBUG] Roll trade - formatted_trade_type: {formatted_trade_type}')
+                print(f'[DEBUG] Roll trade - parent_expiration_date: {parent_expiration_date}')
+                
+                # Get commission rate in effect at trade date (using same logic as add_trade)
+                db = get_db_helper()
+                print(f'[DEBUG] Roll trade - Before get_commission_rate: account_id={account_id} (type: {type(account_id)}), date_trade_open={current_date} (type: {type(current_date)})', flush=True)
+                commission = db.get_commission_rate(account_id, current_date)
+                print(f'[DEBUG] Roll trade - Commission calculated for account_id={account_id}, date_trade_open={current_date}: {commission}', flush=True)
+                
+                # Create a new trade entry with default values (same rules as ROCT CALL roll)
+                # Use the same ticker, trade_type, and account
+                # Set default values for editable fields
+                # Set trade_parent_id to the original trade's ID
+                # Include ticker column (added in migration 015)
+                try:
+                    # Calculate num_of_shares for child trade
+                    child_num_of_contracts = trade_dict.get('num_of_contracts', 1)
+                    # For options trades, num_of_shares = num_of_contracts * 100
+                    # Check if it's an options trade (not BTO/STC)
+                    child_num_of_shares = None
+                    if base_trade_type not in ['BTO', 'STC']:
+                        child_num_of_shares = child_num_of_contracts * 100
+                    
+                    cursor.execute('''
+                        INSERT INTO trades 
+                        (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
+                         credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status, 
+                         trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
+                         net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id, trade_parent_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        account_id,
+                        ticker_id,
+                        ticker,        # Include ticker column (same as ROCT CALL roll)
+                        current_date,  # Child's date_trade_open = current date (date when roll happened)
+                        parent_expiration_date,  # Child's expiration_date = parent's original expiration_date (save for reference)
+                        child_num_of_contracts,  # Use same num_of_contracts as parent trade
+                        child_num_of_shares,  # num_of_shares = num_of_contracts * 100 for options trades
+                        0.0,           # Default credit/debit (editable)
+                        0.0,           # Default total_premium
+                        0,             # Default DTE (will be recalculated using parent's date_trade_rolled)
+                        0.0,           # Default current_price
+                        0.0,           # Default strike (editable)
+                        None,          # long_strike (NULL for non-spread roll trades)
+                        'open',        # New trade starts as 'open'
+                        formatted_trade_type,    # Same trade_type (formatted with ticker)
+                        commission,   # Commission rate in effect at trade date
+                        0.0,           # Default price_per_share
+                        0.0,           # Default total_amount
+                        None,          # Default margin_capital (NULL)
+                        0.0,           # Default net_credit_per_share (will be recalculated when credit_debit is set)
+                        None,          # Default risk_capital_per_share (NULL)
+                        100.0,         # Default margin percent
+                        None,          # Default ARORC (NULL, will be recalculated using parent's date_trade_rolled)
+                        trade_type_id,  # trade_type_id
+                        trade_id  # trade_parent_id - set to the original trade's ID
+                    ))
+                    new_trade_id = cursor.lastrowid
+                    print(f'[DEBUG] Roll trade - new_trade_id created: {new_trade_id}')
+                except Exception as e:
+                    import traceback
+                    error_msg = f"Error creating roll trade: {str(e)}"
+                    print(f'Error: {error_msg}')
+                    print(f'Traceback: {traceback.format_exc()}')
+                    conn.rollback()
+                    return jsonify({'error': error_msg}), 500
+                
+                # Don't create diagonal cost basis entry here - it will be created when the new trade
+                # is filled in with actual values (strike, credit, expiration_date) in update_trade_field
+                # This ensures the diagonal entry has real values, not default 0.0 values
+                
+                # Return the new trade ID so frontend can update it
                 conn.commit()
-                conn.close()
-                return jsonify({'success': True, 'new_trade_id': new_rop_trade_id, 'message': 'ROCS BPS closed; new ROP trade created'})
+                print(f'[DEBUG] Roll trade - committed, new_trade_id: {new_trade_id}')
+                
+                return jsonify({
+                    'success': True,
+                    'new_trade_id': new_trade_id,
+                    'message': 'New trade created for roll'
+                })
+            
+            # Handle ROCS BPS closed -> auto-create adjacent ROP trade
+            trade_type_for_bps = trade_dict.get('trade_type', '')
+            if new_status == 'closed' and old_status == 'open' and ('BULL PUT SPREAD' in trade_type_for_bps or 'BPS' in trade_type_for_bps):
+                print(f'[DEBUG] ROCS BPS closed - creating adjacent ROP trade for trade_id: {trade_id}')
+                bps_account_id = trade_dict.get('account_id', 9)
+                bps_ticker_id = trade_dict.get('ticker_id')
+                from datetime import datetime
+                bps_current_date = datetime.now().strftime('%Y-%m-%d')
+                bps_expiration = next_friday_str = None
+                try:
+                    def _next_friday(d):
+                        days_ahead = 4 - d.weekday()
+                        if days_ahead <= 0:
+                            days_ahead += 7
+                        return d + timedelta(days=days_ahead)
+                    bps_expiration = _next_friday(datetime.now()).strftime('%Y-%m-%d')
+                except:
+                    bps_expiration = bps_current_date
 
-        conn.commit()
-        conn.close()
+                if bps_ticker_id:
+                    bps_ticker = trade_dict['ticker_symbol'] or 'TBD'
+                    
+                    db = get_db_helper()
+                    bps_commission = db.get_commission_rate(bps_account_id, bps_current_date)
+                    
+                    rop_type_row = get_trade_type(cursor, 'ROP')
+                    rop_type_id = rop_type_row['id'] if rop_type_row else None
+                    bps_child_num_contracts = trade_dict.get('num_of_contracts', 1)
+                    bps_child_num_shares = bps_child_num_contracts * 100
+
+                    cursor.execute('''
+                        INSERT INTO trades
+                        (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
+                         credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status,
+                         trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
+                         net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id, trade_parent_id)
+                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    ''', (
+                        bps_account_id, bps_ticker_id, bps_ticker, bps_current_date, bps_expiration,
+                        bps_child_num_contracts, bps_child_num_shares,
+                        0.0, 0.0, 0, 0.0, 0.0, None, 'open',
+                        f'{bps_ticker} ROP',
+                        bps_commission, 0.0, 0.0, None, 0.0, None, 100.0, None,
+                        rop_type_id, trade_id
+                    ))
+                    new_rop_trade_id = cursor.lastrowid
+                    print(f'[DEBUG] ROCS BPS - created adjacent ROP trade_id: {new_rop_trade_id}')
+                    conn.commit()
+                    return jsonify({'success': True, 'new_trade_id': new_rop_trade_id, 'message': 'ROCS BPS closed; new ROP trade created'})
+
+            conn.commit()
         
         # Invalidate metrics cache for this account
         db = get_db_helper()
         account_id = trade_dict.get('account_id')
         if account_id:
             db.invalidate_metrics_cache(account_id=account_id)
+            schedule_bankroll_summary_refresh(account_id)
         
         return jsonify({'success': True})
     except Exception as e:
         import traceback
         print(f'Error updating trade status: {e}')
         print(f'Traceback: {traceback.format_exc()}')
-        if 'conn' in locals():
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
         return jsonify({'error': f'Failed to update trade status: {str(e)}'}), 500
 
 @app.route('/api/trades/quick-add', methods=['POST'])
 def quick_add_trade():
     """Create a new trade with default values for quick add functionality"""
-    conn = None
     try:
         data = request.get_json()
         trade_type = data.get('tradeType')
@@ -2746,82 +3158,78 @@ def quick_add_trade():
             ticker_id = db.create_or_get_ticker(ticker, ticker)
         
         # Get trade_type_id
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (trade_type,))
-        trade_type_row = cursor.fetchone()
-        trade_type_id = trade_type_row['id'] if trade_type_row else None
-        
-        if trade_type_id is None:
-            conn.close()
-            return jsonify({'error': f'Invalid trade type: "{trade_type}" does not exist in trade_types table'}), 400
-        
-        # Format trade_type with ticker for options trades
-        base_trade_type = trade_type
-        if trade_type in ['ROCT PUT', 'ROCT CALL', 'ROP', 'ROC', 'ROCS BULL PUT SPREAD']:
-            formatted_trade_type = f"{ticker} {trade_type}"
-        else:
-            formatted_trade_type = trade_type
-        
-        # Get commission rate in effect at trade date
-        print(f'[DEBUG] Quick add - Before get_commission_rate: account_id={account_id} (type: {type(account_id)}), date_trade_open={current_date} (type: {type(current_date)})', flush=True)
-        commission = db.get_commission_rate(account_id, current_date)
-        print(f'[DEBUG] Quick add - Commission calculated for account_id={account_id}, date_trade_open={current_date}: {commission}', flush=True)
-        
-        # Default values (same as roll trade creation)
-        num_of_contracts = 1
-        num_of_shares = num_of_contracts * 100  # For options trades
-        
-        # Insert trade with default values
-        try:
-            cursor.execute('''
-                INSERT INTO trades 
-                (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
-                 credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status, 
-                 trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
-                 net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                account_id,
-                ticker_id,
-                ticker,
-                current_date,
-                expiration_date,
-                num_of_contracts,
-                num_of_shares,
-                0.0,           # Default credit/debit (editable)
-                0.0,           # Default total_premium
-                0,             # Default DTE (will be recalculated when dates are set)
-                0.0,           # Default current_price
-                0.0,           # Default strike (editable)
-                None,          # long_strike (NULL for non-spread; user fills in)
-                'open',        # New trade starts as 'open'
-                formatted_trade_type,
-                commission,   # Commission rate in effect at trade date
-                0.0,           # Default price_per_share
-                0.0,           # Default total_amount
-                None,          # Default margin_capital (NULL)
-                0.0,           # Default net_credit_per_share (will be recalculated when credit_debit is set)
-                None,          # Default risk_capital_per_share (NULL)
-                100.0,         # Default margin percent
-                None,          # Default ARORC (NULL, will be recalculated when dates/strikes are set)
-                trade_type_id
-            ))
-            new_trade_id = cursor.lastrowid
-            print(f'[DEBUG] Quick add - new_trade_id created: {new_trade_id}')
-        except Exception as e:
-            import traceback
-            error_msg = f"Error creating quick add trade: {str(e)}"
-            print(f'Error: {error_msg}')
-            print(f'Traceback: {traceback.format_exc()}')
-            conn.rollback()
-            conn.close()
-            return jsonify({'error': error_msg}), 500
-        
-        # Commit and return
-        conn.commit()
-        print(f'[DEBUG] Quick add - committed, new_trade_id: {new_trade_id}')
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            trade_type_row = get_trade_type(cursor, trade_type)
+            trade_type_id = trade_type_row['id'] if trade_type_row else None
+            
+            if trade_type_id is None:
+                return jsonify({'error': f'Invalid trade type: "{trade_type}" does not exist in trade_types table'}), 400
+            
+            # Format trade_type with ticker for options trades
+            base_trade_type = trade_type
+            if trade_type in ['ROCT PUT', 'ROCT CALL', 'ROP', 'ROC', 'ROCS BULL PUT SPREAD']:
+                formatted_trade_type = f"{ticker} {trade_type}"
+            else:
+                formatted_trade_type = trade_type
+            
+            # Get commission rate in effect at trade date
+            print(f'[DEBUG] Quick add - Before get_commission_rate: account_id={account_id} (type: {type(account_id)}), date_trade_open={current_date} (type: {type(current_date)})', flush=True)
+            commission = db.get_commission_rate(account_id, current_date)
+            print(f'[DEBUG] Quick add - Commission calculated for account_id={account_id}, date_trade_open={current_date}: {commission}', flush=True)
+            
+            # Default values (same as roll trade creation)
+            num_of_contracts = 1
+            num_of_shares = num_of_contracts * 100  # For options trades
+            
+            # Insert trade with default values
+            try:
+                cursor.execute('''
+                    INSERT INTO trades 
+                    (account_id, ticker_id, ticker, date_trade_open, expiration_date, num_of_contracts, num_of_shares,
+                     credit_debit, total_premium, days_to_expiration, current_price, strike_price, long_strike, trade_status, 
+                     trade_type, commission_per_share, price_per_share, total_amount, margin_capital,
+                     net_credit_per_share, risk_capital_per_share, margin_percent, ARORC, trade_type_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    account_id,
+                    ticker_id,
+                    ticker,
+                    current_date,
+                    expiration_date,
+                    num_of_contracts,
+                    num_of_shares,
+                    0.0,           # Default credit/debit (editable)
+                    0.0,           # Default total_premium
+                    0,             # Default DTE (will be recalculated when dates are set)
+                    0.0,           # Default current_price
+                    0.0,           # Default strike (editable)
+                    None,          # long_strike (NULL for non-spread; user fills in)
+                    'open',        # New trade starts as 'open'
+                    formatted_trade_type,
+                    commission,   # Commission rate in effect at trade date
+                    0.0,           # Default price_per_share
+                    0.0,           # Default total_amount
+                    None,          # Default margin_capital (NULL)
+                    0.0,           # Default net_credit_per_share (will be recalculated when credit_debit is set)
+                    None,          # Default risk_capital_per_share (NULL)
+                    100.0,         # Default margin percent
+                    None,          # Default ARORC (NULL, will be recalculated when dates/strikes are set)
+                    trade_type_id
+                ))
+                new_trade_id = cursor.lastrowid
+                print(f'[DEBUG] Quick add - new_trade_id created: {new_trade_id}')
+            except Exception as e:
+                import traceback
+                error_msg = f"Error creating quick add trade: {str(e)}"
+                print(f'Error: {error_msg}')
+                print(f'Traceback: {traceback.format_exc()}')
+                conn.rollback()
+                return jsonify({'error': error_msg}), 500
+            
+            # Commit and return
+            conn.commit()
+            print(f'[DEBUG] Quick add - committed, new_trade_id: {new_trade_id}')
         
         return jsonify({
             'success': True,
@@ -2832,12 +3240,6 @@ def quick_add_trade():
         import traceback
         print(f'Error in quick_add_trade: {e}')
         print(f'Traceback: {traceback.format_exc()}')
-        if conn:
-            try:
-                conn.rollback()
-                conn.close()
-            except:
-                pass
         return jsonify({'error': f'Failed to create quick add trade: {str(e)}'}), 500
 
 def create_roll_diagonal_cost_basis_entry(cursor, new_trade_id, original_trade_id, account_id, ticker_id, 
@@ -2920,7 +3322,7 @@ def create_roll_diagonal_cost_basis_entry(cursor, new_trade_id, original_trade_i
         print(f"Traceback: {traceback.format_exc()}")
 
 def create_assigned_cost_basis_entry(cursor, trade):
-    """Create cost basis entry for assigned trades"""
+    """Create cost basis entry for assigned trades and return its id (None if the trade already has one)"""
     print(f"Creating assigned cost basis entry for trade: {trade}")
     # Convert Row to dict for easier access
     trade_dict = dict(trade) if isinstance(trade, sqlite3.Row) else trade
@@ -2931,7 +3333,28 @@ def create_assigned_cost_basis_entry(cursor, trade):
     trade_id = trade_dict.get('id')
     if not trade_id:
         raise ValueError(f"trade_id is required for assigned trades")
-    date_trade_open = trade_dict.get('date_trade_open')
+    
+    # Ticker and whether an assigned cost basis entry already exists for this trade, in one query
+    context = get_cost_basis_context(cursor, account_id, ticker_id, trade_id)
+    if not context:
+        raise ValueError(f"Ticker not found for ticker_id {ticker_id} (trade_id: {trade_id})")
+    
+    if context['already_assigned']:
+        print(f"Assigned cost basis entry already exists for trade {trade_id}, skipping creation")
+        return None
+    
+    # Insert cost basis entry (use expiration_date as transaction_date for assigned trades),
+    # then fill in its running totals (and any later entries')
+    assigned_date_trade_open, description, shares, cost_per_share, total_amount = assigned_cost_basis_values(context['ticker'], trade_dict)
+    cursor.execute(_SQL_INSERT_COST_BASIS, (account_id, ticker_id, trade_id, None, assigned_date_trade_open, description, shares, cost_per_share,
+                                            total_amount, 0, 0, 0))
+    cost_basis_id = cursor.lastrowid
+    recalculate_running_totals(cursor, account_id, ticker_id, cost_basis_id)
+    return cost_basis_id
+
+def assigned_cost_basis_values(ticker, trade_dict):
+    """(transaction_date, description, shares, cost_per_share, total_amount) of the ASSIGNED cost basis entry for a trade"""
+    trade_id = trade_dict.get('id')
     trade_type = trade_dict.get('trade_type', '')
     num_of_contracts = trade_dict.get('num_of_contracts', 0)
     strike_price = trade_dict.get('strike_price', 0)
@@ -2942,43 +3365,6 @@ def create_assigned_cost_basis_entry(cursor, trade):
     if not strike_price or strike_price == 0:
         raise ValueError(f"strike_price must be greater than 0 for assigned trades (trade_id: {trade_id})")
     
-    # Check if an assigned cost basis entry already exists for this trade
-    cursor.execute('''
-        SELECT COUNT(*) as count FROM cost_basis
-        WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
-        AND description LIKE 'ASSIGNED%'
-    ''', (trade_id, account_id, ticker_id))
-    existing_count = cursor.fetchone()['count']
-    
-    if existing_count > 0:
-        print(f"Assigned cost basis entry already exists for trade {trade_id}, skipping creation")
-        return
-    
-    # Get current running totals BEFORE creating the assigned entry
-    # Use transaction_date to get the most recent entry chronologically
-    cursor.execute('''
-        SELECT running_basis, running_shares 
-        FROM cost_basis 
-        WHERE ticker_id = ? AND account_id = ?
-        ORDER BY transaction_date DESC, rowid DESC 
-        LIMIT 1
-    ''', (ticker_id, account_id))
-    
-    last_entry = cursor.fetchone()
-    if last_entry:
-        running_basis = last_entry['running_basis']
-        running_shares = last_entry['running_shares']
-    else:
-        running_basis = 0
-        running_shares = 0
-    
-    # Get ticker for description
-    cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-    ticker_row = cursor.fetchone()
-    if not ticker_row:
-        raise ValueError(f"Ticker not found for ticker_id {ticker_id} (trade_id: {trade_id})")
-    ticker = ticker_row['ticker']
-    
     # Use expiration date as the transaction date for assigned trades
     expiration_date = trade_dict.get('expiration_date')
     if not expiration_date:
@@ -2989,7 +3375,7 @@ def create_assigned_cost_basis_entry(cursor, trade):
     
     # Format expiration date
     try:
-        exp_date = datetime.strptime(expiration_date, '%Y-%m-%d').strftime('%d-%b-%y').upper()
+        exp_date = format_expiration(expiration_date)
     except (ValueError, TypeError) as e:
         print(f"Error parsing expiration_date '{expiration_date}' for trade {trade_id}: {e}")
         raise ValueError(f"Invalid expiration_date format for trade {trade_id}: {expiration_date}")
@@ -2998,7 +3384,8 @@ def create_assigned_cost_basis_entry(cursor, trade):
     num_shares = num_of_contracts * 100
     
     # Determine if this is a PUT or CALL based on trade type
-    is_put = 'PUT' in trade_type.upper() or 'ROP' in trade_type.upper()
+    trade_type_upper = trade_type.upper()
+    is_put = 'PUT' in trade_type_upper or 'ROP' in trade_type_upper
     
     # Create description as "ASSIGNED " + exp date + trade type
     if is_put:
@@ -3012,22 +3399,7 @@ def create_assigned_cost_basis_entry(cursor, trade):
         cost_per_share = strike_price
         total_amount = -(strike_price * num_shares)  # Make negative for sold
     
-    # Get current running totals for this account and ticker
-    # Update running totals (running_basis and running_shares already retrieved above)
-    new_running_basis = running_basis + total_amount
-    new_running_shares = running_shares + shares
-    
-    # Calculate basis per share
-    basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
-    
-    # Insert cost basis entry (use expiration_date as transaction_date for assigned trades)
-    cursor.execute('''
-        INSERT INTO cost_basis 
-        (account_id, ticker_id, trade_id, cash_flow_id, transaction_date, description, shares, cost_per_share, 
-         total_amount, running_basis, running_shares, basis_per_share)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (account_id, ticker_id, trade_id, None, assigned_date_trade_open, description, shares, cost_per_share,
-          total_amount, new_running_basis, new_running_shares, basis_per_share))
+    return assigned_date_trade_open, description, shares, cost_per_share, total_amount
 
 def safe_row_to_dict(row):
     """Safely convert SQLite Row object to dict, handling all edge cases"""
@@ -3067,6 +3439,33 @@ def get_effective_expiration_date(cursor, trade):
     # Use trade's own expiration_date
     return trade.get('expiration_date')
 
+def _blank_or(convert, default):
+    """Coercer returning default for an empty/blank value and convert(value) otherwise"""
+    return lambda value: convert(value) if value and str(value).strip() else default
+
+def _price(value):
+    return round_standard(float(value), 2)
+
+# Fields PUT /api/trades/<id>/field may update (snake_case, matching the database schema),
+# each with the coercion applied to the posted value before it is written
+TRADE_FIELD_COERCERS = {
+    'num_of_contracts': _blank_or(int, 1),
+    'credit_debit': _blank_or(float, 0.0),
+    'strike_price': _blank_or(_price, 0.0),
+    'long_strike': _blank_or(_price, None),
+    'trade_status': str,
+    'current_price': _blank_or(_price, 0.0),
+    'expiration_date': str,  # Date string in YYYY-MM-DD format
+    'ticker': lambda value: str(value).upper(),
+    'date_trade_open': str,  # Date string in YYYY-MM-DD format
+    'account_id': int,
+    'closing_debit': _blank_or(float, 0.0),
+    'total_debit': lambda value: value,
+    'date_trade_rolled': str,  # Date string in YYYY-MM-DD format
+    'notes': lambda value: str(value) if value else None,
+    'needs_review': lambda value: value,
+}
+
 @app.route('/api/trades/<int:trade_id>/field', methods=['PUT'])
 def update_trade_field(trade_id):
     try:
@@ -3074,106 +3473,77 @@ def update_trade_field(trade_id):
         field = data['field']
         value = data['value']
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Validate field name (use snake_case to match database schema)
-        valid_fields = ['num_of_contracts', 'credit_debit', 'strike_price', 'long_strike', 'trade_status', 'current_price', 'expiration_date', 'ticker', 'date_trade_open', 'account_id', 'closing_debit', 'total_debit', 'date_trade_rolled', 'notes', 'needs_review']
-        if field not in valid_fields:
-            return jsonify({'error': 'Invalid field'}), 400
-        
-        # Get current trade to recalculate dependent fields
-        cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-        trade_row = cursor.fetchone()
-        
-        if not trade_row:
-            return jsonify({'error': 'Trade not found'}), 404
-        
-        # Convert Row to dict for easier access
-        trade = safe_row_to_dict(trade_row)
-        
-        # Get ticker for cost basis entry creation
-        ticker_id = trade.get('ticker_id')
-        if ticker_id:
-            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-            ticker_row = cursor.fetchone()
-            if ticker_row:
-                ticker_row_dict = safe_row_to_dict(ticker_row)
-                ticker = ticker_row_dict.get('ticker', '')
-            else:
-                ticker = ''
-        else:
-            ticker = ''
-        
-        updates = []
-        params = []
-        
-        # Convert value to appropriate type (field names already match database schema)
-        db_field_name = field
-        if field == 'num_of_contracts':
-            value = int(value) if value and str(value).strip() else 1
-        elif field == 'credit_debit':
-            value = float(value) if value and str(value).strip() else 0.0
-        elif field == 'strike_price':
-            value = round_standard(float(value), 2) if value and str(value).strip() else 0.0
-        elif field == 'long_strike':
-            value = round_standard(float(value), 2) if value and str(value).strip() else None
-        elif field == 'current_price':
-            value = round_standard(float(value), 2) if value and str(value).strip() else 0.0
-        elif field == 'expiration_date':
-            value = str(value)  # Date string in YYYY-MM-DD format
-        elif field == 'date_trade_open':
-            value = str(value)  # Date string in YYYY-MM-DD format
-        elif field == 'trade_status':
-            value = str(value)
-        elif field == 'account_id':
-            value = int(value)
-        elif field == 'ticker':
-            # Ticker needs special handling - update ticker_id instead
-            ticker = str(value).upper()
-            # Get or create ticker (case-insensitive)
-            cursor.execute('SELECT id FROM tickers WHERE UPPER(ticker) = UPPER(?)', (ticker,))
-            symbol_row = cursor.fetchone()
-            
-            if symbol_row:
-                symbol_row_dict = safe_row_to_dict(symbol_row)
-                ticker_id = symbol_row_dict.get('id')
-            else:
-                # Create new ticker (store as uppercase)
-                cursor.execute('INSERT INTO tickers (ticker, company_name) VALUES (?, ?)', (ticker.upper(), ticker))
-                ticker_id = cursor.lastrowid
-            
-            # Update ticker_id instead of ticker
-            db_field_name = 'ticker_id'
-            value = ticker_id
-        elif field == 'closing_debit':
-            value = float(value) if value and str(value).strip() else 0.0
-            # Calculate total_debit = closing_debit * num_of_shares
-            num_of_shares = trade.get('num_of_shares')
-            if num_of_shares:
-                total_debit = value * num_of_shares
-                updates.append('total_debit = ?')
-                params.append(total_debit)
-        elif field == 'date_trade_rolled':
-            value = str(value)  # Date string in YYYY-MM-DD format
-            # Recalculate child trade's DTE, RORC, and ARORC using parent's date_trade_rolled as effective expiration_date
-            # This will be handled after the update
-        elif field == 'notes':
-            value = str(value) if value else None
-        
-        # Update the field
-        updates.append(f'{db_field_name} = ?')
-        params.append(value)
-        
-        # Recalculate dependent fields based on what changed
-        if field == 'expiration_date':
-            # Recalculate days_to_expiration
-            # For child trades, use parent's date_trade_rolled as effective expiration_date
-            date_trade_open = trade.get('date_trade_open')
-            if date_trade_open:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            
+            # Validate field name (use snake_case to match database schema)
+            coerce = TRADE_FIELD_COERCERS.get(field)
+            if coerce is None:
+                return jsonify({'error': 'Invalid field'}), 400
+            
+            # Get current trade (with its ticker for cost basis entry creation) to recalculate dependent fields
+            cursor.execute(_SQL_GET_TRADE_WITH_TICKER, (trade_id,))
+            trade_row = cursor.fetchone()
+            
+            if not trade_row:
+                return jsonify({'error': 'Trade not found'}), 404
+            
+            # Convert Row to dict for easier access
+            trade = safe_row_to_dict(trade_row)
+            ticker = trade.pop('ticker_symbol') or ''
+
+            updates = []
+            params = []
+            
+            # Convert value to appropriate type (field names already match database schema)
+            value = coerce(value)
+            db_field_name = field
+            if field == 'ticker':
+                # Ticker needs special handling - update ticker_id instead
+                ticker = value
+                # Get or create ticker in one statement (tickers are stored upper-case)
+                cursor.execute(UPSERT_TICKER_SQL, {'ticker': ticker, 'company_name': ticker})
+                ticker_id = cursor.fetchone()['id']
+                
+                # Update ticker_id instead of ticker
+                db_field_name = 'ticker_id'
+                value = ticker_id
+            elif field == 'closing_debit':
+                # Calculate total_debit = closing_debit * num_of_shares
+                num_of_shares = trade.get('num_of_shares')
+                if num_of_shares:
+                    total_debit = value * num_of_shares
+                    updates.append('total_debit = ?')
+                    params.append(total_debit)
+            
+            # Update the field
+            updates.append(f'{db_field_name} = ?')
+            params.append(value)
+            
+            # Recalculate dependent fields based on what changed
+            if field == 'expiration_date':
+                # Recalculate days_to_expiration
+                # For child trades, use parent's date_trade_rolled as effective expiration_date
+                date_trade_open = trade.get('date_trade_open')
+                if date_trade_open:
+                    from datetime import datetime
+                    try:
+                        date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                        # Get effective expiration date (parent's date_trade_rolled for child trades)
+                        effective_exp_date = get_effective_expiration_date(cursor, trade)
+                        if effective_exp_date:
+                            exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                            days_to_exp = (exp_date_obj - date_trade_open_obj).days
+                            updates.append('days_to_expiration = ?')
+                            params.append(days_to_exp)
+                    except:
+                        pass  # If date parsing fails, skip DTE calculation
+            elif field == 'date_trade_open':
+                # Recalculate days_to_expiration when date_trade_open changes
+                # For child trades, use parent's date_trade_rolled as effective expiration_date
                 from datetime import datetime
                 try:
-                    date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                    date_trade_open_obj = datetime.strptime(value, '%Y-%m-%d')
                     # Get effective expiration date (parent's date_trade_rolled for child trades)
                     effective_exp_date = get_effective_expiration_date(cursor, trade)
                     if effective_exp_date:
@@ -3183,978 +3553,962 @@ def update_trade_field(trade_id):
                         params.append(days_to_exp)
                 except:
                     pass  # If date parsing fails, skip DTE calculation
-        elif field == 'date_trade_open':
-            # Recalculate days_to_expiration when date_trade_open changes
-            # For child trades, use parent's date_trade_rolled as effective expiration_date
-            from datetime import datetime
-            try:
-                date_trade_open_obj = datetime.strptime(value, '%Y-%m-%d')
-                # Get effective expiration date (parent's date_trade_rolled for child trades)
-                effective_exp_date = get_effective_expiration_date(cursor, trade)
-                if effective_exp_date:
-                    exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                    days_to_exp = (exp_date_obj - date_trade_open_obj).days
-                    updates.append('days_to_expiration = ?')
-                    params.append(days_to_exp)
-            except:
-                pass  # If date parsing fails, skip DTE calculation
-            
-            # Diagonal entry creation is now handled AFTER the trade update (see below)
-        elif field == 'date_trade_rolled':
-            # When parent's date_trade_rolled is updated, recalculate child trade's DTE, RORC, and ARORC
-            # Find all child trades
-            cursor.execute('SELECT * FROM trades WHERE trade_parent_id = ?', (trade_id,))
-            child_trades = cursor.fetchall()
-            for child_row in child_trades:
-                child_trade = safe_row_to_dict(child_row)
-                child_trade_id = child_trade.get('id')
-                child_date_trade_open = child_trade.get('date_trade_open')
                 
-                if child_date_trade_open and value:
-                    from datetime import datetime
-                    try:
-                        date_trade_open_obj = datetime.strptime(child_date_trade_open, '%Y-%m-%d')
-                        exp_date_obj = datetime.strptime(value, '%Y-%m-%d')  # Use parent's date_trade_rolled
-                        days_to_exp = (exp_date_obj - date_trade_open_obj).days
-                        
-                        # Update child trade's DTE
-                        cursor.execute('UPDATE trades SET days_to_expiration = ? WHERE id = ?', (days_to_exp, child_trade_id))
-                        
-                        # Recalculate child trade's ARORC if it's a ROCT PUT or RULE ONE PUT
-                        child_trade_type = child_trade.get('trade_type', '')
-                        if 'ROCT PUT' in child_trade_type or 'RULE ONE PUT' in child_trade_type or ('PUT' in child_trade_type and ('ROCT' in child_trade_type or 'RULE ONE' in child_trade_type)):
-                            child_net_credit = child_trade.get('net_credit_per_share', 0)
-                            child_strike = child_trade.get('strike_price', 0)
-                            child_margin_percent = child_trade.get('margin_percent', 100.0)
+                # Diagonal entry creation is now handled AFTER the trade update (see below)
+            elif field == 'date_trade_rolled':
+                # When parent's date_trade_rolled is updated, recalculate child trade's DTE, RORC, and ARORC
+                # Find all child trades
+                cursor.execute('SELECT * FROM trades WHERE trade_parent_id = ?', (trade_id,))
+                child_trades = cursor.fetchall()
+                for child_row in child_trades:
+                    child_trade = safe_row_to_dict(child_row)
+                    child_trade_id = child_trade.get('id')
+                    child_date_trade_open = child_trade.get('date_trade_open')
+                    
+                    if child_date_trade_open and value:
+                        from datetime import datetime
+                        try:
+                            date_trade_open_obj = datetime.strptime(child_date_trade_open, '%Y-%m-%d')
+                            exp_date_obj = datetime.strptime(value, '%Y-%m-%d')  # Use parent's date_trade_rolled
+                            days_to_exp = (exp_date_obj - date_trade_open_obj).days
                             
-                            risk_capital_unrounded = child_strike - child_net_credit
-                            if risk_capital_unrounded > 0 and days_to_exp > 0 and child_margin_percent > 0:
-                                denominator = risk_capital_unrounded * (child_margin_percent / 100.0)
-                                if denominator > 0:
-                                    arorc_decimal = (365.0 / days_to_exp) * (child_net_credit / denominator)
-                                    new_arorc = round_standard(arorc_decimal * 100.0, 1)
-                                    cursor.execute('UPDATE trades SET ARORC = ? WHERE id = ?', (new_arorc, child_trade_id))
-                    except:
-                        pass  # If date parsing fails, skip recalculation
-        
-        # Recalculate dependent fields based on what changed
-        if field == 'num_of_contracts':
-            # Update num_of_shares for options trades
-            trade_type = trade.get('trade_type', '')
-            base_trade_type = trade_type
-            # Remove ticker prefix if present
-            if ' ' in trade_type:
-                base_trade_type = trade_type.split(' ', 1)[1] if ' ' in trade_type else trade_type
-            
-            if base_trade_type not in ['BTO', 'STC']:
-                # For options trades, num_of_shares = num_of_contracts * 100
-                new_num_of_shares = value * 100
-                updates.append('num_of_shares = ?')
-                params.append(new_num_of_shares)
-            
-            # Recalculate total_premium
-            current_credit_debit = trade.get('credit_debit', 0)
-            new_total_premium = current_credit_debit * value
-            updates.append('total_premium = ?')
-            params.append(new_total_premium)
-            
-            # Recalculate margin_capital
-            # Use unrounded risk_capital_per_share for margin_capital calculation
-            current_strike = trade.get('strike_price', 0)
-            
-            if 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type:
-                # BPS: risk_capital = (short_strike - long_strike) - net_credit; commission doubled
-                current_commission = trade.get('commission_per_share', 0)
-                current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
-                long_strike_val = trade.get('long_strike') or 0
-                spread_width = (current_strike or 0) - long_strike_val
-                if spread_width > 0:
-                    risk_capital_unrounded = spread_width - current_net_credit
-                    new_margin_capital = value * 100 * risk_capital_unrounded
-                    updates.append('margin_capital = ?')
-                    params.append(new_margin_capital)
-            elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                # Calculate unrounded risk_capital_per_share for margin_capital
-                current_commission = trade.get('commission_per_share', 0)
-                current_net_credit = round_standard((current_credit_debit - current_commission), 5)
-                risk_capital_unrounded = current_strike - current_net_credit
-                new_margin_capital = value * 100 * risk_capital_unrounded
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            elif trade_type not in ['BTO', 'STC'] and current_strike > 0:
-                current_commission = trade.get('commission_per_share', 0)
-                current_net_credit = trade.get('net_credit_per_share', current_credit_debit - current_commission)
-                new_margin_capital = (current_strike - current_net_credit) * value * 100
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-        
-        elif field == 'credit_debit':
-            # Recalculate total_premium
-            current_num_contracts = trade.get('num_of_contracts', 1)
-            new_total_premium = value * current_num_contracts
-            updates.append('total_premium = ?')
-            params.append(new_total_premium)
-            
-            # BPS has two legs, so commission is charged twice per share
-            trade_type = trade.get('trade_type', '')
-            current_commission = trade.get('commission_per_share', 0)
-            is_bps = 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type
-            eff_commission = current_commission * 2 if is_bps else current_commission
-            new_net_credit = round_standard((value - eff_commission), 5)
-            updates.append('net_credit_per_share = ?')
-            params.append(new_net_credit)
-            
-            # Diagonal entry creation is now handled AFTER the trade update (see below)
-            
-            # Recalculate risk_capital_per_share for PUT-based and spread trades
-            current_strike = trade.get('strike_price', 0)
-            new_risk_capital = None  # Initialize for ARORC calculation
-            
-            if is_bps:
-                # BPS: risk_capital = (short_strike - long_strike) - net_credit
-                long_strike_val = trade.get('long_strike') or 0
-                spread_width = (current_strike or 0) - long_strike_val
-                if spread_width > 0:
-                    new_risk_capital = round_standard((spread_width - new_net_credit), 2)
-                    updates.append('risk_capital_per_share = ?')
-                    params.append(new_risk_capital)
-                    new_margin_capital = current_num_contracts * 100 * new_risk_capital
-                    updates.append('margin_capital = ?')
-                    params.append(new_margin_capital)
-            elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                new_risk_capital = round_standard((current_strike - new_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
+                            # Update child trade's DTE
+                            cursor.execute('UPDATE trades SET days_to_expiration = ? WHERE id = ?', (days_to_exp, child_trade_id))
+                            
+                            # Recalculate child trade's ARORC if it's a ROCT PUT or RULE ONE PUT
+                            child_trade_type = child_trade.get('trade_type', '')
+                            if 'ROCT PUT' in child_trade_type or 'RULE ONE PUT' in child_trade_type or ('PUT' in child_trade_type and ('ROCT' in child_trade_type or 'RULE ONE' in child_trade_type)):
+                                child_net_credit = child_trade.get('net_credit_per_share', 0)
+                                child_strike = child_trade.get('strike_price', 0)
+                                child_margin_percent = child_trade.get('margin_percent', 100.0)
+                                
+                                risk_capital_unrounded = child_strike - child_net_credit
+                                if risk_capital_unrounded > 0 and days_to_exp > 0 and child_margin_percent > 0:
+                                    denominator = risk_capital_unrounded * (child_margin_percent / 100.0)
+                                    if denominator > 0:
+                                        arorc_decimal = (365.0 / days_to_exp) * (child_net_credit / denominator)
+                                        new_arorc = round_standard(arorc_decimal * 100.0, 1)
+                                        cursor.execute('UPDATE trades SET ARORC = ? WHERE id = ?', (new_arorc, child_trade_id))
+                        except:
+                            pass  # If date parsing fails, skip recalculation
+            
+            # Recalculate dependent fields based on what changed
+            if field == 'num_of_contracts':
+                # Update num_of_shares for options trades
+                trade_type = trade.get('trade_type', '')
+                base_trade_type = trade_type
+                # Remove ticker prefix if present
+                if ' ' in trade_type:
+                    base_trade_type = trade_type.split(' ', 1)[1] if ' ' in trade_type else trade_type
+                
+                if base_trade_type not in ['BTO', 'STC']:
+                    # For options trades, num_of_shares = num_of_contracts * 100
+                    new_num_of_shares = value * 100
+                    updates.append('num_of_shares = ?')
+                    params.append(new_num_of_shares)
+                
+                # Recalculate total_premium
+                current_credit_debit = trade.get('credit_debit', 0)
+                new_total_premium = current_credit_debit * value
+                updates.append('total_premium = ?')
+                params.append(new_total_premium)
                 
                 # Recalculate margin_capital
-                new_margin_capital = current_num_contracts * 100 * new_risk_capital
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-            else:
-                updates.append('risk_capital_per_share = ?')
-                params.append(None)
+                # Use unrounded risk_capital_per_share for margin_capital calculation
+                current_strike = trade.get('strike_price', 0)
                 
-                # For other options trades, recalculate margin_capital
-                if trade_type not in ['BTO', 'STC'] and current_strike > 0:
-                    new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+                if 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type:
+                    # BPS: risk_capital = (short_strike - long_strike) - net_credit; commission doubled
+                    current_commission = trade.get('commission_per_share', 0)
+                    current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
+                    long_strike_val = trade.get('long_strike') or 0
+                    spread_width = (current_strike or 0) - long_strike_val
+                    if spread_width > 0:
+                        risk_capital_unrounded = spread_width - current_net_credit
+                        new_margin_capital = value * 100 * risk_capital_unrounded
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+                elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                    # Calculate unrounded risk_capital_per_share for margin_capital
+                    current_commission = trade.get('commission_per_share', 0)
+                    current_net_credit = round_standard((current_credit_debit - current_commission), 5)
+                    risk_capital_unrounded = current_strike - current_net_credit
+                    new_margin_capital = value * 100 * risk_capital_unrounded
+                    updates.append('margin_capital = ?')
+                    params.append(new_margin_capital)
+                elif trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                    current_commission = trade.get('commission_per_share', 0)
+                    current_net_credit = trade.get('net_credit_per_share', current_credit_debit - current_commission)
+                    new_margin_capital = (current_strike - current_net_credit) * value * 100
                     updates.append('margin_capital = ?')
                     params.append(new_margin_capital)
             
-            # Recalculate ARORC for ROCT PUT and RULE ONE PUT trades
-            # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-            # Use unrounded risk_capital_per_share for ARORC calculation
-            if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                # For child trades, use effective expiration date (parent's date_trade_rolled) for DTE calculation
-                date_trade_open = trade.get('date_trade_open')
-                effective_exp_date = get_effective_expiration_date(cursor, trade)
-                days_to_expiration = trade.get('days_to_expiration', 0)
+            elif field == 'credit_debit':
+                # Recalculate total_premium
+                current_num_contracts = trade.get('num_of_contracts', 1)
+                new_total_premium = value * current_num_contracts
+                updates.append('total_premium = ?')
+                params.append(new_total_premium)
                 
-                # Recalculate DTE if we have effective expiration date
-                if date_trade_open and effective_exp_date:
-                    from datetime import datetime
-                    try:
-                        date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
-                        exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                        days_to_expiration = (exp_date_obj - date_trade_open_obj).days
-                        updates.append('days_to_expiration = ?')
-                        params.append(days_to_expiration)
-                    except:
-                        pass  # If date parsing fails, use existing days_to_expiration
+                # BPS has two legs, so commission is charged twice per share
+                trade_type = trade.get('trade_type', '')
+                current_commission = trade.get('commission_per_share', 0)
+                is_bps = 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type
+                eff_commission = current_commission * 2 if is_bps else current_commission
+                new_net_credit = round_standard((value - eff_commission), 5)
+                updates.append('net_credit_per_share = ?')
+                params.append(new_net_credit)
                 
-                margin_percent = trade.get('margin_percent', 100.0)
+                # Diagonal entry creation is now handled AFTER the trade update (see below)
                 
-                # Calculate unrounded risk_capital_per_share for ARORC calculation
-                risk_capital_unrounded = current_strike - new_net_credit
-                if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
-                    # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                    denominator = risk_capital_unrounded * (margin_percent / 100.0)
-                    if denominator > 0:
-                        # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                        arorc_decimal = (365.0 / days_to_expiration) * (new_net_credit / denominator)
-                        new_arorc = round_standard(arorc_decimal * 100.0, 1)
-                        updates.append('ARORC = ?')
-                        params.append(new_arorc)
-        
-        elif field == 'strike_price':
-            # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades
-            trade_type = trade.get('trade_type', '')
-            current_credit_debit = trade.get('credit_debit', 0)
-            current_commission = trade.get('commission_per_share', 0)
-            current_net_credit = round_standard((current_credit_debit - current_commission), 5)
-            
-            # For BPS trades, use spread width as risk capital instead of naked-put formula
-            is_bps_strike = 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type
-            if is_bps_strike:
-                # BPS has two legs: double the commission when computing net credit
-                current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
-                long_strike_val = trade.get('long_strike') or 0
-                spread_width = value - long_strike_val
-                if spread_width > 0 and long_strike_val > 0:
-                    new_risk_capital = round_standard((spread_width - current_net_credit), 2)
-                    current_num_contracts = trade.get('num_of_contracts', 1)
+                # Recalculate risk_capital_per_share for PUT-based and spread trades
+                current_strike = trade.get('strike_price', 0)
+                new_risk_capital = None  # Initialize for ARORC calculation
+                
+                if is_bps:
+                    # BPS: risk_capital = (short_strike - long_strike) - net_credit
+                    long_strike_val = trade.get('long_strike') or 0
+                    spread_width = (current_strike or 0) - long_strike_val
+                    if spread_width > 0:
+                        new_risk_capital = round_standard((spread_width - new_net_credit), 2)
+                        updates.append('risk_capital_per_share = ?')
+                        params.append(new_risk_capital)
+                        new_margin_capital = current_num_contracts * 100 * new_risk_capital
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+                elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                    new_risk_capital = round_standard((current_strike - new_net_credit), 2)
                     updates.append('risk_capital_per_share = ?')
                     params.append(new_risk_capital)
+                    
+                    # Recalculate margin_capital
+                    new_margin_capital = current_num_contracts * 100 * new_risk_capital
                     updates.append('margin_capital = ?')
-                    params.append(current_num_contracts * 100 * new_risk_capital)
+                    params.append(new_margin_capital)
+                else:
+                    updates.append('risk_capital_per_share = ?')
+                    params.append(None)
+                    
+                    # For other options trades, recalculate margin_capital
+                    if trade_type not in ['BTO', 'STC'] and current_strike > 0:
+                        new_margin_capital = (current_strike - new_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
+                
+                # Recalculate ARORC for ROCT PUT and RULE ONE PUT trades
+                # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+                # Use unrounded risk_capital_per_share for ARORC calculation
+                if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                    # For child trades, use effective expiration date (parent's date_trade_rolled) for DTE calculation
                     date_trade_open = trade.get('date_trade_open')
                     effective_exp_date = get_effective_expiration_date(cursor, trade)
                     days_to_expiration = trade.get('days_to_expiration', 0)
+                    
+                    # Recalculate DTE if we have effective expiration date
                     if date_trade_open and effective_exp_date:
                         from datetime import datetime
                         try:
-                            dte_open = datetime.strptime(date_trade_open, '%Y-%m-%d')
-                            dte_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                            days_to_expiration = (dte_exp - dte_open).days
+                            date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                            exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                            days_to_expiration = (exp_date_obj - date_trade_open_obj).days
                             updates.append('days_to_expiration = ?')
                             params.append(days_to_expiration)
                         except:
-                            pass
+                            pass  # If date parsing fails, use existing days_to_expiration
+                    
                     margin_percent = trade.get('margin_percent', 100.0)
-                    risk_capital_unrounded = spread_width - current_net_credit
+                    
+                    # Calculate unrounded risk_capital_per_share for ARORC calculation
+                    risk_capital_unrounded = current_strike - new_net_credit
                     if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                        # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
                         denominator = risk_capital_unrounded * (margin_percent / 100.0)
                         if denominator > 0:
-                            arorc_decimal = (365.0 / days_to_expiration) * (current_net_credit / denominator)
+                            # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
+                            arorc_decimal = (365.0 / days_to_expiration) * (new_net_credit / denominator)
+                            new_arorc = round_standard(arorc_decimal * 100.0, 1)
                             updates.append('ARORC = ?')
-                            params.append(round_standard(arorc_decimal * 100.0, 1))
-            elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                new_risk_capital = round_standard((value - current_net_credit), 2)
-                updates.append('risk_capital_per_share = ?')
-                params.append(new_risk_capital)
-                
-                # Recalculate margin_capital
-                # Use unrounded risk_capital_per_share for margin_capital calculation
-                current_num_contracts = trade.get('num_of_contracts', 1)
-                risk_capital_unrounded = value - current_net_credit
-                new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
-                updates.append('margin_capital = ?')
-                params.append(new_margin_capital)
-                
-                # Recalculate ARORC
-                # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-                # Use unrounded risk_capital_per_share for ARORC calculation
-                # For child trades, use effective expiration date (parent's date_trade_rolled) for DTE calculation
-                date_trade_open = trade.get('date_trade_open')
-                effective_exp_date = get_effective_expiration_date(cursor, trade)
-                days_to_expiration = trade.get('days_to_expiration', 0)
-                
-                # Recalculate DTE if we have effective expiration date
-                if date_trade_open and effective_exp_date:
-                    from datetime import datetime
-                    try:
-                        date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
-                        exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                        days_to_expiration = (exp_date_obj - date_trade_open_obj).days
-                        updates.append('days_to_expiration = ?')
-                        params.append(days_to_expiration)
-                    except:
-                        pass  # If date parsing fails, use existing days_to_expiration
-                
-                margin_percent = trade.get('margin_percent', 100.0)
-                
-                # Calculate unrounded risk_capital_per_share for ARORC calculation
-                risk_capital_unrounded = value - current_net_credit
-                if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
-                    # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                    denominator = risk_capital_unrounded * (margin_percent / 100.0)
-                    if denominator > 0:
-                        # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                        arorc_decimal = (365.0 / days_to_expiration) * (current_net_credit / denominator)
-                        new_arorc = round_standard(arorc_decimal * 100.0, 1)
-                        updates.append('ARORC = ?')
-                        params.append(new_arorc)
-            else:
-                # For other options trades, recalculate margin_capital
-                if trade_type not in ['BTO', 'STC'] and value > 0:
-                    current_num_contracts = trade.get('num_of_contracts', 1)
-                    new_margin_capital = (value - current_net_credit) * current_num_contracts * 100
-                    updates.append('margin_capital = ?')
-                    params.append(new_margin_capital)
+                            params.append(new_arorc)
             
-            # Diagonal entry creation is now handled AFTER the trade update (see below)
-        
-        elif field == 'long_strike':
-            # Recalculate spread risk capital / ARORC when long strike changes on BPS trades
-            trade_type = trade.get('trade_type', '')
-            if 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type:
-                short_strike = trade.get('strike_price', 0) or 0
-                current_credit_debit = trade.get('credit_debit', 0) or 0
-                current_commission = trade.get('commission_per_share', 0) or 0
-                # BPS has two legs: double the commission
-                current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
-                long_strike_val = value or 0
-                spread_width = short_strike - long_strike_val
-                if spread_width > 0:
-                    new_risk_capital = round_standard((spread_width - current_net_credit), 2)
-                    current_num_contracts = trade.get('num_of_contracts', 1)
+            elif field == 'strike_price':
+                # Recalculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades
+                trade_type = trade.get('trade_type', '')
+                current_credit_debit = trade.get('credit_debit', 0)
+                current_commission = trade.get('commission_per_share', 0)
+                current_net_credit = round_standard((current_credit_debit - current_commission), 5)
+                
+                # For BPS trades, use spread width as risk capital instead of naked-put formula
+                is_bps_strike = 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type
+                if is_bps_strike:
+                    # BPS has two legs: double the commission when computing net credit
+                    current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
+                    long_strike_val = trade.get('long_strike') or 0
+                    spread_width = value - long_strike_val
+                    if spread_width > 0 and long_strike_val > 0:
+                        new_risk_capital = round_standard((spread_width - current_net_credit), 2)
+                        current_num_contracts = trade.get('num_of_contracts', 1)
+                        updates.append('risk_capital_per_share = ?')
+                        params.append(new_risk_capital)
+                        updates.append('margin_capital = ?')
+                        params.append(current_num_contracts * 100 * new_risk_capital)
+                        date_trade_open = trade.get('date_trade_open')
+                        effective_exp_date = get_effective_expiration_date(cursor, trade)
+                        days_to_expiration = trade.get('days_to_expiration', 0)
+                        if date_trade_open and effective_exp_date:
+                            from datetime import datetime
+                            try:
+                                dte_open = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                                dte_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                                days_to_expiration = (dte_exp - dte_open).days
+                                updates.append('days_to_expiration = ?')
+                                params.append(days_to_expiration)
+                            except:
+                                pass
+                        margin_percent = trade.get('margin_percent', 100.0)
+                        risk_capital_unrounded = spread_width - current_net_credit
+                        if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                            denominator = risk_capital_unrounded * (margin_percent / 100.0)
+                            if denominator > 0:
+                                arorc_decimal = (365.0 / days_to_expiration) * (current_net_credit / denominator)
+                                updates.append('ARORC = ?')
+                                params.append(round_standard(arorc_decimal * 100.0, 1))
+                elif 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                    new_risk_capital = round_standard((value - current_net_credit), 2)
                     updates.append('risk_capital_per_share = ?')
                     params.append(new_risk_capital)
+                    
+                    # Recalculate margin_capital
+                    # Use unrounded risk_capital_per_share for margin_capital calculation
+                    current_num_contracts = trade.get('num_of_contracts', 1)
+                    risk_capital_unrounded = value - current_net_credit
+                    new_margin_capital = current_num_contracts * 100 * risk_capital_unrounded
                     updates.append('margin_capital = ?')
-                    params.append(current_num_contracts * 100 * new_risk_capital)
+                    params.append(new_margin_capital)
+                    
+                    # Recalculate ARORC
+                    # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+                    # Use unrounded risk_capital_per_share for ARORC calculation
+                    # For child trades, use effective expiration date (parent's date_trade_rolled) for DTE calculation
                     date_trade_open = trade.get('date_trade_open')
                     effective_exp_date = get_effective_expiration_date(cursor, trade)
                     days_to_expiration = trade.get('days_to_expiration', 0)
+                    
+                    # Recalculate DTE if we have effective expiration date
                     if date_trade_open and effective_exp_date:
                         from datetime import datetime
                         try:
-                            dte_open = datetime.strptime(date_trade_open, '%Y-%m-%d')
-                            dte_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                            days_to_expiration = (dte_exp - dte_open).days
+                            date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                            exp_date_obj = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                            days_to_expiration = (exp_date_obj - date_trade_open_obj).days
                             updates.append('days_to_expiration = ?')
                             params.append(days_to_expiration)
                         except:
-                            pass
+                            pass  # If date parsing fails, use existing days_to_expiration
+                    
                     margin_percent = trade.get('margin_percent', 100.0)
-                    risk_capital_unrounded = spread_width - current_net_credit
+                    
+                    # Calculate unrounded risk_capital_per_share for ARORC calculation
+                    risk_capital_unrounded = value - current_net_credit
                     if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                        # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
                         denominator = risk_capital_unrounded * (margin_percent / 100.0)
                         if denominator > 0:
+                            # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
                             arorc_decimal = (365.0 / days_to_expiration) * (current_net_credit / denominator)
+                            new_arorc = round_standard(arorc_decimal * 100.0, 1)
                             updates.append('ARORC = ?')
-                            params.append(round_standard(arorc_decimal * 100.0, 1))
-        
-        # Execute update
-        if updates:
-            params.append(trade_id)
-            query = f"UPDATE trades SET {', '.join(updates)} WHERE id = ?"
-            print(f'[DEBUG] update_trade_field - Executing UPDATE: field={field}, value={value}, trade_id={trade_id}, query={query}, params={params}', flush=True)
-            cursor.execute(query, params)
-            print(f'[DEBUG] update_trade_field - UPDATE executed, rows affected: {cursor.rowcount}', flush=True)
-        else:
-            print(f'[DEBUG] update_trade_field - No updates to execute for field={field}, value={value}, trade_id={trade_id}', flush=True)
-        
-        # After updating the trade (or even if no updates), check if we need to create a diagonal entry for roll trades
-        # Get the updated trade to check for roll trade status
-        cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
-        updated_trade_row = cursor.fetchone()
-        if updated_trade_row:
-            # Convert Row to dict safely
-            updated_trade = safe_row_to_dict(updated_trade_row)
-            
-            # Check if this is a roll trade (child) and if we need to create/update a diagonal entry
-            # This should be done AFTER the trade is updated so we can use the updated values
-            # Check for diagonal entry creation/update whenever any relevant field is updated
-            trade_parent_id = updated_trade.get('trade_parent_id')
-            if trade_parent_id and field in ['strike_price', 'credit_debit', 'expiration_date', 'num_of_contracts', 'date_trade_open', 'current_price', 'ticker', 'account_id']:
-                # Get updated values from the updated trade
-                new_exp_date = updated_trade.get('expiration_date')
-                new_strike = updated_trade.get('strike_price', 0)
-                new_credit = updated_trade.get('credit_debit', 0)
-                new_num_contracts = updated_trade.get('num_of_contracts', 1)
-                
-                print(f'[DEBUG] update_trade_field - After update: trade_id={trade_id}, trade_parent_id={trade_parent_id}, new_exp_date={new_exp_date}, new_strike={new_strike}, new_credit={new_credit}')
+                            params.append(new_arorc)
+                else:
+                    # For other options trades, recalculate margin_capital
+                    if trade_type not in ['BTO', 'STC'] and value > 0:
+                        current_num_contracts = trade.get('num_of_contracts', 1)
+                        new_margin_capital = (value - current_net_credit) * current_num_contracts * 100
+                        updates.append('margin_capital = ?')
+                        params.append(new_margin_capital)
                 
-                # Find the parent trade that was rolled
-                cursor.execute('''
-                    SELECT id, expiration_date, strike_price, trade_type, num_of_contracts
-                    FROM trades 
-                    WHERE id = ?
-                ''', (trade_parent_id,))
-                original_trade = cursor.fetchone()
+                # Diagonal entry creation is now handled AFTER the trade update (see below)
+            
+            elif field == 'long_strike':
+                # Recalculate spread risk capital / ARORC when long strike changes on BPS trades
+                trade_type = trade.get('trade_type', '')
+                if 'BULL PUT SPREAD' in trade_type or 'BPS' in trade_type:
+                    short_strike = trade.get('strike_price', 0) or 0
+                    current_credit_debit = trade.get('credit_debit', 0) or 0
+                    current_commission = trade.get('commission_per_share', 0) or 0
+                    # BPS has two legs: double the commission
+                    current_net_credit = round_standard((current_credit_debit - current_commission * 2), 5)
+                    long_strike_val = value or 0
+                    spread_width = short_strike - long_strike_val
+                    if spread_width > 0:
+                        new_risk_capital = round_standard((spread_width - current_net_credit), 2)
+                        current_num_contracts = trade.get('num_of_contracts', 1)
+                        updates.append('risk_capital_per_share = ?')
+                        params.append(new_risk_capital)
+                        updates.append('margin_capital = ?')
+                        params.append(current_num_contracts * 100 * new_risk_capital)
+                        date_trade_open = trade.get('date_trade_open')
+                        effective_exp_date = get_effective_expiration_date(cursor, trade)
+                        days_to_expiration = trade.get('days_to_expiration', 0)
+                        if date_trade_open and effective_exp_date:
+                            from datetime import datetime
+                            try:
+                                dte_open = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                                dte_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                                days_to_expiration = (dte_exp - dte_open).days
+                                updates.append('days_to_expiration = ?')
+                                params.append(days_to_expiration)
+                            except:
+                                pass
+                        margin_percent = trade.get('margin_percent', 100.0)
+                        risk_capital_unrounded = spread_width - current_net_credit
+                        if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                            denominator = risk_capital_unrounded * (margin_percent / 100.0)
+                            if denominator > 0:
+                                arorc_decimal = (365.0 / days_to_expiration) * (current_net_credit / denominator)
+                                updates.append('ARORC = ?')
+                                params.append(round_standard(arorc_decimal * 100.0, 1))
+            
+            # Execute update
+            if updates:
+                params.append(trade_id)
+                query = f"UPDATE trades SET {', '.join(updates)} WHERE id = ?"
+                print(f'[DEBUG] update_trade_field - Executing UPDATE: field={field}, value={value}, trade_id={trade_id}, query={query}, params={params}', flush=True)
+                cursor.execute(query, params)
+                print(f'[DEBUG] update_trade_field - UPDATE executed, rows affected: {cursor.rowcount}', flush=True)
+            else:
+                print(f'[DEBUG] update_trade_field - No updates to execute for field={field}, value={value}, trade_id={trade_id}', flush=True)
+            
+            # After updating the trade (or even if no updates), check if we need to create a diagonal entry for roll trades
+            # Get the updated trade to check for roll trade status
+            cursor.execute('SELECT * FROM trades WHERE id = ?', (trade_id,))
+            updated_trade_row = cursor.fetchone()
+            if updated_trade_row:
+                # Convert Row to dict safely
+                updated_trade = safe_row_to_dict(updated_trade_row)
                 
-                if original_trade:
-                    # Convert Row to dict for safe access
-                    original_trade_dict = safe_row_to_dict(original_trade)
-                    original_exp_date = original_trade_dict.get('expiration_date')
-                    original_strike = original_trade_dict.get('strike_price', 0)
-                    original_trade_type = original_trade_dict.get('trade_type', '')
-                    original_trade_id = original_trade_dict.get('id')
-                    print(f'[DEBUG] update_trade_field - After update: original_trade_id={original_trade_id}, original_exp_date={original_exp_date}')
+                # Check if this is a roll trade (child) and if we need to create/update a diagonal entry
+                # This should be done AFTER the trade is updated so we can use the updated values
+                # Check for diagonal entry creation/update whenever any relevant field is updated
+                trade_parent_id = updated_trade.get('trade_parent_id')
+                if trade_parent_id and field in ['strike_price', 'credit_debit', 'expiration_date', 'num_of_contracts', 'date_trade_open', 'current_price', 'ticker', 'account_id']:
+                    # Get updated values from the updated trade
+                    new_exp_date = updated_trade.get('expiration_date')
+                    new_strike = updated_trade.get('strike_price', 0)
+                    new_credit = updated_trade.get('credit_debit', 0)
+                    new_num_contracts = updated_trade.get('num_of_contracts', 1)
                     
-                    # Check if cost basis entry already exists for this roll trade
-                    # Match any number of contracts (SELL -1, SELL -2, etc.)
-                    cursor.execute('''
-                        SELECT id FROM cost_basis 
-                        WHERE trade_id = ? AND description LIKE 'SELL -% DIAGONAL%'
-                    ''', (trade_id,))
-                    existing_entry = cursor.fetchone()
+                    print(f'[DEBUG] update_trade_field - After update: trade_id={trade_id}, trade_parent_id={trade_parent_id}, new_exp_date={new_exp_date}, new_strike={new_strike}, new_credit={new_credit}')
                     
-                    # Get ticker symbol
-                    ticker_id = updated_trade.get('ticker_id')
-                    if ticker_id:
-                        cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-                        ticker_row = cursor.fetchone()
-                        if ticker_row:
-                            ticker_row_dict = safe_row_to_dict(ticker_row)
-                            ticker_symbol = ticker_row_dict.get('ticker', '')
-                        else:
-                            ticker_symbol = ''
-                    else:
-                        ticker_symbol = ''
+                    # Find the parent trade that was rolled
+                    cursor.execute('''
+                        SELECT id, expiration_date, strike_price, trade_type, num_of_contracts
+                        FROM trades 
+                        WHERE id = ?
+                    ''', (trade_parent_id,))
+                    original_trade = cursor.fetchone()
                     
-                    # If diagonal entry exists, update it with current values
-                    # If it doesn't exist and we have required values, create it
-                    if existing_entry:
-                        # Update existing diagonal entry - use current values even if some are 0
-                        # This allows updating fields like num_of_contracts, date_trade_open, etc.
-                        existing_entry_dict = safe_row_to_dict(existing_entry)
-                        diagonal_entry_id = existing_entry_dict.get('id')
-                        
-                        # Get current values from the existing diagonal entry to use as fallbacks
-                        cursor.execute('SELECT description FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
-                        existing_diagonal = cursor.fetchone()
-                        existing_diagonal_dict = safe_row_to_dict(existing_diagonal)
-                        existing_description = existing_diagonal_dict.get('description', '') if existing_diagonal_dict else ''
-                        
-                        # Import datetime and re for parsing
-                        from datetime import datetime
-                        import re
+                    if original_trade:
+                        # Convert Row to dict for safe access
+                        original_trade_dict = safe_row_to_dict(original_trade)
+                        original_exp_date = original_trade_dict.get('expiration_date')
+                        original_strike = original_trade_dict.get('strike_price', 0)
+                        original_trade_type = original_trade_dict.get('trade_type', '')
+                        original_trade_id = original_trade_dict.get('id')
+                        print(f'[DEBUG] update_trade_field - After update: original_trade_id={original_trade_id}, original_exp_date={original_exp_date}')
                         
-                        # Use current values from updated trade, or fall back to original if not set
-                        effective_strike = new_strike if new_strike > 0 else (original_strike if original_strike else 0)
-                        effective_credit = new_credit if new_credit != 0 else 0
-                        effective_exp_date = new_exp_date if new_exp_date else (original_exp_date if original_exp_date else None)
+                        # Check if cost basis entry already exists for this roll trade
+                        # Match any number of contracts (SELL -1, SELL -2, etc.)
+                        cursor.execute('''
+                            SELECT id FROM cost_basis 
+                            WHERE trade_id = ? AND description LIKE 'SELL -% DIAGONAL%'
+                        ''', (trade_id,))
+                        existing_entry = cursor.fetchone()
                         
-                        # If we don't have required values, try to extract them from existing description
-                        if effective_strike == 0 or effective_credit == 0 or not effective_exp_date:
-                            # Try to parse from existing description (format: SELL -1 DIAGONAL TICKER 100 DATE1/DATE2 STRIKE1/STRIKE2 PUT @ CREDIT)
-                            if effective_credit == 0:
-                                match = re.search(r'@\s*([\d.]+)', existing_description)
-                                if match:
-                                    effective_credit = float(match.group(1))
-                            if effective_strike == 0:
-                                match = re.search(r'(\d+\.?\d*)/(\d+\.?\d*)\s+(PUT|CALL)', existing_description)
-                                if match:
-                                    # First number is child strike, second is parent strike
-                                    effective_strike = float(match.group(1))
-                            if not effective_exp_date:
-                                # Try to extract date from description (format: DD-MMM-YY/DD-MMM-YY)
-                                match = re.search(r'(\d{2}-[A-Z]{3}-\d{2})/(\d{2}-[A-Z]{3}-\d{2})', existing_description)
-                                if match:
-                                    # First date is child expiration, second is parent expiration
-                                    try:
-                                        child_date_str = match.group(1)
-                                        # Convert DD-MMM-YY to YYYY-MM-DD
-                                        child_date = datetime.strptime(child_date_str, '%d-%b-%y')
-                                        effective_exp_date = child_date.strftime('%Y-%m-%d')
-                                    except:
-                                        pass
+                        # Get ticker symbol
+                        ticker_id = updated_trade.get('ticker_id')
+                        if ticker_id:
+                            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
+                            ticker_row = cursor.fetchone()
+                            if ticker_row:
+                                ticker_row_dict = safe_row_to_dict(ticker_row)
+                                ticker_symbol = ticker_row_dict.get('ticker', '')
+                            else:
+                                ticker_symbol = ''
+                        else:
+                            ticker_symbol = ''
                         
-                        # Only update if we have minimum required values
-                        if effective_strike > 0 and effective_credit != 0 and effective_exp_date:
-                            print(f'[DEBUG] update_trade_field - After update: Updating existing diagonal entry')
-                            # Update the existing diagonal entry with new values
-                            
-                            # Format dates as DD-MMM-YY
-                            try:
-                                new_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
-                                new_exp_formatted = new_exp.strftime('%d-%b-%y').upper()
-                            except:
-                                new_exp_formatted = effective_exp_date
+                        # If diagonal entry exists, update it with current values
+                        # If it doesn't exist and we have required values, create it
+                        if existing_entry:
+                            # Update existing diagonal entry - use current values even if some are 0
+                            # This allows updating fields like num_of_contracts, date_trade_open, etc.
+                            existing_entry_dict = safe_row_to_dict(existing_entry)
+                            diagonal_entry_id = existing_entry_dict.get('id')
                             
-                            try:
-                                orig_exp = datetime.strptime(original_exp_date, '%Y-%m-%d')
-                                orig_exp_formatted = orig_exp.strftime('%d-%b-%y').upper()
-                            except:
-                                orig_exp_formatted = original_exp_date
+                            # Get current values from the existing diagonal entry to use as fallbacks
+                            cursor.execute('SELECT description FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
+                            existing_diagonal = cursor.fetchone()
+                            existing_diagonal_dict = safe_row_to_dict(existing_diagonal)
+                            existing_description = existing_diagonal_dict.get('description', '') if existing_diagonal_dict else ''
                             
-                            # Determine if it's PUT or CALL based on trade_type
-                            is_put = 'PUT' in original_trade_type or 'ROP' in original_trade_type
-                            is_call = 'CALL' in original_trade_type or 'ROC' in original_trade_type
+                            # Import datetime and re for parsing
+                            from datetime import datetime
+                            import re
                             
-                            # Create updated description using effective values
-                            if is_put:
-                                new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} PUT @ {effective_credit}"
-                            elif is_call:
-                                new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} CALL @ {effective_credit}"
-                            else:
-                                new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} {original_trade_type} @ {effective_credit}"
+                            # Use current values from updated trade, or fall back to original if not set
+                            effective_strike = new_strike if new_strike > 0 else (original_strike if original_strike else 0)
+                            effective_credit = new_credit if new_credit != 0 else 0
+                            effective_exp_date = new_exp_date if new_exp_date else (original_exp_date if original_exp_date else None)
                             
-                            # Recalculate total_amount for diagonal entry
-                            # For diagonal roll trades: total_amount = -effective_credit * new_num_contracts * 100
-                            new_total_amount = -(effective_credit * new_num_contracts * 100)
+                            # If we don't have required values, try to extract them from existing description
+                            if effective_strike == 0 or effective_credit == 0 or not effective_exp_date:
+                                # Try to parse from existing description (format: SELL -1 DIAGONAL TICKER 100 DATE1/DATE2 STRIKE1/STRIKE2 PUT @ CREDIT)
+                                if effective_credit == 0:
+                                    match = re.search(r'@\s*([\d.]+)', existing_description)
+                                    if match:
+                                        effective_credit = float(match.group(1))
+                                if effective_strike == 0:
+                                    match = re.search(r'(\d+\.?\d*)/(\d+\.?\d*)\s+(PUT|CALL)', existing_description)
+                                    if match:
+                                        # First number is child strike, second is parent strike
+                                        effective_strike = float(match.group(1))
+                                if not effective_exp_date:
+                                    # Try to extract date from description (format: DD-MMM-YY/DD-MMM-YY)
+                                    match = re.search(r'(\d{2}-[A-Z]{3}-\d{2})/(\d{2}-[A-Z]{3}-\d{2})', existing_description)
+                                    if match:
+                                        # First date is child expiration, second is parent expiration
+                                        try:
+                                            child_date_str = match.group(1)
+                                            # Convert DD-MMM-YY to YYYY-MM-DD
+                                            child_date = datetime.strptime(child_date_str, '%d-%b-%y')
+                                            effective_exp_date = child_date.strftime('%Y-%m-%d')
+                                        except:
+                                            pass
                             
-                            # Get the previous entry's running totals (before this entry)
-                            date_trade_open = updated_trade.get('date_trade_open')
-                            if not date_trade_open:
-                                print(f'[DEBUG] update_trade_field - date_trade_open is None or empty for trade_id={trade_id}, skipping diagonal entry update')
-                                # Skip the update if date_trade_open is missing
-                            else:
-                                cursor.execute('''
-                                    SELECT running_basis, running_shares 
-                                    FROM cost_basis 
-                                    WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
-                                    ORDER BY transaction_date DESC, rowid DESC
-                                    LIMIT 1
-                                ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open))
-                                prev_entry = cursor.fetchone()
+                            # Only update if we have minimum required values
+                            if effective_strike > 0 and effective_credit != 0 and effective_exp_date:
+                                print(f'[DEBUG] update_trade_field - After update: Updating existing diagonal entry')
+                                # Update the existing diagonal entry with new values
                                 
-                                if prev_entry:
-                                    prev_entry_dict = safe_row_to_dict(prev_entry)
-                                    prev_running_basis = prev_entry_dict.get('running_basis', 0)
-                                    prev_running_shares = prev_entry_dict.get('running_shares', 0)
-                                else:
-                                    prev_running_basis = 0
-                                    prev_running_shares = 0
+                                # Format dates as DD-MMM-YY
+                                try:
+                                    new_exp = datetime.strptime(effective_exp_date, '%Y-%m-%d')
+                                    new_exp_formatted = new_exp.strftime('%d-%b-%y').upper()
+                                except:
+                                    new_exp_formatted = effective_exp_date
                                 
-                                # Recalculate running totals for this entry
-                                # For diagonal trades: shares = 0, so running_shares stays the same
-                                new_running_basis = prev_running_basis + new_total_amount
-                                new_running_shares = prev_running_shares  # shares is 0 for options
-                                new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
+                                try:
+                                    orig_exp = datetime.strptime(original_exp_date, '%Y-%m-%d')
+                                    orig_exp_formatted = orig_exp.strftime('%d-%b-%y').upper()
+                                except:
+                                    orig_exp_formatted = original_exp_date
                                 
-                                # Update the diagonal entry
-                                cursor.execute('''
-                                    UPDATE cost_basis 
-                                    SET description = ?, total_amount = ?, running_basis = ?, running_shares = ?, basis_per_share = ?,
-                                        transaction_date = ?
-                                    WHERE id = ?
-                                ''', (new_description, new_total_amount, new_running_basis, new_running_shares, new_basis_per_share, date_trade_open, diagonal_entry_id))
+                                # Determine if it's PUT or CALL based on trade_type
+                                is_put = 'PUT' in original_trade_type or 'ROP' in original_trade_type
+                                is_call = 'CALL' in original_trade_type or 'ROC' in original_trade_type
                                 
-                                # Get the rowid of the diagonal entry for ordering subsequent entries
-                                cursor.execute('SELECT rowid FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
-                                diagonal_rowid = cursor.fetchone()
-                                diagonal_rowid_dict = safe_row_to_dict(diagonal_rowid)
-                                diagonal_rowid_value = diagonal_rowid_dict.get('rowid') if diagonal_rowid_dict else None
+                                # Create updated description using effective values
+                                if is_put:
+                                    new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} PUT @ {effective_credit}"
+                                elif is_call:
+                                    new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} CALL @ {effective_credit}"
+                                else:
+                                    new_description = f"SELL -{new_num_contracts} DIAGONAL {ticker_symbol} 100 {new_exp_formatted}/{orig_exp_formatted} {effective_strike}/{original_strike} {original_trade_type} @ {effective_credit}"
                                 
-                                # Recalculate running totals for all subsequent entries
-                                if diagonal_rowid_value:
-                                    cursor.execute('''
-                                        SELECT id, total_amount, shares, transaction_date, rowid
-                                        FROM cost_basis 
-                                        WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND rowid > ?))
-                                        ORDER BY transaction_date ASC, rowid ASC
-                                    ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open, date_trade_open, diagonal_rowid_value))
+                                # Recalculate total_amount for diagonal entry
+                                # For diagonal roll trades: total_amount = -effective_credit * new_num_contracts * 100
+                                new_total_amount = -(effective_credit * new_num_contracts * 100)
+                                
+                                # Get the previous entry's running totals (before this entry)
+                                date_trade_open = updated_trade.get('date_trade_open')
+                                if not date_trade_open:
+                                    print(f'[DEBUG] update_trade_field - date_trade_open is None or empty for trade_id={trade_id}, skipping diagonal entry update')
+                                    # Skip the update if date_trade_open is missing
                                 else:
-                                    # Fallback: use id for ordering if rowid is not available
                                     cursor.execute('''
-                                        SELECT id, total_amount, shares, transaction_date, rowid
+                                        SELECT running_basis, running_shares 
                                         FROM cost_basis 
-                                        WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND id > ?))
-                                        ORDER BY transaction_date ASC, id ASC
-                                    ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open, date_trade_open, diagonal_entry_id))
-                                subsequent_entries = cursor.fetchall()
-                                
-                                # Start with the updated running totals from this entry
-                                running_basis = new_running_basis
-                                running_shares = new_running_shares
-                                
-                                for entry in subsequent_entries:
-                                    entry_dict = safe_row_to_dict(entry)
-                                    running_basis += entry_dict.get('total_amount', 0)
-                                    running_shares += entry_dict.get('shares', 0)
-                                    basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
+                                        WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
+                                        ORDER BY transaction_date DESC, rowid DESC
+                                        LIMIT 1
+                                    ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open))
+                                    prev_entry = cursor.fetchone()
+                                    
+                                    if prev_entry:
+                                        prev_entry_dict = safe_row_to_dict(prev_entry)
+                                        prev_running_basis = prev_entry_dict.get('running_basis', 0)
+                                        prev_running_shares = prev_entry_dict.get('running_shares', 0)
+                                    else:
+                                        prev_running_basis = 0
+                                        prev_running_shares = 0
+                                    
+                                    # Recalculate running totals for this entry
+                                    # For diagonal trades: shares = 0, so running_shares stays the same
+                                    new_running_basis = prev_running_basis + new_total_amount
+                                    new_running_shares = prev_running_shares  # shares is 0 for options
+                                    new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
                                     
+                                    # Update the diagonal entry
                                     cursor.execute('''
                                         UPDATE cost_basis 
-                                        SET running_basis = ?, running_shares = ?, basis_per_share = ?
+                                        SET description = ?, total_amount = ?, running_basis = ?, running_shares = ?, basis_per_share = ?,
+                                            transaction_date = ?
                                         WHERE id = ?
-                                    ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
-                                
-                                print(f'[DEBUG] update_trade_field - Updated diagonal entry {diagonal_entry_id} with new values')
+                                    ''', (new_description, new_total_amount, new_running_basis, new_running_shares, new_basis_per_share, date_trade_open, diagonal_entry_id))
+                                    
+                                    # Get the rowid of the diagonal entry for ordering subsequent entries
+                                    cursor.execute('SELECT rowid FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
+                                    diagonal_rowid = cursor.fetchone()
+                                    diagonal_rowid_dict = safe_row_to_dict(diagonal_rowid)
+                                    diagonal_rowid_value = diagonal_rowid_dict.get('rowid') if diagonal_rowid_dict else None
+                                    
+                                    # Recalculate running totals for all subsequent entries
+                                    if diagonal_rowid_value:
+                                        cursor.execute('''
+                                            SELECT id, total_amount, shares, transaction_date, rowid
+                                            FROM cost_basis 
+                                            WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND rowid > ?))
+                                            ORDER BY transaction_date ASC, rowid ASC
+                                        ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open, date_trade_open, diagonal_rowid_value))
+                                    else:
+                                        # Fallback: use id for ordering if rowid is not available
+                                        cursor.execute('''
+                                            SELECT id, total_amount, shares, transaction_date, rowid
+                                            FROM cost_basis 
+                                            WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND id > ?))
+                                            ORDER BY transaction_date ASC, id ASC
+                                        ''', (updated_trade.get('ticker_id'), updated_trade.get('account_id'), date_trade_open, date_trade_open, diagonal_entry_id))
+                                    subsequent_entries = cursor.fetchall()
+                                    
+                                    # Start with the updated running totals from this entry
+                                    running_basis = new_running_basis
+                                    running_shares = new_running_shares
+                                    
+                                    for entry in subsequent_entries:
+                                        entry_dict = safe_row_to_dict(entry)
+                                        running_basis += entry_dict.get('total_amount', 0)
+                                        running_shares += entry_dict.get('shares', 0)
+                                        basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
+                                        
+                                        cursor.execute('''
+                                            UPDATE cost_basis 
+                                            SET running_basis = ?, running_shares = ?, basis_per_share = ?
+                                            WHERE id = ?
+                                        ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
+                                    
+                                    print(f'[DEBUG] update_trade_field - Updated diagonal entry {diagonal_entry_id} with new values')
+                            else:
+                                print(f'[DEBUG] update_trade_field - After update: Conditions not met for existing entry - effective_strike={effective_strike}, effective_credit={effective_credit}, effective_exp_date={effective_exp_date}')
+                        elif new_strike > 0 and new_credit != 0 and new_exp_date:
+                            # Create new diagonal entry if it doesn't exist and we have required values
+                            print(f'[DEBUG] update_trade_field - After update: Creating diagonal entry')
+                            create_roll_diagonal_cost_basis_entry(
+                                cursor, trade_id, original_trade_id, updated_trade.get('account_id'), 
+                                updated_trade.get('ticker_id'), updated_trade.get('date_trade_open'), ticker_symbol, new_exp_date, original_exp_date,
+                                new_strike, original_strike, new_credit, original_trade_type, new_num_contracts
+                            )
                         else:
-                            print(f'[DEBUG] update_trade_field - After update: Conditions not met for existing entry - effective_strike={effective_strike}, effective_credit={effective_credit}, effective_exp_date={effective_exp_date}')
-                    elif new_strike > 0 and new_credit != 0 and new_exp_date:
-                        # Create new diagonal entry if it doesn't exist and we have required values
-                        print(f'[DEBUG] update_trade_field - After update: Creating diagonal entry')
-                        create_roll_diagonal_cost_basis_entry(
-                            cursor, trade_id, original_trade_id, updated_trade.get('account_id'), 
-                            updated_trade.get('ticker_id'), updated_trade.get('date_trade_open'), ticker_symbol, new_exp_date, original_exp_date,
-                            new_strike, original_strike, new_credit, original_trade_type, new_num_contracts
-                        )
+                            print(f'[DEBUG] update_trade_field - After update: Conditions not met for creation - strike={new_strike}, credit={new_credit}, exp_date={new_exp_date}')
                     else:
-                        print(f'[DEBUG] update_trade_field - After update: Conditions not met for creation - strike={new_strike}, credit={new_credit}, exp_date={new_exp_date}')
-                else:
-                    print(f'[DEBUG] update_trade_field - After update: Parent trade not found - parent={original_trade is not None}')
-            
-            # Check if this is a parent trade that has roll children - update their diagonal entries
-            # When parent trade fields change, we need to update all child trades' diagonal entries
-            if field in ['expiration_date', 'credit_debit', 'strike_price']:
-                # Find all child trades (roll trades) that have this trade as their parent
-                cursor.execute('''
-                    SELECT id, expiration_date, strike_price, credit_debit, num_of_contracts, account_id, ticker_id, date_trade_open
-                    FROM trades 
-                    WHERE trade_parent_id = ?
-                ''', (trade_id,))
-                child_trades = cursor.fetchall()
+                        print(f'[DEBUG] update_trade_field - After update: Parent trade not found - parent={original_trade is not None}')
                 
-                if child_trades:
-                    print(f'[DEBUG] update_trade_field - Found {len(child_trades)} child trades for parent trade_id={trade_id}')
-                    
-                    # Get updated parent values - use the new value for the field being updated
-                    if field == 'expiration_date':
-                        parent_exp_date = value  # Use the new value
-                    else:
-                        parent_exp_date = updated_trade.get('expiration_date')
-                    
-                    if field == 'strike_price':
-                        parent_strike = float(value) if value and str(value).strip() else 0  # Use the new value
-                    else:
-                        parent_strike = updated_trade.get('strike_price', 0)
-                    
-                    parent_trade_type = updated_trade.get('trade_type', '')
-                    
-                    # Get ticker symbol
-                    ticker_id = updated_trade.get('ticker_id')
-                    if ticker_id:
-                        cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-                        ticker_row = cursor.fetchone()
-                        ticker_row_dict = safe_row_to_dict(ticker_row)
-                        ticker_symbol = ticker_row_dict.get('ticker', '') if ticker_row_dict else ''
-                    else:
-                        ticker_symbol = ''
+                # Check if this is a parent trade that has roll children - update their diagonal entries
+                # When parent trade fields change, we need to update all child trades' diagonal entries
+                if field in ['expiration_date', 'credit_debit', 'strike_price']:
+                    # Find all child trades (roll trades) that have this trade as their parent
+                    cursor.execute('''
+                        SELECT id, expiration_date, strike_price, credit_debit, num_of_contracts, account_id, ticker_id, date_trade_open
+                        FROM trades 
+                        WHERE trade_parent_id = ?
+                    ''', (trade_id,))
+                    child_trades = cursor.fetchall()
                     
-                    for child_trade_row in child_trades:
-                        child_trade = safe_row_to_dict(child_trade_row)
-                        child_trade_id = child_trade.get('id')
-                        child_exp_date = child_trade.get('expiration_date')
-                        child_strike = child_trade.get('strike_price', 0)
-                        child_credit = child_trade.get('credit_debit', 0)
-                        child_num_contracts = child_trade.get('num_of_contracts', 1)
+                    if child_trades:
+                        print(f'[DEBUG] update_trade_field - Found {len(child_trades)} child trades for parent trade_id={trade_id}')
                         
-                        # Only update if child trade has valid values and parent has valid values
-                        if child_strike > 0 and child_credit != 0 and child_exp_date and parent_exp_date:
-                            # Find the diagonal entry for this child trade
-                            cursor.execute('''
-                                SELECT id FROM cost_basis 
-                                WHERE trade_id = ? AND description LIKE 'SELL -% DIAGONAL%'
-                            ''', (child_trade_id,))
-                            diagonal_entry = cursor.fetchone()
+                        # Get updated parent values - use the new value for the field being updated
+                        if field == 'expiration_date':
+                            parent_exp_date = value  # Use the new value
+                        else:
+                            parent_exp_date = updated_trade.get('expiration_date')
+                        
+                        if field == 'strike_price':
+                            parent_strike = float(value) if value and str(value).strip() else 0  # Use the new value
+                        else:
+                            parent_strike = updated_trade.get('strike_price', 0)
+                        
+                        parent_trade_type = updated_trade.get('trade_type', '')
+                        
+                        # Get ticker symbol
+                        ticker_id = updated_trade.get('ticker_id')
+                        if ticker_id:
+                            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
+                            ticker_row = cursor.fetchone()
+                            ticker_row_dict = safe_row_to_dict(ticker_row)
+                            ticker_symbol = ticker_row_dict.get('ticker', '') if ticker_row_dict else ''
+                        else:
+                            ticker_symbol = ''
+                        
+                        for child_trade_row in child_trades:
+                            child_trade = safe_row_to_dict(child_trade_row)
+                            child_trade_id = child_trade.get('id')
+                            child_exp_date = child_trade.get('expiration_date')
+                            child_strike = child_trade.get('strike_price', 0)
+                            child_credit = child_trade.get('credit_debit', 0)
+                            child_num_contracts = child_trade.get('num_of_contracts', 1)
                             
-                            if diagonal_entry:
-                                diagonal_entry_dict = safe_row_to_dict(diagonal_entry)
-                                diagonal_entry_id = diagonal_entry_dict.get('id')
-                                print(f'[DEBUG] update_trade_field - Updating diagonal entry {diagonal_entry_id} for child trade {child_trade_id} with new parent values')
-                                
-                                # Format dates as DD-MMM-YY
-                                from datetime import datetime
-                                try:
-                                    child_exp = datetime.strptime(child_exp_date, '%Y-%m-%d')
-                                    child_exp_formatted = child_exp.strftime('%d-%b-%y').upper()
-                                except:
-                                    child_exp_formatted = child_exp_date
-                                
-                                try:
-                                    parent_exp = datetime.strptime(parent_exp_date, '%Y-%m-%d')
-                                    parent_exp_formatted = parent_exp.strftime('%d-%b-%y').upper()
-                                except:
-                                    parent_exp_formatted = parent_exp_date
-                                
-                                # Determine if it's PUT or CALL based on parent trade_type
-                                is_put = 'PUT' in parent_trade_type or 'ROP' in parent_trade_type
-                                is_call = 'CALL' in parent_trade_type or 'ROC' in parent_trade_type
-                                
-                                # Create updated description with new parent values
-                                if is_put:
-                                    new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} PUT @ {child_credit}"
-                                elif is_call:
-                                    new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} CALL @ {child_credit}"
-                                else:
-                                    new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} {parent_trade_type} @ {child_credit}"
-                                
-                                # Recalculate total_amount (unchanged, based on child credit)
-                                new_total_amount = -(child_credit * child_num_contracts * 100)
-                                
-                                # Get the previous entry's running totals (before this entry)
-                                child_date_trade_open = child_trade.get('date_trade_open')
-                                cursor.execute('''
-                                    SELECT running_basis, running_shares 
-                                    FROM cost_basis 
-                                    WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
-                                    ORDER BY transaction_date DESC, rowid DESC
-                                    LIMIT 1
-                                ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open))
-                                prev_entry = cursor.fetchone()
-                                
-                                if prev_entry:
-                                    prev_entry_dict = safe_row_to_dict(prev_entry)
-                                    prev_running_basis = prev_entry_dict.get('running_basis', 0)
-                                    prev_running_shares = prev_entry_dict.get('running_shares', 0)
-                                else:
-                                    prev_running_basis = 0
-                                    prev_running_shares = 0
-                                
-                                # Recalculate running totals for this entry
-                                new_running_basis = prev_running_basis + new_total_amount
-                                new_running_shares = prev_running_shares  # shares is 0 for options
-                                new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
-                                
-                                # Update the diagonal entry
+                            # Only update if child trade has valid values and parent has valid values
+                            if child_strike > 0 and child_credit != 0 and child_exp_date and parent_exp_date:
+                                # Find the diagonal entry for this child trade
                                 cursor.execute('''
-                                    UPDATE cost_basis 
-                                    SET description = ?, total_amount = ?, running_basis = ?, running_shares = ?, basis_per_share = ?
-                                    WHERE id = ?
-                                ''', (new_description, new_total_amount, new_running_basis, new_running_shares, new_basis_per_share, diagonal_entry_id))
-                                
-                                # Recalculate running totals for all subsequent entries
-                                cursor.execute('SELECT rowid FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
-                                diagonal_rowid = cursor.fetchone()
-                                if diagonal_rowid:
-                                    diagonal_rowid_dict = safe_row_to_dict(diagonal_rowid)
-                                    diagonal_rowid_value = diagonal_rowid_dict.get('rowid')
-                                else:
-                                    diagonal_rowid_value = None
+                                    SELECT id FROM cost_basis 
+                                    WHERE trade_id = ? AND description LIKE 'SELL -% DIAGONAL%'
+                                ''', (child_trade_id,))
+                                diagonal_entry = cursor.fetchone()
                                 
-                                if diagonal_rowid_value:
-                                    cursor.execute('''
-                                        SELECT id, total_amount, shares, transaction_date, rowid
-                                        FROM cost_basis 
-                                        WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND rowid > ?))
-                                        ORDER BY transaction_date ASC, rowid ASC
-                                    ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open, child_date_trade_open, diagonal_rowid_value))
-                                else:
+                                if diagonal_entry:
+                                    diagonal_entry_dict = safe_row_to_dict(diagonal_entry)
+                                    diagonal_entry_id = diagonal_entry_dict.get('id')
+                                    print(f'[DEBUG] update_trade_field - Updating diagonal entry {diagonal_entry_id} for child trade {child_trade_id} with new parent values')
+                                    
+                                    # Format dates as DD-MMM-YY
+                                    from datetime import datetime
+                                    try:
+                                        child_exp = datetime.strptime(child_exp_date, '%Y-%m-%d')
+                                        child_exp_formatted = child_exp.strftime('%d-%b-%y').upper()
+                                    except:
+                                        child_exp_formatted = child_exp_date
+                                    
+                                    try:
+                                        parent_exp = datetime.strptime(parent_exp_date, '%Y-%m-%d')
+                                        parent_exp_formatted = parent_exp.strftime('%d-%b-%y').upper()
+                                    except:
+                                        parent_exp_formatted = parent_exp_date
+                                    
+                                    # Determine if it's PUT or CALL based on parent trade_type
+                                    is_put = 'PUT' in parent_trade_type or 'ROP' in parent_trade_type
+                                    is_call = 'CALL' in parent_trade_type or 'ROC' in parent_trade_type
+                                    
+                                    # Create updated description with new parent values
+                                    if is_put:
+                                        new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} PUT @ {child_credit}"
+                                    elif is_call:
+                                        new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} CALL @ {child_credit}"
+                                    else:
+                                        new_description = f"SELL -{child_num_contracts} DIAGONAL {ticker_symbol} 100 {child_exp_formatted}/{parent_exp_formatted} {child_strike}/{parent_strike} {parent_trade_type} @ {child_credit}"
+                                    
+                                    # Recalculate total_amount (unchanged, based on child credit)
+                                    new_total_amount = -(child_credit * child_num_contracts * 100)
+                                    
+                                    # Get the previous entry's running totals (before this entry)
+                                    child_date_trade_open = child_trade.get('date_trade_open')
                                     cursor.execute('''
-                                        SELECT id, total_amount, shares, transaction_date, rowid
+                                        SELECT running_basis, running_shares 
                                         FROM cost_basis 
-                                        WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND id > ?))
-                                        ORDER BY transaction_date ASC, id ASC
-                                    ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open, child_date_trade_open, diagonal_entry_id))
-                                subsequent_entries = cursor.fetchall()
-                                
-                                # Start with the updated running totals from this entry
-                                running_basis = new_running_basis
-                                running_shares = new_running_shares
-                                
-                                for entry in subsequent_entries:
-                                    entry_dict = safe_row_to_dict(entry)
-                                    running_basis += entry_dict.get('total_amount', 0)
-                                    running_shares += entry_dict.get('shares', 0)
-                                    basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
+                                        WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
+                                        ORDER BY transaction_date DESC, rowid DESC
+                                        LIMIT 1
+                                    ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open))
+                                    prev_entry = cursor.fetchone()
+                                    
+                                    if prev_entry:
+                                        prev_entry_dict = safe_row_to_dict(prev_entry)
+                                        prev_running_basis = prev_entry_dict.get('running_basis', 0)
+                                        prev_running_shares = prev_entry_dict.get('running_shares', 0)
+                                    else:
+                                        prev_running_basis = 0
+                                        prev_running_shares = 0
+                                    
+                                    # Recalculate running totals for this entry
+                                    new_running_basis = prev_running_basis + new_total_amount
+                                    new_running_shares = prev_running_shares  # shares is 0 for options
+                                    new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
                                     
+                                    # Update the diagonal entry
                                     cursor.execute('''
                                         UPDATE cost_basis 
-                                        SET running_basis = ?, running_shares = ?, basis_per_share = ?
+                                        SET description = ?, total_amount = ?, running_basis = ?, running_shares = ?, basis_per_share = ?
                                         WHERE id = ?
-                                    ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
-                                
-                                print(f'[DEBUG] update_trade_field - Updated diagonal entry {diagonal_entry_id} for child trade {child_trade_id} with new parent values')
-            
-            # Update cash_flows entries for this trade
-            # Cash flows are linked to trades via trade_id
-            # Update amount if credit_debit or num_of_contracts changed
-            # Update account_id if account_id changed
-            if field in ['credit_debit', 'num_of_contracts', 'account_id']:
-                # Get all cash flows for this trade
-                cursor.execute('SELECT * FROM cash_flows WHERE trade_id = ?', (trade_id,))
-                cash_flows = cursor.fetchall()
-                
-                for cf in cash_flows:
-                    cf_dict = safe_row_to_dict(cf)
-                    # Update account_id if account_id changed
-                    if field == 'account_id':
-                        cursor.execute('''
-                            UPDATE cash_flows 
-                            SET account_id = ?
-                            WHERE id = ?
-                        ''', (updated_trade.get('account_id'), cf_dict.get('id')))
-                    # Recalculate amount based on updated trade values
-                    elif cf_dict.get('transaction_type') in ['PREMIUM_CREDIT', 'PREMIUM_DEBIT']:
-                        # Amount = credit_debit * num_of_contracts * 100
-                        new_amount = updated_trade.get('credit_debit', 0) * updated_trade.get('num_of_contracts', 1) * 100
-                        cursor.execute('''
-                            UPDATE cash_flows 
-                            SET amount = ?
-                            WHERE id = ?
-                        ''', (new_amount, cf_dict.get('id')))
-            
-            # Update cost_basis entries for this trade
-            # Cost basis entries are linked to trades via trade_id
-            # Update description, shares, cost_per_share, total_amount if relevant fields changed
-            # Also update account_id if account_id changed
-            if field in ['num_of_contracts', 'credit_debit', 'strike_price', 'expiration_date', 'date_trade_open', 'ticker', 'current_price', 'account_id']:
-                # Get all cost_basis entries for this trade
-                # Only update existing entries - do NOT create new ones
-                cursor.execute('SELECT * FROM cost_basis WHERE trade_id = ?', (trade_id,))
-                cost_basis_entries = cursor.fetchall()
+                                    ''', (new_description, new_total_amount, new_running_basis, new_running_shares, new_basis_per_share, diagonal_entry_id))
+                                    
+                                    # Recalculate running totals for all subsequent entries
+                                    cursor.execute('SELECT rowid FROM cost_basis WHERE id = ?', (diagonal_entry_id,))
+                                    diagonal_rowid = cursor.fetchone()
+                                    if diagonal_rowid:
+                                        diagonal_rowid_dict = safe_row_to_dict(diagonal_rowid)
+                                        diagonal_rowid_value = diagonal_rowid_dict.get('rowid')
+                                    else:
+                                        diagonal_rowid_value = None
+                                    
+                                    if diagonal_rowid_value:
+                                        cursor.execute('''
+                                            SELECT id, total_amount, shares, transaction_date, rowid
+                                            FROM cost_basis 
+                                            WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND rowid > ?))
+                                            ORDER BY transaction_date ASC, rowid ASC
+                                        ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open, child_date_trade_open, diagonal_rowid_value))
+                                    else:
+                                        cursor.execute('''
+                                            SELECT id, total_amount, shares, transaction_date, rowid
+                                            FROM cost_basis 
+                                            WHERE ticker_id = ? AND account_id = ? AND (transaction_date > ? OR (transaction_date = ? AND id > ?))
+                                            ORDER BY transaction_date ASC, id ASC
+                                        ''', (child_trade.get('ticker_id'), child_trade.get('account_id'), child_date_trade_open, child_date_trade_open, diagonal_entry_id))
+                                    subsequent_entries = cursor.fetchall()
+                                    
+                                    # Start with the updated running totals from this entry
+                                    running_basis = new_running_basis
+                                    running_shares = new_running_shares
+                                    
+                                    for entry in subsequent_entries:
+                                        entry_dict = safe_row_to_dict(entry)
+                                        running_basis += entry_dict.get('total_amount', 0)
+                                        running_shares += entry_dict.get('shares', 0)
+                                        basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
+                                        
+                                        cursor.execute('''
+                                            UPDATE cost_basis 
+                                            SET running_basis = ?, running_shares = ?, basis_per_share = ?
+                                            WHERE id = ?
+                                        ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
+                                    
+                                    print(f'[DEBUG] update_trade_field - Updated diagonal entry {diagonal_entry_id} for child trade {child_trade_id} with new parent values')
                 
-                # If account_id changed, update account_id for all cost_basis entries
-                if field == 'account_id':
-                    for cb in cost_basis_entries:
-                        cb_dict = safe_row_to_dict(cb)
-                        cursor.execute('''
-                            UPDATE cost_basis 
-                            SET account_id = ?
-                            WHERE id = ?
-                        ''', (updated_trade.get('account_id'), cb_dict.get('id')))
+                # Update cash_flows entries for this trade
+                # Cash flows are linked to trades via trade_id
+                # Update amount if credit_debit or num_of_contracts changed
+                # Update account_id if account_id changed
+                if field in ['credit_debit', 'num_of_contracts', 'account_id']:
+                    # Get all cash flows for this trade
+                    cursor.execute('SELECT * FROM cash_flows WHERE trade_id = ?', (trade_id,))
+                    cash_flows = cursor.fetchall()
+                    
+                    for cf in cash_flows:
+                        cf_dict = safe_row_to_dict(cf)
+                        # Update account_id if account_id changed
+                        if field == 'account_id':
+                            cursor.execute('''
+                                UPDATE cash_flows 
+                                SET account_id = ?
+                                WHERE id = ?
+                            ''', (updated_trade.get('account_id'), cf_dict.get('id')))
+                        # Recalculate amount based on updated trade values
+                        elif cf_dict.get('transaction_type') in ['PREMIUM_CREDIT', 'PREMIUM_DEBIT']:
+                            # Amount = credit_debit * num_of_contracts * 100
+                            new_amount = updated_trade.get('credit_debit', 0) * updated_trade.get('num_of_contracts', 1) * 100
+                            cursor.execute('''
+                                UPDATE cash_flows 
+                                SET amount = ?
+                                WHERE id = ?
+                            ''', (new_amount, cf_dict.get('id')))
                 
-                # If no cost_basis entries exist, check if this is a roll trade
-                # Roll trades should only have diagonal entries, not regular entries
-                if not cost_basis_entries:
-                    # Check if this is a roll trade (has trade_parent_id)
-                    trade_parent_id = updated_trade.get('trade_parent_id')
-                    if trade_parent_id:
-                        # This is a roll trade - don't create regular cost basis entries
-                        # The diagonal entry should have been created above
-                        print(f'[DEBUG] update_trade_field - No cost_basis entries found for roll trade_id={trade_id}, skipping regular entry creation')
-                    else:
-                        # This is not a roll trade - don't create new entries here
-                        # Cost_basis entries should only be created when the trade is first created
-                        print(f'[DEBUG] update_trade_field - No cost_basis entries found for trade_id={trade_id}, skipping update')
-                else:
-                    # Get ticker symbol and account_id for recalculating running totals
-                    ticker_id = updated_trade.get('ticker_id')
-                    if ticker_id:
-                        cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-                        ticker_row = cursor.fetchone()
-                        if ticker_row:
-                            ticker_row_dict = safe_row_to_dict(ticker_row)
-                            ticker_symbol = ticker_row_dict.get('ticker', '')
-                        else:
-                            ticker_symbol = ''
-                    else:
-                        ticker_symbol = ''
-                    account_id = updated_trade.get('account_id')
+                # Update cost_basis entries for this trade
+                # Cost basis entries are linked to trades via trade_id
+                # Update description, shares, cost_per_share, total_amount if relevant fields changed
+                # Also update account_id if account_id changed
+                if field in ['num_of_contracts', 'credit_debit', 'strike_price', 'expiration_date', 'date_trade_open', 'ticker', 'current_price', 'account_id']:
+                    # Get all cost_basis entries for this trade
+                    # Only update existing entries - do NOT create new ones
+                    cursor.execute('SELECT * FROM cost_basis WHERE trade_id = ?', (trade_id,))
+                    cost_basis_entries = cursor.fetchall()
                     
-                    # Check if this is a roll trade - if so, skip updating cost basis entries
-                    # Roll trades should only have diagonal entries, which should not be updated
-                    trade_parent_id = updated_trade.get('trade_parent_id')
-                    if trade_parent_id:
-                        # This is a roll trade - skip updating cost basis entries
-                        # The diagonal entry should have been created/updated above
-                        print(f'[DEBUG] update_trade_field - Roll trade_id={trade_id} has cost_basis entries, but skipping regular update (diagonal entries should not be updated)')
-                    else:
-                        # Not a roll trade - update existing cost basis entries
+                    # If account_id changed, update account_id for all cost_basis entries
+                    if field == 'account_id':
                         for cb in cost_basis_entries:
                             cb_dict = safe_row_to_dict(cb)
-                            # Skip diagonal entries - they should not be updated
-                            if 'DIAGONAL' in cb_dict.get('description', ''):
-                                print(f'[DEBUG] update_trade_field - Skipping diagonal entry update for trade_id={trade_id}')
-                                continue
-                            
-                            # Recalculate based on trade type
-                            trade_type = updated_trade.get('trade_type', '')
-                            
-                            if trade_type in ['BTO', 'STC']:
-                                # For BTO/STC trades, update shares and total_amount
-                                new_shares = updated_trade.get('num_of_contracts', 1)
-                                if trade_type == 'STC':
-                                    new_shares = -new_shares
-                                new_total_amount = updated_trade.get('total_premium', 0)
-                                if trade_type == 'STC':
-                                    new_total_amount = -abs(new_total_amount)
-                                
-                                new_description = f"{trade_type} {abs(new_shares)} {ticker_symbol}"
-                                # Update cost_per_share based on current_price (price_per_share)
-                                # For BTO/STC, price_per_share = current_price
-                                new_cost_per_share = updated_trade.get('current_price', updated_trade.get('price_per_share', 0))
-                                
-                                # Get the previous entry's running totals (before this entry)
-                                cursor.execute('''
-                                    SELECT running_basis, running_shares 
-                                    FROM cost_basis 
-                                    WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
-                                    ORDER BY transaction_date DESC, rowid DESC
-                                    LIMIT 1
-                                ''', (ticker_id, account_id, cb_dict.get('transaction_date')))
-                                prev_entry = cursor.fetchone()
-                                
-                                if prev_entry:
-                                    prev_entry_dict = safe_row_to_dict(prev_entry)
-                                    prev_running_basis = prev_entry_dict.get('running_basis', 0)
-                                    prev_running_shares = prev_entry_dict.get('running_shares', 0)
-                                else:
-                                    prev_running_basis = 0
-                                    prev_running_shares = 0
-                                
-                                # Recalculate running totals for this entry
-                                new_running_basis = prev_running_basis + new_total_amount
-                                if trade_type == 'STC':
-                                    new_running_shares = prev_running_shares - updated_trade.get('num_of_contracts', 1)
-                                else:  # BTO
-                                    new_running_shares = prev_running_shares + updated_trade.get('num_of_contracts', 1)
-                                
-                                new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
-                                
-                                cursor.execute('''
-                                    UPDATE cost_basis 
-                                    SET description = ?, shares = ?, cost_per_share = ?, total_amount = ?,
-                                        running_basis = ?, running_shares = ?, basis_per_share = ?
-                                    WHERE id = ?
-                                ''', (new_description, new_shares, new_cost_per_share, new_total_amount,
-                                      new_running_basis, new_running_shares, new_basis_per_share, cb_dict.get('id')))
+                            cursor.execute('''
+                                UPDATE cost_basis 
+                                SET account_id = ?
+                                WHERE id = ?
+                            ''', (updated_trade.get('account_id'), cb_dict.get('id')))
+                    
+                    # If no cost_basis entries exist, check if this is a roll trade
+                    # Roll trades should only have diagonal entries, not regular entries
+                    if not cost_basis_entries:
+                        # Check if this is a roll trade (has trade_parent_id)
+                        trade_parent_id = updated_trade.get('trade_parent_id')
+                        if trade_parent_id:
+                            # This is a roll trade - don't create regular cost basis entries
+                            # The diagonal entry should have been created above
+                            print(f'[DEBUG] update_trade_field - No cost_basis entries found for roll trade_id={trade_id}, skipping regular entry creation')
+                        else:
+                            # This is not a roll trade - don't create new entries here
+                            # Cost_basis entries should only be created when the trade is first created
+                            print(f'[DEBUG] update_trade_field - No cost_basis entries found for trade_id={trade_id}, skipping update')
+                    else:
+                        # Get ticker symbol and account_id for recalculating running totals
+                        ticker_id = updated_trade.get('ticker_id')
+                        if ticker_id:
+                            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
+                            ticker_row = cursor.fetchone()
+                            if ticker_row:
+                                ticker_row_dict = safe_row_to_dict(ticker_row)
+                                ticker_symbol = ticker_row_dict.get('ticker', '')
                             else:
-                                # For options trades, update description with new strike/premium/expiration
-                                expiration_date = updated_trade.get('expiration_date', '')
-                                strike_price = updated_trade.get('strike_price', 0)
-                                premium = updated_trade.get('credit_debit', 0)
-                                num_contracts = updated_trade.get('num_of_contracts', 1)
-                                
-                                # Format expiration date as DD-MMM-YY (matching create_options_cost_basis_entry format)
-                                from datetime import datetime
-                                try:
-                                    exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
-                                    expiration_formatted = exp_date_obj.strftime('%d-%b-%y').upper()
-                                except:
-                                    expiration_formatted = expiration_date
-                                
-                                # Format strike_price and premium to 2 decimal places (matching create_options_cost_basis_entry)
-                                strike_str = f"{strike_price:.2f}" if strike_price else "0.0"
-                                premium_str = f"{premium:.2f}" if premium else "0.0"
-                                
-                                # Build description matching create_options_cost_basis_entry format
-                                if 'ROP' in trade_type or 'PUT' in trade_type:
-                                    new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} PUT @{premium_str}"
-                                elif 'ROC' in trade_type or 'CALL' in trade_type:
-                                    new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} CALL @{premium_str}"
-                                else:
-                                    new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} {trade_type.split()[0]} @{premium_str}"
-                                
-                                # Update transaction_date if date_trade_open changed
-                                date_trade_open = updated_trade.get('date_trade_open', cb_dict.get('transaction_date'))
-                                
-                                # Recalculate total_amount for options trades
-                                # For options: total_amount = -(premium * num_of_contracts * 100)
-                                new_total_amount = -(premium * num_contracts * 100)
+                                ticker_symbol = ''
+                        else:
+                            ticker_symbol = ''
+                        account_id = updated_trade.get('account_id')
+                        
+                        # Check if this is a roll trade - if so, skip updating cost basis entries
+                        # Roll trades should only have diagonal entries, which should not be updated
+                        trade_parent_id = updated_trade.get('trade_parent_id')
+                        if trade_parent_id:
+                            # This is a roll trade - skip updating cost basis entries
+                            # The diagonal entry should have been created/updated above
+                            print(f'[DEBUG] update_trade_field - Roll trade_id={trade_id} has cost_basis entries, but skipping regular update (diagonal entries should not be updated)')
+                        else:
+                            # Not a roll trade - update existing cost basis entries
+                            for cb in cost_basis_entries:
+                                cb_dict = safe_row_to_dict(cb)
+                                # Skip diagonal entries - they should not be updated
+                                if 'DIAGONAL' in cb_dict.get('description', ''):
+                                    print(f'[DEBUG] update_trade_field - Skipping diagonal entry update for trade_id={trade_id}')
+                                    continue
                                 
-                                # Get the previous entry's running totals (before this entry)
-                                cursor.execute('''
-                                    SELECT running_basis, running_shares 
-                                    FROM cost_basis 
-                                    WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
-                                    ORDER BY transaction_date DESC, rowid DESC
-                                    LIMIT 1
-                                ''', (ticker_id, account_id, date_trade_open))
-                                prev_entry = cursor.fetchone()
+                                # Recalculate based on trade type
+                                trade_type = updated_trade.get('trade_type', '')
                                 
-                                if prev_entry:
-                                    prev_entry_dict = safe_row_to_dict(prev_entry)
-                                    prev_running_basis = prev_entry_dict.get('running_basis', 0)
-                                    prev_running_shares = prev_entry_dict.get('running_shares', 0)
+                                if trade_type in ['BTO', 'STC']:
+                                    # For BTO/STC trades, update shares and total_amount
+                                    new_shares = updated_trade.get('num_of_contracts', 1)
+                                    if trade_type == 'STC':
+                                        new_shares = -new_shares
+                                    new_total_amount = updated_trade.get('total_premium', 0)
+                                    if trade_type == 'STC':
+                                        new_total_amount = -abs(new_total_amount)
+                                    
+                                    new_description = f"{trade_type} {abs(new_shares)} {ticker_symbol}"
+                                    # Update cost_per_share based on current_price (price_per_share)
+                                    # For BTO/STC, price_per_share = current_price
+                                    new_cost_per_share = updated_trade.get('current_price', updated_trade.get('price_per_share', 0))
+                                    
+                                    # Get the previous entry's running totals (before this entry)
+                                    cursor.execute('''
+                                        SELECT running_basis, running_shares 
+                                        FROM cost_basis 
+                                        WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
+                                        ORDER BY transaction_date DESC, rowid DESC
+                                        LIMIT 1
+                                    ''', (ticker_id, account_id, cb_dict.get('transaction_date')))
+                                    prev_entry = cursor.fetchone()
+                                    
+                                    if prev_entry:
+                                        prev_entry_dict = safe_row_to_dict(prev_entry)
+                                        prev_running_basis = prev_entry_dict.get('running_basis', 0)
+                                        prev_running_shares = prev_entry_dict.get('running_shares', 0)
+                                    else:
+                                        prev_running_basis = 0
+                                        prev_running_shares = 0
+                                    
+                                    # Recalculate running totals for this entry
+                                    new_running_basis = prev_running_basis + new_total_amount
+                                    if trade_type == 'STC':
+                                        new_running_shares = prev_running_shares - updated_trade.get('num_of_contracts', 1)
+                                    else:  # BTO
+                                        new_running_shares = prev_running_shares + updated_trade.get('num_of_contracts', 1)
+                                    
+                                    new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
+                                    
+                                    cursor.execute('''
+                                        UPDATE cost_basis 
+                                        SET description = ?, shares = ?, cost_per_share = ?, total_amount = ?,
+                                            running_basis = ?, running_shares = ?, basis_per_share = ?
+                                        WHERE id = ?
+                                    ''', (new_description, new_shares, new_cost_per_share, new_total_amount,
+                                          new_running_basis, new_running_shares, new_basis_per_share, cb_dict.get('id')))
                                 else:
-                                    prev_running_basis = 0
-                                    prev_running_shares = 0
-                                
-                                # Recalculate running totals for options trades
-                                # For options: shares = 0, so running_shares stays the same
-                                new_running_basis = prev_running_basis + new_total_amount
-                                new_running_shares = prev_running_shares  # Options don't change shares
-                                new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
+                                    # For options trades, update description with new strike/premium/expiration
+                                    expiration_date = updated_trade.get('expiration_date', '')
+                                    strike_price = updated_trade.get('strike_price', 0)
+                                    premium = updated_trade.get('credit_debit', 0)
+                                    num_contracts = updated_trade.get('num_of_contracts', 1)
+                                    
+                                    # Format expiration date as DD-MMM-YY (matching create_options_cost_basis_entry format)
+                                    from datetime import datetime
+                                    try:
+                                        exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
+                                        expiration_formatted = exp_date_obj.strftime('%d-%b-%y').upper()
+                                    except:
+                                        expiration_formatted = expiration_date
+                                    
+                                    # Format strike_price and premium to 2 decimal places (matching create_options_cost_basis_entry)
+                                    strike_str = f"{strike_price:.2f}" if strike_price else "0.0"
+                                    premium_str = f"{premium:.2f}" if premium else "0.0"
+                                    
+                                    # Build description matching create_options_cost_basis_entry format
+                                    if 'ROP' in trade_type or 'PUT' in trade_type:
+                                        new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} PUT @{premium_str}"
+                                    elif 'ROC' in trade_type or 'CALL' in trade_type:
+                                        new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} CALL @{premium_str}"
+                                    else:
+                                        new_description = f"SELL -{num_contracts} {ticker_symbol} 100 {expiration_formatted} {strike_str} {trade_type.split()[0]} @{premium_str}"
+                                    
+                                    # Update transaction_date if date_trade_open changed
+                                    date_trade_open = updated_trade.get('date_trade_open', cb_dict.get('transaction_date'))
+                                    
+                                    # Recalculate total_amount for options trades
+                                    # For options: total_amount = -(premium * num_of_contracts * 100)
+                                    new_total_amount = -(premium * num_contracts * 100)
+                                    
+                                    # Get the previous entry's running totals (before this entry)
+                                    cursor.execute('''
+                                        SELECT running_basis, running_shares 
+                                        FROM cost_basis 
+                                        WHERE ticker_id = ? AND account_id = ? AND transaction_date < ?
+                                        ORDER BY transaction_date DESC, rowid DESC
+                                        LIMIT 1
+                                    ''', (ticker_id, account_id, date_trade_open))
+                                    prev_entry = cursor.fetchone()
+                                    
+                                    if prev_entry:
+                                        prev_entry_dict = safe_row_to_dict(prev_entry)
+                                        prev_running_basis = prev_entry_dict.get('running_basis', 0)
+                                        prev_running_shares = prev_entry_dict.get('running_shares', 0)
+                                    else:
+                                        prev_running_basis = 0
+                                        prev_running_shares = 0
+                                    
+                                    # Recalculate running totals for options trades
+                                    # For options: shares = 0, so running_shares stays the same
+                                    new_running_basis = prev_running_basis + new_total_amount
+                                    new_running_shares = prev_running_shares  # Options don't change shares
+                                    new_basis_per_share = new_running_basis / new_running_shares if new_running_shares != 0 else new_running_basis
+                                    
+                                    cursor.execute('''
+                                        UPDATE cost_basis 
+                                        SET description = ?, transaction_date = ?, total_amount = ?,
+                                            running_basis = ?, running_shares = ?, basis_per_share = ?
+                                        WHERE id = ?
+                                    ''', (new_description, date_trade_open, new_total_amount,
+                                          new_running_basis, new_running_shares, new_basis_per_share, cb_dict['id']))
+                            
+                            # After updating all entries, recalculate running totals for ALL subsequent entries
+                            # Get all entries for this ticker/account ordered by transaction_date
+                            cursor.execute('''
+                                SELECT id, total_amount, shares, transaction_date, rowid
+                                FROM cost_basis 
+                                WHERE ticker_id = ? AND account_id = ?
+                                ORDER BY transaction_date ASC, rowid ASC
+                            ''', (ticker_id, account_id))
+                            all_entries = cursor.fetchall()
+                            
+                            # Recalculate running totals sequentially
+                            running_basis = 0
+                            running_shares = 0
+                            for entry in all_entries:
+                                entry_dict = safe_row_to_dict(entry)
+                                running_basis += entry_dict.get('total_amount', 0)
+                                running_shares += entry_dict.get('shares', 0)
+                                basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
                                 
                                 cursor.execute('''
                                     UPDATE cost_basis 
-                                    SET description = ?, transaction_date = ?, total_amount = ?,
-                                        running_basis = ?, running_shares = ?, basis_per_share = ?
+                                    SET running_basis = ?, running_shares = ?, basis_per_share = ?
                                     WHERE id = ?
-                                ''', (new_description, date_trade_open, new_total_amount,
-                                      new_running_basis, new_running_shares, new_basis_per_share, cb_dict['id']))
-                        
-                        # After updating all entries, recalculate running totals for ALL subsequent entries
-                        # Get all entries for this ticker/account ordered by transaction_date
-                        cursor.execute('''
-                            SELECT id, total_amount, shares, transaction_date, rowid
-                            FROM cost_basis 
-                            WHERE ticker_id = ? AND account_id = ?
-                            ORDER BY transaction_date ASC, rowid ASC
-                        ''', (ticker_id, account_id))
-                        all_entries = cursor.fetchall()
-                        
-                        # Recalculate running totals sequentially
-                        running_basis = 0
-                        running_shares = 0
-                        for entry in all_entries:
-                            entry_dict = safe_row_to_dict(entry)
-                            running_basis += entry_dict.get('total_amount', 0)
-                            running_shares += entry_dict.get('shares', 0)
-                            basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
-                            
-                            cursor.execute('''
-                                UPDATE cost_basis 
-                                SET running_basis = ?, running_shares = ?, basis_per_share = ?
-                                WHERE id = ?
-                            ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
-        
-        conn.commit()
-        conn.close()
+                                ''', (running_basis, running_shares, basis_per_share, entry_dict.get('id')))
+            
+            conn.commit()
         
         return jsonify({'success': True})
     except Exception as e:
@@ -4170,6 +4524,7 @@ def update_trade_field(trade_id):
         return jsonify({'error': f'Failed to update trade field: {error_type}: {error_msg}'}), 500
 
 @app.route('/api/company-search')
+@response_cache.cached('company-search', timeout=60, query_string=True)
 def company_search():
     try:
         query = request.args.get('q', '').upper()
@@ -4177,21 +4532,15 @@ def company_search():
         if not query:
             return jsonify([])
         
-        # Search in tickers table (case-insensitive)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Search for tickers that start with or contain the query
-        cursor.execute('''
-            SELECT DISTINCT ticker, company_name 
-            FROM tickers 
-            WHERE UPPER(ticker) LIKE ? OR UPPER(company_name) LIKE ?
-            ORDER BY ticker
-            LIMIT 20
-        ''', (f'%{query}%', f'%{query}%'))
-        
-        results = cursor.fetchall()
-        conn.close()
+        # Search in tickers table (case-insensitive) for tickers that start with or contain the query
+        with get_db() as conn:
+            results = conn.execute('''
+                SELECT DISTINCT ticker, company_name 
+                FROM tickers 
+                WHERE UPPER(ticker) LIKE ? OR UPPER(company_name) LIKE ?
+                ORDER BY ticker
+                LIMIT 20
+            ''', (f'%{query}%', f'%{query}%')).fetchall()
         
         companies = []
         for row in results:
@@ -4205,70 +4554,117 @@ def company_search():
         print(f'Error searching tickers: {e}')
         return jsonify([])
 
+# Company names found for a ticker (in the database or from yfinance) are kept in
+# response_cache for a day; a name never changes once it is set, so there is no invalidation
+COMPANY_INFO_CACHE_TIMEOUT = 86400
+# yfinance lookups that found no name are remembered for 30 minutes, so an unknown symbol
+# is not looked up again on every request (failed lookups are not cached)
+COMPANY_NAME_MISS_CACHE_TIMEOUT = 1800
+# When Yahoo rate-limits a lookup (HTTP 429), further lookups are skipped for a back-off
+# period that doubles on each consecutive rate-limited lookup, up to the maximum, so a
+# burst of new tickers does not keep hitting (and timing out against) the limit
+YFINANCE_RATE_LIMIT_BACKOFF = 15
+YFINANCE_RATE_LIMIT_MAX_BACKOFF = 300
+_yfinance_backoff = {'until': 0.0, 'seconds': 0}
+_yfinance_backoff_lock = threading.Lock()
+
+def _is_rate_limit_error(error):
+    """True for the errors yfinance/requests raise when Yahoo answers 429 Too Many Requests"""
+    response = getattr(error, 'response', None)
+    return (type(error).__name__ == 'YFRateLimitError'
+            or getattr(response, 'status_code', None) == 429
+            or 'Too Many Requests' in str(error))
+
 def get_company_name_from_yfinance(ticker):
     """
     Helper function to fetch company name from yfinance.
     Returns company name or None if not found.
+    Results are cached per process under 'yfinance-company-name?symbol=<TICKER>'.
+    Returns None without a lookup while backing off from a rate limit.
     """
+    cache_key = f'yfinance-company-name?symbol={ticker.upper()}'
+    cached_name = response_cache.get(cache_key)
+    if cached_name is not None:
+        return cached_name or None
+    
+    if time.monotonic() < _yfinance_backoff['until']:
+        return None
+    
     try:
         import yfinance as yf
-        stock = yf.Ticker(ticker.upper())
+        stock = yf.Ticker(ticker.upper(), session=YFINANCE_SESSION)
         info = stock.info
         company_name = info.get('longName') or info.get('shortName') or info.get('name')
-        return company_name
     except Exception as e:
-        print(f'[YFINANCE] Error fetching company name for {ticker}: {e}', flush=True)
+        if _is_rate_limit_error(e):
+            with _yfinance_backoff_lock:
+                # Concurrent lookups rate-limited in the same burst share one back-off period
+                now = time.monotonic()
+                if now >= _yfinance_backoff['until']:
+                    seconds = min(YFINANCE_RATE_LIMIT_MAX_BACKOFF,
+                                  _yfinance_backoff['seconds'] * 2 or YFINANCE_RATE_LIMIT_BACKOFF)
+                    _yfinance_backoff.update(until=now + seconds, seconds=seconds)
+                seconds = _yfinance_backoff['seconds']
+            print(f'[YFINANCE] Rate limited looking up {ticker}; skipping lookups for {seconds}s', flush=True)
+        else:
+            print(f'[YFINANCE] Error fetching company name for {ticker}: {e}', flush=True)
         return None
+    
+    _yfinance_backoff['seconds'] = 0
+    if company_name:
+        response_cache.set(cache_key, company_name, COMPANY_INFO_CACHE_TIMEOUT)
+    else:
+        response_cache.set(cache_key, '', COMPANY_NAME_MISS_CACHE_TIMEOUT)
+    return company_name
+
+# Store a looked-up company name, creating the ticker if it does not exist yet
+_SQL_UPSERT_TICKER_COMPANY_NAME = '''
+    INSERT INTO tickers (ticker, company_name, needs_update) VALUES (?, ?, 0)
+    ON CONFLICT (ticker) DO UPDATE SET company_name = excluded.company_name, needs_update = 0
+'''
 
 @app.route('/api/company-info/<ticker>')
 def get_company_info(ticker):
+    cache_key = f'company-info?symbol={ticker.upper()}'
+    cached_name = response_cache.get(cache_key)
+    if cached_name is not None:
+        return jsonify({'symbol': ticker.upper(), 'name': cached_name})
+    
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # First check if we have the company name cached in database
-        cursor.execute('SELECT company_name FROM tickers WHERE ticker = ?', (ticker.upper(),))
-        ticker_row = cursor.fetchone()
-        
-        if ticker_row and ticker_row['company_name'] and ticker_row['company_name'] != ticker.upper():
-            # Return cached value
-            conn.close()
-            return jsonify({
-                'symbol': ticker.upper(),
-                'name': ticker_row['company_name']
-            })
-        
-        # Not cached, fetch from yfinance
-        company_name = get_company_name_from_yfinance(ticker)
-        
-        if company_name:
-            # Cache the result in database
-            cursor.execute('''
-                UPDATE tickers 
-                SET company_name = ?, needs_update = 0
-                WHERE ticker = ?
-            ''', (company_name, ticker.upper()))
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # If ticker doesn't exist, create it
-            if cursor.rowcount == 0:
-                cursor.execute('''
-                    INSERT INTO tickers (ticker, company_name, needs_update)
-                    VALUES (?, ?, 0)
-                ''', (ticker.upper(), company_name))
+            # First check if we have the company name cached in database
+            cursor.execute('SELECT company_name FROM tickers WHERE ticker = ?', (ticker.upper(),))
+            ticker_row = cursor.fetchone()
             
-            conn.commit()
-            conn.close()
-            return jsonify({
-                'symbol': ticker.upper(),
-                'name': company_name
-            })
-        else:
-            # Fallback to ticker symbol if yfinance fails
-            conn.close()
-            return jsonify({
-                'symbol': ticker.upper(),
-                'name': ticker.upper()
-            })
+            if ticker_row and ticker_row['company_name'] and ticker_row['company_name'] != ticker.upper():
+                # Return cached value
+                response_cache.set(cache_key, ticker_row['company_name'], COMPANY_INFO_CACHE_TIMEOUT)
+                return jsonify({
+                    'symbol': ticker.upper(),
+                    'name': ticker_row['company_name']
+                })
+            
+            # Not cached, fetch from yfinance
+            company_name = get_company_name_from_yfinance(ticker)
+            
+            if company_name:
+                # Cache the result in database
+                cursor.execute(_SQL_UPSERT_TICKER_COMPANY_NAME, (ticker.upper(), company_name))
+                conn.commit()
+                response_cache.set(cache_key, company_name, COMPANY_INFO_CACHE_TIMEOUT)
+                response_cache.delete('company-search')
+                return jsonify({
+                    'symbol': ticker.upper(),
+                    'name': company_name
+                })
+            else:
+                # Fallback to ticker symbol if yfinance fails
+                return jsonify({
+                    'symbol': ticker.upper(),
+                    'name': ticker.upper()
+                })
     except ImportError:
         return jsonify({
             'error': 'yfinance library not installed. Please install it with: pip install yfinance==0.2.32'
@@ -4279,38 +4675,38 @@ def get_company_info(ticker):
         print(f'Traceback: {traceback.format_exc()}', flush=True)
         return jsonify({'symbol': ticker.upper(), 'name': ticker.upper()})
 
+# yfinance lookups run concurrently for /api/pending-tickers/update; the shared session's
+# connection pool (pool_maxsize=20) is large enough for every worker
+PENDING_TICKER_FETCH_WORKERS = 10
+
 @app.route('/api/pending-tickers/update', methods=['POST'])
 def update_pending_tickers():
     """Update company names for tickers marked as needing update using yfinance"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Get all tickers that need updating (needs_update = 1, or missing company_name, or company_name = ticker)
-        cursor.execute('SELECT ticker FROM tickers WHERE needs_update = 1 OR company_name IS NULL OR company_name = ticker LIMIT 50')
-        pending_tickers = cursor.fetchall()
+        with get_db() as conn:
+            pending_tickers = conn.execute(
+                'SELECT ticker FROM tickers WHERE needs_update = 1 OR company_name IS NULL OR company_name = ticker LIMIT 50'
+            ).fetchall()
         
         if not pending_tickers:
-            conn.close()
             return jsonify({'updated': 0, 'message': 'No pending tickers'})
         
-        updated_count = 0
         errors = []
         
-        for ticker_row in pending_tickers:
-            ticker = ticker_row['ticker']
-            
+        # Fetch all names concurrently (the lookups are network-bound, so no connection is
+        # held meanwhile), then store them in one batch
+        tickers = [ticker_row['ticker'] for ticker_row in pending_tickers]
+        with ThreadPoolExecutor(max_workers=PENDING_TICKER_FETCH_WORKERS) as executor:
+            futures = [executor.submit(get_company_name_from_yfinance, ticker) for ticker in tickers]
+        
+        updates = []
+        for ticker, future in zip(tickers, futures):
             try:
-                company_name = get_company_name_from_yfinance(ticker)
+                company_name = future.result()
                 
                 if company_name:
-                    cursor.execute('''
-                        UPDATE tickers 
-                        SET company_name = ?, needs_update = 0
-                        WHERE ticker = ?
-                    ''', (company_name, ticker))
-                    conn.commit()
-                    updated_count += 1
+                    updates.append((company_name, ticker))
                     print(f'[PENDING TICKERS] Updated {ticker}: {company_name}', flush=True)
                 else:
                     print(f'[PENDING TICKERS] Could not fetch company name for {ticker}', flush=True)
@@ -4320,7 +4716,18 @@ def update_pending_tickers():
                 errors.append(error_msg)
                 continue
         
-        conn.close()
+        if updates:
+            with get_db() as conn:
+                conn.executemany('''
+                    UPDATE tickers 
+                    SET company_name = ?, needs_update = 0
+                    WHERE ticker = ?
+                ''', updates)
+                conn.commit()
+        updated_count = len(updates)
+        
+        if updated_count:
+            response_cache.delete('company-search')
         return jsonify({
             'updated': updated_count,
             'message': f'Updated {updated_count} tickers',
@@ -4339,52 +4746,114 @@ def update_pending_tickers():
 @app.route('/api/top-symbols')
 def get_top_symbols():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get top 10 most commonly used ticker symbols with status information
-        cursor.execute('''
-            SELECT t.ticker, COUNT(st.id) as trade_count,
-                   MAX(CASE WHEN st.trade_status = 'open' THEN 1 ELSE 0 END) as has_open_trades,
-                   MAX(CASE WHEN st.trade_status IN ('assigned', 'expired') THEN st.date_trade_open ELSE NULL END) as last_assigned_expired_date
-            FROM tickers t
-            JOIN trades st ON t.id = st.ticker_id
-            WHERE t.ticker IS NOT NULL AND t.ticker != ""
-            GROUP BY t.ticker
-            ORDER BY trade_count DESC
-            LIMIT 10
-        ''')
-        
-        results = cursor.fetchall()
-        conn.close()
-        
-        top_symbols = []
-        for result in results:
-            # Calculate if last assigned/expired trade was more than 30 days ago
-            last_assigned_expired = result['last_assigned_expired_date']
-            is_old_assigned_expired = False
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            if last_assigned_expired:
-                try:
-                    from datetime import datetime, timedelta
-                    last_date = datetime.strptime(str(last_assigned_expired), '%Y-%m-%d')
-                    thirty_days_ago = datetime.now() - timedelta(days=30)
-                    is_old_assigned_expired = last_date < thirty_days_ago
-                except:
-                    is_old_assigned_expired = False
+            # Get top 10 most commonly used ticker symbols with status information.
+            # is_old_assigned_expired: the last assigned/expired trade opened 30+ days ago
+            # (local date, matching datetime.now()), compared in SQL rather than per row in Python
+            cursor.execute('''
+                SELECT t.ticker, COUNT(st.id) as trade_count,
+                       MAX(CASE WHEN st.trade_status = 'open' THEN 1 ELSE 0 END) as has_open_trades,
+                       IFNULL(MAX(CASE WHEN st.trade_status IN ('assigned', 'expired') THEN st.date_trade_open ELSE NULL END)
+                              <= date('now', 'localtime', '-30 days'), 0) as is_old_assigned_expired
+                FROM tickers t
+                JOIN trades st ON t.id = st.ticker_id
+                WHERE t.ticker IS NOT NULL AND t.ticker != ""
+                GROUP BY t.ticker
+                ORDER BY trade_count DESC
+                LIMIT 10
+            ''')
             
-            top_symbols.append({
+            top_symbols = [{
                 'ticker': result['ticker'],
                 'trade_count': result['trade_count'],
                 'has_open_trades': bool(result['has_open_trades']),
-                'is_old_assigned_expired': is_old_assigned_expired
-            })
+                'is_old_assigned_expired': bool(result['is_old_assigned_expired'])
+            } for result in cursor.fetchall()]
         
-        return jsonify(top_symbols)
+        return revalidated(jsonify(top_symbols))
     except Exception as e:
         print(f'Error fetching top symbols: {e}')
         return jsonify([])
 
+# Entries for /api/cost-basis: cost_basis rows (with parent trade info for diagonal roll
+# display) plus the Dividend and CLOSING_DEBIT cash flows, padded with NULLs to the same
+# columns. For a CLOSING_DEBIT, cf.trade_id is the PARENT trade being closed, not the new STO.
+# Each part takes the optional ticker and account filters in that order, so the statement is
+# executed with the same parameters repeated for all three parts.
+_SQL_COST_BASIS_ENTRY_PARTS = (
+    ('''
+    SELECT
+        cb.id, cb.account_id, cb.ticker_id, cb.trade_id, cb.cash_flow_id,
+        cb.transaction_date, cb.description, cb.shares, cb.cost_per_share,
+        cb.total_amount, cb.running_basis, cb.running_shares, cb.basis_per_share, cb.created_at,
+        t.ticker, t.company_name, tr.trade_status as status, tr.trade_type, a.account_name, 'cost_basis' as entry_type,
+        tr.trade_parent_id,
+        tr.price_per_share as sto_price,
+        tr.num_of_contracts as trade_num_contracts,
+        tr.strike_price as new_strike,
+        tr.expiration_date as new_exp,
+        ptr.strike_price as orig_strike,
+        ptr.expiration_date as orig_exp,
+        ptr.closing_debit as parent_closing_debit,
+        ptr.trade_type as parent_trade_type
+    FROM cost_basis cb
+    JOIN tickers t ON cb.ticker_id = t.id
+    LEFT JOIN trades tr ON cb.trade_id = tr.id
+    LEFT JOIN trades ptr ON tr.trade_parent_id = ptr.id
+    LEFT JOIN accounts a ON cb.account_id = a.id
+    WHERE t.ticker IS NOT NULL AND t.ticker != ''
+    ''', 't.ticker', 'cb.account_id'),
+    ('''
+    SELECT
+        cf.id, cf.account_id, t.id as ticker_id, NULL as trade_id, cf.id as cash_flow_id,
+        cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
+        cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
+        t.ticker, t.company_name, NULL as status, NULL as trade_type, a.account_name, 'dividend' as entry_type,
+        NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
+        NULL as new_strike, NULL as new_exp,
+        NULL as orig_strike, NULL as orig_exp,
+        NULL as parent_closing_debit, NULL as parent_trade_type
+    FROM cash_flows cf
+    JOIN tickers t ON cf.ticker_id = t.id
+    LEFT JOIN accounts a ON cf.account_id = a.id
+    WHERE cf.transaction_type = 'Dividend'
+    ''', 't.ticker', 'cf.account_id'),
+    ('''
+    SELECT
+        cf.id, cf.account_id, t.id as ticker_id, cf.trade_id, cf.id as cash_flow_id,
+        cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
+        cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
+        t.ticker, t.company_name, tr.trade_status as status, tr.trade_type, a.account_name, 'closing_debit' as entry_type,
+        NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
+        NULL as new_strike, NULL as new_exp,
+        NULL as orig_strike, NULL as orig_exp,
+        NULL as parent_closing_debit, NULL as parent_trade_type
+    FROM cash_flows cf
+    JOIN tickers t ON cf.ticker_id = t.id
+    LEFT JOIN trades tr ON cf.trade_id = tr.id
+    LEFT JOIN accounts a ON cf.account_id = a.id
+    WHERE cf.transaction_type = 'CLOSING_DEBIT'
+    ''', 't.ticker', 'cf.account_id'),
+)
+
+def _cost_basis_entries_sql(by_ticker, by_account):
+    """UNION ALL of the _SQL_COST_BASIS_ENTRY_PARTS with the given filters, in date order (grouped by ticker when unfiltered)"""
+    parts = []
+    for part, ticker_column, account_column in _SQL_COST_BASIS_ENTRY_PARTS:
+        if by_ticker:
+            part += f'AND {ticker_column} = ?\n    '
+        if by_account:
+            part += f'AND {account_column} = ?\n    '
+        parts.append(part)
+    order = 'transaction_date ASC, id ASC' if by_ticker else 'ticker, transaction_date ASC, id ASC'
+    return f"SELECT * FROM ({'UNION ALL'.join(parts)}) ORDER BY {order}"
+
+# Keyed by (by_ticker, by_account)
+_SQL_COST_BASIS_ENTRIES = {(by_ticker, by_account): _cost_basis_entries_sql(by_ticker, by_account)
+                           for by_ticker in (False, True) for by_account in (False, True)}
+
 @app.route('/api/cost-basis')
 def get_cost_basis():
     try:
@@ -4394,470 +4863,302 @@ def get_cost_basis():
         # Get ticker from query parameter (optional)
         ticker = request.args.get('ticker')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get account_id filter if provided - handle both string and int conversion
-        account_id_arg = request.args.get('account_id')
-        account_id = None
-        if account_id_arg:
-            try:
-                account_id = int(account_id_arg)
-            except (ValueError, TypeError):
-                account_id = None
-        
-        print(f'[DEBUG] Cost basis query - account_id_arg: {account_id_arg}, account_id: {account_id}')
-        
-        # Query cost_basis table directly instead of trades table
-        # Also include dividend entries from cash_flows table
-        if ticker:
-            # Query cost_basis entries — include parent trade info for diagonal roll display
-            query = '''
-                SELECT 
-                    cb.id, cb.account_id, cb.ticker_id, cb.trade_id, cb.cash_flow_id,
-                    cb.transaction_date, cb.description, cb.shares, cb.cost_per_share,
-                    cb.total_amount, cb.running_basis, cb.running_shares, cb.basis_per_share, cb.created_at,
-                    t.ticker, tr.trade_status as status, tr.trade_type, a.account_name, 'cost_basis' as entry_type,
-                    tr.trade_parent_id,
-                    tr.price_per_share as sto_price,
-                    tr.num_of_contracts as trade_num_contracts,
-                    tr.strike_price as new_strike,
-                    tr.expiration_date as new_exp,
-                    ptr.strike_price as orig_strike,
-                    ptr.expiration_date as orig_exp,
-                    ptr.closing_debit as parent_closing_debit,
-                    ptr.trade_type as parent_trade_type
-                FROM cost_basis cb
-                JOIN tickers t ON cb.ticker_id = t.id
-                LEFT JOIN trades tr ON cb.trade_id = tr.id
-                LEFT JOIN trades ptr ON tr.trade_parent_id = ptr.id
-                LEFT JOIN accounts a ON cb.account_id = a.id
-                WHERE t.ticker = ? AND t.ticker IS NOT NULL AND t.ticker != ""
-            '''
-            params = [ticker]
-            if account_id:
-                query += ' AND cb.account_id = ?'
-                params.append(account_id)
-            
-            # Query dividend entries — pad with NULLs for parent columns
-            dividend_query = '''
-                SELECT 
-                    cf.id, cf.account_id, t.id as ticker_id, NULL as trade_id, cf.id as cash_flow_id,
-                    cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
-                    cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
-                    t.ticker, NULL as status, NULL as trade_type, a.account_name, 'dividend' as entry_type,
-                    NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
-                    NULL as new_strike, NULL as new_exp,
-                    NULL as orig_strike, NULL as orig_exp,
-                    NULL as parent_closing_debit, NULL as parent_trade_type
-                FROM cash_flows cf
-                JOIN tickers t ON cf.ticker_id = t.id
-                LEFT JOIN accounts a ON cf.account_id = a.id
-                WHERE t.ticker = ? AND cf.transaction_type = 'Dividend'
-            '''
-            dividend_params = [ticker]
-            if account_id:
-                dividend_query += ' AND cf.account_id = ?'
-                dividend_params.append(account_id)
-
-            # Query CLOSING_DEBIT entries — pad with NULLs for parent columns
-            # Note: cf.trade_id is the PARENT trade being closed, not the new STO
-            closing_debit_query = '''
-                SELECT
-                    cf.id, cf.account_id, t.id as ticker_id, cf.trade_id, cf.id as cash_flow_id,
-                    cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
-                    cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
-                    t.ticker, tr.trade_status as status, tr.trade_type, a.account_name, 'closing_debit' as entry_type,
-                    NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
-                    NULL as new_strike, NULL as new_exp,
-                    NULL as orig_strike, NULL as orig_exp,
-                    NULL as parent_closing_debit, NULL as parent_trade_type
-                FROM cash_flows cf
-                JOIN tickers t ON cf.ticker_id = t.id
-                LEFT JOIN trades tr ON cf.trade_id = tr.id
-                LEFT JOIN accounts a ON cf.account_id = a.id
-                WHERE t.ticker = ? AND cf.transaction_type = 'CLOSING_DEBIT'
-            '''
-            closing_debit_params = [ticker]
-            if account_id:
-                closing_debit_query += ' AND cf.account_id = ?'
-                closing_debit_params.append(account_id)
-            
-            # Combine all three queries with UNION
-            combined_query = f'''
-                {query}
-                UNION ALL
-                {dividend_query}
-                UNION ALL
-                {closing_debit_query}
-                ORDER BY transaction_date ASC
-            '''
-            combined_params = params + dividend_params + closing_debit_params
-            cursor.execute(combined_query, combined_params)
-        else:
-            # Query cost_basis entries — include parent trade info for diagonal roll display
-            query = '''
-                SELECT 
-                    cb.id, cb.account_id, cb.ticker_id, cb.trade_id, cb.cash_flow_id,
-                    cb.transaction_date, cb.description, cb.shares, cb.cost_per_share,
-                    cb.total_amount, cb.running_basis, cb.running_shares, cb.basis_per_share, cb.created_at,
-                    t.ticker, tr.trade_status as status, tr.trade_type, a.account_name, 'cost_basis' as entry_type,
-                    tr.trade_parent_id,
-                    tr.price_per_share as sto_price,
-                    tr.num_of_contracts as trade_num_contracts,
-                    tr.strike_price as new_strike,
-                    tr.expiration_date as new_exp,
-                    ptr.strike_price as orig_strike,
-                    ptr.expiration_date as orig_exp,
-                    ptr.closing_debit as parent_closing_debit,
-                    ptr.trade_type as parent_trade_type
-                FROM cost_basis cb
-                JOIN tickers t ON cb.ticker_id = t.id
-                LEFT JOIN trades tr ON cb.trade_id = tr.id
-                LEFT JOIN trades ptr ON tr.trade_parent_id = ptr.id
-                LEFT JOIN accounts a ON cb.account_id = a.id
-                WHERE t.ticker IS NOT NULL AND t.ticker != ""
-            '''
-            params = []
-            if account_id:
-                query += ' AND cb.account_id = ?'
-                params.append(account_id)
-            
-            # Query dividend entries — pad with NULLs for parent columns
-            dividend_query = '''
-                SELECT 
-                    cf.id, cf.account_id, t.id as ticker_id, NULL as trade_id, cf.id as cash_flow_id,
-                    cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
-                    cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
-                    t.ticker, NULL as status, NULL as trade_type, a.account_name, 'dividend' as entry_type,
-                    NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
-                    NULL as new_strike, NULL as new_exp,
-                    NULL as orig_strike, NULL as orig_exp,
-                    NULL as parent_closing_debit, NULL as parent_trade_type
-                FROM cash_flows cf
-                JOIN tickers t ON cf.ticker_id = t.id
-                LEFT JOIN accounts a ON cf.account_id = a.id
-                WHERE cf.transaction_type = 'Dividend'
-            '''
-            dividend_params = []
-            if account_id:
-                dividend_query += ' AND cf.account_id = ?'
-                dividend_params.append(account_id)
-
-            # Query CLOSING_DEBIT entries — pad with NULLs for parent columns
-            closing_debit_query = '''
-                SELECT
-                    cf.id, cf.account_id, t.id as ticker_id, cf.trade_id, cf.id as cash_flow_id,
-                    cf.transaction_date, cf.description, 0 as shares, 0 as cost_per_share,
-                    cf.amount as total_amount, 0 as running_basis, 0 as running_shares, 0 as basis_per_share, cf.created_at,
-                    t.ticker, tr.trade_status as status, tr.trade_type, a.account_name, 'closing_debit' as entry_type,
-                    NULL as trade_parent_id, NULL as sto_price, NULL as trade_num_contracts,
-                    NULL as new_strike, NULL as new_exp,
-                    NULL as orig_strike, NULL as orig_exp,
-                    NULL as parent_closing_debit, NULL as parent_trade_type
-                FROM cash_flows cf
-                JOIN tickers t ON cf.ticker_id = t.id
-                LEFT JOIN trades tr ON cf.trade_id = tr.id
-                LEFT JOIN accounts a ON cf.account_id = a.id
-                WHERE cf.transaction_type = 'CLOSING_DEBIT'
-            '''
-            closing_debit_params = []
-            if account_id:
-                closing_debit_query += ' AND cf.account_id = ?'
-                closing_debit_params.append(account_id)
-            
-            # Combine all three queries with UNION
-            combined_query = f'''
-                {query}
-                UNION ALL
-                {dividend_query}
-                UNION ALL
-                {closing_debit_query}
-                ORDER BY t.ticker, transaction_date ASC
-            '''
-            combined_params = params + dividend_params + closing_debit_params
-            cursor.execute(combined_query, combined_params)
-        
-        cost_basis_entries = cursor.fetchall()
-        
-        print(f'[DEBUG] Cost basis query returned {len(cost_basis_entries)} entries')
-        if cost_basis_entries:
-            sample_entry = dict(cost_basis_entries[0])
-            print(f'[DEBUG] First entry - account_id: {sample_entry.get("account_id")}, account_name: {sample_entry.get("account_name")}, ticker: {sample_entry.get("ticker")}')
-            # Log all unique account_ids in the results
-            unique_accounts = set()
-            for entry in cost_basis_entries:
-                entry_dict = dict(entry)
-                unique_accounts.add((entry_dict.get("account_id"), entry_dict.get("account_name")))
-            print(f'[DEBUG] Unique accounts in query results: {unique_accounts}')
-        
-        # Convert to list of dicts for processing
-        entries = [dict(entry) for entry in cost_basis_entries]
-        
-        # Group entries by ticker and account
-        ticker_groups = {}
-        for entry in entries:
-            ticker = entry['ticker']
-            entry_account_id = entry.get('account_id')
-            account_name = entry.get('account_name', 'Unknown')
-            
-            # If filtering by account_id, only include entries that match
-            if account_id and entry_account_id != account_id:
-                print(f'[DEBUG] Skipping entry - entry_account_id: {entry_account_id}, filter_account_id: {account_id}')
-                continue
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # Create a unique key for ticker + account combination
-            key = f"{ticker}_{entry_account_id}"
-            if key not in ticker_groups:
-                ticker_groups[key] = {
-                    'trades': [],
-                    'account_id': entry_account_id,
-                    'account_name': account_name
-                }
-            ticker_groups[key]['trades'].append(entry)
-        
-        # Fetch all company names at once for better performance
-        unique_tickers = set()
-        for key, ticker_data in ticker_groups.items():
-            if ticker_data['trades']:
-                unique_tickers.add(ticker_data['trades'][0]['ticker'])
-        
-        # Batch fetch company names
-        company_names = {}
-        if unique_tickers:
-            placeholders = ','.join(['?'] * len(unique_tickers))
-            cursor.execute(f'SELECT ticker, company_name FROM tickers WHERE ticker IN ({placeholders})', list(unique_tickers))
-            for row in cursor.fetchall():
-                ticker_key = row['ticker']
-                company_name_val = row['company_name']
-                if company_name_val and company_name_val.upper() != ticker_key.upper():
-                    company_names[ticker_key] = company_name_val
-                else:
-                    # Company name is missing or equals ticker - use ticker for now
-                    # Don't fetch from yfinance here as it's too slow for multiple tickers
-                    # Company names will be fetched in background via /api/pending-tickers endpoint
-                    company_names[ticker_key] = ticker_key
-        
-        result = []
-        print(f'[DEBUG] Number of ticker_groups (ticker+account combinations): {len(ticker_groups)}')
-        for key, ticker_data in ticker_groups.items():
-            ticker = ticker_data['trades'][0]['ticker'] if ticker_data['trades'] else ''
-            entries_list = ticker_data['trades']
-            print(f'[DEBUG] Processing group {key} - ticker: {ticker}, account_id: {ticker_data.get("account_id")}, account_name: {ticker_data.get("account_name")}, entries: {len(entries_list)}')
-            # Sort entries by transaction_date to ensure correct running totals
-            entries_list.sort(key=lambda x: (x.get('transaction_date', ''), x.get('id', 0)))
-            
-            # Get company name from pre-fetched dictionary
-            company_name = company_names.get(ticker, ticker)
-
-            # ----------------------------------------------------------------
-            # PRE-PASS: index closing_debit entries by the parent_trade_id they
-            # belong to. This lets rolled STO entries absorb the debit and render
-            # as a single DIAGONAL row instead of two separate rows.
-            # closing_debit.trade_id == the rolled-out (parent) trade
-            # ----------------------------------------------------------------
-            closing_debits_by_parent_id = {}
-            for entry in entries_list:
-                if entry.get('entry_type') == 'closing_debit':
-                    pid = entry.get('trade_id')
-                    if pid:
-                        closing_debits_by_parent_id[pid] = entry
-
-            # PRE-PASS 2: find all rolled STO cost_basis entries that have a
-            # matching closing_debit — mark their parent_ids as merged so the
-            # standalone closing_debit rows are skipped in the main loop.
-            merged_parent_ids = set()
-            for entry in entries_list:
-                if entry.get('entry_type') == 'cost_basis':
-                    parent_id = entry.get('trade_parent_id')
-                    parent_cd = entry.get('parent_closing_debit') or 0
-                    if parent_id and parent_id in closing_debits_by_parent_id and parent_cd > 0:
-                        merged_parent_ids.add(parent_id)
-            
-            # Map cost_basis entries and dividends to trade structure
-            mapped_trades = []
-            # Calculate running totals by summing shares and amounts
-            calculated_running_shares = 0
-            calculated_running_basis = 0
-            for entry in entries_list:
-                entry_type = entry.get('entry_type', 'cost_basis')
+            # Get account_id filter if provided - handle both string and int conversion
+            account_id = get_account_id_arg()
+            
+            logger.debug('Cost basis query - account_id: %s, ticker: %s', account_id, ticker)
+            
+            # Cost basis entries plus the dividend and closing debit cash flows shown with them
+            # (the query text for each filter combination is built once, at import)
+            by_ticker, by_account = bool(ticker), bool(account_id)
+            params = ([ticker] if by_ticker else []) + ([account_id] if by_account else [])
+            cursor.execute(_SQL_COST_BASIS_ENTRIES[by_ticker, by_account], params * 3)
+            
+            # Group the sqlite3.Row entries by ticker and account as they are fetched (no
+            # intermediate list or per-row dict); the query returns them in (transaction_date, id)
+            # order, the order the running totals are summed in
+            ticker_groups = {}
+            for entry in cursor:
+                ticker = entry['ticker']
+                entry_account_id = entry['account_id']
+                account_name = entry['account_name']
                 
-                if entry_type == 'dividend':
-                    amount = entry.get('total_amount', 0) or 0
-                    calculated_running_basis += amount
-                    
-                    trade = {
-                        'id': entry.get('id'),
-                        'date_trade_open': entry.get('transaction_date'),
-                        'trade_description': entry.get('description', 'Dividend'),
-                        'shares': 0,
-                        'cost_per_share': 0,
-                        'amount': amount,
-                        'running_basis': calculated_running_basis,
-                        'running_basis_per_share': calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis,
-                        'running_shares': calculated_running_shares,
-                        'trade_status': None,
-                        'trade_type': 'Dividend',
-                        'is_dividend': True
-                    }
-                    mapped_trades.append(trade)
-
-                elif entry_type == 'closing_debit':
-                    # Skip if this closing_debit was merged into a DIAGONAL row
-                    pid = entry.get('trade_id')
-                    if pid and pid in merged_parent_ids:
-                        continue
-                    # Standalone closing_debit (no matching rolled STO found) — show as its own row
-                    raw_amount = entry.get('total_amount', 0) or 0
-                    amount = -raw_amount  # flip sign: cash outflow → positive cost
-                    calculated_running_basis += amount
-
-                    trade = {
-                        'id': entry.get('id'),
-                        'date_trade_open': entry.get('transaction_date'),
-                        'trade_description': '↩ ' + (entry.get('description') or 'Rolling debit (BTC)'),
-                        'shares': 0,
-                        'cost_per_share': 0,
-                        'amount': amount,
-                        'running_basis': calculated_running_basis,
-                        'running_basis_per_share': calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis,
-                        'running_shares': calculated_running_shares,
-                        'trade_status': entry.get('status'),
-                        'trade_type': entry.get('trade_type'),
-                        'is_dividend': False,
-                        'is_closing_debit': True,
+                # If filtering by account_id, only include entries that match
+                if account_id and entry_account_id != account_id:
+                    logger.debug('Skipping entry - entry_account_id: %s, filter_account_id: %s', entry_account_id, account_id)
+                    continue
+                
+                # Create a unique key for ticker + account combination
+                key = f"{ticker}_{entry_account_id}"
+                if key not in ticker_groups:
+                    # Use the ticker until a real company name is known (names are filled in
+                    # in the background via /api/pending-tickers, not here - too slow for many tickers)
+                    company_name = entry['company_name']
+                    if not company_name or company_name.upper() == ticker.upper():
+                        company_name = ticker
+                    ticker_groups[key] = {
+                        'company_name': company_name,
+                        'trades': [],
+                        'account_id': entry_account_id,
+                        'account_name': account_name
                     }
-                    mapped_trades.append(trade)
-
-                else:
-                    # cost_basis entry — check if this is a rolled STO with a parent closing_debit
-                    parent_id = entry.get('trade_parent_id')
-                    parent_cd = entry.get('parent_closing_debit') or 0
-
-                    if parent_id and parent_id in closing_debits_by_parent_id and parent_cd > 0:
-                        # ---- DIAGONAL MERGE ----
-
-                        sto_price   = entry.get('sto_price') or 0
-                        n_contracts = entry.get('trade_num_contracts') or 1
-                        net_credit  = round(sto_price - parent_cd, 4)
-                        net_amount  = -(net_credit * n_contracts * 100)
-
-                        # Format dates
-                        from datetime import datetime as _dt
-                        def _fmt(d):
-                            try:
-                                return _dt.strptime(d, '%Y-%m-%d').strftime('%d-%b-%y').upper()
-                            except Exception:
-                                return d or ''
-
-                        new_exp_str  = _fmt(entry.get('new_exp', ''))
-                        orig_exp_str = _fmt(entry.get('orig_exp', ''))
-                        new_strike   = entry.get('new_strike') or 0
-                        orig_strike  = entry.get('orig_strike') or 0
-
-                        # Determine PUT/CALL from trade_type
-                        ttype = (entry.get('trade_type') or entry.get('parent_trade_type') or '').upper()
-                        opt_label = 'PUT' if 'PUT' in ttype else ('CALL' if 'CALL' in ttype else '')
-
-                        description = (
-                            f"SELL -{n_contracts} DIAGONAL {ticker} 100 "
-                            f"{new_exp_str}/{orig_exp_str} "
-                            f"{new_strike}/{orig_strike} {opt_label} @{net_credit:.2f}"
-                        )
-
-                        calculated_running_basis += net_amount
+                ticker_groups[key]['trades'].append(entry)
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Cost basis query returned %s entries in %s ticker+account groups, accounts: %s',
+                             sum(len(group['trades']) for group in ticker_groups.values()), len(ticker_groups),
+                             {(group['account_id'], group['account_name']) for group in ticker_groups.values()})
+            
+            result = []
+            for key, ticker_data in ticker_groups.items():
+                ticker = ticker_data['trades'][0]['ticker'] if ticker_data['trades'] else ''
+                entries_list = ticker_data['trades']
+                logger.debug('Processing group %s - ticker: %s, account_id: %s, account_name: %s, entries: %s',
+                             key, ticker, ticker_data['account_id'], ticker_data['account_name'], len(entries_list))
+                
+                company_name = ticker_data['company_name']
 
+                # ----------------------------------------------------------------
+                # PRE-PASS: index closing_debit entries by the parent_trade_id they
+                # belong to. This lets rolled STO entries absorb the debit and render
+                # as a single DIAGONAL row instead of two separate rows.
+                # closing_debit.trade_id == the rolled-out (parent) trade
+                # ----------------------------------------------------------------
+                closing_debits_by_parent_id = {}
+                for entry in entries_list:
+                    if entry['entry_type'] == 'closing_debit':
+                        pid = entry['trade_id']
+                        if pid:
+                            closing_debits_by_parent_id[pid] = entry
+
+                # PRE-PASS 2: find all rolled STO cost_basis entries that have a
+                # matching closing_debit — mark their parent_ids as merged so the
+                # standalone closing_debit rows are skipped in the main loop.
+                merged_parent_ids = set()
+                for entry in entries_list:
+                    if entry['entry_type'] == 'cost_basis':
+                        parent_id = entry['trade_parent_id']
+                        parent_cd = entry['parent_closing_debit'] or 0
+                        if parent_id and parent_id in closing_debits_by_parent_id and parent_cd > 0:
+                            merged_parent_ids.add(parent_id)
+                
+                # Map cost_basis entries and dividends to trade structure
+                mapped_trades = []
+                # Calculate running totals by summing shares and amounts
+                calculated_running_shares = 0
+                calculated_running_basis = 0
+                for entry in entries_list:
+                    entry_type = entry['entry_type']
+                    
+                    if entry_type == 'dividend':
+                        amount = entry['total_amount'] or 0
+                        calculated_running_basis += amount
+                        
                         trade = {
-                            'id': entry.get('id'),
-                            'date_trade_open': entry.get('transaction_date'),
-                            'trade_description': description,
+                            'id': entry['id'],
+                            'date_trade_open': entry['transaction_date'],
+                            'trade_description': entry['description'],
                             'shares': 0,
                             'cost_per_share': 0,
-                            'amount': net_amount,
+                            'amount': amount,
                             'running_basis': calculated_running_basis,
                             'running_basis_per_share': calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis,
                             'running_shares': calculated_running_shares,
-                            'trade_status': entry.get('status'),
-                            'trade_type': entry.get('trade_type'),
-                            'is_diagonal': True,
+                            'trade_status': None,
+                            'trade_type': 'Dividend',
+                            'is_dividend': True
                         }
-                    else:
-                        # Regular cost_basis row (no merge)
-                        shares = entry.get('shares', 0) or 0
-                        amount = entry.get('total_amount', 0) or 0
-                        calculated_running_shares += shares
-                        calculated_running_basis += amount
+                        mapped_trades.append(trade)
 
-                        basis_per_share = calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis
-
-                        # Detect assignment rows: BTO trade with a parent option trade
-                        is_assignment = (
-                            entry.get('trade_type') == 'BTO' and
-                            entry.get('trade_parent_id') is not None and
-                            shares > 0
-                        )
+                    elif entry_type == 'closing_debit':
+                        # Skip if this closing_debit was merged into a DIAGONAL row
+                        pid = entry['trade_id']
+                        if pid and pid in merged_parent_ids:
+                            continue
+                        # Standalone closing_debit (no matching rolled STO found) — show as its own row
+                        raw_amount = entry['total_amount'] or 0
+                        amount = -raw_amount  # flip sign: cash outflow → positive cost
+                        calculated_running_basis += amount
 
                         trade = {
-                            'id': entry.get('id'),
-                            'date_trade_open': entry.get('transaction_date'),
-                            'trade_description': entry.get('description'),
-                            'shares': shares,
-                            'cost_per_share': entry.get('cost_per_share'),
+                            'id': entry['id'],
+                            'date_trade_open': entry['transaction_date'],
+                            'trade_description': '↩ ' + (entry['description'] or 'Rolling debit (BTC)'),
+                            'shares': 0,
+                            'cost_per_share': 0,
                             'amount': amount,
                             'running_basis': calculated_running_basis,
-                            'running_basis_per_share': basis_per_share,
+                            'running_basis_per_share': calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis,
                             'running_shares': calculated_running_shares,
-                            'trade_status': entry.get('status'),
-                            'trade_type': entry.get('trade_type'),
+                            'trade_status': entry['status'],
+                            'trade_type': entry['trade_type'],
                             'is_dividend': False,
-                            'is_closing_debit': False,
-                            'is_diagonal': False,
-                            'is_assignment': is_assignment,
+                            'is_closing_debit': True,
                         }
-                    mapped_trades.append(trade)
-            
-            # Calculate totals from the calculated running totals (more reliable than database values)
-            if mapped_trades:
-                last_entry = mapped_trades[-1]
-                total_shares = last_entry['running_shares']
-                total_cost_basis = last_entry['running_basis']
-                # Use the calculated basis_per_share from the last entry (always use it, even if shares is 0)
-                total_cost_basis_per_share = last_entry['running_basis_per_share']
+                        mapped_trades.append(trade)
+
+                    else:
+                        # cost_basis entry — check if this is a rolled STO with a parent closing_debit
+                        parent_id = entry['trade_parent_id']
+                        parent_cd = entry['parent_closing_debit'] or 0
+
+                        if parent_id and parent_id in closing_debits_by_parent_id and parent_cd > 0:
+                            # ---- DIAGONAL MERGE ----
+
+                            sto_price   = entry['sto_price'] or 0
+                            n_contracts = entry['trade_num_contracts'] or 1
+                            net_credit  = round(sto_price - parent_cd, 4)
+                            net_amount  = -(net_credit * n_contracts * 100)
+
+                            # Format dates (DD-MON-YY, shown as stored when unparseable)
+                            def _fmt(d):
+                                try:
+                                    return format_expiration(d)
+                                except Exception:
+                                    return d or ''
+
+                            new_exp_str  = _fmt(entry['new_exp'])
+                            orig_exp_str = _fmt(entry['orig_exp'])
+                            new_strike   = entry['new_strike'] or 0
+                            orig_strike  = entry['orig_strike'] or 0
+
+                            # Determine PUT/CALL from trade_type
+                            ttype = (entry['trade_type'] or entry['parent_trade_type'] or '').upper()
+                            opt_label = 'PUT' if 'PUT' in ttype else ('CALL' if 'CALL' in ttype else '')
+
+                            description = (
+                                f"SELL -{n_contracts} DIAGONAL {ticker} 100 "
+                                f"{new_exp_str}/{orig_exp_str} "
+                                f"{new_strike}/{orig_strike} {opt_label} @{net_credit:.2f}"
+                            )
+
+                            calculated_running_basis += net_amount
+
+                            trade = {
+                                'id': entry['id'],
+                                'date_trade_open': entry['transaction_date'],
+                                'trade_description': description,
+                                'shares': 0,
+                                'cost_per_share': 0,
+                                'amount': net_amount,
+                                'running_basis': calculated_running_basis,
+                                'running_basis_per_share': calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis,
+                                'running_shares': calculated_running_shares,
+                                'trade_status': entry['status'],
+                                'trade_type': entry['trade_type'],
+                                'is_diagonal': True,
+                            }
+                        else:
+                            # Regular cost_basis row (no merge)
+                            shares = entry['shares'] or 0
+                            amount = entry['total_amount'] or 0
+                            calculated_running_shares += shares
+                            calculated_running_basis += amount
+
+                            basis_per_share = calculated_running_basis / calculated_running_shares if calculated_running_shares != 0 else calculated_running_basis
+
+                            # Detect assignment rows: BTO trade with a parent option trade
+                            is_assignment = (
+                                entry['trade_type'] == 'BTO' and
+                                entry['trade_parent_id'] is not None and
+                                shares > 0
+                            )
+
+                            trade = {
+                                'id': entry['id'],
+                                'date_trade_open': entry['transaction_date'],
+                                'trade_description': entry['description'],
+                                'shares': shares,
+                                'cost_per_share': entry['cost_per_share'],
+                                'amount': amount,
+                                'running_basis': calculated_running_basis,
+                                'running_basis_per_share': basis_per_share,
+                                'running_shares': calculated_running_shares,
+                                'trade_status': entry['status'],
+                                'trade_type': entry['trade_type'],
+                                'is_dividend': False,
+                                'is_closing_debit': False,
+                                'is_diagonal': False,
+                                'is_assignment': is_assignment,
+                            }
+                        mapped_trades.append(trade)
+                
+                # Calculate totals from the calculated running totals (more reliable than database values)
+                if mapped_trades:
+                    last_entry = mapped_trades[-1]
+                    total_shares = last_entry['running_shares']
+                    total_cost_basis = last_entry['running_basis']
+                    # Use the calculated basis_per_share from the last entry (always use it, even if shares is 0)
+                    total_cost_basis_per_share = last_entry['running_basis_per_share']
+                else:
+                    total_shares = 0
+                    total_cost_basis = 0
+                    total_cost_basis_per_share = 0
+                
+                result.append({
+                    'ticker': ticker,
+                    'company_name': company_name,
+                    'account_id': ticker_data.get('account_id'),
+                    'account_name': ticker_data.get('account_name'),
+                    'total_shares': total_shares,
+                    'total_cost_basis': total_cost_basis,
+                    'total_cost_basis_per_share': total_cost_basis_per_share,
+                    'trades': mapped_trades
+                })
+            
+            # Sort result based on whether ticker is selected
+            if ticker:
+                # When ticker is selected: Rule One account (id=9) first
+                result.sort(key=lambda x: (
+                    0 if x.get('account_id') == 9 else 1  # Rule One (id=9) comes first
+                ))
             else:
-                total_shares = 0
-                total_cost_basis = 0
-                total_cost_basis_per_share = 0
-            
-            result.append({
-                'ticker': ticker,
-                'company_name': company_name,
-                'account_id': ticker_data.get('account_id'),
-                'account_name': ticker_data.get('account_name'),
-                'total_shares': total_shares,
-                'total_cost_basis': total_cost_basis,
-                'total_cost_basis_per_share': total_cost_basis_per_share,
-                'trades': mapped_trades
-            })
-        
-        # Sort result based on whether ticker is selected
-        if ticker:
-            # When ticker is selected: Rule One account (id=9) first
-            result.sort(key=lambda x: (
-                0 if x.get('account_id') == 9 else 1  # Rule One (id=9) comes first
-            ))
-        else:
-            # When no ticker is selected: Rule One account (id=9) first, then by ticker alphabetically
-            result.sort(key=lambda x: (
-                0 if x.get('account_id') == 9 else 1,  # Rule One (id=9) comes first
-                x.get('ticker', '').upper()  # Then sort by ticker alphabetically
-            ))
-        
-        conn.close()
-        return jsonify(result)
+                # When no ticker is selected: Rule One account (id=9) first, then by ticker alphabetically
+                result.sort(key=lambda x: (
+                    0 if x.get('account_id') == 9 else 1,  # Rule One (id=9) comes first
+                    x.get('ticker', '').upper()  # Then sort by ticker alphabetically
+                ))
+            
+        return revalidated(jsonify(result))
     except Exception as e:
         print(f'Error fetching cost basis: {e}')
         return jsonify({'error': 'Failed to fetch cost basis'}), 500
 
+# Base statements for /api/summary and /api/chart-data; optional filters are appended
+# as bound parameters, so each filter combination is one fixed SQL string that the
+# connection's statement cache prepares once. String literals are single-quoted
+# (double quotes are identifiers in SQL; SQLite only falls back to a string).
+# Trade counts: closed, expired and assigned trades are the completed ones.
+_SQL_SUMMARY_TRADE_COUNTS = '''
+    SELECT COUNT(*) as total_trades,
+           COUNT(CASE WHEN st.trade_status = 'open' THEN 1 END) as open_trades,
+           COUNT(CASE WHEN st.trade_status IN ('closed', 'expired', 'assigned') THEN 1 END) as closed_trades,
+           COUNT(CASE WHEN st.trade_status IN ('closed', 'expired', 'assigned') AND st.total_premium > 0 THEN 1 END) as wins,
+           COUNT(CASE WHEN st.trade_status IN ('closed', 'expired', 'assigned') AND st.total_premium < 0 THEN 1 END) as losses
+    FROM trades st 
+    JOIN tickers s ON st.ticker_id = s.id 
+    WHERE s.ticker IS NOT NULL AND s.ticker != '' 
+    AND st.trade_type NOT IN ('BTO', 'STC', 'ASSIGNED')
+    AND st.trade_status != 'roll'
+'''
+
+# total_net_credit is the sum of OPTIONS cash flows
+_SQL_SUMMARY_NET_CREDIT = '''
+    SELECT SUM(cf.amount) as total_net_credit
+    FROM cash_flows cf
+    WHERE cf.transaction_type = 'OPTIONS'
+'''
+
+# Daily OPTIONS premium, dates formatted as MM/DD by SQLite
+_SQL_CHART_DATA = '''
+    SELECT strftime('%m/%d', transaction_date) as date, SUM(amount) as daily_premium
+    FROM cash_flows
+    WHERE transaction_type = 'OPTIONS'
+'''
+
 @app.route('/api/summary')
 def get_summary():
     try:
@@ -4866,18 +5167,8 @@ def get_summary():
         start_date = request.args.get('start_date', '')
         end_date = request.args.get('end_date', '')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Build query with date filters
-        query = '''
-            SELECT st.*, s.ticker 
-            FROM trades st 
-            JOIN tickers s ON st.ticker_id = s.id 
-            WHERE s.ticker IS NOT NULL AND s.ticker != "" 
-            AND st.trade_type NOT IN ("BTO", "STC", "ASSIGNED")
-            AND st.trade_status != "roll"
-        '''
+        # Build query with date filters; the trade counts are aggregated in SQL
+        query = _SQL_SUMMARY_TRADE_COUNTS
         params = []
         
         if account_id:
@@ -4896,15 +5187,8 @@ def get_summary():
             query += ' AND st.date_trade_open <= ?'
             params.append(end_date)
         
-        cursor.execute(query, params)
-        trades = cursor.fetchall()
-        
         # Calculate total_net_credit from cash_flows where transaction_type='OPTIONS'
-        cash_flow_query = '''
-            SELECT SUM(cf.amount) as total_net_credit
-            FROM cash_flows cf
-            WHERE cf.transaction_type = 'OPTIONS'
-        '''
+        cash_flow_query = _SQL_SUMMARY_NET_CREDIT
         cash_flow_params = []
         
         if ticker:
@@ -4930,35 +5214,29 @@ def get_summary():
             cash_flow_query += ' AND cf.transaction_date <= ?'
             cash_flow_params.append(end_date)
         
-        cursor.execute(cash_flow_query, cash_flow_params)
-        result = cursor.fetchone()
+        with get_db() as conn:
+            counts = conn.execute(query, params).fetchone()
+            result = conn.execute(cash_flow_query, cash_flow_params).fetchone()
         total_net_credit = result['total_net_credit'] if result['total_net_credit'] is not None else 0
         
-        conn.close()
-        
-        # Calculate summary statistics
-        total_trades = len(trades)
-        open_trades = len([t for t in trades if t['trade_status'] == 'open'])
-        closed_trades = len([t for t in trades if t['trade_status'] in ['closed', 'expired', 'assigned']])
-        
-        # Calculate wins and losses only from completed trades
-        completed_trades_list = [t for t in trades if t['trade_status'] in ['closed', 'expired', 'assigned']]
-        wins = len([t for t in completed_trades_list if t['total_premium'] > 0])
-        losses = len([t for t in completed_trades_list if t['total_premium'] < 0])
-        winning_percentage = (wins / len(completed_trades_list) * 100) if len(completed_trades_list) > 0 else 0
+        # Calculate summary statistics (wins and losses only count completed trades)
+        closed_trades = counts['closed_trades']
+        wins = counts['wins']
+        losses = counts['losses']
+        winning_percentage = (wins / closed_trades * 100) if closed_trades > 0 else 0
         
         # Calculate days remaining in year
-        today = datetime.now().date()
-        year_end = datetime(today.year, 12, 31).date()
+        today = date.today()
+        year_end = date(today.year, 12, 31)
         days_remaining = (year_end - today).days
         
         # Calculate days done in year
-        year_start = datetime(today.year, 1, 1).date()
+        year_start = date(today.year, 1, 1)
         days_done = (today - year_start).days
         
-        return jsonify({
-            'total_trades': total_trades,
-            'open_trades': open_trades,
+        return revalidated(jsonify({
+            'total_trades': counts['total_trades'],
+            'open_trades': counts['open_trades'],
             'closed_trades': closed_trades,
             'wins': wins,
             'losses': losses,
@@ -4966,7 +5244,7 @@ def get_summary():
             'total_net_credit': total_net_credit,
             'days_remaining': days_remaining,
             'days_done': days_done
-        })
+        }))
     except Exception as e:
         print(f'Error fetching summary: {e}')
         return jsonify({'error': 'Failed to fetch summary'}), 500
@@ -4977,15 +5255,8 @@ def get_chart_data():
         start_date = request.args.get('start_date', '')
         end_date = request.args.get('end_date', '')
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # Build query with date filters - sum only OPTIONS cash_flows.amount grouped by transaction_date
-        query = '''
-            SELECT transaction_date, SUM(amount) as daily_premium
-            FROM cash_flows
-            WHERE transaction_type = 'OPTIONS'
-        '''
+        query = _SQL_CHART_DATA
         params = []
         
         if start_date:
@@ -4994,123 +5265,112 @@ def get_chart_data():
         
         if end_date:
             query += ' AND transaction_date <= ?'
-            params.append(end_date)
-        
-        query += ' GROUP BY transaction_date ORDER BY transaction_date'
-        
-        cursor.execute(query, params)
-        data = cursor.fetchall()
-        conn.close()
-        
-        chart_data = []
-        for row in data:
-            # Format date as MM/DD
-            date_obj = datetime.strptime(row['transaction_date'], '%Y-%m-%d')
-            formatted_date = date_obj.strftime('%m/%d')
-            
-            chart_data.append({
-                'date': formatted_date,
-                'premium': row['daily_premium']
-            })
-        
-        return jsonify(chart_data)
-    except Exception as e:
-        print(f'Error fetching chart data: {e}')
-        return jsonify({'error': 'Failed to fetch chart data'}), 500
-
-@app.route('/api/repopulate-cash-flows', methods=['POST'])
-def repopulate_cash_flows():
-    """Reset cash_flows table and repopulate from trades table"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Clear all existing cash flows
-        cursor.execute('DELETE FROM cash_flows')
-        print("Cleared cash_flows table", flush=True)
-        
-        # Get all trades
-        cursor.execute('''
-            SELECT t.*, tt.requires_contracts 
-            FROM trades t
-            LEFT JOIN trade_types tt ON t.trade_type = tt.type_name
-        ''')
-        trades = cursor.fetchall()
-        
-        print(f"Found {len(trades)} trades to process", flush=True)
-        
-        created_count = 0
-        
-        for trade in trades:
-            trade_dict = dict(trade)
-            account_id = trade_dict.get('account_id', 9)
-            ticker_id = trade_dict['ticker_id']
-            date_trade_open = trade_dict['date_trade_open']
-            trade_id = trade_dict['id']
-            premium = trade_dict['credit_debit']
-            num_of_contracts = trade_dict['num_of_contracts']
-            trade_type = trade_dict['trade_type']
-            trade_status = trade_dict['trade_status']
-            strike_price = trade_dict['strike_price']
-            requires_contracts = trade_dict.get('requires_contracts', 0)
-            
-            # Get ticker symbol
-            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-            ticker_result = cursor.fetchone()
-            ticker = ticker_result['ticker'] if ticker_result else 'UNKNOWN'
-            
-            # Create cash flow entry for the initial trade
-            if requires_contracts == 1:
-                # Options trade: determine if PUT or CALL
-                if 'PUT' in trade_type or 'ROP' in trade_type:
-                    transaction_type = 'SELL PUT'
-                elif 'CALL' in trade_type or 'ROC' in trade_type:
-                    transaction_type = 'SELL CALL'
-                else:
-                    # Default to PREMIUM_CREDIT if can't determine
-                    transaction_type = 'PREMIUM_CREDIT'
-                amount = premium * num_of_contracts * 100
-                cursor.execute('''
-                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (account_id, date_trade_open, transaction_type, round(amount, 2), 
-                      f"{trade_type} premium received", trade_id, ticker_id))
-            else:
-                # Non-options trade: use PREMIUM_CREDIT or PREMIUM_DEBIT
-                amount = trade_dict.get('total_premium', premium * num_of_contracts)
-                if trade_type == 'BTO':
-                    transaction_type = 'PREMIUM_DEBIT'  # Buying stock
-                else:
-                    transaction_type = 'PREMIUM_CREDIT'  # Selling stock
-                cursor.execute('''
-                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (account_id, date_trade_open, transaction_type, round(amount, 2), 
-                      f"{trade_type} {num_of_contracts} shares", trade_id, ticker_id))
+            params.append(end_date)
+        
+        query += ' GROUP BY transaction_date ORDER BY transaction_date'
+        
+        with get_db() as conn:
+            data = conn.execute(query, params).fetchall()
+        
+        chart_data = [{'date': row['date'], 'premium': row['daily_premium']} for row in data]
+        
+        return revalidated(jsonify(chart_data))
+    except Exception as e:
+        print(f'Error fetching chart data: {e}')
+        return jsonify({'error': 'Failed to fetch chart data'}), 500
+
+@app.route('/api/repopulate-cash-flows', methods=['POST'])
+def repopulate_cash_flows():
+    """Reset cash_flows table and repopulate from trades table"""
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            created_count += 1
+            # Clear all existing cash flows
+            cursor.execute('DELETE FROM cash_flows')
+            print("Cleared cash_flows table", flush=True)
             
-            # If trade is assigned, create ASSIGNMENT cash flow entry
-            if trade_status == 'assigned':
-                shares = num_of_contracts * 100
-                if 'PUT' in trade_type or 'ROP' in trade_type:
-                    # PUT assignment: negative amount (buying shares)
-                    assignment_amount = -(strike_price * shares)
-                    description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
+            # Get all trades
+            cursor.execute('''
+                SELECT t.*, tt.requires_contracts 
+                FROM trades t
+                LEFT JOIN trade_types tt ON t.trade_type = tt.type_name
+            ''')
+            trades = cursor.fetchall()
+            
+            print(f"Found {len(trades)} trades to process", flush=True)
+            
+            created_count = 0
+            
+            for trade in trades:
+                trade_dict = dict(trade)
+                account_id = trade_dict.get('account_id', 9)
+                ticker_id = trade_dict['ticker_id']
+                date_trade_open = trade_dict['date_trade_open']
+                trade_id = trade_dict['id']
+                premium = trade_dict['credit_debit']
+                num_of_contracts = trade_dict['num_of_contracts']
+                trade_type = trade_dict['trade_type']
+                trade_status = trade_dict['trade_status']
+                strike_price = trade_dict['strike_price']
+                requires_contracts = trade_dict.get('requires_contracts', 0)
+                
+                # Get ticker symbol
+                cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
+                ticker_result = cursor.fetchone()
+                ticker = ticker_result['ticker'] if ticker_result else 'UNKNOWN'
+                
+                # Create cash flow entry for the initial trade
+                if requires_contracts == 1:
+                    # Options trade: determine if PUT or CALL
+                    if 'PUT' in trade_type or 'ROP' in trade_type:
+                        transaction_type = 'SELL PUT'
+                    elif 'CALL' in trade_type or 'ROC' in trade_type:
+                        transaction_type = 'SELL CALL'
+                    else:
+                        # Default to PREMIUM_CREDIT if can't determine
+                        transaction_type = 'PREMIUM_CREDIT'
+                    amount = premium * num_of_contracts * 100
+                    cursor.execute('''
+                        INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (account_id, date_trade_open, transaction_type, round(amount, 2), 
+                          f"{trade_type} premium received", trade_id, ticker_id))
                 else:
-                    # CALL assignment: positive amount (selling shares)
-                    assignment_amount = strike_price * shares
-                    description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
+                    # Non-options trade: use PREMIUM_CREDIT or PREMIUM_DEBIT
+                    amount = trade_dict.get('total_premium', premium * num_of_contracts)
+                    if trade_type == 'BTO':
+                        transaction_type = 'PREMIUM_DEBIT'  # Buying stock
+                    else:
+                        transaction_type = 'PREMIUM_CREDIT'  # Selling stock
+                    cursor.execute('''
+                        INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (account_id, date_trade_open, transaction_type, round(amount, 2), 
+                          f"{trade_type} {num_of_contracts} shares", trade_id, ticker_id))
                 
-                cursor.execute('''
-                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (account_id, date_trade_open, 'ASSIGNMENT', round(assignment_amount, 2), 
-                      description, trade_id, ticker_id))
                 created_count += 1
-        
-        conn.commit()
-        conn.close()
+                
+                # If trade is assigned, create ASSIGNMENT cash flow entry
+                if trade_status == 'assigned':
+                    shares = num_of_contracts * 100
+                    if 'PUT' in trade_type or 'ROP' in trade_type:
+                        # PUT assignment: negative amount (buying shares)
+                        assignment_amount = -(strike_price * shares)
+                        description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
+                    else:
+                        # CALL assignment: positive amount (selling shares)
+                        assignment_amount = strike_price * shares
+                        description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
+                    
+                    cursor.execute('''
+                        INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (account_id, date_trade_open, 'ASSIGNMENT', round(assignment_amount, 2), 
+                          description, trade_id, ticker_id))
+                    created_count += 1
+            
+            conn.commit()
         
         return jsonify({
             'success': True, 
@@ -5127,83 +5387,82 @@ def repopulate_cash_flows():
 def repopulate_cost_basis():
     """Repopulate cost_basis entries for assigned trades and link to cash_flows"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all assigned trades
-        cursor.execute('''
-            SELECT t.*, tick.ticker 
-            FROM trades t
-            JOIN tickers tick ON t.ticker_id = tick.id
-            WHERE t.trade_status = 'assigned'
-        ''')
-        assigned_trades = cursor.fetchall()
-        
-        print(f"Found {len(assigned_trades)} assigned trades", flush=True)
-        
-        linked_count = 0
-        created_count = 0
-        
-        for trade in assigned_trades:
-            trade_dict = dict(trade)
-            account_id = trade_dict.get('account_id', 9)
-            ticker_id = trade_dict['ticker_id']
-            trade_id = trade_dict['id']
-            date_trade_open = trade_dict['date_trade_open']
-            trade_type = trade_dict['trade_type']
-            num_of_contracts = trade_dict['num_of_contracts']
-            strike_price = trade_dict['strike_price']
-            expiration_date = trade_dict['expiration_date']
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # Check if cost_basis entry exists for this assignment
+            # Get all assigned trades
             cursor.execute('''
-                SELECT id, cash_flow_id FROM cost_basis
-                WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
-                AND description LIKE 'ASSIGNED%'
-            ''', (trade_id, account_id, ticker_id))
-            cost_basis_entry = cursor.fetchone()
+                SELECT t.*, tick.ticker 
+                FROM trades t
+                JOIN tickers tick ON t.ticker_id = tick.id
+                WHERE t.trade_status = 'assigned'
+            ''')
+            assigned_trades = cursor.fetchall()
             
-            # Find the ASSIGNMENT cash flow for this trade
-            cursor.execute('''
-                SELECT id FROM cash_flows
-                WHERE trade_id = ? AND transaction_type = 'ASSIGNMENT'
-            ''', (trade_id,))
-            assignment_cash_flow = cursor.fetchone()
+            print(f"Found {len(assigned_trades)} assigned trades", flush=True)
             
-            if assignment_cash_flow:
-                cash_flow_id = assignment_cash_flow['id']
+            linked_count = 0
+            created_count = 0
+            
+            for trade in assigned_trades:
+                trade_dict = dict(trade)
+                account_id = trade_dict.get('account_id', 9)
+                ticker_id = trade_dict['ticker_id']
+                trade_id = trade_dict['id']
+                date_trade_open = trade_dict['date_trade_open']
+                trade_type = trade_dict['trade_type']
+                num_of_contracts = trade_dict['num_of_contracts']
+                strike_price = trade_dict['strike_price']
+                expiration_date = trade_dict['expiration_date']
+                
+                # Check if cost_basis entry exists for this assignment
+                cursor.execute('''
+                    SELECT id, cash_flow_id FROM cost_basis
+                    WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
+                    AND description LIKE 'ASSIGNED%'
+                ''', (trade_id, account_id, ticker_id))
+                cost_basis_entry = cursor.fetchone()
+                
+                # Find the ASSIGNMENT cash flow for this trade
+                cursor.execute('''
+                    SELECT id FROM cash_flows
+                    WHERE trade_id = ? AND transaction_type = 'ASSIGNMENT'
+                ''', (trade_id,))
+                assignment_cash_flow = cursor.fetchone()
                 
-                if cost_basis_entry:
-                    # Update existing cost_basis entry to link to cash flow
-                    if not cost_basis_entry['cash_flow_id']:
+                if assignment_cash_flow:
+                    cash_flow_id = assignment_cash_flow['id']
+                    
+                    if cost_basis_entry:
+                        # Update existing cost_basis entry to link to cash flow
+                        if not cost_basis_entry['cash_flow_id']:
+                            cursor.execute('''
+                                UPDATE cost_basis SET cash_flow_id = ?
+                                WHERE id = ?
+                            ''', (cash_flow_id, cost_basis_entry['id']))
+                            linked_count += 1
+                            print(f"Linked cost_basis {cost_basis_entry['id']} to cash_flow {cash_flow_id} for trade {trade_id}", flush=True)
+                    else:
+                        # Create missing cost_basis entry for this assignment
+                        print(f"Creating missing cost_basis entry for trade {trade_id}", flush=True)
+                        create_assigned_cost_basis_entry(cursor, trade_dict)
+                        created_count += 1
+                        
+                        # Now link it to the cash flow
                         cursor.execute('''
                             UPDATE cost_basis SET cash_flow_id = ?
-                            WHERE id = ?
-                        ''', (cash_flow_id, cost_basis_entry['id']))
+                            WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
+                            AND description LIKE 'ASSIGNED%'
+                        ''', (cash_flow_id, trade_id, account_id, ticker_id))
                         linked_count += 1
-                        print(f"Linked cost_basis {cost_basis_entry['id']} to cash_flow {cash_flow_id} for trade {trade_id}", flush=True)
                 else:
-                    # Create missing cost_basis entry for this assignment
-                    print(f"Creating missing cost_basis entry for trade {trade_id}", flush=True)
-                    create_assigned_cost_basis_entry(cursor, trade_dict)
-                    created_count += 1
-                    
-                    # Now link it to the cash flow
-                    cursor.execute('''
-                        UPDATE cost_basis SET cash_flow_id = ?
-                        WHERE trade_id = ? AND account_id = ? AND ticker_id = ?
-                        AND description LIKE 'ASSIGNED%'
-                    ''', (cash_flow_id, trade_id, account_id, ticker_id))
-                    linked_count += 1
-            else:
-                # No cash flow found, but still create cost basis entry if it doesn't exist
-                if not cost_basis_entry:
-                    print(f"No ASSIGNMENT cash flow found for trade {trade_id}, but creating cost basis entry anyway", flush=True)
-                    create_assigned_cost_basis_entry(cursor, trade_dict)
-                    created_count += 1
-        
-        conn.commit()
-        conn.close()
+                    # No cash flow found, but still create cost basis entry if it doesn't exist
+                    if not cost_basis_entry:
+                        print(f"No ASSIGNMENT cash flow found for trade {trade_id}, but creating cost basis entry anyway", flush=True)
+                        create_assigned_cost_basis_entry(cursor, trade_dict)
+                        created_count += 1
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -5220,118 +5479,117 @@ def repopulate_cost_basis():
 def backfill_cash_flows_for_cost_basis():
     """Create missing cash_flow entries for all cost_basis entries that don't have one"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all cost_basis entries without cash_flow_id
-        cursor.execute('''
-            SELECT cb.*, t.ticker, tr.trade_type, tr.trade_status, tr.num_of_contracts, 
-                   tr.strike_price, tr.expiration_date, tr.account_id as trade_account_id
-            FROM cost_basis cb
-            JOIN tickers t ON cb.ticker_id = t.id
-            LEFT JOIN trades tr ON cb.trade_id = tr.id
-            WHERE cb.cash_flow_id IS NULL
-            ORDER BY cb.transaction_date ASC
-        ''')
-        cost_basis_entries = cursor.fetchall()
-        
-        print(f"Found {len(cost_basis_entries)} cost_basis entries without cash_flow_id", flush=True)
-        
-        created_count = 0
-        linked_count = 0
-        
-        for cb_entry in cost_basis_entries:
-            cb_dict = dict(cb_entry)
-            cb_id = cb_dict['id']
-            account_id = cb_dict['account_id']
-            ticker_id = cb_dict['ticker_id']
-            trade_id = cb_dict['trade_id']
-            transaction_date = cb_dict['transaction_date']
-            description = cb_dict['description']
-            total_amount = cb_dict['total_amount']
-            ticker = cb_dict['ticker']
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            # Check if a cash_flow already exists for this trade and transaction_date
+            # Get all cost_basis entries without cash_flow_id
             cursor.execute('''
-                SELECT id FROM cash_flows
-                WHERE trade_id = ? AND transaction_date = ? AND ticker_id = ?
-            ''', (trade_id, transaction_date, ticker_id))
-            existing_cash_flow = cursor.fetchone()
-            
-            if existing_cash_flow:
-                # Link existing cash_flow to cost_basis
-                cash_flow_id = existing_cash_flow['id']
+                SELECT cb.*, t.ticker, tr.trade_type, tr.trade_status, tr.num_of_contracts, 
+                       tr.strike_price, tr.expiration_date, tr.account_id as trade_account_id
+                FROM cost_basis cb
+                JOIN tickers t ON cb.ticker_id = t.id
+                LEFT JOIN trades tr ON cb.trade_id = tr.id
+                WHERE cb.cash_flow_id IS NULL
+                ORDER BY cb.transaction_date ASC
+            ''')
+            cost_basis_entries = cursor.fetchall()
+            
+            print(f"Found {len(cost_basis_entries)} cost_basis entries without cash_flow_id", flush=True)
+            
+            created_count = 0
+            linked_count = 0
+            
+            for cb_entry in cost_basis_entries:
+                cb_dict = dict(cb_entry)
+                cb_id = cb_dict['id']
+                account_id = cb_dict['account_id']
+                ticker_id = cb_dict['ticker_id']
+                trade_id = cb_dict['trade_id']
+                transaction_date = cb_dict['transaction_date']
+                description = cb_dict['description']
+                total_amount = cb_dict['total_amount']
+                ticker = cb_dict['ticker']
+                
+                # Check if a cash_flow already exists for this trade and transaction_date
                 cursor.execute('''
-                    UPDATE cost_basis SET cash_flow_id = ? WHERE id = ?
-                ''', (cash_flow_id, cb_id))
-                linked_count += 1
-                print(f"Linked cost_basis {cb_id} to existing cash_flow {cash_flow_id}", flush=True)
-            else:
-                # Create new cash_flow entry based on cost_basis description
-                transaction_type = None
-                amount = total_amount
+                    SELECT id FROM cash_flows
+                    WHERE trade_id = ? AND transaction_date = ? AND ticker_id = ?
+                ''', (trade_id, transaction_date, ticker_id))
+                existing_cash_flow = cursor.fetchone()
                 
-                # Determine transaction type based on description
-                if 'ASSIGNED' in description.upper() or 'ASSIGNMENT' in description.upper():
-                    transaction_type = 'ASSIGNMENT'
-                    # For assigned trades, amount should match the cost_basis total_amount
-                    # PUT assignments: negative (buying shares)
-                    # CALL assignments: positive (selling shares)
-                elif 'BTO' in description.upper() or 'BUY' in description.upper():
-                    transaction_type = 'PREMIUM_DEBIT'  # Buying stock
-                    # BTO: negative amount (buying shares, money goes out)
-                    amount = abs(total_amount) if total_amount < 0 else -abs(total_amount)
-                elif 'STC' in description.upper() or 'SELL' in description.upper():
-                    # Options trades (SELL): determine PUT or CALL
-                    # Stock trades (STC): PREMIUM_CREDIT
-                    if cb_dict.get('trade_type') and cb_dict['trade_type'] not in ['BTO', 'STC']:
-                        # Options trade: determine PUT or CALL
-                        trade_type = cb_dict['trade_type']
-                        if 'PUT' in trade_type or 'ROP' in trade_type:
-                            transaction_type = 'SELL PUT'
-                        elif 'CALL' in trade_type or 'ROC' in trade_type:
-                            transaction_type = 'SELL CALL'
-                        else:
-                            transaction_type = 'PREMIUM_CREDIT'
-                        # Options: negative amount (we receive premium)
+                if existing_cash_flow:
+                    # Link existing cash_flow to cost_basis
+                    cash_flow_id = existing_cash_flow['id']
+                    cursor.execute('''
+                        UPDATE cost_basis SET cash_flow_id = ? WHERE id = ?
+                    ''', (cash_flow_id, cb_id))
+                    linked_count += 1
+                    print(f"Linked cost_basis {cb_id} to existing cash_flow {cash_flow_id}", flush=True)
+                else:
+                    # Create new cash_flow entry based on cost_basis description
+                    transaction_type = None
+                    amount = total_amount
+                    
+                    # Determine transaction type based on description
+                    if 'ASSIGNED' in description.upper() or 'ASSIGNMENT' in description.upper():
+                        transaction_type = 'ASSIGNMENT'
+                        # For assigned trades, amount should match the cost_basis total_amount
+                        # PUT assignments: negative (buying shares)
+                        # CALL assignments: positive (selling shares)
+                    elif 'BTO' in description.upper() or 'BUY' in description.upper():
+                        transaction_type = 'PREMIUM_DEBIT'  # Buying stock
+                        # BTO: negative amount (buying shares, money goes out)
                         amount = abs(total_amount) if total_amount < 0 else -abs(total_amount)
+                    elif 'STC' in description.upper() or 'SELL' in description.upper():
+                        # Options trades (SELL): determine PUT or CALL
+                        # Stock trades (STC): PREMIUM_CREDIT
+                        if cb_dict.get('trade_type') and cb_dict['trade_type'] not in ['BTO', 'STC']:
+                            # Options trade: determine PUT or CALL
+                            trade_type = cb_dict['trade_type']
+                            if 'PUT' in trade_type or 'ROP' in trade_type:
+                                transaction_type = 'SELL PUT'
+                            elif 'CALL' in trade_type or 'ROC' in trade_type:
+                                transaction_type = 'SELL CALL'
+                            else:
+                                transaction_type = 'PREMIUM_CREDIT'
+                            # Options: negative amount (we receive premium)
+                            amount = abs(total_amount) if total_amount < 0 else -abs(total_amount)
+                        else:
+                            transaction_type = 'PREMIUM_CREDIT'  # Stock trade
+                            # STC: positive amount (selling shares, money comes in)
+                            amount = abs(total_amount) if total_amount > 0 else -abs(total_amount)
                     else:
-                        transaction_type = 'PREMIUM_CREDIT'  # Stock trade
-                        # STC: positive amount (selling shares, money comes in)
-                        amount = abs(total_amount) if total_amount > 0 else -abs(total_amount)
-                else:
-                    # Default: assume it's an options trade
-                    if cb_dict.get('trade_type'):
-                        trade_type = cb_dict['trade_type']
-                        if 'PUT' in trade_type or 'ROP' in trade_type:
-                            transaction_type = 'SELL PUT'
-                        elif 'CALL' in trade_type or 'ROC' in trade_type:
-                            transaction_type = 'SELL CALL'
+                        # Default: assume it's an options trade
+                        if cb_dict.get('trade_type'):
+                            trade_type = cb_dict['trade_type']
+                            if 'PUT' in trade_type or 'ROP' in trade_type:
+                                transaction_type = 'SELL PUT'
+                            elif 'CALL' in trade_type or 'ROC' in trade_type:
+                                transaction_type = 'SELL CALL'
+                            else:
+                                transaction_type = 'PREMIUM_CREDIT'
                         else:
                             transaction_type = 'PREMIUM_CREDIT'
-                    else:
-                        transaction_type = 'PREMIUM_CREDIT'
-                    amount = abs(total_amount) if total_amount < 0 else -abs(total_amount)
-                
-                # Create cash_flow entry
-                cash_flow_description = description
-                cursor.execute('''
-                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (account_id, transaction_date, transaction_type, round(amount, 2), 
-                      cash_flow_description, trade_id, ticker_id))
-                cash_flow_id = cursor.lastrowid
-                
-                # Link cost_basis to cash_flow
-                cursor.execute('''
-                    UPDATE cost_basis SET cash_flow_id = ? WHERE id = ?
-                ''', (cash_flow_id, cb_id))
-                
-                created_count += 1
-                print(f"Created cash_flow {cash_flow_id} for cost_basis {cb_id} ({description})", flush=True)
-        
-        conn.commit()
-        conn.close()
+                        amount = abs(total_amount) if total_amount < 0 else -abs(total_amount)
+                    
+                    # Create cash_flow entry
+                    cash_flow_description = description
+                    cursor.execute('''
+                        INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (account_id, transaction_date, transaction_type, round(amount, 2), 
+                          cash_flow_description, trade_id, ticker_id))
+                    cash_flow_id = cursor.lastrowid
+                    
+                    # Link cost_basis to cash_flow
+                    cursor.execute('''
+                        UPDATE cost_basis SET cash_flow_id = ? WHERE id = ?
+                    ''', (cash_flow_id, cb_id))
+                    
+                    created_count += 1
+                    print(f"Created cash_flow {cash_flow_id} for cost_basis {cb_id} ({description})", flush=True)
+            
+            conn.commit()
         
         return jsonify({
             'success': True,
@@ -5350,41 +5608,15 @@ def test_endpoint():
     return 'App is running!', 200
 
 
-@app.route('/webhook/deploy', methods=['POST'])
-def webhook_deploy():
-    """Webhook endpoint for automatic deployment from GitHub"""
+# Deployments run one at a time off the request thread (git fetch, pip install and the
+# post-deploy repopulation can take far longer than GitHub waits for a webhook response)
+_deploy_executor = ThreadPoolExecutor(max_workers=1)
+
+def _do_deploy(project_dir):
+    """Update the checkout in project_dir to origin/main, install requirements, reload and repopulate"""
+    import subprocess
+    import time
     try:
-        import subprocess
-        import os
-        import hmac
-        import hashlib
-        
-        # Optional: Verify webhook secret for security
-        # webhook_secret = os.environ.get('WEBHOOK_SECRET', '')
-        # if webhook_secret:
-        #     signature = request.headers.get('X-Hub-Signature-256', '')
-        #     if not signature.startswith('sha256='):
-        #         return 'Invalid signature', 401
-        #     
-        #     expected_signature = 'sha256=' + hmac.new(
-        #         webhook_secret.encode(),
-        #         request.get_data(),
-        #         hashlib.sha256
-        #     ).hexdigest()
-        #     
-        #     if not hmac.compare_digest(signature, expected_signature):
-        #         return 'Signature mismatch', 401
-        
-        # Get current working directory (detect if on PythonAnywhere or local)
-        current_dir = os.getcwd()
-        
-        # For local development
-        if 'pythonanywhere' not in current_dir.lower():
-            project_dir = current_dir
-        else:
-            # For PythonAnywhere
-            project_dir = os.path.expanduser('~/inv_track')
-        
         print(f"Deploying from: {project_dir}")
         
         # Force checkout to overwrite local changes to trades.db
@@ -5469,7 +5701,6 @@ def webhook_deploy():
             
             # After deployment, automatically repopulate database tables
             # Wait a moment for the app to reload
-            import time
             time.sleep(2)
             
             messages = []
@@ -5509,12 +5740,51 @@ def webhook_deploy():
                 print(f"Warning: Could not repopulate cost basis: {e}")
                 messages.append("Cost basis: skipped")
             
-            message = f"Deployment successful. {'; '.join(messages)}"
-            return jsonify({'success': True, 'message': message, 'output': result.stdout}), 200
+            print(f"Deployment successful. {'; '.join(messages)}")
         else:
             print(f"Git reset failed: {result.stderr}")
-            return jsonify({'success': False, 'error': result.stderr}), 500
+    except Exception as e:
+        import traceback
+        print(f"Deployment error: {e}")
+        print(traceback.format_exc())
+
+@app.route('/webhook/deploy', methods=['POST'])
+def webhook_deploy():
+    """Webhook endpoint for automatic deployment from GitHub"""
+    try:
+        import hmac
+        import hashlib
+        
+        # Verify the GitHub signature when a webhook secret is configured
+        # (get_data(cache=True) keeps the body readable for the rest of the request)
+        webhook_secret = os.environ.get('WEBHOOK_SECRET', '')
+        if webhook_secret:
+            signature = request.headers.get('X-Hub-Signature-256', '')
+            if not signature.startswith('sha256='):
+                return 'Invalid signature', 401
             
+            expected_signature = 'sha256=' + hmac.new(
+                webhook_secret.encode(),
+                request.get_data(cache=True),
+                hashlib.sha256
+            ).hexdigest()
+            
+            if not hmac.compare_digest(signature, expected_signature):
+                return 'Signature mismatch', 401
+        
+        # Get current working directory (detect if on PythonAnywhere or local)
+        current_dir = os.getcwd()
+        
+        # For local development
+        if 'pythonanywhere' not in current_dir.lower():
+            project_dir = current_dir
+        else:
+            # For PythonAnywhere
+            project_dir = os.path.expanduser('~/inv_track')
+        
+        # Run the deployment in the background so the webhook answers GitHub right away
+        _deploy_executor.submit(_do_deploy, project_dir)
+        return jsonify({'accepted': True, 'message': 'Deployment started'}), 202
     except Exception as e:
         import traceback
         print(f"Webhook deployment error: {e}")
@@ -5523,55 +5793,54 @@ def webhook_deploy():
 
 @app.route('/api/recalculate-cost-basis', methods=['POST'])
 def recalculate_cost_basis():
-    """Recalculate cost basis entries for all existing trades"""
+    """
+    Recalculate cost basis entries for all existing trades.
+    Entries (including ASSIGNED entries for assigned options trades) are written with one
+    executemany, then their running totals are filled in by one window-function UPDATE,
+    all in one transaction.
+    """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all trades - ORDER BY date_trade_open to process in chronological order
-        cursor.execute('''
-            SELECT * FROM trades ORDER BY date_trade_open ASC
-        ''')
-        trades = cursor.fetchall()
-        
-        # Delete all existing cost basis entries
-        cursor.execute('DELETE FROM cost_basis')
-        
-        # Recreate cost basis entries for each trade
-        for trade in trades:
-            trade_dict = dict(trade)
-            trade_id = trade_dict['id']
-            trade_type = trade_dict['trade_type']
-            date_trade_open = trade_dict['date_trade_open']
-            num_of_contracts = trade_dict['num_of_contracts']
-            premium = trade_dict['premium']
-            account_id = trade_dict['account_id']
-            ticker_id = trade_dict['ticker_id']
-            
-            if trade_type in ['BTO', 'STC']:
-                # For BTO/STC, we need to get the purchase price
-                total_amount = premium * num_of_contracts
-                create_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, 
-                                       trade_type, num_of_contracts, premium, total_amount)
-            else:
-                # For options trades
-                strike_price = trade_dict['strike_price']
-                expiration_date = trade_dict['expiration_date']
-                create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, 
-                                               trade_type, num_of_contracts, premium, strike_price, expiration_date)
-        
-        # Create assigned cost basis entries for trades with status='assigned'
-        cursor.execute('SELECT * FROM trades WHERE status = "assigned"')
-        assigned_trades = cursor.fetchall()
-        
-        for trade in assigned_trades:
-            trade_dict = dict(trade)
-            # Only create if it's an options trade (not BTO/STC)
-            if trade_dict['trade_type'] not in ['BTO', 'STC']:
-                create_assigned_cost_basis_entry(cursor, trade_dict)
-        
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            conn.execute('BEGIN IMMEDIATE')
+            
+            # Get all trades - ORDER BY date_trade_open to process in chronological order
+            cursor.execute('''
+                SELECT t.id, t.account_id, t.ticker_id, tk.ticker, t.trade_type, t.trade_status, t.date_trade_open,
+                       t.expiration_date, t.num_of_contracts, t.credit_debit, t.strike_price
+                FROM trades t
+                JOIN tickers tk ON tk.id = t.ticker_id
+                ORDER BY t.date_trade_open ASC
+            ''')
+            trades = cursor.fetchall()
+            
+            # Delete all existing cost basis entries
+            cursor.execute('DELETE FROM cost_basis')
+            
+            # Cost basis entry values for each trade, in insertion order:
+            # (account_id, ticker_id, trade_id, transaction_date, description, shares, cost_per_share, total_amount)
+            entries = []
+            for trade in trades:
+                if trade['trade_type'] in ['BTO', 'STC']:
+                    # For BTO/STC, credit_debit is the price per share
+                    values = stock_cost_basis_values(trade['ticker'], trade['trade_type'], trade['num_of_contracts'],
+                                                     trade['credit_debit'], trade['credit_debit'] * trade['num_of_contracts'])
+                else:
+                    # For options trades
+                    values = options_cost_basis_values(trade['ticker'], trade['trade_type'], trade['num_of_contracts'],
+                                                       trade['credit_debit'], trade['strike_price'], trade['expiration_date'])
+                entries.append((trade['account_id'], trade['ticker_id'], trade['id'], trade['date_trade_open']) + values)
+            
+            # Assigned cost basis entries for options trades (not BTO/STC) with status='assigned'
+            for trade in sorted(trades, key=lambda trade: trade['id']):
+                if trade['trade_status'] == 'assigned' and trade['trade_type'] not in ['BTO', 'STC']:
+                    entries.append((trade['account_id'], trade['ticker_id'], trade['id'])
+                                   + assigned_cost_basis_values(trade['ticker'], dict(trade)))
+            
+            # Insert with zero running totals, then compute them for every (account, ticker) at once
+            cursor.executemany(_SQL_INSERT_COST_BASIS, [entry[:3] + (None,) + entry[3:] + (0, 0, 0) for entry in entries])
+            cursor.execute(_SQL_RECALCULATE_ALL_RUNNING_TOTALS)
+            conn.commit()
         
         return jsonify({'success': True, 'message': f'Recalculated cost basis for {len(trades)} trades'})
     except Exception as e:
@@ -6004,474 +6273,469 @@ def import_excel():
             print(f"Dataframe before dropna: {len(df)} rows", flush=True)
             df = df.dropna(subset=["date_trade_open", "ticker"], how="any")
             print(f"Dataframe after dropna: {len(df)} rows", flush=True)
-
-            # Import all trades
-            df_to_insert = df
-            print(f"df_to_insert has {len(df_to_insert)} rows to import", flush=True)
-
-            # Insert into database
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Reset trades and cost_basis tables for the selected account only before importing
-            # This prevents deleting data from other accounts
-            # IMPORTANT: We preserve cost_basis entries that were created from cost basis import
-            # by NOT deleting cost_basis entries when importing trades - we only delete trades
-            # This way, cost_basis entries from cost basis import remain even if their trades are deleted
-            
-            # Delete all trades for this account
-            # NOTE: We intentionally do NOT delete cost_basis entries here
-            # This preserves cost_basis entries that were created from cost basis import
-            # even though their associated trades will be deleted
-            cursor.execute('DELETE FROM trades WHERE account_id = ?', (account_id,))
-            
-            conn.commit()
-            print(f"Reset trades table for account {account_id} before import (preserving cost_basis entries)", flush=True)
-            
-            # Check for duplicates against existing trades from the selected account only
-            try:
-                existing = pd.read_sql("SELECT * FROM trades WHERE account_id = ?", conn, params=(account_id,))
-                # Get ticker names for comparison
-                existing_tickers = pd.read_sql("SELECT * FROM tickers", conn)
-                if not existing_tickers.empty:
-                    existing = existing.merge(existing_tickers[['id', 'ticker']], left_on='ticker_id', right_on='id', suffixes=('', '_ticker'))
-                    existing['ticker'] = existing['ticker']
-            except Exception:
-                existing = pd.DataFrame()
-            
-            # Only import trades that don't already exist
-            # Compare based on key fields
-            if not existing.empty and not df_to_insert.empty:
-                # Convert dates for comparison
-                df_to_insert['date_trade_open_str'] = df_to_insert['date_trade_open'].dt.strftime('%Y-%m-%d')
-                df_to_insert['expiration_date_str'] = df_to_insert['expiration_date'].dt.strftime('%Y-%m-%d')
-                
-                # Create comparison columns
-                df_to_insert['key'] = (df_to_insert['ticker'] + '|' + 
-                                     df_to_insert['date_trade_open_str'] + '|' + 
-                                     df_to_insert['expiration_date_str'] + '|' + 
-                                     df_to_insert['trade_type'].astype(str) + '|' + 
-                                     df_to_insert['num_of_contracts'].astype(str) + '|' + 
-                                     df_to_insert['credit_debit'].astype(str))
-                
-                if 'ticker' in existing.columns:
-                    existing['key'] = (existing['ticker'].astype(str) + '|' + 
-                                     existing['date_trade_open'].astype(str) + '|' + 
-                                     existing['expiration_date'].astype(str) + '|' + 
-                                     existing['trade_type'].astype(str) + '|' + 
-                                     existing['num_of_contracts'].astype(str) + '|' + 
-                                     existing['credit_debit'].astype(str))
-                    
-                    # Filter out duplicates
-                    df_to_insert = df_to_insert[~df_to_insert['key'].isin(existing['key'])]
-                
-                # Drop helper columns
-                df_to_insert = df_to_insert.drop(columns=['key', 'date_trade_open_str', 'expiration_date_str'], errors='ignore')
-            
-            # Store count before insertion loop
-            final_count_before_insert = len(df_to_insert)
-            print(f"About to process {final_count_before_insert} trades for import", flush=True)
-            imported_count = 0
-            errors = []
-            
-            # Track the previous trade's ID for roll trades
-            previous_trade_id = None
-            
-            for idx, row in df_to_insert.iterrows():
-                # Check if this trade comes after a blank column - if so, reset previous_trade_id
-                after_blank = row.get('after_blank', False)
-                if after_blank:
-                    previous_trade_id = None
-                    print(f"Row {idx}: Blank column detected, resetting previous_trade_id", flush=True)
-                
-                try:
-                    # Get ticker safely
-                    ticker = str(row.get('ticker', '')).strip()
-                    if not ticker:
-                        errors.append(f"Row {idx}: Missing ticker")
-                        continue
-                        
-                    date_trade_open = row['date_trade_open'].strftime('%Y-%m-%d')
-                    expiration_date = row['expiration_date'].strftime('%Y-%m-%d')
-                    trade_type = str(row['trade_type']).strip()
-                    
-                    # Debug: Print trade_type being imported
-                    print(f"Importing trade with trade_type: '{trade_type}' (ticker: {ticker})", flush=True)
-                    
-                    # Validate trade_type against trade_types table
-                    cursor.execute("SELECT type_name FROM trade_types WHERE type_name = ?", (trade_type,))
-                    valid_type = cursor.fetchone()
-                    if not valid_type:
-                        # Check if there's a similar valid type (e.g., underscores vs spaces)
-                        cursor.execute("SELECT type_name FROM trade_types")
-                        valid_types = [row['type_name'] for row in cursor.fetchall()]
-                        error_msg = f"Row {idx} ({ticker}): Invalid trade_type '{trade_type}'. Valid types are: {', '.join(valid_types)}"
-                        errors.append(error_msg)
-                        print(f"Import Error: {error_msg}", flush=True)
-                        continue
-                    
-                    num_of_contracts = int(row['num_of_contracts']) if pd.notna(row['num_of_contracts']) else 0
-                    credit_debit = float(row['credit_debit']) if pd.notna(row['credit_debit']) else 0
-                    strike_price = round_standard(float(row['strike_price']) if pd.notna(row['strike_price']) else 0, 2)
-                    current_price = float(row['current_price']) if pd.notna(row['current_price']) else 0
-                    
-                    # Read trade_status from dataframe (sourced from row 65 in Excel)
-                    # Normalize for case-insensitive and numeric matching
-                    if 'trade_status' in row and pd.notna(row['trade_status']) and str(row['trade_status']).strip():
-                        raw_status = row['trade_status']
-                        status_val = str(raw_status).strip()
-                        # Normalize numeric values (Excel may store 79.0 or 79)
-                        try:
-                            status_val = str(int(float(status_val)))
-                        except (ValueError, TypeError):
-                            status_val = status_val.lower()
-                        
-                        # Debug: print the raw status value
-                        print(f"Importing trade_status: raw='{raw_status}', normalized='{status_val}' (ticker: {ticker})", flush=True)
-                        
-                        # Normalize common variations to standard values
-                        # Excel dropdown order: open, expired, closed, roll, assigned
-                        status_normalize = {
-                            # Text values (handle all case variations)
-                            'open': 'open',
-                            'closed': 'closed',
-                            'assigned': 'assigned',
-                            'expired': 'expired',
-                            'roll': 'roll',
-                            'rolling': 'roll',
-                            # Uppercase variants
-                            'OPEN': 'open',
-                            'CLOSED': 'closed',
-                            'ASSIGNED': 'assigned',
-                            'EXPIRED': 'expired',
-                            'ROLL': 'roll',
-                            # Excel dropdown numeric indices (0-indexed)
-                            '0': 'open',      # First option
-                            '1': 'expired',   # Second option
-                            '2': 'closed',    # Third option
-                            '3': 'roll',      # Fourth option
-                            '4': 'assigned',  # Fifth option
-                            # Excel status codes (mapped based on actual data)
-                            '43': 'open',      # Less common, mapped to open
-                            '79': 'expired',   # Most common - expired trades
-                            '90': 'closed',    # Closed trades
-                            '108': 'assigned', # Assigned trades (first 2 in your file)
-                            '109': 'roll',     # Roll trades (next 6 in your file)
-                        }
-                        trade_status = status_normalize.get(status_val, 'open')
-                        print(f"  Mapped to: '{trade_status}'", flush=True)
-                    else:
-                        # No status provided - use open as default
-                        print(f"  No trade_status in row for {ticker}, using 'open'", flush=True)
-                        trade_status = 'open'
-                    
-                    # Get or create ticker (case-insensitive)
-                    cursor.execute("SELECT id FROM tickers WHERE UPPER(ticker) = UPPER(?)", (ticker,))
-                    ticker_row = cursor.fetchone()
-                    if ticker_row:
-                        ticker_id = ticker_row['id']
-                    else:
-                        # Insert ticker with company_name (use ticker as default, store as uppercase)
-                        cursor.execute("INSERT INTO tickers (ticker, company_name) VALUES (?, ?)", (ticker.upper(), ticker.upper()))
-                        ticker_id = cursor.lastrowid
-                    
-                    # Calculate days to expiration
-                    date_trade_open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d').date()
-                    expiration = datetime.strptime(expiration_date, '%Y-%m-%d').date()
-                    days_to_expiration = (expiration - date_trade_open_obj).days
-                    
-                    # Calculate total_premium
-                    total_premium = credit_debit * num_of_contracts
-                    
-                    # Get commission rate in effect at trade date using the same logic as get_commission_rate
-                    # This ensures consistency: finds the commission with the latest effective_date <= trade_date
-                    # Example: If commissions are effective on 1/10/2020 and 11/15/2025:
-                    #   - Trades on or between 1/10/2020 and before 11/15/2025 use the 1/10/2020 commission
-                    #   - Trades on or after 11/15/2025 use the 11/15/2025 commission
-                    db = get_db_helper()
-                    commission = db.get_commission_rate(account_id, date_trade_open)
-                    print(f'[DEBUG] Import - Commission calculated for account_id={account_id}, date_trade_open={date_trade_open}: {commission}', flush=True)
-                    
-                    # Calculate net_credit_per_share = credit_debit - commission_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
-                    net_credit_per_share = round_standard((credit_debit - commission), 5)
-                    
-                    # Calculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
-                    risk_capital_per_share = None
-                    if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                        risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
-                    
-                    # Calculate margin_capital for options trades
-                    # Use unrounded risk_capital_per_share for margin_capital calculation
-                    margin_capital = None
-                    if trade_type not in ['BTO', 'STC'] and strike_price > 0:
-                        # For ROCT PUT and RULE ONE PUT trades, use unrounded risk_capital_per_share
-                        if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                            # Use unrounded risk_capital_per_share for margin_capital calculation
-                            risk_capital_unrounded = strike_price - net_credit_per_share
-                            margin_capital = num_of_contracts * 100 * risk_capital_unrounded
-                        else:
-                            # For other options trades, use the standard calculation
-                            margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
-                    
-                    # Set default margin_percent to 100%
-                    margin_percent = 100.0
-                    
-                    # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
-                    # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * (margin_percent / 100)))
-                    # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
-                    # Use unrounded risk_capital_per_share for ARORC calculation
-                    arorc = None
-                    if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
-                        # Calculate unrounded risk_capital_per_share for ARORC calculation
-                        risk_capital_unrounded = strike_price - net_credit_per_share
-                        if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
-                            # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
-                            denominator = risk_capital_unrounded * (margin_percent / 100.0)
-                            if denominator > 0:
-                                # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
-                                arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
-                                arorc = round_standard(arorc_decimal * 100.0, 1)
-                    
-                    # Get trade_type_id from trade_types table
-                    # First try the full trade_type as-is
-                    cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (trade_type,))
-                    trade_type_row = cursor.fetchone()
-                    trade_type_id = trade_type_row['id'] if trade_type_row else None
-                    
-                    # Initialize base_trade_type for later use
-                    base_trade_type = trade_type
+
+            # Import all trades
+            df_to_insert = df
+            print(f"df_to_insert has {len(df_to_insert)} rows to import", flush=True)
+
+            # Insert into database
+            with get_db() as conn:
+                cursor = conn.cursor()
+                
+                # Reset trades and cost_basis tables for the selected account only before importing
+                # This prevents deleting data from other accounts
+                # IMPORTANT: We preserve cost_basis entries that were created from cost basis import
+                # by NOT deleting cost_basis entries when importing trades - we only delete trades
+                # This way, cost_basis entries from cost basis import remain even if their trades are deleted
+                
+                # Delete all trades for this account
+                # NOTE: We intentionally do NOT delete cost_basis entries here
+                # This preserves cost_basis entries that were created from cost basis import
+                # even though their associated trades will be deleted
+                cursor.execute('DELETE FROM trades WHERE account_id = ?', (account_id,))
+                
+                conn.commit()
+                print(f"Reset trades table for account {account_id} before import (preserving cost_basis entries)", flush=True)
+                
+                # Check for duplicates against existing trades from the selected account only
+                try:
+                    existing = pd.read_sql("SELECT * FROM trades WHERE account_id = ?", conn, params=(account_id,))
+                    # Get ticker names for comparison
+                    existing_tickers = pd.read_sql("SELECT * FROM tickers", conn)
+                    if not existing_tickers.empty:
+                        existing = existing.merge(existing_tickers[['id', 'ticker']], left_on='ticker_id', right_on='id', suffixes=('', '_ticker'))
+                        existing['ticker'] = existing['ticker']
+                except Exception:
+                    existing = pd.DataFrame()
+                
+                # Only import trades that don't already exist
+                # Compare based on key fields
+                if not existing.empty and not df_to_insert.empty:
+                    # Convert dates for comparison
+                    df_to_insert['date_trade_open_str'] = df_to_insert['date_trade_open'].dt.strftime('%Y-%m-%d')
+                    df_to_insert['expiration_date_str'] = df_to_insert['expiration_date'].dt.strftime('%Y-%m-%d')
                     
-                    # If not found, try extracting base trade type (remove ticker prefix if present)
-                    if trade_type_id is None and ' ' in trade_type:
-                        # Check if it starts with a ticker (4-5 uppercase letters followed by space)
-                        parts = trade_type.split(' ', 1)
-                        if len(parts) == 2 and len(parts[0]) <= 5 and parts[0].isupper():
-                            base_trade_type = parts[1]  # Use the part after the ticker
-                            cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (base_trade_type,))
-                            trade_type_row = cursor.fetchone()
-                            trade_type_id = trade_type_row['id'] if trade_type_row else None
+                    # Create comparison columns
+                    df_to_insert['key'] = (df_to_insert['ticker'] + '|' + 
+                                         df_to_insert['date_trade_open_str'] + '|' + 
+                                         df_to_insert['expiration_date_str'] + '|' + 
+                                         df_to_insert['trade_type'].astype(str) + '|' + 
+                                         df_to_insert['num_of_contracts'].astype(str) + '|' + 
+                                         df_to_insert['credit_debit'].astype(str))
                     
-                    if trade_type_id is None:
-                        print(f"WARNING: trade_type_id not found for trade_type '{trade_type}'", flush=True)
+                    if 'ticker' in existing.columns:
+                        existing['key'] = (existing['ticker'].astype(str) + '|' + 
+                                         existing['date_trade_open'].astype(str) + '|' + 
+                                         existing['expiration_date'].astype(str) + '|' + 
+                                         existing['trade_type'].astype(str) + '|' + 
+                                         existing['num_of_contracts'].astype(str) + '|' + 
+                                         existing['credit_debit'].astype(str))
+                        
+                        # Filter out duplicates
+                        df_to_insert = df_to_insert[~df_to_insert['key'].isin(existing['key'])]
                     
-                    # Check if this trade comes after a blank column
+                    # Drop helper columns
+                    df_to_insert = df_to_insert.drop(columns=['key', 'date_trade_open_str', 'expiration_date_str'], errors='ignore')
+                
+                # Store count before insertion loop
+                final_count_before_insert = len(df_to_insert)
+                print(f"About to process {final_count_before_insert} trades for import", flush=True)
+                imported_count = 0
+                errors = []
+                
+                # Track the previous trade's ID for roll trades
+                previous_trade_id = None
+                
+                for idx, row in df_to_insert.iterrows():
+                    # Check if this trade comes after a blank column - if so, reset previous_trade_id
                     after_blank = row.get('after_blank', False)
-                    
-                    # Import logic:
-                    # 1. Blank column = separator, starts a new trade sequence (not linked)
-                    # 2. If a trade has status "roll" and comes after a blank column, the next trade (if not blank) should be its child
-                    # 3. If a trade is adjacent to a previous trade (not after blank), it should be part of the chain (child of previous)
-                    # 4. Chain continues until a blank column is encountered
-                    
                     if after_blank:
-                        # Trade comes after blank column - it's a new trade sequence
-                        # IMPORTANT: If there's a blank column before a trade, it should NOT have a trade_parent_id,
-                        # regardless of its status (even if it's "roll")
-                        # The blank column is a separator - it starts a new trade sequence
-                        trade_parent_id = None
-                        print(f"Row {idx}: Trade comes after blank column, treating as new trade sequence (NO PARENT) (ticker: {ticker}, date: {date_trade_open}, status: {trade_status})", flush=True)
-                    else:
-                        # This trade is adjacent to a previous trade (not after blank)
-                        # It should be part of the chain (child of previous)
-                        if previous_trade_id is None:
-                            print(f"WARNING: Trade is adjacent to previous but previous_trade_id is None for ticker {ticker}", flush=True)
-                            trade_parent_id = None
-                        else:
-                            trade_parent_id = previous_trade_id
-                            print(f"Row {idx}: Trade is adjacent to previous (part of chain), setting trade_parent_id={previous_trade_id} (ticker: {ticker}, date: {date_trade_open})", flush=True)
+                        previous_trade_id = None
+                        print(f"Row {idx}: Blank column detected, resetting previous_trade_id", flush=True)
                     
-                    # Create trade_dict for use in cost basis creation (before insertion)
-                    trade_dict = {
-                        'id': None,  # Will be set after insertion
-                        'account_id': account_id,
-                        'ticker_id': ticker_id,
-                        'date_trade_open': date_trade_open,
-                        'expiration_date': expiration_date,
-                        'trade_type': trade_type,
-                        'num_of_contracts': num_of_contracts,
-                        'strike_price': strike_price
-                    }
-                    
-                    # Insert trade using flexible schema-aware approach
-                    # Get actual columns from the trades table (excluding auto-generated ones)
-                    cursor.execute("PRAGMA table_info(trades)")
-                    table_columns = [col[1] for col in cursor.fetchall()]
-                    # Exclude columns that are auto-generated or shouldn't be inserted
-                    exclude_columns = {'id', 'created_at'}
-                    insert_columns = [col for col in table_columns if col not in exclude_columns]
-                    
-                    # Build the INSERT statement dynamically
-                    columns_str = ', '.join(insert_columns)
-                    placeholders_str = ', '.join(['?' for _ in insert_columns])
-                    
-                    # Prepare values in the same order as columns
-                    # Map of column names to values
-                    values_map = {
-                        'account_id': account_id,
-                        'ticker_id': ticker_id,
-                        'ticker': ticker,  # Store ticker symbol
-                        'date_trade_open': date_trade_open,
-                        'expiration_date': expiration_date,
-                        'num_of_contracts': num_of_contracts,
-                        'num_of_shares': None,  # Will be set if column exists
-                        'credit_debit': credit_debit,
-                        'total_premium': total_premium,
-                        'days_to_expiration': days_to_expiration,
-                        'current_price': current_price,
-                        'strike_price': strike_price,
-                        'trade_status': trade_status,
-                        'trade_type': trade_type,
-                        'price_per_share': current_price,
-                        'total_amount': total_premium,
-                        'commission_per_share': commission,
-                        'net_credit_per_share': net_credit_per_share,
-                        'risk_capital_per_share': risk_capital_per_share,
-                        'margin_capital': margin_capital,
-                        'margin_percent': margin_percent,
-                        'ARORC': arorc,
-                        'trade_type_id': trade_type_id,
-                        'trade_parent_id': trade_parent_id
-                    }
-                    
-                    # Build values list in the same order as columns
-                    values = [values_map.get(col, None) for col in insert_columns]
-                    
-                    # Execute the dynamic INSERT
-                    cursor.execute(f'''
-                        INSERT INTO trades ({columns_str})
-                        VALUES ({placeholders_str})
-                    ''', values)
-                    
-                    trade_id = cursor.lastrowid
-                    
-                    # Update trade_dict with the new trade_id
-                    trade_dict['id'] = trade_id
-                    
-                    # Update previous_trade_id for next iteration
-                    # Always update to the current trade_id so that consecutive roll trades chain correctly
-                    # For example: Trade A (roll) -> Trade B (roll, parent=A) -> Trade C (roll, parent=B)
-                    previous_trade_id = trade_id
-                    
-                    # Create cost basis entry based on trade status
-                    if trade_status == 'assigned':
-                        # For assigned trades, create assigned cost basis entry and cash flow
-                        # First create the assigned cost basis entry
-                        # create_assigned_cost_basis_entry accepts dict or Row, so pass trade_dict directly
-                        create_assigned_cost_basis_entry(cursor, trade_dict)
+                    try:
+                        # Get ticker safely
+                        ticker = str(row.get('ticker', '')).strip()
+                        if not ticker:
+                            errors.append(f"Row {idx}: Missing ticker")
+                            continue
+                            
+                        date_trade_open = row['date_trade_open'].strftime('%Y-%m-%d')
+                        expiration_date = row['expiration_date'].strftime('%Y-%m-%d')
+                        trade_type = str(row['trade_type']).strip()
                         
-                        # Then create cash flow entry for the assignment
-                        shares = num_of_contracts * 100
-                        if 'PUT' in trade_type or 'ROP' in trade_type:
-                            # PUT assignment: negative amount (buying shares)
-                            total_amount = -(strike_price * shares)
-                            description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
+                        # Debug: Print trade_type being imported
+                        print(f"Importing trade with trade_type: '{trade_type}' (ticker: {ticker})", flush=True)
+                        
+                        # Validate trade_type against trade_types table
+                        cursor.execute("SELECT type_name FROM trade_types WHERE type_name = ?", (trade_type,))
+                        valid_type = cursor.fetchone()
+                        if not valid_type:
+                            # Check if there's a similar valid type (e.g., underscores vs spaces)
+                            cursor.execute("SELECT type_name FROM trade_types")
+                            valid_types = [row['type_name'] for row in cursor.fetchall()]
+                            error_msg = f"Row {idx} ({ticker}): Invalid trade_type '{trade_type}'. Valid types are: {', '.join(valid_types)}"
+                            errors.append(error_msg)
+                            print(f"Import Error: {error_msg}", flush=True)
+                            continue
+                        
+                        num_of_contracts = int(row['num_of_contracts']) if pd.notna(row['num_of_contracts']) else 0
+                        credit_debit = float(row['credit_debit']) if pd.notna(row['credit_debit']) else 0
+                        strike_price = round_standard(float(row['strike_price']) if pd.notna(row['strike_price']) else 0, 2)
+                        current_price = float(row['current_price']) if pd.notna(row['current_price']) else 0
+                        
+                        # Read trade_status from dataframe (sourced from row 65 in Excel)
+                        # Normalize for case-insensitive and numeric matching
+                        if 'trade_status' in row and pd.notna(row['trade_status']) and str(row['trade_status']).strip():
+                            raw_status = row['trade_status']
+                            status_val = str(raw_status).strip()
+                            # Normalize numeric values (Excel may store 79.0 or 79)
+                            try:
+                                status_val = str(int(float(status_val)))
+                            except (ValueError, TypeError):
+                                status_val = status_val.lower()
+                            
+                            # Debug: print the raw status value
+                            print(f"Importing trade_status: raw='{raw_status}', normalized='{status_val}' (ticker: {ticker})", flush=True)
+                            
+                            # Normalize common variations to standard values
+                            # Excel dropdown order: open, expired, closed, roll, assigned
+                            status_normalize = {
+                                # Text values (handle all case variations)
+                                'open': 'open',
+                                'closed': 'closed',
+                                'assigned': 'assigned',
+                                'expired': 'expired',
+                                'roll': 'roll',
+                                'rolling': 'roll',
+                                # Uppercase variants
+                                'OPEN': 'open',
+                                'CLOSED': 'closed',
+                                'ASSIGNED': 'assigned',
+                                'EXPIRED': 'expired',
+                                'ROLL': 'roll',
+                                # Excel dropdown numeric indices (0-indexed)
+                                '0': 'open',      # First option
+                                '1': 'expired',   # Second option
+                                '2': 'closed',    # Third option
+                                '3': 'roll',      # Fourth option
+                                '4': 'assigned',  # Fifth option
+                                # Excel status codes (mapped based on actual data)
+                                '43': 'open',      # Less common, mapped to open
+                                '79': 'expired',   # Most common - expired trades
+                                '90': 'closed',    # Closed trades
+                                '108': 'assigned', # Assigned trades (first 2 in your file)
+                                '109': 'roll',     # Roll trades (next 6 in your file)
+                            }
+                            trade_status = status_normalize.get(status_val, 'open')
+                            print(f"  Mapped to: '{trade_status}'", flush=True)
                         else:
-                            # CALL assignment: positive amount (selling shares)
-                            total_amount = strike_price * shares
-                            description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
+                            # No status provided - use open as default
+                            print(f"  No trade_status in row for {ticker}, using 'open'", flush=True)
+                            trade_status = 'open'
                         
-                        # Use expiration_date + 2 days as transaction_date for assigned trades
-                        try:
-                            exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
-                            assignment_transaction_date = (exp_date_obj + timedelta(days=2)).strftime('%Y-%m-%d')
-                        except:
-                            assignment_transaction_date = expiration_date  # Fallback to expiration_date if parsing fails
+                        # Get or create ticker (case-insensitive)
+                        cursor.execute("SELECT id, ticker FROM tickers WHERE UPPER(ticker) = UPPER(?)", (ticker,))
+                        ticker_row = cursor.fetchone()
+                        if ticker_row:
+                            ticker_id, ticker_symbol = ticker_row['id'], ticker_row['ticker']
+                        else:
+                            # Insert ticker with company_name (use ticker as default, store as uppercase)
+                            cursor.execute("INSERT INTO tickers (ticker, company_name) VALUES (?, ?)", (ticker.upper(), ticker.upper()))
+                            ticker_id, ticker_symbol = cursor.lastrowid, ticker.upper()
                         
-                        cursor.execute('''
-                            INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (account_id, assignment_transaction_date, 'ASSIGNMENT', round(total_amount, 2), 
-                              description, trade_id, ticker_id))
-                        cash_flow_id = cursor.lastrowid
+                        # Calculate days to expiration
+                        days_to_expiration = days_between(date_trade_open, expiration_date)
                         
-                        # Link the cost_basis entry to this cash flow
-                        assigned_date_trade_open = expiration_date
-                        cursor.execute('''
-                            UPDATE cost_basis SET cash_flow_id = ? 
-                            WHERE trade_id = ? AND account_id = ? AND ticker_id = ? AND transaction_date = ?
-                            AND description LIKE 'ASSIGNED%' AND cash_flow_id IS NULL
-                        ''', (cash_flow_id, trade_id, account_id, ticker_id, assigned_date_trade_open))
-                    elif is_roll and trade_parent_id:
-                        # For roll trades, create roll diagonal cost basis entry
-                        # Get the parent trade details
-                        cursor.execute('''
-                            SELECT expiration_date, strike_price, trade_type, num_of_contracts
-                            FROM trades
-                            WHERE id = ?
-                        ''', (trade_parent_id,))
-                        parent_trade = cursor.fetchone()
+                        # Calculate total_premium
+                        total_premium = credit_debit * num_of_contracts
                         
-                        if parent_trade:
-                            original_exp_date = parent_trade['expiration_date']
-                            original_strike = parent_trade['strike_price']
-                            original_trade_type = parent_trade['trade_type']
-                            
-                            # Only create if we have valid values
-                            if strike_price > 0 and credit_debit != 0:
-                                create_roll_diagonal_cost_basis_entry(
-                                    cursor, trade_id, trade_parent_id, account_id, ticker_id,
-                                    date_trade_open, ticker, expiration_date, original_exp_date,
-                                    strike_price, original_strike, credit_debit, original_trade_type, num_of_contracts
-                                )
-                    else:
-                        # For regular trades, create standard options cost basis entry
-                        create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, 
-                                                        num_of_contracts, credit_debit, strike_price, expiration_date)
-                    
-                    # Create cash flow entry for EVERY trade (if not already created for assigned trades)
-                    if trade_status != 'assigned':
-                        # Check if this trade type requires contracts
-                        cursor.execute('SELECT requires_contracts FROM trade_types WHERE type_name = ?', (base_trade_type,))
-                        trade_type_row = cursor.fetchone()
-                        requires_contracts = trade_type_row['requires_contracts'] if trade_type_row else 0
+                        # Get commission rate in effect at trade date using the same logic as get_commission_rate
+                        # This ensures consistency: finds the commission with the latest effective_date <= trade_date
+                        # Example: If commissions are effective on 1/10/2020 and 11/15/2025:
+                        #   - Trades on or between 1/10/2020 and before 11/15/2025 use the 1/10/2020 commission
+                        #   - Trades on or after 11/15/2025 use the 11/15/2025 commission
+                        db = get_db_helper()
+                        commission = db.get_commission_rate(account_id, date_trade_open)
+                        print(f'[DEBUG] Import - Commission calculated for account_id={account_id}, date_trade_open={date_trade_open}: {commission}', flush=True)
                         
-                        cash_flow_id = None
-                        if requires_contracts == 1:
-                            # Options trade: determine if PUT or CALL
-                            if 'PUT' in trade_type or 'ROP' in trade_type:
-                                transaction_type = 'SELL PUT'
-                            elif 'CALL' in trade_type or 'ROC' in trade_type:
-                                transaction_type = 'SELL CALL'
+                        # Calculate net_credit_per_share = credit_debit - commission_per_share (rounded to 5 decimal places for storage, displayed as 2 decimals)
+                        net_credit_per_share = round_standard((credit_debit - commission), 5)
+                        
+                        # Calculate risk_capital_per_share for ROCT PUT and RULE ONE PUT trades (rounded to nearest hundredth, always rounding 0.5 up)
+                        risk_capital_per_share = None
+                        if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                            risk_capital_per_share = round_standard((strike_price - net_credit_per_share), 2)
+                        
+                        # Calculate margin_capital for options trades
+                        # Use unrounded risk_capital_per_share for margin_capital calculation
+                        margin_capital = None
+                        if trade_type not in ['BTO', 'STC'] and strike_price > 0:
+                            # For ROCT PUT and RULE ONE PUT trades, use unrounded risk_capital_per_share
+                            if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                                # Use unrounded risk_capital_per_share for margin_capital calculation
+                                risk_capital_unrounded = strike_price - net_credit_per_share
+                                margin_capital = num_of_contracts * 100 * risk_capital_unrounded
                             else:
-                                # Default to PREMIUM_CREDIT if can't determine
-                                transaction_type = 'PREMIUM_CREDIT'
-                            cursor.execute('''
-                                INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (account_id, date_trade_open, transaction_type, round(credit_debit * num_of_contracts * 100, 2), 
-                                  f"{trade_type} premium received", trade_id, ticker_id))
-                            cash_flow_id = cursor.lastrowid
+                                # For other options trades, use the standard calculation
+                                margin_capital = (strike_price - net_credit_per_share) * num_of_contracts * 100
+                        
+                        # Set default margin_percent to 100%
+                        margin_percent = 100.0
+                        
+                        # Calculate ARORC for ROCT PUT and RULE ONE PUT trades
+                        # ARORC = (365 / days_to_expiration) * (net_credit_per_share / (risk_capital_per_share * (margin_percent / 100)))
+                        # margin_percent is stored as a percentage (100 = 100%), so divide by 100 to get decimal multiplier
+                        # Use unrounded risk_capital_per_share for ARORC calculation
+                        arorc = None
+                        if 'ROCT PUT' in trade_type or 'RULE ONE PUT' in trade_type or ('PUT' in trade_type and ('ROCT' in trade_type or 'RULE ONE' in trade_type)):
+                            # Calculate unrounded risk_capital_per_share for ARORC calculation
+                            risk_capital_unrounded = strike_price - net_credit_per_share
+                            if risk_capital_unrounded > 0 and days_to_expiration > 0 and margin_percent > 0:
+                                # margin_percent is stored as percentage (100 = 100%), convert to decimal (divide by 100)
+                                denominator = risk_capital_unrounded * (margin_percent / 100.0)
+                                if denominator > 0:
+                                    # Calculate ARORC as decimal, then convert to percentage and round to 1 decimal
+                                    arorc_decimal = (365.0 / days_to_expiration) * (net_credit_per_share / denominator)
+                                    arorc = round_standard(arorc_decimal * 100.0, 1)
+                        
+                        # Get trade_type_id from trade_types table
+                        # First try the full trade_type as-is
+                        trade_type_row = get_trade_type(cursor, trade_type)
+                        trade_type_id = trade_type_row['id'] if trade_type_row else None
+                        
+                        # Initialize base_trade_type for later use
+                        base_trade_type = trade_type
+                        
+                        # If not found, try extracting base trade type (remove ticker prefix if present)
+                        if trade_type_id is None and ' ' in trade_type:
+                            # Check if it starts with a ticker (4-5 uppercase letters followed by space)
+                            parts = trade_type.split(' ', 1)
+                            if len(parts) == 2 and len(parts[0]) <= 5 and parts[0].isupper():
+                                base_trade_type = parts[1]  # Use the part after the ticker
+                                trade_type_row = get_trade_type(cursor, base_trade_type)
+                                trade_type_id = trade_type_row['id'] if trade_type_row else None
+                        
+                        if trade_type_id is None:
+                            print(f"WARNING: trade_type_id not found for trade_type '{trade_type}'", flush=True)
+                        
+                        # Check if this trade comes after a blank column
+                        after_blank = row.get('after_blank', False)
+                        
+                        # Import logic:
+                        # 1. Blank column = separator, starts a new trade sequence (not linked)
+                        # 2. If a trade has status "roll" and comes after a blank column, the next trade (if not blank) should be its child
+                        # 3. If a trade is adjacent to a previous trade (not after blank), it should be part of the chain (child of previous)
+                        # 4. Chain continues until a blank column is encountered
+                        
+                        if after_blank:
+                            # Trade comes after blank column - it's a new trade sequence
+                            # IMPORTANT: If there's a blank column before a trade, it should NOT have a trade_parent_id,
+                            # regardless of its status (even if it's "roll")
+                            # The blank column is a separator - it starts a new trade sequence
+                            trade_parent_id = None
+                            print(f"Row {idx}: Trade comes after blank column, treating as new trade sequence (NO PARENT) (ticker: {ticker}, date: {date_trade_open}, status: {trade_status})", flush=True)
                         else:
-                            # For BTO/STC or other trade types that don't require contracts
-                            # These are stock trades, use PREMIUM_CREDIT or PREMIUM_DEBIT
-                            if trade_type == 'BTO':
-                                transaction_type = 'PREMIUM_DEBIT'  # Buying stock
+                            # This trade is adjacent to a previous trade (not after blank)
+                            # It should be part of the chain (child of previous)
+                            if previous_trade_id is None:
+                                print(f"WARNING: Trade is adjacent to previous but previous_trade_id is None for ticker {ticker}", flush=True)
+                                trade_parent_id = None
+                            else:
+                                trade_parent_id = previous_trade_id
+                                print(f"Row {idx}: Trade is adjacent to previous (part of chain), setting trade_parent_id={previous_trade_id} (ticker: {ticker}, date: {date_trade_open})", flush=True)
+                        
+                        # Create trade_dict for use in cost basis creation (before insertion)
+                        trade_dict = {
+                            'id': None,  # Will be set after insertion
+                            'account_id': account_id,
+                            'ticker_id': ticker_id,
+                            'date_trade_open': date_trade_open,
+                            'expiration_date': expiration_date,
+                            'trade_type': trade_type,
+                            'num_of_contracts': num_of_contracts,
+                            'strike_price': strike_price
+                        }
+                        
+                        # Insert trade using flexible schema-aware approach
+                        # Get actual columns from the trades table (excluding auto-generated ones)
+                        cursor.execute("PRAGMA table_info(trades)")
+                        table_columns = [col[1] for col in cursor.fetchall()]
+                        # Exclude columns that are auto-generated or shouldn't be inserted
+                        exclude_columns = {'id', 'created_at'}
+                        insert_columns = [col for col in table_columns if col not in exclude_columns]
+                        
+                        # Build the INSERT statement dynamically
+                        columns_str = ', '.join(insert_columns)
+                        placeholders_str = ', '.join(['?' for _ in insert_columns])
+                        
+                        # Prepare values in the same order as columns
+                        # Map of column names to values
+                        values_map = {
+                            'account_id': account_id,
+                            'ticker_id': ticker_id,
+                            'ticker': ticker,  # Store ticker symbol
+                            'date_trade_open': date_trade_open,
+                            'expiration_date': expiration_date,
+                            'num_of_contracts': num_of_contracts,
+                            'num_of_shares': None,  # Will be set if column exists
+                            'credit_debit': credit_debit,
+                            'total_premium': total_premium,
+                            'days_to_expiration': days_to_expiration,
+                            'current_price': current_price,
+                            'strike_price': strike_price,
+                            'trade_status': trade_status,
+                            'trade_type': trade_type,
+                            'price_per_share': current_price,
+                            'total_amount': total_premium,
+                            'commission_per_share': commission,
+                            'net_credit_per_share': net_credit_per_share,
+                            'risk_capital_per_share': risk_capital_per_share,
+                            'margin_capital': margin_capital,
+                            'margin_percent': margin_percent,
+                            'ARORC': arorc,
+                            'trade_type_id': trade_type_id,
+                            'trade_parent_id': trade_parent_id
+                        }
+                        
+                        # Build values list in the same order as columns
+                        values = [values_map.get(col, None) for col in insert_columns]
+                        
+                        # Execute the dynamic INSERT
+                        cursor.execute(f'''
+                            INSERT INTO trades ({columns_str})
+                            VALUES ({placeholders_str})
+                        ''', values)
+                        
+                        trade_id = cursor.lastrowid
+                        
+                        # Update trade_dict with the new trade_id
+                        trade_dict['id'] = trade_id
+                        
+                        # Update previous_trade_id for next iteration
+                        # Always update to the current trade_id so that consecutive roll trades chain correctly
+                        # For example: Trade A (roll) -> Trade B (roll, parent=A) -> Trade C (roll, parent=B)
+                        previous_trade_id = trade_id
+                        
+                        # Create cost basis entry based on trade status
+                        if trade_status == 'assigned':
+                            # For assigned trades, create assigned cost basis entry and cash flow
+                            # First create the assigned cost basis entry
+                            # create_assigned_cost_basis_entry accepts dict or Row, so pass trade_dict directly
+                            create_assigned_cost_basis_entry(cursor, trade_dict)
+                            
+                            # Then create cash flow entry for the assignment
+                            shares = num_of_contracts * 100
+                            if 'PUT' in trade_type or 'ROP' in trade_type:
+                                # PUT assignment: negative amount (buying shares)
+                                total_amount = -(strike_price * shares)
+                                description = f"ASSIGNMENT: BUY {shares} {ticker} @ ${strike_price} (assigned PUT)"
                             else:
-                                transaction_type = 'PREMIUM_CREDIT'  # Selling stock
+                                # CALL assignment: positive amount (selling shares)
+                                total_amount = strike_price * shares
+                                description = f"ASSIGNMENT: SELL {shares} {ticker} @ ${strike_price} (assigned CALL)"
+                            
+                            # Use expiration_date + 2 days as transaction_date for assigned trades
+                            try:
+                                exp_date_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
+                                assignment_transaction_date = (exp_date_obj + timedelta(days=2)).strftime('%Y-%m-%d')
+                            except:
+                                assignment_transaction_date = expiration_date  # Fallback to expiration_date if parsing fails
+                            
                             cursor.execute('''
                                 INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
                                 VALUES (?, ?, ?, ?, ?, ?, ?)
-                            ''', (account_id, date_trade_open, transaction_type, round(total_premium, 2), 
-                                  f"{trade_type} {num_of_contracts} shares", trade_id, ticker_id))
+                            ''', (account_id, assignment_transaction_date, 'ASSIGNMENT', round(total_amount, 2), 
+                                  description, trade_id, ticker_id))
                             cash_flow_id = cursor.lastrowid
-                        
-                        # Update cost_basis entry to link to cash_flow if cash flow was created
-                        if cash_flow_id:
+                            
+                            # Link the cost_basis entry to this cash flow
+                            assigned_date_trade_open = expiration_date
                             cursor.execute('''
                                 UPDATE cost_basis SET cash_flow_id = ? 
-                                WHERE trade_id = ? AND ticker_id = ? AND transaction_date = ? AND cash_flow_id IS NULL
-                            ''', (cash_flow_id, trade_id, ticker_id, date_trade_open))
-                    
-                    imported_count += 1
-                    
-                except Exception as e:
-                    ticker_name = str(row.get('ticker', 'Unknown')).strip()
-                    error_msg = f"Row {idx} ({ticker_name}): {str(e)}"
-                    errors.append(error_msg)
-                    print(f"Import Error: {error_msg}", flush=True)  # Print to console
-            
-            conn.commit()
-            conn.close()
+                                WHERE trade_id = ? AND account_id = ? AND ticker_id = ? AND transaction_date = ?
+                                AND description LIKE 'ASSIGNED%' AND cash_flow_id IS NULL
+                            ''', (cash_flow_id, trade_id, account_id, ticker_id, assigned_date_trade_open))
+                        elif is_roll and trade_parent_id:
+                            # For roll trades, create roll diagonal cost basis entry
+                            # Get the parent trade details
+                            cursor.execute('''
+                                SELECT expiration_date, strike_price, trade_type, num_of_contracts
+                                FROM trades
+                                WHERE id = ?
+                            ''', (trade_parent_id,))
+                            parent_trade = cursor.fetchone()
+                            
+                            if parent_trade:
+                                original_exp_date = parent_trade['expiration_date']
+                                original_strike = parent_trade['strike_price']
+                                original_trade_type = parent_trade['trade_type']
+                                
+                                # Only create if we have valid values
+                                if strike_price > 0 and credit_debit != 0:
+                                    create_roll_diagonal_cost_basis_entry(
+                                        cursor, trade_id, trade_parent_id, account_id, ticker_id,
+                                        date_trade_open, ticker, expiration_date, original_exp_date,
+                                        strike_price, original_strike, credit_debit, original_trade_type, num_of_contracts
+                                    )
+                        else:
+                            # For regular trades, create standard options cost basis entry
+                            create_options_cost_basis_entry(cursor, account_id, ticker_id, trade_id, date_trade_open, trade_type, 
+                                                            num_of_contracts, credit_debit, strike_price, expiration_date,
+                                                            ticker=ticker_symbol)
+                        
+                        # Create cash flow entry for EVERY trade (if not already created for assigned trades)
+                        if trade_status != 'assigned':
+                            # Check if this trade type requires contracts
+                            trade_type_row = get_trade_type(cursor, base_trade_type)
+                            requires_contracts = trade_type_row['requires_contracts'] if trade_type_row else 0
+                            
+                            cash_flow_id = None
+                            if requires_contracts == 1:
+                                # Options trade: determine if PUT or CALL
+                                if 'PUT' in trade_type or 'ROP' in trade_type:
+                                    transaction_type = 'SELL PUT'
+                                elif 'CALL' in trade_type or 'ROC' in trade_type:
+                                    transaction_type = 'SELL CALL'
+                                else:
+                                    # Default to PREMIUM_CREDIT if can't determine
+                                    transaction_type = 'PREMIUM_CREDIT'
+                                cursor.execute('''
+                                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                                ''', (account_id, date_trade_open, transaction_type, round(credit_debit * num_of_contracts * 100, 2), 
+                                      f"{trade_type} premium received", trade_id, ticker_id))
+                                cash_flow_id = cursor.lastrowid
+                            else:
+                                # For BTO/STC or other trade types that don't require contracts
+                                # These are stock trades, use PREMIUM_CREDIT or PREMIUM_DEBIT
+                                if trade_type == 'BTO':
+                                    transaction_type = 'PREMIUM_DEBIT'  # Buying stock
+                                else:
+                                    transaction_type = 'PREMIUM_CREDIT'  # Selling stock
+                                cursor.execute('''
+                                    INSERT INTO cash_flows (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                                ''', (account_id, date_trade_open, transaction_type, round(total_premium, 2), 
+                                      f"{trade_type} {num_of_contracts} shares", trade_id, ticker_id))
+                                cash_flow_id = cursor.lastrowid
+                            
+                            # Update cost_basis entry to link to cash_flow if cash flow was created
+                            if cash_flow_id:
+                                cursor.execute('''
+                                    UPDATE cost_basis SET cash_flow_id = ? 
+                                    WHERE trade_id = ? AND ticker_id = ? AND transaction_date = ? AND cash_flow_id IS NULL
+                                ''', (cash_flow_id, trade_id, ticker_id, date_trade_open))
+                        
+                        imported_count += 1
+                        
+                    except Exception as e:
+                        ticker_name = str(row.get('ticker', 'Unknown')).strip()
+                        error_msg = f"Row {idx} ({ticker_name}): {str(e)}"
+                        errors.append(error_msg)
+                        print(f"Import Error: {error_msg}", flush=True)  # Print to console
+                
+                conn.commit()
             
             skipped_count = final_count_before_insert - imported_count
             
@@ -6678,8 +6942,7 @@ def import_cost_basis_excel():
         total_amount = num_of_shares * price_per_share
         
         # Get trade type ID
-        cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (trade_type,))
-        trade_type_row = cursor.fetchone()
+        trade_type_row = get_trade_type(cursor, trade_type)
         trade_type_id = trade_type_row['id'] if trade_type_row else None
         
         if trade_type_id is None:
@@ -6856,276 +7119,275 @@ def import_cost_basis_excel():
         
         try:
             # Get database connection
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            db = get_db_helper()
-            
-            # Read workbook XML
-            with zipfile.ZipFile(excel_path, "r") as z:
-                # Shared strings for Excel text values
-                shared_strings = []
-                if "xl/sharedStrings.xml" in z.namelist():
-                    shared_xml = ET.parse(z.open("xl/sharedStrings.xml"))
-                    shared_strings = [t.text for t in shared_xml.findall(".//{*}t")]
-                
-                # Find all sheets
-                wb = ET.parse(z.open("xl/workbook.xml"))
-                sheets = wb.findall(".//{*}sheet")
-                if not sheets:
-                    raise ValueError("Couldn't find any sheets in the workbook")
-                
-                total_trades = 0
-                total_dividends = 0
-                errors = []
-                
-                # Get Roth account ID
-                cursor.execute('SELECT id FROM accounts WHERE UPPER(account_name) LIKE UPPER(?)', ('%Roth%',))
-                roth_account_row = cursor.fetchone()
-                roth_account_id = roth_account_row['id'] if roth_account_row else None
-                # default_account_id is already set above (always 9 for non-Roth sheets)
-                
-                print(f"Cost basis import - Roth account_id: {roth_account_id}, Default account_id: {default_account_id}", flush=True)
+            with get_db() as conn:
+                cursor = conn.cursor()
+                db = get_db_helper()
                 
-                # Process each sheet
-                for sheet_idx, sheet in enumerate(sheets, 1):
-                    sheet_name = sheet.attrib.get("name", f"Sheet{sheet_idx}")
-                    print(f"Processing sheet {sheet_idx}: '{sheet_name}'", flush=True)
+                # Read workbook XML
+                with zipfile.ZipFile(excel_path, "r") as z:
+                    # Shared strings for Excel text values
+                    shared_strings = []
+                    if "xl/sharedStrings.xml" in z.namelist():
+                        shared_xml = ET.parse(z.open("xl/sharedStrings.xml"))
+                        shared_strings = [t.text for t in shared_xml.findall(".//{*}t")]
                     
-                    # Determine account_id based on sheet name (case-insensitive check)
-                    sheet_name_upper = sheet_name.upper()
-                    sheet_account_id = default_account_id
-                    has_roth = roth_account_id and 'ROTH' in sheet_name_upper
-                    print(f"Sheet '{sheet_name}': Checking for 'Roth' - sheet_name_upper='{sheet_name_upper}', contains 'ROTH'={has_roth}, roth_account_id={roth_account_id}", flush=True)
-                    if has_roth:
-                        sheet_account_id = roth_account_id
-                        print(f"Sheet '{sheet_name}': Found 'Roth' in sheet name (case-insensitive), using account_id = {sheet_account_id} (Roth account)", flush=True)
-                    else:
-                        print(f"Sheet '{sheet_name}': No 'Roth' in sheet name, using account_id = {sheet_account_id} (default account)", flush=True)
+                    # Find all sheets
+                    wb = ET.parse(z.open("xl/workbook.xml"))
+                    sheets = wb.findall(".//{*}sheet")
+                    if not sheets:
+                        raise ValueError("Couldn't find any sheets in the workbook")
                     
-                    try:
-                        sheet_xml = ET.parse(z.open(f"xl/worksheets/sheet{sheet_idx}.xml"))
-                        
-                        # Collect all cells from the sheet
-                        cells = {}
-                        for r in sheet_xml.findall(".//{*}row"):
-                            idx = int(r.attrib["r"])
-                            for c in r.findall("{*}c"):
-                                ref = c.attrib.get("r")
-                                if not ref:
-                                    continue
-                                col = col_num(ref)
-                                val = cell_value(c, shared_strings)
-                                cells[(idx, col)] = val
-                        
-                        # Get ticker from B1
-                        ticker = cells.get((1, 2), "").strip().upper()
-                        if not ticker:
-                            print(f"Sheet '{sheet_name}': No ticker found in B1, skipping", flush=True)
-                            continue
+                    total_trades = 0
+                    total_dividends = 0
+                    errors = []
+                    
+                    # Get Roth account ID
+                    cursor.execute('SELECT id FROM accounts WHERE UPPER(account_name) LIKE UPPER(?)', ('%Roth%',))
+                    roth_account_row = cursor.fetchone()
+                    roth_account_id = roth_account_row['id'] if roth_account_row else None
+                    # default_account_id is already set above (always 9 for non-Roth sheets)
+                    
+                    print(f"Cost basis import - Roth account_id: {roth_account_id}, Default account_id: {default_account_id}", flush=True)
+                    
+                    # Process each sheet
+                    for sheet_idx, sheet in enumerate(sheets, 1):
+                        sheet_name = sheet.attrib.get("name", f"Sheet{sheet_idx}")
+                        print(f"Processing sheet {sheet_idx}: '{sheet_name}'", flush=True)
                         
-                        print(f"Sheet '{sheet_name}': Ticker = {ticker}", flush=True)
-                        # Use the same cursor to get or create ticker to avoid database locking
-                        cursor.execute('SELECT id FROM tickers WHERE UPPER(ticker) = UPPER(?)', (ticker,))
-                        ticker_row = cursor.fetchone()
-                        if ticker_row:
-                            ticker_id = ticker_row['id']
+                        # Determine account_id based on sheet name (case-insensitive check)
+                        sheet_name_upper = sheet_name.upper()
+                        sheet_account_id = default_account_id
+                        has_roth = roth_account_id and 'ROTH' in sheet_name_upper
+                        print(f"Sheet '{sheet_name}': Checking for 'Roth' - sheet_name_upper='{sheet_name_upper}', contains 'ROTH'={has_roth}, roth_account_id={roth_account_id}", flush=True)
+                        if has_roth:
+                            sheet_account_id = roth_account_id
+                            print(f"Sheet '{sheet_name}': Found 'Roth' in sheet name (case-insensitive), using account_id = {sheet_account_id} (Roth account)", flush=True)
                         else:
-                            # Create new ticker using the same cursor
-                            cursor.execute('INSERT INTO tickers (ticker, company_name) VALUES (?, ?)', (ticker.upper(), ticker))
-                            ticker_id = cursor.lastrowid
-                        cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
-                        ticker_result = cursor.fetchone()
-                        ticker_symbol = ticker_result['ticker'] if ticker_result else ticker
-                        
-                        # Start at row 11 and process rows until blank
-                        row = 11
-                        processed_data = set()  # Track processed data to prevent duplicates (based on content, not row number)
-                        print(f"Sheet '{sheet_name}': Starting to process rows from row 11", flush=True)
-                        print(f"Sheet '{sheet_name}': Ticker = {ticker}, Ticker ID = {ticker_id}, Account ID = {sheet_account_id}", flush=True)
-                        
-                        # Check if row 11 has any data
-                        row_11_description = cells.get((11, 2), "").strip()
-                        print(f"Sheet '{sheet_name}': Row 11, column B value: '{row_11_description}'", flush=True)
+                            print(f"Sheet '{sheet_name}': No 'Roth' in sheet name, using account_id = {sheet_account_id} (default account)", flush=True)
                         
-                        while True:
-                            # Check if row B is blank
-                            description = cells.get((row, 2), "").strip()
-                            if not description:
-                                # Blank row found, move to next sheet
-                                print(f"Sheet '{sheet_name}': Blank row found at row {row}, moving to next sheet", flush=True)
-                                break
-                            
-                            print(f"Sheet '{sheet_name}', Row {row}: Found description '{description}' in column B", flush=True)
+                        try:
+                            sheet_xml = ET.parse(z.open(f"xl/worksheets/sheet{sheet_idx}.xml"))
                             
-                            # Check if it's a dividend (case-insensitive, check for DIVIDEND anywhere in description)
-                            description_upper = description.upper()
-                            print(f"Sheet '{sheet_name}', Row {row}: Checking for dividend - description_upper = '{description_upper}', contains 'DIVIDEND' = {('DIVIDEND' in description_upper)}", flush=True)
-                            if 'DIVIDEND' in description_upper:
-                                try:
-                                    # Get date and amount to create a unique key for duplicate detection
-                                    transaction_date_str = cells.get((row, 3), "").strip()
-                                    amount_str = cells.get((row, 7), "").strip()
-                                    print(f"Sheet '{sheet_name}', Row {row}: Dividend detected - Date (col C): '{transaction_date_str}', Amount (col G): '{amount_str}'", flush=True)
-                                    data_key = ('dividend', ticker_id, transaction_date_str, amount_str)
-                                    
-                                    # Check if we've already processed this exact dividend data in this import session
-                                    if data_key in processed_data:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Duplicate dividend data detected in import session, skipping", flush=True)
-                                        row += 1
+                            # Collect all cells from the sheet
+                            cells = {}
+                            for r in sheet_xml.findall(".//{*}row"):
+                                idx = int(r.attrib["r"])
+                                for c in r.findall("{*}c"):
+                                    ref = c.attrib.get("r")
+                                    if not ref:
                                         continue
-                                    
-                                    # Check if this dividend already exists in the database
-                                    transaction_date_obj = parse_date(transaction_date_str)
-                                    if transaction_date_obj:
-                                        transaction_date = transaction_date_obj.strftime('%Y-%m-%d')
-                                        try:
-                                            amount = float(amount_str)
-                                            cursor.execute('''
-                                                SELECT id FROM cash_flows 
-                                                WHERE ticker_id = ? AND account_id = ? 
-                                                AND transaction_date = ? AND transaction_type = 'Dividend' 
-                                                AND ABS(amount - ?) < 0.01
-                                            ''', (ticker_id, sheet_account_id, transaction_date, amount))
-                                            existing_dividend = cursor.fetchone()
-                                            if existing_dividend:
-                                                print(f"Sheet '{sheet_name}', Row {row}: Dividend already exists in database (ID: {existing_dividend['id']}), skipping", flush=True)
-                                                processed_data.add(data_key)
-                                                row += 1
-                                                continue
-                                        except (ValueError, TypeError):
-                                            pass  # Will be caught by process_dividend_row
-                                    
-                                    print(f"Sheet '{sheet_name}', Row {row}: Processing dividend - Description: '{description}', Ticker: {ticker_symbol} (ID: {ticker_id}), Account: {sheet_account_id}", flush=True)
-                                    result = process_dividend_row(cursor, cells, row, ticker_id, sheet_account_id, ticker_symbol)
-                                    if result:
-                                        total_dividends += 1
-                                        processed_data.add(data_key)
-                                        print(f"Sheet '{sheet_name}', Row {row}: Successfully imported dividend - Cash Flow ID: {result.get('cash_flow_id')}", flush=True)
-                                    else:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Dividend processing returned None - check date/amount parsing", flush=True)
-                                except Exception as e:
-                                    error_msg = f"Sheet '{sheet_name}', Row {row}: {str(e)}"
-                                    errors.append(error_msg)
-                                    print(f"ERROR processing dividend: {error_msg}", flush=True)
-                                    import traceback
-                                    print(f"Traceback: {traceback.format_exc()}", flush=True)
-                                row += 1
+                                    col = col_num(ref)
+                                    val = cell_value(c, shared_strings)
+                                    cells[(idx, col)] = val
+                            
+                            # Get ticker from B1
+                            ticker = cells.get((1, 2), "").strip().upper()
+                            if not ticker:
+                                print(f"Sheet '{sheet_name}': No ticker found in B1, skipping", flush=True)
                                 continue
                             
-                            # Check if it's a trade type (BUY, SELL, BTO, STC)
-                            trade_type_str = get_trade_type(description)
-                            print(f"Sheet '{sheet_name}', Row {row}: get_trade_type returned '{trade_type_str}' for description '{description}'", flush=True)
-                            if trade_type_str in ['BUY', 'SELL', 'BTO', 'STC']:
-                                try:
-                                    # Map to standard trade types (BUY -> BTO, SELL -> STC)
-                                    if trade_type_str == 'BUY':
-                                        trade_type = 'BTO'
-                                    elif trade_type_str == 'SELL':
-                                        trade_type = 'STC'
-                                    else:
-                                        trade_type = trade_type_str
-                                    
-                                    # Get date and shares to create a unique key for duplicate detection
-                                    transaction_date_str = cells.get((row, 3), "").strip()
-                                    shares_str = cells.get((row, 5), "").strip()
-                                    print(f"Sheet '{sheet_name}', Row {row}: Date='{transaction_date_str}' (col C), Shares='{shares_str}' (col E)", flush=True)
-                                    # Create key based on data content, not row number
-                                    data_key = ('trade', ticker_id, description, transaction_date_str, shares_str)
-                                    
-                                    # Check if we've already processed this exact trade data in this import session
-                                    if data_key in processed_data:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Duplicate trade data detected in import session (Description: '{description}', Date: '{transaction_date_str}', Shares: '{shares_str}'), skipping", flush=True)
-                                        row += 1
-                                        continue
-                                    
-                                    # Check if this trade already exists in the database
-                                    transaction_date_obj = parse_date(transaction_date_str)
-                                    if not transaction_date_obj:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Invalid date, skipping duplicate check", flush=True)
-                                        row += 1
-                                        continue
-                                    
-                                    transaction_date = transaction_date_obj.strftime('%Y-%m-%d')
+                            print(f"Sheet '{sheet_name}': Ticker = {ticker}", flush=True)
+                            # Use the same cursor to get or create ticker to avoid database locking
+                            cursor.execute('SELECT id FROM tickers WHERE UPPER(ticker) = UPPER(?)', (ticker,))
+                            ticker_row = cursor.fetchone()
+                            if ticker_row:
+                                ticker_id = ticker_row['id']
+                            else:
+                                # Create new ticker using the same cursor
+                                cursor.execute('INSERT INTO tickers (ticker, company_name) VALUES (?, ?)', (ticker.upper(), ticker))
+                                ticker_id = cursor.lastrowid
+                            cursor.execute('SELECT ticker FROM tickers WHERE id = ?', (ticker_id,))
+                            ticker_result = cursor.fetchone()
+                            ticker_symbol = ticker_result['ticker'] if ticker_result else ticker
+                            
+                            # Start at row 11 and process rows until blank
+                            row = 11
+                            processed_data = set()  # Track processed data to prevent duplicates (based on content, not row number)
+                            print(f"Sheet '{sheet_name}': Starting to process rows from row 11", flush=True)
+                            print(f"Sheet '{sheet_name}': Ticker = {ticker}, Ticker ID = {ticker_id}, Account ID = {sheet_account_id}", flush=True)
+                            
+                            # Check if row 11 has any data
+                            row_11_description = cells.get((11, 2), "").strip()
+                            print(f"Sheet '{sheet_name}': Row 11, column B value: '{row_11_description}'", flush=True)
+                            
+                            while True:
+                                # Check if row B is blank
+                                description = cells.get((row, 2), "").strip()
+                                if not description:
+                                    # Blank row found, move to next sheet
+                                    print(f"Sheet '{sheet_name}': Blank row found at row {row}, moving to next sheet", flush=True)
+                                    break
+                                
+                                print(f"Sheet '{sheet_name}', Row {row}: Found description '{description}' in column B", flush=True)
+                                
+                                # Check if it's a dividend (case-insensitive, check for DIVIDEND anywhere in description)
+                                description_upper = description.upper()
+                                print(f"Sheet '{sheet_name}', Row {row}: Checking for dividend - description_upper = '{description_upper}', contains 'DIVIDEND' = {('DIVIDEND' in description_upper)}", flush=True)
+                                if 'DIVIDEND' in description_upper:
                                     try:
-                                        shares = int(float(shares_str))
-                                    except (ValueError, TypeError) as e:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Invalid shares value for duplicate check: {e}, skipping", flush=True)
-                                        row += 1
-                                        continue
-                                    
-                                    # The description in the database is formatted as "{trade_type} {shares} {ticker_symbol}"
-                                    # Use the mapped trade_type (BTO/STC), not the raw trade_type_str (BUY/SELL)
-                                    expected_description = f"{trade_type} {shares} {ticker_symbol}"
-                                    print(f"Sheet '{sheet_name}', Row {row}: Checking for duplicate - ticker_id={ticker_id}, account_id={sheet_account_id}, date={transaction_date}, description='{expected_description}', shares={shares}", flush=True)
-                                    
-                                    # Check for existing trade with exact match
-                                    cursor.execute('''
-                                        SELECT id, description FROM cost_basis 
-                                        WHERE ticker_id = ? AND account_id = ? 
-                                        AND transaction_date = ? AND shares = ?
-                                    ''', (ticker_id, sheet_account_id, transaction_date, shares))
-                                    existing_trades = cursor.fetchall()
-                                    
-                                    # Check if any existing trade matches the description
-                                    found_duplicate = False
-                                    for existing in existing_trades:
-                                        existing_desc = existing['description']
-                                        if existing_desc == expected_description:
-                                            found_duplicate = True
-                                            print(f"Sheet '{sheet_name}', Row {row}: Trade already exists in database (ID: {existing['id']}, description='{existing_desc}'), skipping", flush=True)
+                                        # Get date and amount to create a unique key for duplicate detection
+                                        transaction_date_str = cells.get((row, 3), "").strip()
+                                        amount_str = cells.get((row, 7), "").strip()
+                                        print(f"Sheet '{sheet_name}', Row {row}: Dividend detected - Date (col C): '{transaction_date_str}', Amount (col G): '{amount_str}'", flush=True)
+                                        data_key = ('dividend', ticker_id, transaction_date_str, amount_str)
+                                        
+                                        # Check if we've already processed this exact dividend data in this import session
+                                        if data_key in processed_data:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Duplicate dividend data detected in import session, skipping", flush=True)
+                                            row += 1
+                                            continue
+                                        
+                                        # Check if this dividend already exists in the database
+                                        transaction_date_obj = parse_date(transaction_date_str)
+                                        if transaction_date_obj:
+                                            transaction_date = transaction_date_obj.strftime('%Y-%m-%d')
+                                            try:
+                                                amount = float(amount_str)
+                                                cursor.execute('''
+                                                    SELECT id FROM cash_flows 
+                                                    WHERE ticker_id = ? AND account_id = ? 
+                                                    AND transaction_date = ? AND transaction_type = 'Dividend' 
+                                                    AND ABS(amount - ?) < 0.01
+                                                ''', (ticker_id, sheet_account_id, transaction_date, amount))
+                                                existing_dividend = cursor.fetchone()
+                                                if existing_dividend:
+                                                    print(f"Sheet '{sheet_name}', Row {row}: Dividend already exists in database (ID: {existing_dividend['id']}), skipping", flush=True)
+                                                    processed_data.add(data_key)
+                                                    row += 1
+                                                    continue
+                                            except (ValueError, TypeError):
+                                                pass  # Will be caught by process_dividend_row
+                                        
+                                        print(f"Sheet '{sheet_name}', Row {row}: Processing dividend - Description: '{description}', Ticker: {ticker_symbol} (ID: {ticker_id}), Account: {sheet_account_id}", flush=True)
+                                        result = process_dividend_row(cursor, cells, row, ticker_id, sheet_account_id, ticker_symbol)
+                                        if result:
+                                            total_dividends += 1
                                             processed_data.add(data_key)
-                                            break
-                                    
-                                    if found_duplicate:
-                                        row += 1
-                                        continue
-                                    
-                                    if existing_trades:
-                                        print(f"Sheet '{sheet_name}', Row {row}: Found {len(existing_trades)} existing trades with same date/shares but different description. Existing: {[e['description'] for e in existing_trades]}, Expected: '{expected_description}'", flush=True)
-                                    else:
-                                        print(f"Sheet '{sheet_name}', Row {row}: No duplicate found, proceeding with import", flush=True)
-                                    
-                                    print(f"Sheet '{sheet_name}', Row {row}: Processing trade - Type: {trade_type}, Ticker: {ticker_symbol}, Account: {sheet_account_id}", flush=True)
-                                    result = process_trade_row(cursor, db, cells, row, ticker_id, sheet_account_id, ticker_symbol)
-                                    if result:
-                                        total_trades += 1
-                                        processed_data.add(data_key)
-                                        print(f"Sheet '{sheet_name}', Row {row}: Successfully imported trade", flush=True)
-                                    else:
-                                        print(f"Sheet '{sheet_name}', Row {row}: process_trade_row returned None", flush=True)
-                                except Exception as e:
-                                    error_msg = f"Sheet '{sheet_name}', Row {row}: {str(e)}"
-                                    errors.append(error_msg)
-                                    print(f"Error processing trade: {error_msg}", flush=True)
-                                    import traceback
-                                    print(f"Traceback: {traceback.format_exc()}", flush=True)
-                                row += 1
-                            else:
-                                # Not a trade type, move to next row
-                                print(f"Sheet '{sheet_name}', Row {row}: Not a recognized trade type (got '{trade_type_str}'), moving to next row", flush=True)
-                                row += 1
+                                            print(f"Sheet '{sheet_name}', Row {row}: Successfully imported dividend - Cash Flow ID: {result.get('cash_flow_id')}", flush=True)
+                                        else:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Dividend processing returned None - check date/amount parsing", flush=True)
+                                    except Exception as e:
+                                        error_msg = f"Sheet '{sheet_name}', Row {row}: {str(e)}"
+                                        errors.append(error_msg)
+                                        print(f"ERROR processing dividend: {error_msg}", flush=True)
+                                        import traceback
+                                        print(f"Traceback: {traceback.format_exc()}", flush=True)
+                                    row += 1
+                                    continue
+                                
+                                # Check if it's a trade type (BUY, SELL, BTO, STC)
+                                trade_type_str = get_trade_type(description)
+                                print(f"Sheet '{sheet_name}', Row {row}: get_trade_type returned '{trade_type_str}' for description '{description}'", flush=True)
+                                if trade_type_str in ['BUY', 'SELL', 'BTO', 'STC']:
+                                    try:
+                                        # Map to standard trade types (BUY -> BTO, SELL -> STC)
+                                        if trade_type_str == 'BUY':
+                                            trade_type = 'BTO'
+                                        elif trade_type_str == 'SELL':
+                                            trade_type = 'STC'
+                                        else:
+                                            trade_type = trade_type_str
+                                        
+                                        # Get date and shares to create a unique key for duplicate detection
+                                        transaction_date_str = cells.get((row, 3), "").strip()
+                                        shares_str = cells.get((row, 5), "").strip()
+                                        print(f"Sheet '{sheet_name}', Row {row}: Date='{transaction_date_str}' (col C), Shares='{shares_str}' (col E)", flush=True)
+                                        # Create key based on data content, not row number
+                                        data_key = ('trade', ticker_id, description, transaction_date_str, shares_str)
+                                        
+                                        # Check if we've already processed this exact trade data in this import session
+                                        if data_key in processed_data:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Duplicate trade data detected in import session (Description: '{description}', Date: '{transaction_date_str}', Shares: '{shares_str}'), skipping", flush=True)
+                                            row += 1
+                                            continue
+                                        
+                                        # Check if this trade already exists in the database
+                                        transaction_date_obj = parse_date(transaction_date_str)
+                                        if not transaction_date_obj:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Invalid date, skipping duplicate check", flush=True)
+                                            row += 1
+                                            continue
+                                        
+                                        transaction_date = transaction_date_obj.strftime('%Y-%m-%d')
+                                        try:
+                                            shares = int(float(shares_str))
+                                        except (ValueError, TypeError) as e:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Invalid shares value for duplicate check: {e}, skipping", flush=True)
+                                            row += 1
+                                            continue
+                                        
+                                        # The description in the database is formatted as "{trade_type} {shares} {ticker_symbol}"
+                                        # Use the mapped trade_type (BTO/STC), not the raw trade_type_str (BUY/SELL)
+                                        expected_description = f"{trade_type} {shares} {ticker_symbol}"
+                                        print(f"Sheet '{sheet_name}', Row {row}: Checking for duplicate - ticker_id={ticker_id}, account_id={sheet_account_id}, date={transaction_date}, description='{expected_description}', shares={shares}", flush=True)
+                                        
+                                        # Check for existing trade with exact match
+                                        cursor.execute('''
+                                            SELECT id, description FROM cost_basis 
+                                            WHERE ticker_id = ? AND account_id = ? 
+                                            AND transaction_date = ? AND shares = ?
+                                        ''', (ticker_id, sheet_account_id, transaction_date, shares))
+                                        existing_trades = cursor.fetchall()
+                                        
+                                        # Check if any existing trade matches the description
+                                        found_duplicate = False
+                                        for existing in existing_trades:
+                                            existing_desc = existing['description']
+                                            if existing_desc == expected_description:
+                                                found_duplicate = True
+                                                print(f"Sheet '{sheet_name}', Row {row}: Trade already exists in database (ID: {existing['id']}, description='{existing_desc}'), skipping", flush=True)
+                                                processed_data.add(data_key)
+                                                break
+                                        
+                                        if found_duplicate:
+                                            row += 1
+                                            continue
+                                        
+                                        if existing_trades:
+                                            print(f"Sheet '{sheet_name}', Row {row}: Found {len(existing_trades)} existing trades with same date/shares but different description. Existing: {[e['description'] for e in existing_trades]}, Expected: '{expected_description}'", flush=True)
+                                        else:
+                                            print(f"Sheet '{sheet_name}', Row {row}: No duplicate found, proceeding with import", flush=True)
+                                        
+                                        print(f"Sheet '{sheet_name}', Row {row}: Processing trade - Type: {trade_type}, Ticker: {ticker_symbol}, Account: {sheet_account_id}", flush=True)
+                                        result = process_trade_row(cursor, db, cells, row, ticker_id, sheet_account_id, ticker_symbol)
+                                        if result:
+                                            total_trades += 1
+                                            processed_data.add(data_key)
+                                            print(f"Sheet '{sheet_name}', Row {row}: Successfully imported trade", flush=True)
+                                        else:
+                                            print(f"Sheet '{sheet_name}', Row {row}: process_trade_row returned None", flush=True)
+                                    except Exception as e:
+                                        error_msg = f"Sheet '{sheet_name}', Row {row}: {str(e)}"
+                                        errors.append(error_msg)
+                                        print(f"Error processing trade: {error_msg}", flush=True)
+                                        import traceback
+                                        print(f"Traceback: {traceback.format_exc()}", flush=True)
+                                    row += 1
+                                else:
+                                    # Not a trade type, move to next row
+                                    print(f"Sheet '{sheet_name}', Row {row}: Not a recognized trade type (got '{trade_type_str}'), moving to next row", flush=True)
+                                    row += 1
+                        
+                        except Exception as e:
+                            error_msg = f"Sheet '{sheet_name}': {str(e)}"
+                            errors.append(error_msg)
+                            print(f"Error processing sheet: {error_msg}", flush=True)
+                            continue
                     
-                    except Exception as e:
-                        error_msg = f"Sheet '{sheet_name}': {str(e)}"
-                        errors.append(error_msg)
-                        print(f"Error processing sheet: {error_msg}", flush=True)
-                        continue
-                
-                # Commit all changes
-                conn.commit()
-                conn.close()
-                
-                message = f'Successfully imported {total_trades} trades and {total_dividends} dividends'
-                if errors:
-                    message += f'. {len(errors)} errors occurred.'
-                
-                return jsonify({
-                    'success': True,
-                    'message': message,
-                    'trades_imported': total_trades,
-                    'dividends_imported': total_dividends,
-                    'errors': errors if errors else []
-                })
+                    # Commit all changes
+                    conn.commit()
+                    
+                    message = f'Successfully imported {total_trades} trades and {total_dividends} dividends'
+                    if errors:
+                        message += f'. {len(errors)} errors occurred.'
+                    
+                    return jsonify({
+                        'success': True,
+                        'message': message,
+                        'trades_imported': total_trades,
+                        'dividends_imported': total_dividends,
+                        'errors': errors if errors else []
+                    })
         
         finally:
             # Clean up temporary file
@@ -7172,151 +7434,149 @@ def import_dividends():
         else:
             start_date = (datetime.now() - timedelta(days=365)).date()  # Default: 1 year ago
         
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
-        else:
-            end_date = datetime.now().date()  # Default: today
-        
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get all unique tickers that have trades
-        if tickers_to_import:
-            # Import specific tickers
-            ticker_list = [t.upper() for t in tickers_to_import]
-            placeholders = ','.join(['?' for _ in ticker_list])
-            cursor.execute(f'''
-                SELECT DISTINCT t.id, t.ticker, t.company_name
-                FROM tickers t
-                JOIN trades tr ON t.id = tr.ticker_id
-                WHERE UPPER(t.ticker) IN ({placeholders})
-            ''', ticker_list)
-        else:
-            # Get all tickers that have trades
-            cursor.execute('''
-                SELECT DISTINCT t.id, t.ticker, t.company_name
-                FROM tickers t
-                JOIN trades tr ON t.id = tr.ticker_id
-                WHERE t.ticker IS NOT NULL AND t.ticker != ""
-                ORDER BY t.ticker
-            ''')
-        
-        ticker_rows = cursor.fetchall()
-        
-        if not ticker_rows:
-            conn.close()
-            return jsonify({
-                'success': True,
-                'message': 'No tickers found to import dividends for',
-                'imported': 0,
-                'skipped': 0,
-                'errors': []
-            })
-        
-        imported_count = 0
-        skipped_count = 0
-        errors = []
-        dividend_entries = []
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        else:
+            end_date = datetime.now().date()  # Default: today
         
-        for ticker_row in ticker_rows:
-            ticker_id = ticker_row['id']
-            ticker_symbol = ticker_row['ticker']
-            company_name = ticker_row.get('company_name', ticker_symbol)
+        with get_db() as conn:
+            cursor = conn.cursor()
             
-            try:
-                # Fetch dividend history from Yahoo Finance
-                print(f'[DIVIDEND IMPORT] Fetching dividends for {ticker_symbol}...', flush=True)
-                stock = yf.Ticker(ticker_symbol)
-                dividend_history = stock.dividends
-                
-                if dividend_history.empty:
-                    print(f'[DIVIDEND IMPORT] No dividends found for {ticker_symbol}', flush=True)
-                    continue
-                
-                # Filter dividends by date range
-                # Convert index to date for comparison
-                dividend_history = dividend_history[
-                    (dividend_history.index >= pd.Timestamp(start_date)) & 
-                    (dividend_history.index <= pd.Timestamp(end_date))
-                ]
-                
-                if dividend_history.empty:
-                    print(f'[DIVIDEND IMPORT] No dividends in date range for {ticker_symbol}', flush=True)
-                    continue
-                
-                # Get account_id for this ticker (use account from most recent trade, or default)
-                if default_account_id:
-                    account_id = default_account_id
-                else:
-                    cursor.execute('''
-                        SELECT account_id FROM trades 
-                        WHERE ticker_id = ? 
-                        ORDER BY date_trade_open DESC 
-                        LIMIT 1
-                    ''', (ticker_id,))
-                    account_row = cursor.fetchone()
-                    account_id = account_row['account_id'] if account_row else 9
+            # Get all unique tickers that have trades
+            if tickers_to_import:
+                # Import specific tickers
+                ticker_list = [t.upper() for t in tickers_to_import]
+                placeholders = ','.join(['?' for _ in ticker_list])
+                cursor.execute(f'''
+                    SELECT DISTINCT t.id, t.ticker, t.company_name
+                    FROM tickers t
+                    JOIN trades tr ON t.id = tr.ticker_id
+                    WHERE UPPER(t.ticker) IN ({placeholders})
+                ''', ticker_list)
+            else:
+                # Get all tickers that have trades
+                cursor.execute('''
+                    SELECT DISTINCT t.id, t.ticker, t.company_name
+                    FROM tickers t
+                    JOIN trades tr ON t.id = tr.ticker_id
+                    WHERE t.ticker IS NOT NULL AND t.ticker != ""
+                    ORDER BY t.ticker
+                ''')
+            
+            ticker_rows = cursor.fetchall()
+            
+            if not ticker_rows:
+                return jsonify({
+                    'success': True,
+                    'message': 'No tickers found to import dividends for',
+                    'imported': 0,
+                    'skipped': 0,
+                    'errors': []
+                })
+            
+            imported_count = 0
+            skipped_count = 0
+            errors = []
+            dividend_entries = []
+            
+            for ticker_row in ticker_rows:
+                ticker_id = ticker_row['id']
+                ticker_symbol = ticker_row['ticker']
+                company_name = ticker_row.get('company_name', ticker_symbol)
                 
-                # Process each dividend
-                for dividend_date, dividend_amount in dividend_history.items():
-                    # Handle pandas Timestamp
-                    if hasattr(dividend_date, 'strftime'):
-                        dividend_date_str = dividend_date.strftime('%Y-%m-%d')
-                    elif hasattr(dividend_date, 'date'):
-                        dividend_date_str = dividend_date.date().strftime('%Y-%m-%d')
-                    else:
-                        dividend_date_str = str(dividend_date)
-                    
-                    # Check if this dividend already exists
-                    cursor.execute('''
-                        SELECT id FROM cash_flows
-                        WHERE ticker_id = ? 
-                        AND transaction_type = 'Dividend'
-                        AND transaction_date = ?
-                        AND ABS(amount - ?) < 0.01
-                    ''', (ticker_id, dividend_date_str, float(dividend_amount)))
+                try:
+                    # Fetch dividend history from Yahoo Finance
+                    print(f'[DIVIDEND IMPORT] Fetching dividends for {ticker_symbol}...', flush=True)
+                    stock = yf.Ticker(ticker_symbol, session=YFINANCE_SESSION)
+                    dividend_history = stock.dividends
                     
-                    existing = cursor.fetchone()
-                    if existing:
-                        print(f'[DIVIDEND IMPORT] Skipping duplicate dividend: {ticker_symbol} on {dividend_date_str}', flush=True)
-                        skipped_count += 1
+                    if dividend_history.empty:
+                        print(f'[DIVIDEND IMPORT] No dividends found for {ticker_symbol}', flush=True)
                         continue
                     
-                    # Create dividend entry
-                    description = f"Dividend {ticker_symbol}"
-                    amount = float(dividend_amount)
+                    # Filter dividends by date range
+                    # Convert index to date for comparison
+                    dividend_history = dividend_history[
+                        (dividend_history.index >= pd.Timestamp(start_date)) & 
+                        (dividend_history.index <= pd.Timestamp(end_date))
+                    ]
                     
-                    if dry_run:
-                        dividend_entries.append({
-                            'ticker': ticker_symbol,
-                            'date': dividend_date_str,
-                            'amount': amount,
-                            'account_id': account_id,
-                            'description': description
-                        })
-                        imported_count += 1
+                    if dividend_history.empty:
+                        print(f'[DIVIDEND IMPORT] No dividends in date range for {ticker_symbol}', flush=True)
+                        continue
+                    
+                    # Get account_id for this ticker (use account from most recent trade, or default)
+                    if default_account_id:
+                        account_id = default_account_id
                     else:
                         cursor.execute('''
-                            INSERT INTO cash_flows 
-                            (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (account_id, dividend_date_str, 'Dividend', round(amount, 2), 
-                              description, None, ticker_id))
-                        imported_count += 1
-                        print(f'[DIVIDEND IMPORT] Imported dividend: {ticker_symbol} on {dividend_date_str} - ${amount:.2f}', flush=True)
-                
-            except Exception as e:
-                error_msg = f"Error importing dividends for {ticker_symbol}: {str(e)}"
-                print(f'[DIVIDEND IMPORT] {error_msg}', flush=True)
-                errors.append(error_msg)
-                import traceback
-                print(f'[DIVIDEND IMPORT] Traceback: {traceback.format_exc()}', flush=True)
-                continue
-        
-        if not dry_run:
-            conn.commit()
-        
-        conn.close()
+                            SELECT account_id FROM trades 
+                            WHERE ticker_id = ? 
+                            ORDER BY date_trade_open DESC 
+                            LIMIT 1
+                        ''', (ticker_id,))
+                        account_row = cursor.fetchone()
+                        account_id = account_row['account_id'] if account_row else 9
+                    
+                    # Process each dividend
+                    for dividend_date, dividend_amount in dividend_history.items():
+                        # Handle pandas Timestamp
+                        if hasattr(dividend_date, 'strftime'):
+                            dividend_date_str = dividend_date.strftime('%Y-%m-%d')
+                        elif hasattr(dividend_date, 'date'):
+                            dividend_date_str = dividend_date.date().strftime('%Y-%m-%d')
+                        else:
+                            dividend_date_str = str(dividend_date)
+                        
+                        # Check if this dividend already exists
+                        cursor.execute('''
+                            SELECT id FROM cash_flows
+                            WHERE ticker_id = ? 
+                            AND transaction_type = 'Dividend'
+                            AND transaction_date = ?
+                            AND ABS(amount - ?) < 0.01
+                        ''', (ticker_id, dividend_date_str, float(dividend_amount)))
+                        
+                        existing = cursor.fetchone()
+                        if existing:
+                            print(f'[DIVIDEND IMPORT] Skipping duplicate dividend: {ticker_symbol} on {dividend_date_str}', flush=True)
+                            skipped_count += 1
+                            continue
+                        
+                        # Create dividend entry
+                        description = f"Dividend {ticker_symbol}"
+                        amount = float(dividend_amount)
+                        
+                        if dry_run:
+                            dividend_entries.append({
+                                'ticker': ticker_symbol,
+                                'date': dividend_date_str,
+                                'amount': amount,
+                                'account_id': account_id,
+                                'description': description
+                            })
+                            imported_count += 1
+                        else:
+                            cursor.execute('''
+                                INSERT INTO cash_flows 
+                                (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)
+                            ''', (account_id, dividend_date_str, 'Dividend', round(amount, 2), 
+                                  description, None, ticker_id))
+                            imported_count += 1
+                            print(f'[DIVIDEND IMPORT] Imported dividend: {ticker_symbol} on {dividend_date_str} - ${amount:.2f}', flush=True)
+                    
+                except Exception as e:
+                    error_msg = f"Error importing dividends for {ticker_symbol}: {str(e)}"
+                    print(f'[DIVIDEND IMPORT] {error_msg}', flush=True)
+                    errors.append(error_msg)
+                    import traceback
+                    print(f'[DIVIDEND IMPORT] Traceback: {traceback.format_exc()}', flush=True)
+                    continue
+            
+            if not dry_run:
+                conn.commit()
+            
         
         result = {
             'success': True,
@@ -7627,9 +7887,8 @@ _schwab_poll_thread = None
 def _setting_get(key, default=None):
     """Read a value from the settings table."""
     try:
-        conn = get_db_connection()
-        row = conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
-        conn.close()
+        with get_db() as conn:
+            row = conn.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
         return row['value'] if row else default
     except Exception:
         return default
@@ -7638,14 +7897,13 @@ def _setting_get(key, default=None):
 def _setting_set(key, value):
     """Upsert a value in the settings table."""
     try:
-        conn = get_db_connection()
-        conn.execute(
-            'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, datetime("now")) '
-            'ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at',
-            (key, str(value))
-        )
-        conn.commit()
-        conn.close()
+        with get_db() as conn:
+            conn.execute(
+                'INSERT INTO settings (key, value, updated_at) VALUES (?, ?, datetime("now")) '
+                'ON CONFLICT(key) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at',
+                (key, str(value))
+            )
+            conn.commit()
     except Exception as e:
         print(f'[SCHWAB SETTINGS] Error saving setting {key}: {e}', flush=True)
 
@@ -7699,249 +7957,212 @@ def _do_schwab_sync(account_id_override=None, since_override=None, until_overrid
         transactions = schwab_client.get_all_trade_transactions(since=since, until=until)
         print(f'[SCHWAB SYNC] Found {len(transactions)} transaction(s) {since} → {until}', flush=True)
 
-        conn   = get_db_connection()
-        cursor = conn.cursor()
-
-        def _get_or_create_ticker_raw(sym):
-            """Get or insert ticker using existing cursor (avoids SA cross-connection lock)."""
-            cursor.execute('SELECT id FROM tickers WHERE ticker = ?', (sym.upper(),))
-            row = cursor.fetchone()
-            if row:
-                return row['id']
-            cursor.execute(
-                'INSERT INTO tickers (ticker, company_name) VALUES (?, ?)',
-                (sym.upper(), sym.upper())
-            )
-            conn.commit()
-            return cursor.lastrowid
+        with get_db() as conn:
+            cursor = conn.cursor()
 
-        def _get_commission_raw(acct_id, date_str):
-            """Get commission rate using existing cursor."""
-            cursor.execute('''
-                SELECT commission_rate FROM commissions
-                WHERE account_id = ? AND effective_date <= ?
-                ORDER BY effective_date DESC LIMIT 1
-            ''', (acct_id, date_str))
-            row = cursor.fetchone()
-            return float(row['commission_rate']) if row else 0.0
+            def _get_or_create_ticker_raw(sym):
+                """Get or insert ticker using existing cursor (avoids SA cross-connection lock)."""
+                cursor.execute(UPSERT_TICKER_SQL, {'ticker': sym.upper(), 'company_name': sym.upper()})
+                return cursor.fetchone()['id']
 
-        for txn in transactions:
-            txn_id   = txn.get('transaction_id', '')
-            symbol   = txn.get('symbol', '').upper()
-            category = txn.get('category', 'UNKNOWN')
+            def _get_commission_raw(acct_id, date_str):
+                """Get commission rate using existing cursor."""
+                cursor.execute('''
+                    SELECT commission_rate FROM commissions
+                    WHERE account_id = ? AND effective_date <= ?
+                    ORDER BY effective_date DESC LIMIT 1
+                ''', (acct_id, date_str))
+                row = cursor.fetchone()
+                return float(row['commission_rate']) if row else 0.0
+
+            for txn in transactions:
+                txn_id   = txn.get('transaction_id', '')
+                symbol   = txn.get('symbol', '').upper()
+                category = txn.get('category', 'UNKNOWN')
+
+                if not symbol or not txn_id:
+                    continue
 
-            if not symbol or not txn_id:
-                continue
+                # Dedup by schwab_order_id
+                cursor.execute('SELECT id FROM trades WHERE schwab_order_id = ?', (txn_id,))
+                if cursor.fetchone():
+                    skipped_count += 1
+                    continue
 
-            # Dedup by schwab_order_id
-            cursor.execute('SELECT id FROM trades WHERE schwab_order_id = ?', (txn_id,))
-            if cursor.fetchone():
-                skipped_count += 1
-                continue
+                try:
+                    ticker_id       = _get_or_create_ticker_raw(symbol)
+                    account_id      = account_id_override or 9
+                    date_trade_open = txn.get('date', datetime.now().strftime('%Y-%m-%d'))
+                    commission      = _get_commission_raw(account_id, date_trade_open)
+                    needs_review    = 1 if txn.get('needs_review') else 0
+
+                    # ----------------------------------------------------------------
+                    # EQUITY: BTO and STC
+                    # ----------------------------------------------------------------
+                    if category in ('BTO', 'STC'):
+                        price_per_share = txn.get('price_per_share', 0) or 0
+                        num_shares      = int(txn.get('num_shares', 0) or 0)
+                        total_amount    = round(price_per_share * num_shares, 2)
+                        trade_type      = category  # 'BTO' or 'STC'
+
+                        tt_row        = get_trade_type(cursor, trade_type)
+                        trade_type_id = tt_row['id'] if tt_row else None
 
-            try:
-                ticker_id       = _get_or_create_ticker_raw(symbol)
-                account_id      = account_id_override or 9
-                date_trade_open = txn.get('date', datetime.now().strftime('%Y-%m-%d'))
-                commission      = _get_commission_raw(account_id, date_trade_open)
-                needs_review    = 1 if txn.get('needs_review') else 0
+                        cursor.execute('''
+                            INSERT INTO trades
+                                (account_id, ticker_id, ticker, date_trade_open,
+                                 num_of_shares, num_of_contracts,
+                                 current_price, price_per_share, total_amount,
+                                 credit_debit, total_premium,
+                                 trade_status, trade_type, trade_type_id,
+                                 commission_per_share, schwab_order_id,
+                                 expiration_date,
+                                 strike_price, long_strike, net_credit_per_share,
+                                 margin_percent, days_to_expiration, needs_review)
+                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'',0,NULL,0,100,0,?)
+                        ''', (
+                            account_id, ticker_id, symbol, date_trade_open,
+                            num_shares, num_shares,
+                            price_per_share, price_per_share, total_amount,
+                            0.0, total_amount,
+                            'open', trade_type, trade_type_id,
+                            commission, txn_id,
+                            needs_review,
+                        ))
+                        trade_id = cursor.lastrowid
+
+                        # Cost basis
+                        create_cost_basis_entry(
+                            cursor, account_id, ticker_id, trade_id, date_trade_open,
+                            trade_type, num_shares, price_per_share, total_amount,
+                            ticker=symbol
+                        )
+                        # Cash flow
+                        cf_type   = 'PREMIUM_DEBIT' if trade_type == 'BTO' else 'PREMIUM_CREDIT'
+                        cf_amount = -total_amount if trade_type == 'BTO' else total_amount
+                        cursor.execute('''
+                            INSERT INTO cash_flows
+                                (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                            VALUES (?,?,?,?,?,?,?)
+                        ''', (account_id, date_trade_open, cf_type, round(cf_amount, 2),
+                              f'{trade_type} {num_shares} {symbol}', trade_id, ticker_id))
+                        cf_id = cursor.lastrowid
+                        cursor.execute('UPDATE cost_basis SET cash_flow_id=? WHERE trade_id=? AND cash_flow_id IS NULL',
+                                       (cf_id, trade_id))
 
-                # ----------------------------------------------------------------
-                # EQUITY: BTO and STC
-                # ----------------------------------------------------------------
-                if category in ('BTO', 'STC'):
-                    price_per_share = txn.get('price_per_share', 0) or 0
-                    num_shares      = int(txn.get('num_shares', 0) or 0)
-                    total_amount    = round(price_per_share * num_shares, 2)
-                    trade_type      = category  # 'BTO' or 'STC'
+                        print(f'[SCHWAB SYNC] {trade_type} {symbol} x{num_shares} @ ${price_per_share} on {date_trade_open}', flush=True)
+                        imported_count += 1
 
-                    cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (trade_type,))
-                    tt_row        = cursor.fetchone()
-                    trade_type_id = tt_row['id'] if tt_row else None
+                    # ----------------------------------------------------------------
+                    # OPTIONS: SELL_TO_OPEN  →  short option (ROCT PUT / ROCT CALL)
+                    # ----------------------------------------------------------------
+                    elif category == 'OPTION_SELL_OPEN':
+                        option_type    = txn.get('option_type', '')
+                        strike_price   = txn.get('strike_price', 0) or 0
+                        expiration_date= txn.get('expiration_date', '') or ''
+                        num_contracts  = txn.get('num_contracts', 1) or 1
+                        premium        = txn.get('price_per_share', 0) or 0  # price per share
+                        total_premium  = round(premium * num_contracts * 100, 2)
+
+                        trade_type, _  = _map_option_trade_type(symbol, option_type, 'SELL_TO_OPEN')
+                        base_type      = 'ROCT PUT' if 'PUT' in trade_type else 'ROCT CALL'
+
+                        tt_row        = get_trade_type(cursor, base_type)
+                        trade_type_id = tt_row['id'] if tt_row else None
+
+                        # DTE
+                        dte = 0
+                        if expiration_date:
+                            try:
+                                exp_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
+                                open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
+                                dte = max(0, (exp_obj - open_obj).days)
+                            except Exception:
+                                pass
 
-                    cursor.execute('''
-                        INSERT INTO trades
-                            (account_id, ticker_id, ticker, date_trade_open,
-                             num_of_shares, num_of_contracts,
-                             current_price, price_per_share, total_amount,
-                             credit_debit, total_premium,
-                             trade_status, trade_type, trade_type_id,
-                             commission_per_share, schwab_order_id,
-                             expiration_date,
-                             strike_price, long_strike, net_credit_per_share,
-                             margin_percent, days_to_expiration, needs_review)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,'',0,NULL,0,100,0,?)
-                    ''', (
-                        account_id, ticker_id, symbol, date_trade_open,
-                        num_shares, num_shares,
-                        price_per_share, price_per_share, total_amount,
-                        0.0, total_amount,
-                        'open', trade_type, trade_type_id,
-                        commission, txn_id,
-                        needs_review,
-                    ))
-                    trade_id = cursor.lastrowid
-
-                    # Cost basis
-                    create_cost_basis_entry(
-                        cursor, account_id, ticker_id, trade_id, date_trade_open,
-                        trade_type, num_shares, price_per_share, total_amount
-                    )
-                    # Cash flow
-                    cf_type   = 'PREMIUM_DEBIT' if trade_type == 'BTO' else 'PREMIUM_CREDIT'
-                    cf_amount = -total_amount if trade_type == 'BTO' else total_amount
-                    cursor.execute('''
-                        INSERT INTO cash_flows
-                            (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                        VALUES (?,?,?,?,?,?,?)
-                    ''', (account_id, date_trade_open, cf_type, round(cf_amount, 2),
-                          f'{trade_type} {num_shares} {symbol}', trade_id, ticker_id))
-                    cf_id = cursor.lastrowid
-                    cursor.execute('UPDATE cost_basis SET cash_flow_id=? WHERE trade_id=? AND cash_flow_id IS NULL',
-                                   (cf_id, trade_id))
-
-                    print(f'[SCHWAB SYNC] {trade_type} {symbol} x{num_shares} @ ${price_per_share} on {date_trade_open}', flush=True)
-                    imported_count += 1
+                        net_credit = round(premium - commission, 5)
+                        risk_capital = round(strike_price - net_credit, 2) if strike_price > 0 else None
+                        margin_capital = num_contracts * 100 * risk_capital if risk_capital else None
+                        arorc = None
+                        if risk_capital and risk_capital > 0 and dte > 0:
+                            arorc = round_standard((365.0 / dte) * (net_credit / risk_capital) * 100, 1)
 
-                # ----------------------------------------------------------------
-                # OPTIONS: SELL_TO_OPEN  →  short option (ROCT PUT / ROCT CALL)
-                # ----------------------------------------------------------------
-                elif category == 'OPTION_SELL_OPEN':
-                    option_type    = txn.get('option_type', '')
-                    strike_price   = txn.get('strike_price', 0) or 0
-                    expiration_date= txn.get('expiration_date', '') or ''
-                    num_contracts  = txn.get('num_contracts', 1) or 1
-                    premium        = txn.get('price_per_share', 0) or 0  # price per share
-                    total_premium  = round(premium * num_contracts * 100, 2)
-
-                    trade_type, _  = _map_option_trade_type(symbol, option_type, 'SELL_TO_OPEN')
-                    base_type      = 'ROCT PUT' if 'PUT' in trade_type else 'ROCT CALL'
-
-                    cursor.execute('SELECT id FROM trade_types WHERE type_name = ?', (base_type,))
-                    tt_row        = cursor.fetchone()
-                    trade_type_id = tt_row['id'] if tt_row else None
-
-                    # DTE
-                    dte = 0
-                    if expiration_date:
+                        cursor.execute('''
+                            INSERT INTO trades
+                                (account_id, ticker_id, ticker, date_trade_open, expiration_date,
+                                 num_of_contracts, num_of_shares,
+                                 credit_debit, total_premium,
+                                 days_to_expiration, current_price, strike_price, long_strike,
+                                 trade_status, trade_type, trade_type_id,
+                                 commission_per_share, price_per_share, total_amount,
+                                 margin_capital, net_credit_per_share, risk_capital_per_share,
+                                 margin_percent, ARORC, schwab_order_id, needs_review)
+                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                        ''', (
+                            account_id, ticker_id, symbol, date_trade_open, expiration_date,
+                            num_contracts, num_contracts * 100,
+                            premium, total_premium,
+                            dte, 0.0, strike_price, None,
+                            'open', trade_type, trade_type_id,
+                            commission, premium, total_premium,
+                            margin_capital, net_credit, risk_capital,
+                            100.0, arorc, txn_id, needs_review,
+                        ))
+                        trade_id = cursor.lastrowid
+
+                        # Cost basis + cash flow (mirrors create_options_cost_basis_entry path)
                         try:
-                            exp_obj = datetime.strptime(expiration_date, '%Y-%m-%d')
-                            open_obj = datetime.strptime(date_trade_open, '%Y-%m-%d')
-                            dte = max(0, (exp_obj - open_obj).days)
-                        except Exception:
-                            pass
-
-                    net_credit = round(premium - commission, 5)
-                    risk_capital = round(strike_price - net_credit, 2) if strike_price > 0 else None
-                    margin_capital = num_contracts * 100 * risk_capital if risk_capital else None
-                    arorc = None
-                    if risk_capital and risk_capital > 0 and dte > 0:
-                        arorc = round_standard((365.0 / dte) * (net_credit / risk_capital) * 100, 1)
-
-                    cursor.execute('''
-                        INSERT INTO trades
-                            (account_id, ticker_id, ticker, date_trade_open, expiration_date,
-                             num_of_contracts, num_of_shares,
-                             credit_debit, total_premium,
-                             days_to_expiration, current_price, strike_price, long_strike,
-                             trade_status, trade_type, trade_type_id,
-                             commission_per_share, price_per_share, total_amount,
-                             margin_capital, net_credit_per_share, risk_capital_per_share,
-                             margin_percent, ARORC, schwab_order_id, needs_review)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                    ''', (
-                        account_id, ticker_id, symbol, date_trade_open, expiration_date,
-                        num_contracts, num_contracts * 100,
-                        premium, total_premium,
-                        dte, 0.0, strike_price, None,
-                        'open', trade_type, trade_type_id,
-                        commission, premium, total_premium,
-                        margin_capital, net_credit, risk_capital,
-                        100.0, arorc, txn_id, needs_review,
-                    ))
-                    trade_id = cursor.lastrowid
-
-                    # Cost basis + cash flow (mirrors create_options_cost_basis_entry path)
-                    try:
-                        create_options_cost_basis_entry(
-                            cursor, account_id, ticker_id, trade_id, date_trade_open,
-                            trade_type, num_contracts, premium, strike_price, expiration_date
-                        )
-                    except Exception as cbe:
-                        print(f'[SCHWAB SYNC] cost_basis warn for {txn_id}: {cbe}', flush=True)
-
-                    cf_type = 'SELL PUT' if 'PUT' in trade_type else 'SELL CALL'
-                    cursor.execute('''
-                        INSERT INTO cash_flows
-                            (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                        VALUES (?,?,?,?,?,?,?)
-                    ''', (account_id, date_trade_open, cf_type, total_premium,
-                          f'{trade_type} premium received', trade_id, ticker_id))
-                    cf_id = cursor.lastrowid
-                    cursor.execute('UPDATE cost_basis SET cash_flow_id=? WHERE trade_id=? AND cash_flow_id IS NULL',
-                                   (cf_id, trade_id))
-
-                    print(f'[SCHWAB SYNC] OPTION_SELL_OPEN {symbol} {option_type} x{num_contracts} '
-                          f'@ ${premium} strike=${strike_price} exp={expiration_date} needs_review={needs_review}', flush=True)
-                    imported_count += 1
-
-                # ----------------------------------------------------------------
-                # OPTIONS: BUY_TO_CLOSE  →  find existing open STO and mark it
-                #   rolled/closed; record the closing debit on that position
-                # ----------------------------------------------------------------
-                elif category == 'OPTION_BUY_CLOSE':
-                    option_type     = txn.get('option_type', '')
-                    strike_price    = txn.get('strike_price', 0) or 0
-                    expiration_date = txn.get('expiration_date', '') or ''
-                    num_contracts   = txn.get('num_contracts', 1) or 1
-                    closing_price   = txn.get('price_per_share', 0) or 0
-                    total_debit     = round(closing_price * num_contracts * 100, 2)
-
-                    # Try to find the matching open STO to update
-                    cursor.execute('''
-                        SELECT id FROM trades
-                        WHERE ticker=? AND strike_price=? AND expiration_date=?
-                          AND trade_status='open'
-                          AND trade_type NOT LIKE '%BTC%'
-                        ORDER BY date_trade_open DESC LIMIT 1
-                    ''', (symbol, strike_price, expiration_date))
-                    orig_row = cursor.fetchone()
-
-                    if orig_row:
-                        orig_trade_id = orig_row['id']
-                        # Update the existing STO with closing info; roll status
-                        # will be set later if a new STO is opened same day.
-                        # For now mark as 'closed' (will be corrected to 'roll' by
-                        # the roll-detection pass if a continuation exists).
+                            create_options_cost_basis_entry(
+                                cursor, account_id, ticker_id, trade_id, date_trade_open,
+                                trade_type, num_contracts, premium, strike_price, expiration_date,
+                                ticker=symbol
+                            )
+                        except Exception as cbe:
+                            print(f'[SCHWAB SYNC] cost_basis warn for {txn_id}: {cbe}', flush=True)
+
+                        cf_type = 'SELL PUT' if 'PUT' in trade_type else 'SELL CALL'
                         cursor.execute('''
-                            UPDATE trades SET
-                                closing_debit     = ?,
-                                total_debit       = ?,
-                                date_trade_rolled = ?,
-                                trade_status      = 'closed',
-                                needs_review      = 1,
-                                schwab_order_id   = CASE WHEN schwab_order_id IS NULL
-                                                         THEN ? ELSE schwab_order_id END
-                            WHERE id = ?
-                        ''', (closing_price, total_debit, date_trade_open, txn_id, orig_trade_id))
-                        trade_id = orig_trade_id
-                        print(f'[SCHWAB SYNC] OPTION_BUY_CLOSE {symbol} {option_type} '
-                              f'x{num_contracts} @ ${closing_price} — updated trade {orig_trade_id}',
-                              flush=True)
-                    else:
-                        # No matching open STO found — try a broader search ignoring expiration
+                            INSERT INTO cash_flows
+                                (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                            VALUES (?,?,?,?,?,?,?)
+                        ''', (account_id, date_trade_open, cf_type, total_premium,
+                              f'{trade_type} premium received', trade_id, ticker_id))
+                        cf_id = cursor.lastrowid
+                        cursor.execute('UPDATE cost_basis SET cash_flow_id=? WHERE trade_id=? AND cash_flow_id IS NULL',
+                                       (cf_id, trade_id))
+
+                        print(f'[SCHWAB SYNC] OPTION_SELL_OPEN {symbol} {option_type} x{num_contracts} '
+                              f'@ ${premium} strike=${strike_price} exp={expiration_date} needs_review={needs_review}', flush=True)
+                        imported_count += 1
+
+                    # ----------------------------------------------------------------
+                    # OPTIONS: BUY_TO_CLOSE  →  find existing open STO and mark it
+                    #   rolled/closed; record the closing debit on that position
+                    # ----------------------------------------------------------------
+                    elif category == 'OPTION_BUY_CLOSE':
+                        option_type     = txn.get('option_type', '')
+                        strike_price    = txn.get('strike_price', 0) or 0
+                        expiration_date = txn.get('expiration_date', '') or ''
+                        num_contracts   = txn.get('num_contracts', 1) or 1
+                        closing_price   = txn.get('price_per_share', 0) or 0
+                        total_debit     = round(closing_price * num_contracts * 100, 2)
+
+                        # Try to find the matching open STO to update
                         cursor.execute('''
                             SELECT id FROM trades
-                            WHERE ticker=? AND strike_price=?
+                            WHERE ticker=? AND strike_price=? AND expiration_date=?
                               AND trade_status='open'
-                              AND trade_type NOT IN ('BTO','STC')
-                              AND trade_type NOT LIKE '% CLOSE %'
+                              AND trade_type NOT LIKE '%BTC%'
                             ORDER BY date_trade_open DESC LIMIT 1
-                        ''', (symbol, strike_price))
-                        fallback_row = cursor.fetchone()
-
-                        if fallback_row:
-                            orig_trade_id = fallback_row['id']
+                        ''', (symbol, strike_price, expiration_date))
+                        orig_row = cursor.fetchone()
+
+                        if orig_row:
+                            orig_trade_id = orig_row['id']
+                            # Update the existing STO with closing info; roll status
+                            # will be set later if a new STO is opened same day.
+                            # For now mark as 'closed' (will be corrected to 'roll' by
+                            # the roll-detection pass if a continuation exists).
                             cursor.execute('''
                                 UPDATE trades SET
                                     closing_debit     = ?,
@@ -7955,187 +8176,215 @@ def _do_schwab_sync(account_id_override=None, since_override=None, until_overrid
                             ''', (closing_price, total_debit, date_trade_open, txn_id, orig_trade_id))
                             trade_id = orig_trade_id
                             print(f'[SCHWAB SYNC] OPTION_BUY_CLOSE {symbol} {option_type} '
-                                  f'x{num_contracts} @ ${closing_price} — fallback-updated trade {orig_trade_id}',
+                                  f'x{num_contracts} @ ${closing_price} — updated trade {orig_trade_id}',
                                   flush=True)
                         else:
-                            # Still no match — record only the cash flow, no phantom trade
-                            trade_id = None
-                            print(f'[SCHWAB SYNC] OPTION_BUY_CLOSE {symbol} {option_type} '
-                                  f'x{num_contracts} @ ${closing_price} — no STO found, cash flow only',
-                                  flush=True)
-
-                    if total_debit > 0:
-                        cursor.execute('''
-                            INSERT INTO cash_flows
-                                (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
-                            VALUES (?,?,?,?,?,?,?)
-                        ''', (account_id, date_trade_open, 'CLOSING_DEBIT', -total_debit,
-                              f'BTC {symbol} {option_type} closing debit', trade_id, ticker_id))
+                            # No matching open STO found — try a broader search ignoring expiration
+                            cursor.execute('''
+                                SELECT id FROM trades
+                                WHERE ticker=? AND strike_price=?
+                                  AND trade_status='open'
+                                  AND trade_type NOT IN ('BTO','STC')
+                                  AND trade_type NOT LIKE '% CLOSE %'
+                                ORDER BY date_trade_open DESC LIMIT 1
+                            ''', (symbol, strike_price))
+                            fallback_row = cursor.fetchone()
+
+                            if fallback_row:
+                                orig_trade_id = fallback_row['id']
+                                cursor.execute('''
+                                    UPDATE trades SET
+                                        closing_debit     = ?,
+                                        total_debit       = ?,
+                                        date_trade_rolled = ?,
+                                        trade_status      = 'closed',
+                                        needs_review      = 1,
+                                        schwab_order_id   = CASE WHEN schwab_order_id IS NULL
+                                                                 THEN ? ELSE schwab_order_id END
+                                    WHERE id = ?
+                                ''', (closing_price, total_debit, date_trade_open, txn_id, orig_trade_id))
+                                trade_id = orig_trade_id
+                                print(f'[SCHWAB SYNC] OPTION_BUY_CLOSE {symbol} {option_type} '
+                                      f'x{num_contracts} @ ${closing_price} — fallback-updated trade {orig_trade_id}',
+                                      flush=True)
+                            else:
+                                # Still no match — record only the cash flow, no phantom trade
+                                trade_id = None
+                                print(f'[SCHWAB SYNC] OPTION_BUY_CLOSE {symbol} {option_type} '
+                                      f'x{num_contracts} @ ${closing_price} — no STO found, cash flow only',
+                                      flush=True)
 
-                    imported_count += 1
+                        if total_debit > 0:
+                            cursor.execute('''
+                                INSERT INTO cash_flows
+                                    (account_id, transaction_date, transaction_type, amount, description, trade_id, ticker_id)
+                                VALUES (?,?,?,?,?,?,?)
+                            ''', (account_id, date_trade_open, 'CLOSING_DEBIT', -total_debit,
+                                  f'BTC {symbol} {option_type} closing debit', trade_id, ticker_id))
 
-                # ----------------------------------------------------------------
-                # OPTION_ASSIGNED: put/call was assigned → close the open STO
-                #   and link the resulting equity BTO that should follow
-                # ----------------------------------------------------------------
-                elif category == 'OPTION_ASSIGNED':
-                    option_type     = txn.get('option_type', '')
-                    strike_price    = txn.get('strike_price', 0) or 0
-                    expiration_date = txn.get('expiration_date', '') or ''
-                    num_contracts   = txn.get('num_contracts', 1) or 1
+                        imported_count += 1
 
-                    # Find the open STO that matches this assignment
-                    cursor.execute('''
-                        SELECT id FROM trades
-                        WHERE ticker=? AND strike_price=? AND expiration_date=?
-                          AND trade_status='open'
-                          AND trade_type NOT IN ('BTO','STC')
-                        ORDER BY date_trade_open DESC LIMIT 1
-                    ''', (symbol, strike_price, expiration_date))
-                    sto_row = cursor.fetchone()
-                    if sto_row:
-                        sto_id = sto_row['id']
+                    # ----------------------------------------------------------------
+                    # OPTION_ASSIGNED: put/call was assigned → close the open STO
+                    #   and link the resulting equity BTO that should follow
+                    # ----------------------------------------------------------------
+                    elif category == 'OPTION_ASSIGNED':
+                        option_type     = txn.get('option_type', '')
+                        strike_price    = txn.get('strike_price', 0) or 0
+                        expiration_date = txn.get('expiration_date', '') or ''
+                        num_contracts   = txn.get('num_contracts', 1) or 1
+
+                        # Find the open STO that matches this assignment
                         cursor.execute('''
-                            UPDATE trades SET
-                                trade_status      = 'assigned',
-                                date_trade_rolled = ?
-                            WHERE id = ?
-                        ''', (date_trade_open, sto_id))
+                            SELECT id FROM trades
+                            WHERE ticker=? AND strike_price=? AND expiration_date=?
+                              AND trade_status='open'
+                              AND trade_type NOT IN ('BTO','STC')
+                            ORDER BY date_trade_open DESC LIMIT 1
+                        ''', (symbol, strike_price, expiration_date))
+                        sto_row = cursor.fetchone()
+                        if sto_row:
+                            sto_id = sto_row['id']
+                            cursor.execute('''
+                                UPDATE trades SET
+                                    trade_status      = 'assigned',
+                                    date_trade_rolled = ?
+                                WHERE id = ?
+                            ''', (date_trade_open, sto_id))
+
+                            # Find a BTO equity trade on the same date — link it as the assigned shares
+                            cursor.execute('''
+                                SELECT id FROM trades
+                                WHERE ticker=? AND date_trade_open=? AND trade_type='BTO'
+                                  AND (trade_parent_id IS NULL OR trade_parent_id=0)
+                                  AND num_of_shares = ?
+                                ORDER BY id ASC LIMIT 1
+                            ''', (symbol, date_trade_open, num_contracts * 100))
+                            bto_row = cursor.fetchone()
+                            if bto_row:
+                                cursor.execute('UPDATE trades SET trade_parent_id=? WHERE id=?',
+                                               (sto_id, bto_row['id']))
+                                # Update cost_basis description to clearly say ASSIGNED
+                                exp_str = expiration_date[5:7] + '/' + expiration_date[8:10] + '/' + expiration_date[2:4] if len(expiration_date) >= 10 else expiration_date
+                                assigned_desc = f'ASSIGNED {num_contracts * 100} {symbol} @ ${strike_price:.2f} ({option_type} ${strike_price} EXP {exp_str})'
+                                cursor.execute('''
+                                    UPDATE cost_basis SET description=? WHERE trade_id=?
+                                ''', (assigned_desc, bto_row['id']))
+                            print(f'[SCHWAB SYNC] OPTION_ASSIGNED {symbol} {option_type} '
+                                  f'{strike_price} exp {expiration_date} — closed STO {sto_id}'
+                                  + (f', linked BTO {bto_row["id"]}' if bto_row else ''), flush=True)
+
+                    # ----------------------------------------------------------------
+                    # OPTION_EXPIRED: option expired worthless → close the open STO
+                    # ----------------------------------------------------------------
+                    elif category == 'OPTION_EXPIRED':
+                        option_type     = txn.get('option_type', '')
+                        strike_price    = txn.get('strike_price', 0) or 0
+                        expiration_date = txn.get('expiration_date', '') or ''
 
-                        # Find a BTO equity trade on the same date — link it as the assigned shares
                         cursor.execute('''
                             SELECT id FROM trades
-                            WHERE ticker=? AND date_trade_open=? AND trade_type='BTO'
-                              AND (trade_parent_id IS NULL OR trade_parent_id=0)
-                              AND num_of_shares = ?
-                            ORDER BY id ASC LIMIT 1
-                        ''', (symbol, date_trade_open, num_contracts * 100))
-                        bto_row = cursor.fetchone()
-                        if bto_row:
-                            cursor.execute('UPDATE trades SET trade_parent_id=? WHERE id=?',
-                                           (sto_id, bto_row['id']))
-                            # Update cost_basis description to clearly say ASSIGNED
-                            exp_str = expiration_date[5:7] + '/' + expiration_date[8:10] + '/' + expiration_date[2:4] if len(expiration_date) >= 10 else expiration_date
-                            assigned_desc = f'ASSIGNED {num_contracts * 100} {symbol} @ ${strike_price:.2f} ({option_type} ${strike_price} EXP {exp_str})'
+                            WHERE ticker=? AND strike_price=? AND expiration_date=?
+                              AND trade_status='open'
+                              AND trade_type NOT IN ('BTO','STC')
+                            ORDER BY date_trade_open DESC LIMIT 1
+                        ''', (symbol, strike_price, expiration_date))
+                        sto_row = cursor.fetchone()
+                        if sto_row:
+                            sto_id = sto_row['id']
                             cursor.execute('''
-                                UPDATE cost_basis SET description=? WHERE trade_id=?
-                            ''', (assigned_desc, bto_row['id']))
-                        print(f'[SCHWAB SYNC] OPTION_ASSIGNED {symbol} {option_type} '
-                              f'{strike_price} exp {expiration_date} — closed STO {sto_id}'
-                              + (f', linked BTO {bto_row["id"]}' if bto_row else ''), flush=True)
-
-                # ----------------------------------------------------------------
-                # OPTION_EXPIRED: option expired worthless → close the open STO
-                # ----------------------------------------------------------------
-                elif category == 'OPTION_EXPIRED':
-                    option_type     = txn.get('option_type', '')
-                    strike_price    = txn.get('strike_price', 0) or 0
-                    expiration_date = txn.get('expiration_date', '') or ''
+                                UPDATE trades SET trade_status='closed', date_trade_rolled=?,
+                                    closing_debit=0, total_debit=0
+                                WHERE id=?
+                            ''', (date_trade_open, sto_id))
+                            print(f'[SCHWAB SYNC] OPTION_EXPIRED {symbol} {option_type} '
+                                  f'{strike_price} exp {expiration_date} — closed STO {sto_id}', flush=True)
+
+                    # ----------------------------------------------------------------
+                    # Everything else: insert with needs_review=1
+                    # ----------------------------------------------------------------
+                    else:
+                        price           = txn.get('price_per_share', 0) or 0
+                        qty_shares      = int(txn.get('num_shares', 0) or 0)
+                        qty_ctrcts      = int(txn.get('num_contracts', 0) or 0)
+                        exp_date_misc   = txn.get('expiration_date', '') or ''
+                        label           = f'{symbol} {txn.get("instruction","")} {txn.get("option_type","")}'.strip()
 
-                    cursor.execute('''
-                        SELECT id FROM trades
-                        WHERE ticker=? AND strike_price=? AND expiration_date=?
-                          AND trade_status='open'
-                          AND trade_type NOT IN ('BTO','STC')
-                        ORDER BY date_trade_open DESC LIMIT 1
-                    ''', (symbol, strike_price, expiration_date))
-                    sto_row = cursor.fetchone()
-                    if sto_row:
-                        sto_id = sto_row['id']
+                        total_amt_misc = round(price * (qty_shares or qty_ctrcts), 2)
                         cursor.execute('''
-                            UPDATE trades SET trade_status='closed', date_trade_rolled=?,
-                                closing_debit=0, total_debit=0
-                            WHERE id=?
-                        ''', (date_trade_open, sto_id))
-                        print(f'[SCHWAB SYNC] OPTION_EXPIRED {symbol} {option_type} '
-                              f'{strike_price} exp {expiration_date} — closed STO {sto_id}', flush=True)
+                            INSERT INTO trades
+                                (account_id, ticker_id, ticker, date_trade_open, expiration_date,
+                                 num_of_shares, num_of_contracts,
+                                 current_price, price_per_share, total_amount, total_premium,
+                                 credit_debit, trade_status, trade_type,
+                                 commission_per_share, schwab_order_id,
+                                 strike_price, long_strike, margin_percent,
+                                 days_to_expiration, needs_review)
+                            VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,0,NULL,100,0,1)
+                        ''', (
+                            account_id, ticker_id, symbol, date_trade_open, exp_date_misc,
+                            qty_shares or qty_ctrcts * 100, qty_ctrcts or qty_shares,
+                            price, price, total_amt_misc, total_amt_misc,
+                            0.0, 'open', label,
+                            commission, txn_id,
+                        ))
+                        imported_count += 1
+                        print(f'[SCHWAB SYNC] UNKNOWN {symbol} {category} — flagged for review', flush=True)
 
-                # ----------------------------------------------------------------
-                # Everything else: insert with needs_review=1
-                # ----------------------------------------------------------------
-                else:
-                    price           = txn.get('price_per_share', 0) or 0
-                    qty_shares      = int(txn.get('num_shares', 0) or 0)
-                    qty_ctrcts      = int(txn.get('num_contracts', 0) or 0)
-                    exp_date_misc   = txn.get('expiration_date', '') or ''
-                    label           = f'{symbol} {txn.get("instruction","")} {txn.get("option_type","")}'.strip()
+                except Exception as e:
+                    import traceback
+                    errors.append(f'Error importing txn {txn_id} ({category}): {str(e)}')
+                    print(f'[SCHWAB SYNC] Error: {e}\n{traceback.format_exc()}', flush=True)
 
-                    total_amt_misc = round(price * (qty_shares or qty_ctrcts), 2)
+            # ----------------------------------------------------------------
+            # Roll-detection pass: for each closed STO, find an STO opened
+            # on the same day for the same ticker with no parent yet → link it.
+            # ----------------------------------------------------------------
+            try:
+                cursor.execute('''
+                    SELECT id, ticker, expiration_date, strike_price, date_trade_open
+                    FROM trades
+                    WHERE trade_status = 'closed'
+                      AND closing_debit > 0
+                      AND trade_type NOT IN ('BTO', 'STC')
+                      AND (trade_parent_id IS NULL OR trade_parent_id = 0)
+                    ORDER BY date_trade_open
+                ''')
+                closed_stos = cursor.fetchall()
+                for cst in closed_stos:
+                    cst_id   = cst[0]
+                    ticker_c = cst[1]
+                    close_dt = cst[4]  # the date the BTC was executed (= date_trade_open of the closing row)
+
+                    # Find a new STO opened on the same date for same ticker with no parent
                     cursor.execute('''
-                        INSERT INTO trades
-                            (account_id, ticker_id, ticker, date_trade_open, expiration_date,
-                             num_of_shares, num_of_contracts,
-                             current_price, price_per_share, total_amount, total_premium,
-                             credit_debit, trade_status, trade_type,
-                             commission_per_share, schwab_order_id,
-                             strike_price, long_strike, margin_percent,
-                             days_to_expiration, needs_review)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,0,NULL,100,0,1)
-                    ''', (
-                        account_id, ticker_id, symbol, date_trade_open, exp_date_misc,
-                        qty_shares or qty_ctrcts * 100, qty_ctrcts or qty_shares,
-                        price, price, total_amt_misc, total_amt_misc,
-                        0.0, 'open', label,
-                        commission, txn_id,
-                    ))
-                    imported_count += 1
-                    print(f'[SCHWAB SYNC] UNKNOWN {symbol} {category} — flagged for review', flush=True)
-
+                        SELECT id FROM trades
+                        WHERE ticker = ?
+                          AND date_trade_open = ?
+                          AND (trade_parent_id IS NULL OR trade_parent_id = 0)
+                          AND trade_status IN ('open', 'closed', 'roll')
+                          AND trade_type NOT IN ('BTO', 'STC')
+                          AND id != ?
+                        ORDER BY id ASC
+                        LIMIT 1
+                    ''', (ticker_c, close_dt, cst_id))
+                    new_sto = cursor.fetchone()
+                    if new_sto:
+                        new_sto_id = new_sto[0]
+                        cursor.execute(
+                            'UPDATE trades SET trade_parent_id = ? WHERE id = ?',
+                            (cst_id, new_sto_id)
+                        )
+                        cursor.execute(
+                            "UPDATE trades SET trade_status = 'roll' WHERE id = ?",
+                            (cst_id,)
+                        )
+                        print(f'[SCHWAB SYNC] Roll detected: trade {cst_id} ({ticker_c}) → continuation {new_sto_id}', flush=True)
             except Exception as e:
                 import traceback
-                errors.append(f'Error importing txn {txn_id} ({category}): {str(e)}')
-                print(f'[SCHWAB SYNC] Error: {e}\n{traceback.format_exc()}', flush=True)
-
-        # ----------------------------------------------------------------
-        # Roll-detection pass: for each closed STO, find an STO opened
-        # on the same day for the same ticker with no parent yet → link it.
-        # ----------------------------------------------------------------
-        try:
-            cursor.execute('''
-                SELECT id, ticker, expiration_date, strike_price, date_trade_open
-                FROM trades
-                WHERE trade_status = 'closed'
-                  AND closing_debit > 0
-                  AND trade_type NOT IN ('BTO', 'STC')
-                  AND (trade_parent_id IS NULL OR trade_parent_id = 0)
-                ORDER BY date_trade_open
-            ''')
-            closed_stos = cursor.fetchall()
-            for cst in closed_stos:
-                cst_id   = cst[0]
-                ticker_c = cst[1]
-                close_dt = cst[4]  # the date the BTC was executed (= date_trade_open of the closing row)
-
-                # Find a new STO opened on the same date for same ticker with no parent
-                cursor.execute('''
-                    SELECT id FROM trades
-                    WHERE ticker = ?
-                      AND date_trade_open = ?
-                      AND (trade_parent_id IS NULL OR trade_parent_id = 0)
-                      AND trade_status IN ('open', 'closed', 'roll')
-                      AND trade_type NOT IN ('BTO', 'STC')
-                      AND id != ?
-                    ORDER BY id ASC
-                    LIMIT 1
-                ''', (ticker_c, close_dt, cst_id))
-                new_sto = cursor.fetchone()
-                if new_sto:
-                    new_sto_id = new_sto[0]
-                    cursor.execute(
-                        'UPDATE trades SET trade_parent_id = ? WHERE id = ?',
-                        (cst_id, new_sto_id)
-                    )
-                    cursor.execute(
-                        "UPDATE trades SET trade_status = 'roll' WHERE id = ?",
-                        (cst_id,)
-                    )
-                    print(f'[SCHWAB SYNC] Roll detected: trade {cst_id} ({ticker_c}) → continuation {new_sto_id}', flush=True)
-        except Exception as e:
-            import traceback
-            print(f'[SCHWAB SYNC] Roll detection error: {e}\n{traceback.format_exc()}', flush=True)
+                print(f'[SCHWAB SYNC] Roll detection error: {e}\n{traceback.format_exc()}', flush=True)
 
-        conn.commit()
-        conn.close()
+            conn.commit()
         _setting_set('schwab_last_sync', datetime.now().isoformat())
 
     except Exception as e:
@@ -8246,47 +8495,45 @@ def schwab_sync_status():
 @app.route('/api/schwab/detect-rolls', methods=['POST'])
 def schwab_detect_rolls():
     """Run roll-detection pass on existing data to link roll chains."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     linked = 0
-    try:
-        cursor.execute('''
-            SELECT id, ticker, expiration_date, strike_price, date_trade_open
-            FROM trades
-            WHERE trade_status = 'closed'
-              AND closing_debit > 0
-              AND trade_type NOT IN ('BTO', 'STC')
-            ORDER BY date_trade_open
-        ''')
-        closed_stos = cursor.fetchall()
-        for cst in closed_stos:
-            cst_id   = cst[0]
-            ticker_c = cst[1]
-            close_dt = cst[4]
-
+    with get_db() as conn:
+        cursor = conn.cursor()
+        try:
             cursor.execute('''
-                SELECT id FROM trades
-                WHERE ticker = ?
-                  AND date_trade_open = ?
-                  AND (trade_parent_id IS NULL OR trade_parent_id = 0)
-                  AND trade_status IN ('open', 'closed', 'roll')
+                SELECT id, ticker, expiration_date, strike_price, date_trade_open
+                FROM trades
+                WHERE trade_status = 'closed'
+                  AND closing_debit > 0
                   AND trade_type NOT IN ('BTO', 'STC')
-                  AND id != ?
-                ORDER BY id ASC
-                LIMIT 1
-            ''', (ticker_c, close_dt, cst_id))
-            new_sto = cursor.fetchone()
-            if new_sto:
-                new_sto_id = new_sto[0]
-                cursor.execute('UPDATE trades SET trade_parent_id = ? WHERE id = ?', (cst_id, new_sto_id))
-                cursor.execute("UPDATE trades SET trade_status = 'roll' WHERE id = ?", (cst_id,))
-                linked += 1
-        conn.commit()
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'success': False, 'error': str(e)}), 500
-    finally:
-        conn.close()
+                ORDER BY date_trade_open
+            ''')
+            closed_stos = cursor.fetchall()
+            for cst in closed_stos:
+                cst_id   = cst[0]
+                ticker_c = cst[1]
+                close_dt = cst[4]
+
+                cursor.execute('''
+                    SELECT id FROM trades
+                    WHERE ticker = ?
+                      AND date_trade_open = ?
+                      AND (trade_parent_id IS NULL OR trade_parent_id = 0)
+                      AND trade_status IN ('open', 'closed', 'roll')
+                      AND trade_type NOT IN ('BTO', 'STC')
+                      AND id != ?
+                    ORDER BY id ASC
+                    LIMIT 1
+                ''', (ticker_c, close_dt, cst_id))
+                new_sto = cursor.fetchone()
+                if new_sto:
+                    new_sto_id = new_sto[0]
+                    cursor.execute('UPDATE trades SET trade_parent_id = ? WHERE id = ?', (cst_id, new_sto_id))
+                    cursor.execute("UPDATE trades SET trade_status = 'roll' WHERE id = ?", (cst_id,))
+                    linked += 1
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return jsonify({'success': False, 'error': str(e)}), 500
     return jsonify({'success': True, 'rolls_linked': linked})
 
 
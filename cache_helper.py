@@ -0,0 +1,74 @@
+"""
+In-process response cache for small, rarely-changing GET endpoints.
+
+Mirrors the SimpleCache backend of Flask-Caching (per-process, TTL based) without
+adding a dependency. Views are cached by key prefix, optionally varied by query
+string, and write handlers drop every entry under a prefix with delete().
+"""
+from functools import wraps
+import threading
+import time
+from flask import request, Response
+
+DEFAULT_TIMEOUT = 60
+
+class ResponseCache:
+    """Thread-safe TTL cache of successful view responses"""
+
+    def __init__(self, default_timeout: int = DEFAULT_TIMEOUT):
+        self.default_timeout = default_timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires_at = time.monotonic() + (timeout or self.default_timeout)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+
+    def delete(self, prefix):
+        """Drop every entry cached under prefix (all query-string variants)"""
+        with self._lock:
+            for key in [k for k in self._entries if k == prefix or k.startswith(prefix + '?')]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def cached(self, key_prefix, timeout=None, query_string=False):
+        """
+        Cache a view's 200 responses under key_prefix.
+        With query_string=True each distinct query string (e.g. ?account_id=9) gets its own entry.
+        Only the body, status and mimetype are stored; a fresh Response is built per hit.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = key_prefix
+                if query_string:
+                    key += '?' + '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+                hit = self.get(key)
+                if hit is not None:
+                    body, mimetype = hit
+                    return Response(body, status=200, mimetype=mimetype)
+
+                rv = view(*args, **kwargs)
+                if isinstance(rv, Response) and rv.status_code == 200 and not rv.is_streamed:
+                    self.set(key, (rv.get_data(), rv.mimetype), timeout)
+                return rv
+            return wrapper
+        return decorator
+
+# Shared instance used by the app's views
+response_cache = ResponseCache()
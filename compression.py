@@ -0,0 +1,58 @@
+"""
+gzip Content-Encoding for JSON responses.
+
+The trade list, cost basis and bankroll payloads are repetitive JSON that shrinks
+several times under gzip. gzip_response() is registered as an after_request hook and
+compresses JSON responses for clients that accept gzip. Streamed responses (such as
+/api/trades) are compressed chunk by chunk, so they keep streaming. A strong ETag is
+made weak, because the bytes sent no longer match the ones it was computed from.
+Werkzeug matches If-None-Match weakly, so 304 Not Modified keeps working.
+"""
+import zlib
+from flask import request
+
+# Bodies smaller than this are sent as they are (gzip framing would outweigh the saving)
+COMPRESS_MIN_SIZE = 500
+COMPRESS_LEVEL = 6
+# zlib wbits for a gzip (not raw deflate) stream
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+def _gzip_stream(chunks):
+    """Compress an iterable of str/bytes chunks into a gzip stream"""
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+    try:
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def gzip_response(response):
+    """after_request hook: gzip a successful JSON response when the client accepts it"""
+    if response.mimetype != 'application/json':
+        return response
+    response.vary.add('Accept-Encoding')
+    if (not 200 <= response.status_code < 300
+            or response.direct_passthrough
+            or 'Content-Encoding' in response.headers
+            or not request.accept_encodings['gzip']):
+        return response
+
+    if response.is_streamed:
+        response.response = _gzip_stream(response.response)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, _GZIP_WBITS)
+        response.set_data(compressor.compress(data) + compressor.flush())
+
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
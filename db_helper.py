@@ -5,12 +5,73 @@ while maintaining raw SQL queries for maximum flexibility.
 from sqlalchemy import create_engine, text, pool
 from sqlalchemy.engine import Engine
 from contextlib import contextmanager
+import queue
 import sqlite3
+import time
 from typing import Optional, List, Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Per-connection PRAGMAs applied to every new connection.
+# journal_mode=WAL is persistent in the database file, so it is switched once
+# (see DatabaseHelper._ensure_wal / init_db) rather than on every connect.
+CONNECTION_PRAGMAS = (
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA synchronous=NORMAL',       # safe under WAL, one fsync per checkpoint instead of per commit
+    'PRAGMA wal_autocheckpoint=1000',  # checkpoint the WAL back into the database every 1000 pages
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',      # 256 MB memory-mapped reads
+    'PRAGMA cache_size=-65536',        # 64 MB page cache (negative = KiB)
+    'PRAGMA analysis_limit=400',       # rows sampled per index by ANALYZE, keeps PRAGMA optimize cheap
+)
+
+# Get-or-create a ticker in one statement (tickers are always stored upper-case).
+# The no-op DO UPDATE makes RETURNING yield the existing row's id on conflict.
+UPSERT_TICKER_SQL = '''
+    INSERT INTO tickers (ticker, company_name) VALUES (:ticker, :company_name)
+    ON CONFLICT (ticker) DO UPDATE SET ticker = excluded.ticker
+    RETURNING id
+'''
+
+# Trade columns returned by get_trade()/get_trades_filtered(), i.e. the fields the UI reads.
+# Internal keys (ticker_id, trade_type_id, schwab_order_id, is_options) and unused legacy
+# columns (date_trade_closed, total_premium) are left out; the symbol comes from tickers.
+TRADE_COLUMNS = '''
+    st.id, st.account_id, st.date_trade_open, st.expiration_date, st.date_trade_rolled,
+    st.num_of_contracts, st.num_of_shares, st.shares, st.credit_debit, st.days_to_expiration,
+    st.current_price, st.strike_price, st.long_strike, st.trade_status, st.trade_type,
+    st.commission_per_share, st.price_per_share, st.total_amount, st.margin_capital,
+    st.net_credit_per_share, st.risk_capital_per_share, st.margin_percent, st.ARORC,
+    st.trade_parent_id, st.closing_debit, st.total_debit, st.notes, st.needs_review, st.created_at
+'''
+
+# Number of idle sqlite3 connections kept open for reuse by connection()
+POOL_SIZE = 8
+
+# Prepared statements kept per connection (sqlite3 default is 128); pooled
+# connections live across requests, so repeated SQL skips parse/plan. Sized for the
+# app's distinct statements, since one pooled connection serves every endpoint.
+STATEMENT_CACHE_SIZE = 512
+
+# Seconds between PRAGMA optimize runs on pooled connections (see DatabaseHelper._maybe_optimize)
+OPTIMIZE_INTERVAL = 3600
+
+def rows_to_dicts(cursor) -> List[Dict[str, Any]]:
+    """
+    Fetch all remaining rows from cursor as plain dicts
+    
+    Reads the column names from cursor.description once and zips each row against
+    them, instead of dict(sqlite3.Row), which looks every column up by name per row.
+    """
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def apply_connection_pragmas(conn):
+    """Apply the tuned per-connection PRAGMAs to a raw sqlite3 connection"""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
 class DatabaseHelper:
     """Database helper using SQLAlchemy Core for connection pooling"""
     
@@ -22,10 +83,15 @@ class DatabaseHelper:
             database_path: Path to SQLite database file
         """
         self.database_path = database_path
+        self._wal_enabled = False
+        # First run when the first connection is returned, then every OPTIMIZE_INTERVAL
+        self._next_optimize = 0.0
+        # LIFO so the most recently used (warmest page cache) connection is reused first
+        self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
         # Create engine with connection pooling
         # SQLite doesn't support true connection pooling, but we get better error handling
         def _set_pragmas(conn, _):
-            conn.execute('PRAGMA busy_timeout=5000')
+            apply_connection_pragmas(conn)
 
         from sqlalchemy import event
         self.engine = create_engine(
@@ -56,15 +122,90 @@ class DatabaseHelper:
         """
         Get a raw sqlite3 connection (for backward compatibility)
         
+        The caller owns the connection and must close it. Prefer connection()
+        for new code so the connection is returned to the pool instead.
+        
         Returns:
             sqlite3.Connection with row_factory set to sqlite3.Row
         """
-        conn = sqlite3.connect(self.database_path, timeout=10)
-        conn.execute('PRAGMA journal_mode=WAL')
-        conn.execute('PRAGMA busy_timeout=5000')
+        return self._new_connection()
+    
+    def _new_connection(self):
+        """Open a sqlite3 connection with the tuned PRAGMAs and Row factory"""
+        conn = sqlite3.connect(self.database_path, timeout=10, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        self._ensure_wal(conn)
+        apply_connection_pragmas(conn)
         conn.row_factory = sqlite3.Row
         return conn
     
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a pooled sqlite3 connection for the duration of a with-block
+        
+        Avoids re-opening trades.db (and its -wal/-shm files) on every request.
+        Any transaction left open by the caller is rolled back before the
+        connection goes back to the pool, so a failed handler cannot hold the
+        write lock for the next borrower.
+        
+        Usage:
+            with db_helper.connection() as conn:
+                conn.execute('SELECT * FROM trades')
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_connection()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+    
+    def _release(self, conn):
+        """Return a borrowed connection to the pool, closing it if the pool is full"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._maybe_optimize(conn)
+            self._pool.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            conn.close()
+    
+    def _maybe_optimize(self, conn):
+        """
+        Run PRAGMA optimize at most once per OPTIMIZE_INTERVAL across the pool
+        
+        This is SQLite's recommended upkeep for long-lived connections. It re-ANALYZEs
+        only tables whose statistics are missing or stale for the queries this
+        connection has run, so the planner keeps choosing the composite indexes as
+        trades and cost_basis grow.
+        """
+        now = time.monotonic()
+        if now < self._next_optimize:
+            return
+        self._next_optimize = now + OPTIMIZE_INTERVAL
+        try:
+            conn.execute('PRAGMA optimize')
+        except sqlite3.Error as e:
+            # Statistics are only a planner hint; never fail the request over them
+            logger.warning(f'PRAGMA optimize failed: {e}')
+    
+    def _ensure_wal(self, conn):
+        """
+        Switch the database to WAL journaling once per process.
+        
+        WAL lets readers proceed while a write is in progress and roughly halves
+        fsync cost per commit. The mode is stored in the database file, so later
+        connections inherit it without re-issuing the PRAGMA.
+        """
+        if self._wal_enabled:
+            return
+        mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+        if mode.lower() != 'wal':
+            logger.warning(f'Could not enable WAL journal mode (got {mode})')
+        self._wal_enabled = True
+    
     def execute_query(self, query: str, params: Optional[Dict] = None) -> List[Dict[str, Any]]:
         """
         Execute a SELECT query and return results as list of dicts
@@ -76,15 +217,9 @@ class DatabaseHelper:
         Returns:
             List of dictionaries (one per row)
         """
-        with self.get_connection() as conn:
-            if params:
-                result = conn.execute(text(query), params)
-            else:
-                result = conn.execute(text(query))
-            
-            # Convert to list of dicts
-            rows = result.fetchall()
-            return [dict(row._mapping) for row in rows]
+        with self.connection() as conn:
+            cursor = conn.execute(query, params or {})
+            return rows_to_dicts(cursor)
     
     def execute_one(self, query: str, params: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
         """
@@ -111,13 +246,10 @@ class DatabaseHelper:
         Returns:
             Number of rows affected
         """
-        with self.get_connection() as conn:
-            if params:
-                result = conn.execute(text(query), params)
-            else:
-                result = conn.execute(text(query))
+        with self.connection() as conn:
+            cursor = conn.execute(query, params or {})
             conn.commit()
-            return result.rowcount
+            return cursor.rowcount
     
     def execute_script(self, script: str):
         """
@@ -141,14 +273,10 @@ class DatabaseHelper:
         Returns:
             ID of inserted row
         """
-        with self.get_connection() as conn:
-            if params:
-                result = conn.execute(text(query), params)
-            else:
-                result = conn.execute(text(query))
+        with self.connection() as conn:
+            cursor = conn.execute(query, params or {})
             conn.commit()
-            # Get lastrowid from result
-            return result.lastrowid
+            return cursor.lastrowid
     
     # Query helper methods for common patterns
     
@@ -173,8 +301,8 @@ class DatabaseHelper:
     
     def get_trade(self, trade_id: int) -> Optional[Dict[str, Any]]:
         """Get a single trade by ID with all joined related data (ticker, account, trade_type)"""
-        return self.execute_one('''
-            SELECT st.*, t.ticker, t.company_name, tt.type_name, a.account_name
+        return self.execute_one(f'''
+            SELECT {TRADE_COLUMNS}, t.ticker, t.company_name, tt.type_name, a.account_name
             FROM trades st 
             JOIN tickers t ON st.ticker_id = t.id 
             LEFT JOIN trade_types tt ON st.trade_type_id = tt.id
@@ -199,10 +327,10 @@ class DatabaseHelper:
             end_date: Filter trades on or before this date
         
         Returns:
-            List of trade dictionaries
+            List of trade dictionaries (including the generated shares column)
         """
-        query = '''
-            SELECT st.*, s.ticker, s.company_name, tt.type_name, a.account_name
+        query = f'''
+            SELECT {TRADE_COLUMNS}, s.ticker, s.company_name, tt.type_name, a.account_name
             FROM trades st 
             JOIN tickers s ON st.ticker_id = s.id 
             LEFT JOIN trade_types tt ON st.trade_type_id = tt.id
@@ -304,17 +432,13 @@ class DatabaseHelper:
         Returns:
             Ticker ID
         """
-        existing = self.get_ticker(ticker)
-        if existing:
-            return existing['id']
-        
-        # Create new ticker
-        company_name = company_name or ticker.upper()
-        ticker_id = self.execute_insert(
-            'INSERT INTO tickers (ticker, company_name) VALUES (:ticker, :company_name)',
-            {'ticker': ticker.upper(), 'company_name': company_name}
-        )
-        return ticker_id
+        with self.connection() as conn:
+            row = conn.execute(
+                UPSERT_TICKER_SQL,
+                {'ticker': ticker.upper(), 'company_name': company_name or ticker.upper()}
+            ).fetchone()
+            conn.commit()
+            return row['id']
     
     # Cache management methods
     
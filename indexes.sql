@@ -4,21 +4,15 @@
 -- ============================================================================
 -- TRADES TABLE INDEXES
 -- ============================================================================
--- Filter by account (most common filter)
-CREATE INDEX IF NOT EXISTS idx_trades_account ON trades(account_id);
-
 -- Filter by status (very common in queries)
 CREATE INDEX IF NOT EXISTS idx_trades_status ON trades(status);
 
--- Filter by ticker (for JOINs and filtering)
-CREATE INDEX IF NOT EXISTS idx_trades_ticker ON trades(ticker_id);
+-- Composite: ticker + trade date (for JOINs, filtering and per-ticker date ranges)
+CREATE INDEX IF NOT EXISTS idx_trades_ticker_date ON trades(ticker_id, date_trade_open);
 
 -- Filter by trade date ranges (very common)
 CREATE INDEX IF NOT EXISTS idx_trades_date_trade_open ON trades(date_trade_open);
 
--- Composite: account + status (common query pattern)
-CREATE INDEX IF NOT EXISTS idx_trades_account_status ON trades(account_id, status);
-
 -- Composite: account + trade date (for date filtering per account)
 CREATE INDEX IF NOT EXISTS idx_trades_account_date ON trades(account_id, date_trade_open);
 
@@ -34,35 +28,32 @@ CREATE INDEX IF NOT EXISTS idx_trades_account_status_date ON trades(account_id,
 -- ============================================================================
 -- COST_BASIS TABLE INDEXES
 -- ============================================================================
--- Filter by ticker and account (most common queries)
-CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_account ON cost_basis(ticker_id, account_id);
-
 -- Sort by transaction date (chronological order for running totals)
 CREATE INDEX IF NOT EXISTS idx_cost_basis_transaction_date ON cost_basis(transaction_date);
 
 -- Filter by account
 CREATE INDEX IF NOT EXISTS idx_cost_basis_account ON cost_basis(account_id);
 
--- Filter by ticker
-CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker ON cost_basis(ticker_id);
-
 -- Composite: ticker + account + date (for chronological queries)
 CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_account_date ON cost_basis(ticker_id, account_id, transaction_date);
 
+-- Composite: ticker + date (one ticker's entries across accounts, in date order)
+CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_date ON cost_basis(ticker_id, transaction_date);
+
+-- Filter by trade_id (entries for a trade being edited or deleted)
+CREATE INDEX IF NOT EXISTS idx_cost_basis_trade ON cost_basis(trade_id);
+
 -- ============================================================================
 -- CASH_FLOWS TABLE INDEXES
 -- ============================================================================
--- Filter by account (very common)
-CREATE INDEX IF NOT EXISTS idx_cash_flows_account ON cash_flows(account_id);
-
--- Filter by transaction type
-CREATE INDEX IF NOT EXISTS idx_cash_flows_type ON cash_flows(transaction_type);
+-- Composite: type + date, covering amount (daily OPTIONS premium for the chart and summary)
+CREATE INDEX IF NOT EXISTS idx_cash_flows_type_date ON cash_flows(transaction_type, transaction_date, amount);
 
 -- Filter by transaction date (date ranges)
 CREATE INDEX IF NOT EXISTS idx_cash_flows_date ON cash_flows(transaction_date);
 
--- Composite: account + date (common query pattern)
-CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date ON cash_flows(account_id, transaction_date);
+-- Composite: account + date + created_at (an account's cash flows by date, newest first)
+CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date_created ON cash_flows(account_id, transaction_date, created_at);
 
 -- Composite: account + type (for summaries)
 CREATE INDEX IF NOT EXISTS idx_cash_flows_account_type ON cash_flows(account_id, transaction_type);
@@ -70,21 +61,18 @@ CREATE INDEX IF NOT EXISTS idx_cash_flows_account_type ON cash_flows(account_id,
 -- Filter by ticker (for ticker-specific cash flows)
 CREATE INDEX IF NOT EXISTS idx_cash_flows_ticker ON cash_flows(ticker_id);
 
+-- Filter by trade_id (cash flows for a trade being edited or deleted)
+CREATE INDEX IF NOT EXISTS idx_cash_flows_trade ON cash_flows(trade_id);
+
 -- ============================================================================
 -- COMMISSIONS TABLE INDEXES
 -- ============================================================================
 -- Composite: account + effective_date (for lookup by date)
 CREATE INDEX IF NOT EXISTS idx_commissions_account_date ON commissions(account_id, effective_date);
 
--- Filter by account
-CREATE INDEX IF NOT EXISTS idx_commissions_account ON commissions(account_id);
-
 -- ============================================================================
 -- BANKROLL TABLE INDEXES
 -- ============================================================================
--- Filter by account
-CREATE INDEX IF NOT EXISTS idx_bankroll_account ON bankroll(account_id);
-
 -- Filter by transaction date
 CREATE INDEX IF NOT EXISTS idx_bankroll_date ON bankroll(transaction_date);
 
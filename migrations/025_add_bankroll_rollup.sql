@@ -0,0 +1,73 @@
+-- Migration 025: Materialize per-day bankroll aggregates for /api/bankroll-summary
+-- mv_bankroll_daily holds one row per (account, trade date, trade type, status) with the
+-- signed premium, margin capital and trade count. Triggers on trades keep it current, so
+-- the bankroll summary aggregates a handful of roll-up rows instead of scanning trades.
+-- NULL account_id / trade_status are stored as 0 / '' so they still merge on the key.
+
+CREATE TABLE IF NOT EXISTS mv_bankroll_daily (
+    account_id INTEGER NOT NULL,
+    trade_date TEXT NOT NULL,
+    trade_type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    premium_sum REAL NOT NULL DEFAULT 0,
+    margin_capital_sum REAL NOT NULL DEFAULT 0,
+    cnt INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (account_id, trade_date, trade_type, status)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_daily_insert AFTER INSERT ON trades
+BEGIN
+    INSERT INTO mv_bankroll_daily (account_id, trade_date, trade_type, status, premium_sum, margin_capital_sum, cnt)
+    VALUES (IFNULL(NEW.account_id, 0), NEW.date_trade_open, NEW.trade_type, IFNULL(NEW.trade_status, ''),
+            CASE WHEN NEW.trade_type = 'SELL' THEN NEW.credit_debit ELSE -NEW.credit_debit END,
+            IFNULL(NEW.margin_capital, 0), 1)
+    ON CONFLICT (account_id, trade_date, trade_type, status) DO UPDATE SET
+        premium_sum = premium_sum + excluded.premium_sum,
+        margin_capital_sum = margin_capital_sum + excluded.margin_capital_sum,
+        cnt = cnt + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_daily_delete AFTER DELETE ON trades
+BEGIN
+    UPDATE mv_bankroll_daily SET
+        premium_sum = premium_sum - CASE WHEN OLD.trade_type = 'SELL' THEN OLD.credit_debit ELSE -OLD.credit_debit END,
+        margin_capital_sum = margin_capital_sum - IFNULL(OLD.margin_capital, 0),
+        cnt = cnt - 1
+    WHERE account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+    DELETE FROM mv_bankroll_daily
+    WHERE cnt <= 0 AND account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_daily_update
+AFTER UPDATE OF account_id, date_trade_open, trade_type, trade_status, credit_debit, margin_capital ON trades
+BEGIN
+    UPDATE mv_bankroll_daily SET
+        premium_sum = premium_sum - CASE WHEN OLD.trade_type = 'SELL' THEN OLD.credit_debit ELSE -OLD.credit_debit END,
+        margin_capital_sum = margin_capital_sum - IFNULL(OLD.margin_capital, 0),
+        cnt = cnt - 1
+    WHERE account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+    DELETE FROM mv_bankroll_daily
+    WHERE cnt <= 0 AND account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+    INSERT INTO mv_bankroll_daily (account_id, trade_date, trade_type, status, premium_sum, margin_capital_sum, cnt)
+    VALUES (IFNULL(NEW.account_id, 0), NEW.date_trade_open, NEW.trade_type, IFNULL(NEW.trade_status, ''),
+            CASE WHEN NEW.trade_type = 'SELL' THEN NEW.credit_debit ELSE -NEW.credit_debit END,
+            IFNULL(NEW.margin_capital, 0), 1)
+    ON CONFLICT (account_id, trade_date, trade_type, status) DO UPDATE SET
+        premium_sum = premium_sum + excluded.premium_sum,
+        margin_capital_sum = margin_capital_sum + excluded.margin_capital_sum,
+        cnt = cnt + 1;
+END;
+
+-- Populate from existing trades
+DELETE FROM mv_bankroll_daily;
+INSERT INTO mv_bankroll_daily (account_id, trade_date, trade_type, status, premium_sum, margin_capital_sum, cnt)
+SELECT IFNULL(account_id, 0), date_trade_open, trade_type, IFNULL(trade_status, ''),
+       SUM(CASE WHEN trade_type = 'SELL' THEN credit_debit ELSE -credit_debit END),
+       SUM(IFNULL(margin_capital, 0)),
+       COUNT(*)
+FROM trades
+GROUP BY IFNULL(account_id, 0), date_trade_open, trade_type, IFNULL(trade_status, '');
@@ -0,0 +1,60 @@
+-- Migration 026: Flag options trades that tie up margin capital with a generated column
+-- is_options replaces the leading-wildcard trade_type LIKE chain used by the bankroll
+-- summary, so the predicate is evaluated once per row write instead of per query and
+-- can be served by an index. Requires SQLite 3.31+ (generated columns).
+
+ALTER TABLE trades ADD COLUMN is_options INTEGER GENERATED ALWAYS AS (
+    trade_type NOT IN ('BTO', 'STC') AND (
+        trade_type LIKE '%ROCT PUT' OR trade_type LIKE '%ROCT CALL' OR trade_type LIKE 'ROCT%'
+        OR trade_type LIKE 'BTO CALL' OR trade_type LIKE 'STC CALL'
+    )
+) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_trades_options_bk ON trades(account_id, is_options, trade_status, date_trade_open);
+
+-- Carry the flag into the bankroll roll-up so the summary filters on it directly
+ALTER TABLE mv_bankroll_daily ADD COLUMN is_options INTEGER NOT NULL DEFAULT 0;
+
+UPDATE mv_bankroll_daily SET is_options = (
+    trade_type NOT IN ('BTO', 'STC') AND (
+        trade_type LIKE '%ROCT PUT' OR trade_type LIKE '%ROCT CALL' OR trade_type LIKE 'ROCT%'
+        OR trade_type LIKE 'BTO CALL' OR trade_type LIKE 'STC CALL'
+    )
+);
+
+DROP TRIGGER IF EXISTS trg_mv_bankroll_daily_insert;
+DROP TRIGGER IF EXISTS trg_mv_bankroll_daily_update;
+
+CREATE TRIGGER trg_mv_bankroll_daily_insert AFTER INSERT ON trades
+BEGIN
+    INSERT INTO mv_bankroll_daily (account_id, trade_date, trade_type, status, is_options, premium_sum, margin_capital_sum, cnt)
+    VALUES (IFNULL(NEW.account_id, 0), NEW.date_trade_open, NEW.trade_type, IFNULL(NEW.trade_status, ''), NEW.is_options,
+            CASE WHEN NEW.trade_type = 'SELL' THEN NEW.credit_debit ELSE -NEW.credit_debit END,
+            IFNULL(NEW.margin_capital, 0), 1)
+    ON CONFLICT (account_id, trade_date, trade_type, status) DO UPDATE SET
+        premium_sum = premium_sum + excluded.premium_sum,
+        margin_capital_sum = margin_capital_sum + excluded.margin_capital_sum,
+        cnt = cnt + 1;
+END;
+
+CREATE TRIGGER trg_mv_bankroll_daily_update
+AFTER UPDATE OF account_id, date_trade_open, trade_type, trade_status, credit_debit, margin_capital ON trades
+BEGIN
+    UPDATE mv_bankroll_daily SET
+        premium_sum = premium_sum - CASE WHEN OLD.trade_type = 'SELL' THEN OLD.credit_debit ELSE -OLD.credit_debit END,
+        margin_capital_sum = margin_capital_sum - IFNULL(OLD.margin_capital, 0),
+        cnt = cnt - 1
+    WHERE account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+    DELETE FROM mv_bankroll_daily
+    WHERE cnt <= 0 AND account_id = IFNULL(OLD.account_id, 0) AND trade_date = OLD.date_trade_open
+      AND trade_type = OLD.trade_type AND status = IFNULL(OLD.trade_status, '');
+    INSERT INTO mv_bankroll_daily (account_id, trade_date, trade_type, status, is_options, premium_sum, margin_capital_sum, cnt)
+    VALUES (IFNULL(NEW.account_id, 0), NEW.date_trade_open, NEW.trade_type, IFNULL(NEW.trade_status, ''), NEW.is_options,
+            CASE WHEN NEW.trade_type = 'SELL' THEN NEW.credit_debit ELSE -NEW.credit_debit END,
+            IFNULL(NEW.margin_capital, 0), 1)
+    ON CONFLICT (account_id, trade_date, trade_type, status) DO UPDATE SET
+        premium_sum = premium_sum + excluded.premium_sum,
+        margin_capital_sum = margin_capital_sum + excluded.margin_capital_sum,
+        cnt = cnt + 1;
+END;
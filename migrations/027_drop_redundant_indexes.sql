@@ -0,0 +1,21 @@
+-- Migration 027: Drop single-column indexes whose column is the leading prefix of a composite
+-- SQLite serves lookups on the leading column(s) of a composite index, so these only add a
+-- B-tree insert/update per row written to trades, cost_basis, cash_flows, commissions and bankroll.
+
+-- trades(account_id) and trades(account_id, trade_status) -> idx_trades_account_status_date / idx_trades_account_date
+CREATE INDEX IF NOT EXISTS idx_trades_account_status_date ON trades(account_id, trade_status, date_trade_open);
+DROP INDEX IF EXISTS idx_trades_account;
+DROP INDEX IF EXISTS idx_trades_account_status;
+
+-- cost_basis(ticker_id) and cost_basis(ticker_id, account_id) -> idx_cost_basis_ticker_account_date
+DROP INDEX IF EXISTS idx_cost_basis_ticker;
+DROP INDEX IF EXISTS idx_cost_basis_ticker_account;
+
+-- cash_flows(account_id) -> idx_cash_flows_account_date
+DROP INDEX IF EXISTS idx_cash_flows_account;
+
+-- commissions(account_id) -> idx_commissions_account_date
+DROP INDEX IF EXISTS idx_commissions_account;
+
+-- bankroll(account_id) -> idx_bankroll_account_date
+DROP INDEX IF EXISTS idx_bankroll_account;
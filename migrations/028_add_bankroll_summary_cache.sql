@@ -0,0 +1,46 @@
+-- Migration 028: Precomputed /api/bankroll-summary responses
+-- One row per (account, status filter) holding the summary JSON, written by the
+-- background refresh in app.py. account_id 0 is the all-accounts summary and
+-- status_filter '' is the default (open + assigned) view. Triggers drop the affected
+-- rows whenever trades or account balances change, so a row is never stale: a missing
+-- row is recomputed from mv_bankroll_daily and re-cached.
+
+CREATE TABLE IF NOT EXISTS mv_bankroll_summary (
+    account_id INTEGER NOT NULL,
+    status_filter TEXT NOT NULL,
+    summary_json TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (account_id, status_filter)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_trades_insert AFTER INSERT ON trades
+BEGIN
+    DELETE FROM mv_bankroll_summary WHERE account_id IN (0, IFNULL(NEW.account_id, 0));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_trades_delete AFTER DELETE ON trades
+BEGIN
+    DELETE FROM mv_bankroll_summary WHERE account_id IN (0, IFNULL(OLD.account_id, 0));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_trades_update
+AFTER UPDATE OF account_id, date_trade_open, trade_type, trade_status, credit_debit, margin_capital ON trades
+BEGIN
+    DELETE FROM mv_bankroll_summary
+    WHERE account_id IN (0, IFNULL(OLD.account_id, 0), IFNULL(NEW.account_id, 0));
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_accounts_insert AFTER INSERT ON accounts
+BEGIN
+    DELETE FROM mv_bankroll_summary WHERE account_id IN (0, NEW.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_accounts_delete AFTER DELETE ON accounts
+BEGIN
+    DELETE FROM mv_bankroll_summary WHERE account_id IN (0, OLD.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_mv_bankroll_summary_accounts_update AFTER UPDATE OF id, starting_balance ON accounts
+BEGIN
+    DELETE FROM mv_bankroll_summary WHERE account_id IN (0, OLD.id, NEW.id);
+END;
@@ -0,0 +1,8 @@
+-- Migration 029: Generated trades.shares column
+-- Share count covered by a trade: contracts x 100 for options, the share count itself for
+-- stock (BTO/STC). Computed by SQLite on read instead of in a Python loop per request.
+-- VIRTUAL because ALTER TABLE cannot add STORED generated columns. Requires SQLite 3.31+.
+
+ALTER TABLE trades ADD COLUMN shares INTEGER GENERATED ALWAYS AS (
+    CASE WHEN trade_type IN ('BTO', 'STC') THEN num_of_contracts ELSE num_of_contracts * 100 END
+) VIRTUAL;
@@ -0,0 +1,9 @@
+-- Migration 030: Index cost_basis and cash_flows by trade_id
+-- Editing or deleting a trade looks up (and deletes) its cost_basis and cash_flows rows by
+-- trade_id, and linking cost basis entries to their cash flows joins on it; without these
+-- indexes every one of those statements scans the whole table.
+-- The "latest cost_basis entry for (account, ticker)" lookup needs nothing new: it seeks
+-- idx_cost_basis_ticker_account_date, whose implicit rowid suffix also orders same-day entries.
+
+CREATE INDEX IF NOT EXISTS idx_cost_basis_trade ON cost_basis(trade_id);
+CREATE INDEX IF NOT EXISTS idx_cash_flows_trade ON cash_flows(trade_id);
@@ -0,0 +1,17 @@
+-- Migration 031: Composite indexes for the summary, chart and cost basis reads
+-- The summary filters one ticker's trades by a date_trade_open range, the chart sums OPTIONS
+-- cash flow amounts per transaction_date over a date range, and the single-ticker cost basis
+-- view lists a ticker's entries across accounts by transaction_date. With these the range
+-- and ordering come from the index (the chart query reads only the index), instead of a
+-- seek on the leading column followed by a filter and a temporary sort B-tree.
+-- tickers(ticker) is already UNIQUE and cost_basis(trade_id) is indexed by migration 030.
+
+-- trades(ticker_id) -> idx_trades_ticker_date
+CREATE INDEX IF NOT EXISTS idx_trades_ticker_date ON trades(ticker_id, date_trade_open);
+DROP INDEX IF EXISTS idx_trades_ticker;
+
+-- cash_flows(transaction_type) -> idx_cash_flows_type_date (amount included so the chart is index-only)
+CREATE INDEX IF NOT EXISTS idx_cash_flows_type_date ON cash_flows(transaction_type, transaction_date, amount);
+DROP INDEX IF EXISTS idx_cash_flows_type;
+
+CREATE INDEX IF NOT EXISTS idx_cost_basis_ticker_date ON cost_basis(ticker_id, transaction_date);
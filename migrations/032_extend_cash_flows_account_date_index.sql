@@ -0,0 +1,11 @@
+-- Migration 032: Cover the cash flows listing's sort with the account + date index
+-- /api/cash-flows lists one account's cash flows in a transaction_date range ordered by
+-- transaction_date DESC, created_at DESC. idx_cash_flows_account_date (account_id,
+-- transaction_date) served the filter, but same-day rows still went through a temporary
+-- sort B-tree for created_at. Adding created_at as the last column lets the index supply
+-- the whole ORDER BY (scanned backwards); it replaces the two-column index.
+-- The bankroll summary reads mv_bankroll_daily (migration 025), not trades, so it needs
+-- no new trades index.
+
+CREATE INDEX IF NOT EXISTS idx_cash_flows_account_date_created ON cash_flows(account_id, transaction_date, created_at);
+DROP INDEX IF EXISTS idx_cash_flows_account_date;
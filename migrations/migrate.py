@@ -28,8 +28,8 @@ def get_applied_migrations(conn):
     applied = [row[0] for row in cursor.fetchall()]
     return applied
 
-def apply_migration(conn, migration_file):
-    """Apply a single migration file. Returns the connection (may be new if reconnected)."""
+def apply_migration(conn, migration_file, database=DATABASE):
+    """Apply a single migration file to database. Returns the connection (may be new if reconnected)."""
     migration_number = int(Path(migration_file).stem.split('_')[0])
     cursor = conn.cursor()
     
@@ -131,7 +131,7 @@ def apply_migration(conn, migration_file):
         # This ensures SQLite recognizes that views are dropped before attempting table rename
         print("  Refreshing SQLite schema cache by closing and reopening connection...")
         conn.close()
-        conn = sqlite3.connect(DATABASE)
+        conn = sqlite3.connect(database)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
     
@@ -185,7 +185,7 @@ def apply_migration(conn, migration_file):
         # This ensures SQLite recognizes that views are dropped before attempting table rename
         print("  Refreshing SQLite schema cache by closing and reopening connection...")
         conn.close()
-        conn = sqlite3.connect(DATABASE)
+        conn = sqlite3.connect(database)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
     
@@ -321,9 +321,9 @@ def apply_migration(conn, migration_file):
     print(f"✓ Applied migration {migration_number}: {Path(migration_file).name}")
     return conn  # Return connection in case it was recreated
 
-def run_migrations():
-    """Run all pending migrations"""
-    conn = sqlite3.connect(DATABASE)
+def run_migrations(database=DATABASE):
+    """Run all pending migrations on database (trades.db in the working directory by default)"""
+    conn = sqlite3.connect(database)
     conn.row_factory = sqlite3.Row
     
     try:
@@ -345,10 +345,14 @@ def run_migrations():
         # Apply migrations in order
         for migration_number, migration_file in sorted(pending):
             print(f"Applying migration {migration_number}...")
-            conn = apply_migration(conn, migration_file)  # Get updated connection
+            conn = apply_migration(conn, migration_file, database)  # Get updated connection
         
         print("All migrations applied successfully")
         
+        # Refresh planner statistics so new or changed indexes are used
+        conn.execute('ANALYZE')
+        conn.commit()
+        
     except Exception as e:
         print(f"Migration error: {e}")
         if conn:
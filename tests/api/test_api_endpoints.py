@@ -23,6 +23,15 @@ class TestAPISummary:
         assert response.status_code == 200
         data = json.loads(response.data)
         assert isinstance(data, dict)
+    
+    def test_get_summary_not_modified(self, client):
+        """Re-requesting an unchanged summary with its ETag is answered with 304"""
+        response = client.get('/api/summary')
+        assert response.headers['Cache-Control'] == 'private, max-age=0, must-revalidate'
+        
+        response = client.get('/api/summary', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+        assert response.data == b''
 
 class TestAPITrades:
     """Test trades endpoint"""
@@ -75,6 +84,76 @@ class TestAPITrades:
         
         # Should succeed or fail gracefully
         assert response.status_code in [200, 201, 500]
+    
+    def test_add_trades_bulk(self, client):
+        """Test adding several trades in one request"""
+        trades = [
+            {'ticker': 'TSLA', 'tradeDate': '2025-01-16', 'expirationDate': '2025-01-16', 'num_of_contracts': 10,
+             'premium': 250.00, 'currentPrice': 250.00, 'tradeType': 'BTO', 'accountId': 9},
+            {'ticker': 'TSLA', 'tradeDate': '2025-01-15', 'expirationDate': '2025-01-20', 'num_of_contracts': 1,
+             'premium': 2.50, 'currentPrice': 250.00, 'strikePrice': 245.00, 'tradeType': 'ROCT PUT', 'accountId': 9},
+        ]
+        
+        response = client.post('/api/trades/bulk',
+                              data=json.dumps(trades),
+                              content_type='application/json')
+        assert response.status_code == 200
+        trade_ids = json.loads(response.data)['trade_ids']
+        assert len(trade_ids) == 2
+        # Inserted in trade-date order, reported in request order
+        assert trade_ids[1] < trade_ids[0]
+        
+        response = client.get(f'/api/trades/{trade_ids[0]}')
+        assert json.loads(response.data)['trade_type'] == 'BTO'
+    
+    def test_add_trades_bulk_rejects_invalid_trade_type(self, client):
+        """An invalid trade anywhere in the batch rejects the whole request"""
+        trades = [{'ticker': 'TSLA', 'tradeDate': '2025-01-15', 'expirationDate': '2025-01-20', 'num_of_contracts': 1,
+                   'premium': 2.50, 'currentPrice': 250.00, 'tradeType': 'NOT A TYPE', 'accountId': 9}]
+        
+        response = client.post('/api/trades/bulk',
+                              data=json.dumps(trades),
+                              content_type='application/json')
+        assert response.status_code == 400
+        assert 'Trade 0' in json.loads(response.data)['error']
+    
+    def test_add_trades_bulk_running_totals(self, client):
+        """Bulk running totals continue from the ticker's latest entry and are recomputed for back-dated trades"""
+        from app import get_db
+        # A ticker with no earlier cost basis entries
+        ticker = 'ZZBULK'
+        def bto(date, shares, price):
+            return {'ticker': ticker, 'tradeDate': date, 'expirationDate': date, 'num_of_contracts': shares,
+                    'premium': price, 'currentPrice': price, 'tradeType': 'BTO', 'accountId': 9}
+        for batch in ([bto('2025-02-10', 10, 5.0)], [bto('2025-02-12', 10, 7.0), bto('2025-02-05', 20, 4.0)]):
+            response = client.post('/api/trades/bulk',
+                                  data=json.dumps(batch),
+                                  content_type='application/json')
+            assert response.status_code == 200
+        
+        with get_db() as conn:
+            rows = conn.execute('''
+                SELECT running_basis, running_shares FROM cost_basis
+                WHERE ticker_id = (SELECT id FROM tickers WHERE ticker = ?)
+                ORDER BY transaction_date, rowid
+            ''', (ticker,)).fetchall()
+        assert [tuple(row) for row in rows] == [(80.0, 20), (130.0, 30), (200.0, 40)]
+
+    def test_delete_trade(self, client):
+        """Deleting a trade removes it and its cost basis entries; unknown ids are 404"""
+        from app import get_db
+        trade = {'ticker': 'TSLA', 'tradeDate': '2025-01-15', 'expirationDate': '2025-01-15', 'num_of_contracts': 10,
+                 'premium': 250.00, 'currentPrice': 250.00, 'tradeType': 'BTO', 'accountId': 9}
+        response = client.post('/api/trades/bulk',
+                              data=json.dumps([trade]),
+                              content_type='application/json')
+        trade_id = json.loads(response.data)['trade_ids'][0]
+        
+        assert client.delete(f'/api/trades/{trade_id}').status_code == 200
+        assert client.get(f'/api/trades/{trade_id}').status_code == 404
+        with get_db() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM cost_basis WHERE trade_id = ?', (trade_id,)).fetchone()[0] == 0
+        assert client.delete(f'/api/trades/{trade_id}').status_code == 404
 
 class TestAPICostBasis:
     """Test cost basis endpoint"""
@@ -86,6 +165,16 @@ class TestAPICostBasis:
         data = json.loads(response.data)
         assert isinstance(data, list)
     
+    def test_get_cost_basis_not_modified(self, client):
+        """A request carrying the current ETag is answered with 304 and no body"""
+        response = client.get('/api/cost-basis')
+        etag = response.headers['ETag']
+        assert response.headers['Cache-Control'] == 'private, max-age=0, must-revalidate'
+        
+        response = client.get('/api/cost-basis', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+    
     def test_get_cost_basis_with_ticker(self, client):
         """Test cost basis with ticker filter"""
         response = client.get('/api/cost-basis?ticker=TSLA')
@@ -108,3 +197,107 @@ class TestAPIBankroll:
         assert 'total_bankroll' in data
         assert 'available' in data
         assert 'used_in_trades' in data
+    
+    def test_get_bankroll_summary_not_modified(self, client):
+        """Polling with the current ETag is answered with 304 and no body"""
+        response = client.get('/api/bankroll-summary?account_id=9')
+        etag = response.headers['ETag']
+        
+        response = client.get('/api/bankroll-summary?account_id=9', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+    
+    def test_precomputed_bankroll_summary(self, client):
+        """Precomputed summaries match the live computation and are dropped when balances change"""
+        from app import refresh_bankroll_summaries, get_db
+        live = json.loads(client.get('/api/bankroll-summary?status_filter=open').data)
+        
+        # account_id 0 holds the all-accounts summaries
+        refresh_bankroll_summaries([0])
+        with get_db() as conn:
+            assert conn.execute('SELECT COUNT(*) FROM mv_bankroll_summary WHERE account_id = 0').fetchone()[0] == 4
+        assert json.loads(client.get('/api/bankroll-summary?status_filter=open').data) == live
+        
+        with get_db() as conn:
+            conn.execute("INSERT INTO accounts (account_name, starting_balance) VALUES ('Summary Cache Test', 100)")
+            assert conn.execute('SELECT COUNT(*) FROM mv_bankroll_summary WHERE account_id = 0').fetchone()[0] == 0
+            conn.rollback()
+
+class TestIndexPage:
+    """Test the single-page app shell"""
+    
+    def test_index_served_from_rendered_copy(self, client):
+        """Repeat requests return the same rendered page"""
+        first = client.get('/')
+        second = client.get('/')
+        assert first.status_code == 200
+        assert first.mimetype == 'text/html'
+        assert b'css/style.css' in first.data
+        assert second.data == first.data
+
+class TestCompanyInfo:
+    """Test company name lookups"""
+    
+    def test_company_info_served_from_cache(self, client, monkeypatch):
+        """A name already known for a ticker is returned without another database or yfinance lookup"""
+        import app as app_module
+        app_module.response_cache.delete('company-info')
+        monkeypatch.setattr(app_module, 'get_company_name_from_yfinance', lambda ticker: 'Cache Test Corp')
+        first = json.loads(client.get('/api/company-info/zzci').data)
+        assert first == {'symbol': 'ZZCI', 'name': 'Cache Test Corp'}
+        
+        def no_lookup(*args, **kwargs):
+            raise AssertionError('company name was looked up again')
+        monkeypatch.setattr(app_module, 'get_db', no_lookup)
+        monkeypatch.setattr(app_module, 'get_company_name_from_yfinance', no_lookup)
+        assert json.loads(client.get('/api/company-info/ZZCI').data) == first
+    
+    def test_yfinance_lookups_cached(self, monkeypatch):
+        """Names and misses from yfinance are remembered, so a symbol is only looked up once"""
+        import sys
+        import types
+        import app as app_module
+        app_module.response_cache.delete('yfinance-company-name')
+        lookups = []
+        class FakeTicker:
+            def __init__(self, symbol, session=None):
+                lookups.append(symbol)
+                self.info = {'longName': 'Lookup Test Corp'} if symbol == 'ZZYF' else {}
+        monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(Ticker=FakeTicker))
+        
+        for _ in range(2):
+            assert app_module.get_company_name_from_yfinance('zzyf') == 'Lookup Test Corp'
+            assert app_module.get_company_name_from_yfinance('ZZNO') is None
+        assert lookups == ['ZZYF', 'ZZNO']
+    
+    def test_yfinance_lookups_back_off_when_rate_limited(self, monkeypatch):
+        """After a 429 no further lookups are made until the back-off period has passed"""
+        import sys
+        import types
+        import app as app_module
+        app_module.response_cache.delete('yfinance-company-name')
+        monkeypatch.setattr(app_module, '_yfinance_backoff', {'until': 0.0, 'seconds': 0})
+        lookups = []
+        class RateLimitedTicker:
+            def __init__(self, symbol, session=None):
+                lookups.append(symbol)
+            @property
+            def info(self):
+                raise Exception('Too Many Requests. Rate limited. Try after a while.')
+        monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(Ticker=RateLimitedTicker))
+        
+        assert app_module.get_company_name_from_yfinance('ZZRL') is None
+        assert app_module.get_company_name_from_yfinance('ZZRM') is None
+        assert lookups == ['ZZRL']
+        assert app_module._yfinance_backoff['seconds'] == app_module.YFINANCE_RATE_LIMIT_BACKOFF
+
+class TestDeployWebhook:
+    """Test the GitHub deploy webhook"""
+    
+    def test_rejects_bad_signature(self, client, monkeypatch):
+        """With WEBHOOK_SECRET set, unsigned or wrongly signed requests are refused before deploying"""
+        monkeypatch.setenv('WEBHOOK_SECRET', 'test-secret')
+        body = b'{"ref": "refs/heads/main"}'
+        assert client.post('/webhook/deploy', data=body).status_code == 401
+        response = client.post('/webhook/deploy', data=body, headers={'X-Hub-Signature-256': 'sha256=' + '0' * 64})
+        assert response.status_code == 401
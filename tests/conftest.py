@@ -5,24 +5,64 @@ import pytest
 import tempfile
 import os
 import sqlite3
+import app as app_module
 from app import app, init_db, get_db_connection
+from db_helper import init_db_helper
+from migrations.migrate import run_migrations
+
+def copy_database(source_path, target_path):
+    """Copy an SQLite database with the backup API, opening the source read-only"""
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+    target = sqlite3.connect(target_path)
+    source.backup(target)
+    target.close()
+    source.close()
+
+@pytest.fixture(scope='session')
+def migrated_db():
+    """A migrated copy of the DB_PATH database, made once per test session"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    copy_database(app_module.DATABASE, db_path)
+    run_migrations(db_path)
+    
+    yield db_path
+    
+    # Cleanup
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
 
 @pytest.fixture
-def client():
-    """Create a test client for the Flask app"""
+def client(migrated_db, monkeypatch):
+    """Create a test client for the Flask app on a temporary database"""
     # Create a temporary database
     db_fd, app.config['DATABASE'] = tempfile.mkstemp(suffix='.db')
     app.config['TESTING'] = True
     app.config['WTF_CSRF_ENABLED'] = False
-    
-    with app.test_client() as client:
-        with app.app_context():
-            init_db()
-        yield client
-    
-    # Cleanup
-    os.close(db_fd)
-    os.unlink(app.config['DATABASE'])
+
+    # Tests run against their own copy of the migrated database, so nothing they write
+    # reaches the tracked trades.db. get_db() uses the global db_helper, not
+    # app.config['DATABASE'], so the helper is pointed at the copy. The startup migrations
+    # are not needed (and would run against trades.db in the working directory).
+    copy_database(migrated_db, app.config['DATABASE'])
+    db = init_db_helper(app.config['DATABASE'])
+    monkeypatch.setattr(app_module, '_migrations_run', True)
+
+    try:
+        with app.test_client() as client:
+            with app.app_context():
+                init_db()
+            yield client
+    finally:
+        # Cleanup
+        init_db_helper(app_module.DATABASE)
+        while not db._pool.empty():
+            db._pool.get_nowait().close()
+        os.close(db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(app.config['DATABASE'] + suffix):
+                os.unlink(app.config['DATABASE'] + suffix)
 
 @pytest.fixture
 def test_db():
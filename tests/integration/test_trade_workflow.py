@@ -4,7 +4,7 @@ Tests the complete flow from adding a trade to calculating cost basis
 """
 import pytest
 import json
-from app import create_assigned_cost_basis_entry
+from app import create_assigned_cost_basis_entry, get_db_connection
 
 def test_add_trade_and_cost_basis_workflow(client):
     """Test complete workflow: add trade -> create cost basis"""
@@ -90,3 +90,62 @@ class TestCustomWorkflow:
         
         # Allow small floating point errors
         assert abs(total - (available + used)) < 1.0
+
+def test_cost_basis_entries_carry_running_totals(client):
+    """Each cost basis entry builds on the latest running totals for its account and ticker"""
+    from app import create_cost_basis_entry
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO tickers (ticker, company_name) VALUES ('ZZCB', 'ZZCB')")
+        ticker_id = cursor.lastrowid
+        cursor.execute('SELECT id FROM accounts ORDER BY id LIMIT 1')
+        account_id = cursor.fetchone()['id']
+        
+        create_cost_basis_entry(cursor, account_id, ticker_id, None, '2025-01-15', 'BTO', 100, 50.0, 5000.0)
+        create_cost_basis_entry(cursor, account_id, ticker_id, None, '2025-01-16', 'STC', 40, 55.0, 2200.0)
+        
+        assigned_trade = {'id': 999999, 'account_id': account_id, 'ticker_id': ticker_id, 'date_trade_open': '2025-01-10',
+                          'expiration_date': '2025-01-17', 'trade_type': 'ROCT PUT', 'num_of_contracts': 1, 'strike_price': 45.0}
+        create_assigned_cost_basis_entry(cursor, assigned_trade)
+        create_assigned_cost_basis_entry(cursor, assigned_trade)  # already assigned: skipped
+        
+        cursor.execute('SELECT description, running_basis, running_shares FROM cost_basis WHERE ticker_id = ? ORDER BY id', (ticker_id,))
+        rows = [tuple(row) for row in cursor.fetchall()]
+        assert rows == [
+            ('BTO 100 ZZCB', 5000.0, 100),
+            ('STC 40 ZZCB', 2800.0, 60),
+            ('ASSIGNED 17-JAN-25 PUT', 7300.0, 160),
+        ]
+    finally:
+        conn.rollback()
+        conn.close()
+
+def test_backdated_cost_basis_entry_updates_later_running_totals(client):
+    """A back-dated entry takes the totals before it and shifts every later entry's totals"""
+    from app import create_cost_basis_entry
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO tickers (ticker, company_name) VALUES ('ZZBD', 'ZZBD')")
+        ticker_id = cursor.lastrowid
+        cursor.execute('SELECT id FROM accounts ORDER BY id LIMIT 1')
+        account_id = cursor.fetchone()['id']
+        
+        create_cost_basis_entry(cursor, account_id, ticker_id, None, '2025-01-10', 'BTO', 100, 50.0, 5000.0)
+        create_cost_basis_entry(cursor, account_id, ticker_id, None, '2025-01-20', 'BTO', 100, 40.0, 4000.0)
+        create_cost_basis_entry(cursor, account_id, ticker_id, None, '2025-01-15', 'STC', 50, 60.0, 3000.0)
+        
+        cursor.execute('''
+            SELECT transaction_date, running_basis, running_shares, basis_per_share FROM cost_basis
+            WHERE ticker_id = ? ORDER BY transaction_date
+        ''', (ticker_id,))
+        rows = [tuple(row) for row in cursor.fetchall()]
+        assert rows == [
+            ('2025-01-10', 5000.0, 100, 50.0),
+            ('2025-01-15', 2000.0, 50, 40.0),
+            ('2025-01-20', 6000.0, 150, 40.0),
+        ]
+    finally:
+        conn.rollback()
+        conn.close()
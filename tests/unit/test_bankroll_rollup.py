@@ -0,0 +1,118 @@
+"""
+Unit tests for the mv_bankroll_daily roll-up maintained by triggers on trades
+"""
+import pytest
+import sqlite3
+from pathlib import Path
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / 'migrations'
+ROLLUP_MIGRATIONS = ('025_add_bankroll_rollup.sql', '026_add_is_options_to_trades.sql')
+
+DIRECT_AGGREGATE = '''
+    SELECT IFNULL(account_id, 0), date_trade_open, trade_type, IFNULL(trade_status, ''),
+           ROUND(SUM(CASE WHEN trade_type = 'SELL' THEN credit_debit ELSE -credit_debit END), 6),
+           ROUND(SUM(IFNULL(margin_capital, 0)), 6),
+           COUNT(*)
+    FROM trades
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 2, 3, 4
+'''
+
+ROLLUP = '''
+    SELECT account_id, trade_date, trade_type, status,
+           ROUND(premium_sum, 6), ROUND(margin_capital_sum, 6), cnt
+    FROM mv_bankroll_daily
+    ORDER BY 1, 2, 3, 4
+'''
+
+@pytest.fixture
+def conn():
+    """In-memory database with a minimal trades table and the roll-up migrations applied"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE trades (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER DEFAULT 9,
+            date_trade_open TEXT NOT NULL,
+            trade_type TEXT NOT NULL,
+            trade_status TEXT DEFAULT 'open',
+            credit_debit REAL NOT NULL,
+            margin_capital REAL DEFAULT 0
+        )
+    ''')
+    conn.executemany('''
+        INSERT INTO trades (account_id, date_trade_open, trade_type, trade_status, credit_debit, margin_capital)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [
+        (9, '2025-01-15', 'ROCT PUT', 'open', 2.50, 24350.0),
+        (9, '2025-01-15', 'ROCT PUT', 'open', 1.25, 9900.0),
+        (9, '2025-01-16', 'BTO', 'open', 50.00, None),
+    ])
+    for migration in ROLLUP_MIGRATIONS:
+        conn.executescript((MIGRATIONS_DIR / migration).read_text())
+    yield conn
+    conn.close()
+
+class TestBankrollRollup:
+    """The roll-up must always equal a direct aggregate over trades"""
+
+    def test_backfill_matches_trades(self, conn):
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+
+    def test_insert_merges_into_existing_row(self, conn):
+        conn.execute('''
+            INSERT INTO trades (account_id, date_trade_open, trade_type, trade_status, credit_debit, margin_capital)
+            VALUES (9, '2025-01-15', 'ROCT PUT', 'open', 0.75, 9235.0)
+        ''')
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+        cnt = conn.execute("SELECT cnt FROM mv_bankroll_daily WHERE trade_type = 'ROCT PUT'").fetchone()[0]
+        assert cnt == 3
+
+    def test_status_change_moves_row(self, conn):
+        conn.execute("UPDATE trades SET trade_status = 'closed' WHERE id = 1")
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+
+    def test_delete_removes_empty_rows(self, conn):
+        conn.execute('DELETE FROM trades WHERE id = 3')
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+        assert conn.execute("SELECT COUNT(*) FROM mv_bankroll_daily WHERE trade_type = 'BTO'").fetchone()[0] == 0
+
+    def test_null_status_and_account_are_tracked(self, conn):
+        conn.execute('''
+            INSERT INTO trades (account_id, date_trade_open, trade_type, trade_status, credit_debit)
+            VALUES (NULL, '2025-02-01', 'ROCT CALL', NULL, 1.00)
+        ''')
+        conn.execute('UPDATE trades SET credit_debit = 2.00 WHERE account_id IS NULL')
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+        conn.execute('DELETE FROM trades WHERE account_id IS NULL')
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+
+    def test_is_options_flag_follows_trade_type(self, conn):
+        conn.execute('''
+            INSERT INTO trades (account_id, date_trade_open, trade_type, trade_status, credit_debit)
+            VALUES (9, '2025-03-01', 'RULE ONE PUT', 'open', 1.00)
+        ''')
+        flags = dict(conn.execute('SELECT trade_type, is_options FROM mv_bankroll_daily').fetchall())
+        assert flags == {'ROCT PUT': 1, 'BTO': 0, 'RULE ONE PUT': 0}
+        assert flags == dict(conn.execute('SELECT trade_type, is_options FROM trades').fetchall())
+
+    def test_statement_split_applies_inside_open_transaction(self):
+        """init_db runs the migration scripts statement by statement inside its own transaction"""
+        from app import iter_sql_statements
+        conn = sqlite3.connect(':memory:')
+        conn.execute('''
+            CREATE TABLE trades (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, account_id INTEGER, date_trade_open TEXT NOT NULL,
+                trade_type TEXT NOT NULL, trade_status TEXT, credit_debit REAL NOT NULL, margin_capital REAL
+            )
+        ''')
+        conn.execute('BEGIN')
+        conn.execute("INSERT INTO trades VALUES (1, 9, '2025-01-15', 'ROCT PUT', 'open', 2.5, 100.0)")
+        for migration in ROLLUP_MIGRATIONS:
+            for statement in iter_sql_statements((MIGRATIONS_DIR / migration).read_text()):
+                conn.execute(statement)
+        assert conn.in_transaction
+        conn.execute("INSERT INTO trades VALUES (2, 9, '2025-01-15', 'ROCT PUT', 'open', 1.0, 50.0)")
+        conn.commit()
+        assert conn.execute(ROLLUP).fetchall() == conn.execute(DIRECT_AGGREGATE).fetchall()
+        conn.close()
@@ -0,0 +1,61 @@
+"""
+Unit tests for the in-process response cache
+"""
+import pytest
+from flask import Flask, jsonify, request
+from cache_helper import ResponseCache
+
+@pytest.fixture
+def cache_app():
+    """Small Flask app with cached views that count how often they run"""
+    app = Flask(__name__)
+    cache = ResponseCache()
+    calls = {'items': 0, 'filtered': 0}
+
+    @app.route('/items')
+    @cache.cached('items', timeout=300)
+    def items():
+        calls['items'] += 1
+        return jsonify([calls['items']])
+
+    @app.route('/filtered')
+    @cache.cached('filtered', query_string=True)
+    def filtered():
+        calls['filtered'] += 1
+        if request.args.get('fail'):
+            return jsonify({'error': 'boom'}), 500
+        return jsonify({'account_id': request.args.get('account_id')})
+
+    return app.test_client(), cache, calls
+
+class TestResponseCache:
+    """Test cached views and prefix invalidation"""
+
+    def test_repeat_request_is_served_from_cache(self, cache_app):
+        client, cache, calls = cache_app
+        assert client.get('/items').get_json() == [1]
+        assert client.get('/items').get_json() == [1]
+        assert calls['items'] == 1
+
+    def test_delete_invalidates_prefix(self, cache_app):
+        client, cache, calls = cache_app
+        client.get('/items')
+        cache.delete('items')
+        assert client.get('/items').get_json() == [2]
+
+    def test_query_string_variants_cached_separately(self, cache_app):
+        client, cache, calls = cache_app
+        assert client.get('/filtered?account_id=9').get_json() == {'account_id': '9'}
+        assert client.get('/filtered?account_id=10').get_json() == {'account_id': '10'}
+        client.get('/filtered?account_id=9')
+        assert calls['filtered'] == 2
+
+        cache.delete('filtered')
+        client.get('/filtered?account_id=10')
+        assert calls['filtered'] == 3
+
+    def test_errors_are_not_cached(self, cache_app):
+        client, cache, calls = cache_app
+        assert client.get('/filtered?fail=1').status_code == 500
+        assert client.get('/filtered?fail=1').status_code == 500
+        assert calls['filtered'] == 2
@@ -92,3 +92,55 @@ class TestCalculations:
         
         basis_per_share = running_basis / running_shares if running_shares != 0 else running_basis
         assert basis_per_share == 1000.00
+
+class TestDaysBetween:
+    """Test days_to_expiration date math"""
+    
+    def test_iso_dates(self):
+        from app import days_between
+        assert days_between('2025-01-15', '2025-02-21') == 37
+        assert days_between('2025-02-21', '2025-01-15') == -37
+    
+    def test_non_padded_dates_fall_back_to_strptime(self):
+        from app import days_between
+        assert days_between('2025-3-7', '2025-03-21') == 14
+    
+    def test_invalid_date_raises(self):
+        from app import days_between
+        with pytest.raises(ValueError):
+            days_between('03/07/2025', '2025-03-21')
+
+class TestFormatExpiration:
+    """Test the DD-MON-YY expiration format used in cost basis descriptions"""
+    
+    def test_matches_strftime(self):
+        from app import format_expiration
+        for value in ('2025-03-21', '2024-12-01', '2030-07-04'):
+            assert format_expiration(value) == datetime.strptime(value, '%Y-%m-%d').strftime('%d-%b-%y').upper()
+    
+    def test_non_padded_dates(self):
+        from app import format_expiration
+        assert format_expiration('2025-3-7') == '07-MAR-25'
+    
+    def test_invalid_date_raises(self):
+        from app import format_expiration
+        with pytest.raises(ValueError):
+            format_expiration('03/21/2025')
+
+class TestCommissionRateOn:
+    """Test picking the commission rate in effect on a trade date"""
+    
+    SCHEDULE = (['2020-01-10', '2025-11-15'], [0.01, 0.02])
+    
+    def test_latest_effective_date_on_or_before_trade_date(self):
+        from app import commission_rate_on
+        assert commission_rate_on(self.SCHEDULE, '2020-01-10') == 0.01
+        assert commission_rate_on(self.SCHEDULE, '2025-11-14') == 0.01
+        assert commission_rate_on(self.SCHEDULE, '2025-11-15') == 0.02
+        assert commission_rate_on(self.SCHEDULE, '2026-01-01') == 0.02
+    
+    def test_no_rate_in_effect(self):
+        from app import commission_rate_on
+        assert commission_rate_on(self.SCHEDULE, '2019-12-31') == 0.0
+        assert commission_rate_on(([], []), '2025-01-15') == 0.0
+        assert commission_rate_on(self.SCHEDULE, '2025-1-15') == 0.0
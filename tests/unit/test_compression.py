@@ -0,0 +1,65 @@
+"""
+Unit tests for gzip compression of JSON responses
+"""
+import pytest
+import gzip
+import json
+from flask import Flask, Response, jsonify, request
+from compression import gzip_response
+
+@pytest.fixture
+def gzip_app():
+    """Flask app with gzip_response registered and a few JSON endpoints"""
+    app = Flask(__name__)
+    app.after_request(gzip_response)
+
+    @app.route('/large')
+    def large():
+        response = jsonify([{'ticker': 'AAPL', 'trade_type': 'ROCT PUT', 'strike_price': 245.0}] * 50)
+        response.add_etag()
+        return response.make_conditional(request)
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((json.dumps({'id': i}) + '\n' for i in range(200)), mimetype='application/json')
+
+    return app.test_client()
+
+class TestGzipResponse:
+    """Responses are only compressed when it is useful and the client accepts gzip"""
+
+    def test_compresses_large_json(self, gzip_app):
+        plain = gzip_app.get('/large')
+        response = gzip_app.get('/large', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert len(response.data) < len(plain.data)
+        assert gzip.decompress(response.data) == plain.data
+
+    def test_leaves_response_alone_without_accept_encoding(self, gzip_app):
+        response = gzip_app.get('/large')
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.data)[0]['ticker'] == 'AAPL'
+
+    def test_skips_small_responses(self, gzip_app):
+        response = gzip_app.get('/small', headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+        assert json.loads(response.data) == {'ok': True}
+
+    def test_compresses_streamed_response(self, gzip_app):
+        response = gzip_app.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        lines = gzip.decompress(response.data).decode().splitlines()
+        assert [json.loads(line)['id'] for line in lines] == list(range(200))
+
+    def test_etag_still_revalidates(self, gzip_app):
+        """The weakened ETag from a gzipped response still gets 304 Not Modified"""
+        headers = {'Accept-Encoding': 'gzip'}
+        etag = gzip_app.get('/large', headers=headers).headers['ETag']
+        assert etag.startswith('W/')
+        response = gzip_app.get('/large', headers={**headers, 'If-None-Match': etag})
+        assert response.status_code == 304
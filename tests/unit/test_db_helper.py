@@ -0,0 +1,59 @@
+"""
+Unit tests for db_helper connection handling
+"""
+import pytest
+import os
+import tempfile
+from db_helper import DatabaseHelper
+
+@pytest.fixture
+def helper():
+    """Create a DatabaseHelper on a throwaway database file"""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    db = DatabaseHelper(db_path)
+    with db.connection() as conn:
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.commit()
+
+    yield db
+
+    # Cleanup
+    while not db._pool.empty():
+        db._pool.get_nowait().close()
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
+class TestConnectionPool:
+    """Test pooled connections"""
+
+    def test_connection_is_reused(self, helper):
+        """A released connection is handed out again instead of reopening the file"""
+        with helper.connection() as first:
+            pass
+        with helper.connection() as second:
+            assert second is first
+
+    def test_uncommitted_transaction_is_rolled_back_on_release(self, helper):
+        """A handler that fails before commit must not leak its write lock or data"""
+        with helper.connection() as conn:
+            conn.execute("INSERT INTO items (name) VALUES ('pending')")
+            assert conn.in_transaction
+
+        with helper.connection() as conn:
+            assert not conn.in_transaction
+            assert conn.execute('SELECT COUNT(*) FROM items').fetchone()[0] == 0
+
+    def test_wal_and_pragmas_applied(self, helper):
+        """Connections come up in WAL mode with the tuned PRAGMAs"""
+        with helper.connection() as conn:
+            assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+            # synchronous=NORMAL is reported as 1
+            assert conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+    def test_execute_query_returns_dicts(self, helper):
+        """Helper queries run on pooled connections and return plain dicts"""
+        helper.execute_insert('INSERT INTO items (name) VALUES (:name)', {'name': 'AAPL'})
+        rows = helper.execute_query('SELECT id, name FROM items')
+        assert rows == [{'id': 1, 'name': 'AAPL'}]
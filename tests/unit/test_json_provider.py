@@ -0,0 +1,48 @@
+"""
+Unit tests for the orjson-backed Flask JSON provider
+"""
+import pytest
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from flask import Flask, jsonify
+from flask.json.provider import DefaultJSONProvider
+from json_provider import FastJSONProvider
+
+@pytest.fixture
+def json_app():
+    """Flask app using FastJSONProvider"""
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    return app
+
+class TestFastJSONProvider:
+    """Output must match Flask's default provider once parsed"""
+
+    PAYLOAD = {
+        'total_premiums': 1234.5600000000002,
+        'breakdown': {'ROCT PUT': {'count': 3, 'margin_capital': 24350.0}},
+        'opened': datetime(2025, 1, 15, 9, 30),
+        'expires': date(2025, 2, 21),
+        'strike': Decimal('245.50'),
+        'ticker': 'AAPL',
+        'notes': None,
+    }
+
+    def test_matches_default_provider(self, json_app):
+        expected = DefaultJSONProvider(json_app).dumps(self.PAYLOAD)
+        assert json.loads(json_app.json.dumps(self.PAYLOAD)) == json.loads(expected)
+
+    def test_jsonify_response(self, json_app):
+        with json_app.app_context():
+            response = jsonify(self.PAYLOAD)
+        assert response.mimetype == 'application/json'
+        assert response.get_json()['opened'] == 'Wed, 15 Jan 2025 09:30:00 GMT'
+        assert response.get_json()['strike'] == '245.50'
+
+    def test_keys_are_sorted(self, json_app):
+        assert json_app.json.dumps({'b': 1, 'a': 2}).replace(' ', '') == '{"a":2,"b":1}'
+
+    def test_falls_back_for_unsupported_values(self, json_app):
+        """Integers wider than 64 bits are not supported by orjson"""
+        assert json.loads(json_app.json.dumps({'big': 2 ** 70})) == {'big': 2 ** 70}
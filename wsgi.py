@@ -7,6 +7,15 @@ if project_dir not in sys.path:
 
 os.chdir(project_dir)
 
+# Use the newer SQLite bundled with pysqlite3-binary when it is installed (optional,
+# Linux-only wheels). It has to replace the stdlib module before app, db_helper and
+# migrations import sqlite3.
+try:
+    import pysqlite3
+    sys.modules['sqlite3'] = pysqlite3
+except ImportError:
+    pass
+
 # env_config runs inside app.py on import — no duplicate logic needed here
 from app import app as application
 